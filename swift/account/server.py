@@ -28,11 +28,13 @@ from swift.common.request_helpers import get_param, get_listing_content_type, \
     split_and_validate_path
 from swift.common.utils import get_logger, hash_path, public, \
     Timestamp, storage_directory, config_true_value, \
-    json, timing_stats, replication, get_log_line
+    timing_stats, replication, get_log_line
 from swift.common.constraints import check_mount, valid_timestamp, check_utf8
 from swift.common import constraints
-from swift.common.db_replicator import ReplicatorRpc
+from swift.common.db_replicator import ReplicatorRpc, journal_db_change, \
+    load_replicate_args
 from swift.common.base_storage_server import BaseStorageServer
+from swift.common.http import is_success
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, \
     HTTPCreated, HTTPForbidden, HTTPInternalServerError, \
     HTTPMethodNotAllowed, HTTPNoContent, HTTPNotFound, \
@@ -59,6 +61,8 @@ class AccountController(BaseStorageServer):
             conf.get('auto_create_account_prefix') or '.'
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        self.change_journal = config_true_value(
+            conf.get('change_journal', 'no'))
 
     def _get_account_broker(self, drive, part, account, **kwargs):
         hsh = hash_path(account)
@@ -82,6 +86,16 @@ class AccountController(BaseStorageServer):
             pass
         return resp(request=req, headers=headers, charset='utf-8', body=body)
 
+    def _journal_change(self, req):
+        drive, part, account, container = split_and_validate_path(
+            req, 3, 4)
+        broker = self._get_account_broker(drive, part, account)
+        try:
+            journal_db_change(broker.db_file)
+        except Exception:
+            self.logger.exception('Failed to journal change to %s during %s' %
+                                  (broker.db_file, req.method))
+
     @public
     @timing_stats()
     def DELETE(self, req):
@@ -227,7 +241,7 @@ class AccountController(BaseStorageServer):
         if self.mount_check and not check_mount(self.root, drive):
             return HTTPInsufficientStorage(drive=drive, request=req)
         try:
-            args = json.load(req.environ['wsgi.input'])
+            args = load_replicate_args(req)
         except ValueError as err:
             return HTTPBadRequest(body=str(err), content_type='text/plain')
         ret = self.replicator_rpc.dispatch(post_args, args)
@@ -273,6 +287,9 @@ class AccountController(BaseStorageServer):
                                         ' %(path)s '),
                                       {'method': req.method, 'path': req.path})
                 res = HTTPInternalServerError(body=traceback.format_exc())
+        if self.change_journal and req.method in ('PUT', 'POST', 'DELETE') \
+                and is_success(res.status_int):
+            self._journal_change(req)
         if self.log_requests:
             trans_time = time.time() - start_time
             additional_info = ''
@@ -0,0 +1,662 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This is a tool for measuring the request handling performance of a complete
+Swift cluster on a single machine, without any network or disk I/O for
+object data. It is intended to help developers quantify improvements or
+regressions in the proxy, its middleware and the storage servers; it says
+little about how a real cluster performs.
+
+The proxy pipeline, loaded from a proxy server config, runs in the same
+process as the account and container servers (with their databases in a
+temporary directory) and one in-memory object server
+(:mod:`swift.obj.mem_server`) per object device. Backend requests are handed
+from the proxy to the servers' WSGI applications directly. Rings for a
+replicated and an erasure coded policy are built on the fly.
+
+Each workload sends a number of requests through the pipeline and reports
+the throughput and the latency percentiles of the requests::
+
+    swift-bench-local -n 2000 -s 65536 put get head listing ec-put ec-get
+
+Without ``--proxy-config`` the pipeline of the sample proxy server config,
+with tempauth, is used. Memcache is replaced by an in-process cache.
+"""
+
+from __future__ import print_function
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from eventlet import GreenPool
+import pkg_resources
+from six.moves import configparser
+from six.moves.urllib.parse import quote, urlparse
+
+from swift.account import server as account_server
+from swift.common import storage_policy, utils
+from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.middleware.memcache import MemcacheMiddleware
+from swift.common.ring import Ring, RingBuilder
+from swift.common.swob import Request, WsgiBytesIO
+from swift.common.utils import Timestamp
+from swift.common.wsgi import ConfigString, loadapp, WSGIContext
+from swift.container import server as container_server
+from swift.obj import mem_server
+
+
+WORKLOADS = ('put', 'get', 'head', 'listing',
+             'ec-put', 'ec-get', 'ec-head', 'ec-listing')
+PERCENTILES = (50, 90, 99)
+
+OBJECT_PORT = 6200
+CONTAINER_PORT = 6201
+ACCOUNT_PORT = 6202
+
+# modules that talk to backend servers through http_connect
+HTTP_CONNECT_USERS = ('swift.proxy.controllers.base',
+                      'swift.proxy.controllers.obj',
+                      'swift.obj.server',
+                      'swift.container.server')
+
+DEFAULT_PROXY_CONF = """
+[DEFAULT]
+
+[pipeline:main]
+pipeline = catch_errors gatekeeper healthcheck proxy-logging cache
+    container_sync bulk tempurl ratelimit tempauth copy container-quotas
+    account-quotas slo dlo versioned_writes proxy-logging proxy-server
+
+[app:proxy-server]
+use = egg:swift#proxy
+
+[filter:tempauth]
+use = egg:swift#tempauth
+user_test_tester = testing .admin
+
+[filter:healthcheck]
+use = egg:swift#healthcheck
+
+[filter:cache]
+use = egg:swift#memcache
+
+[filter:ratelimit]
+use = egg:swift#ratelimit
+
+[filter:catch_errors]
+use = egg:swift#catch_errors
+
+[filter:container-quotas]
+use = egg:swift#container_quotas
+
+[filter:account-quotas]
+use = egg:swift#account_quotas
+
+[filter:proxy-logging]
+use = egg:swift#proxy_logging
+
+[filter:bulk]
+use = egg:swift#bulk
+
+[filter:slo]
+use = egg:swift#slo
+
+[filter:dlo]
+use = egg:swift#dlo
+
+[filter:tempurl]
+use = egg:swift#tempurl
+
+[filter:gatekeeper]
+use = egg:swift#gatekeeper
+
+[filter:container_sync]
+use = egg:swift#container_sync
+
+[filter:versioned_writes]
+use = egg:swift#versioned_writes
+
+[filter:copy]
+use = egg:swift#copy
+"""
+
+ARG_PARSER = argparse.ArgumentParser(
+    description='Benchmark a complete Swift cluster in a single process')
+ARG_PARSER.add_argument(
+    'workloads', nargs='*', default=WORKLOADS, metavar='workload',
+    help='Workloads to run, from %s (default: all)' % ', '.join(WORKLOADS))
+ARG_PARSER.add_argument(
+    '--requests', '-n', type=int, default=1000,
+    help='Number of requests per workload (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--concurrency', '-c', type=int, default=1,
+    help='Number of requests in flight (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--object-size', '-s', type=int, default=4096,
+    help='Size of the objects in bytes (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--objects', type=int, default=100,
+    help='Number of objects put in each container before the workloads '
+    'run (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--proxy-config', metavar='PATH',
+    help='Proxy server config to load the pipeline from (default: the '
+    'sample pipeline, with tempauth)')
+ARG_PARSER.add_argument(
+    '--user', default='test:tester',
+    help='User to authenticate as (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--key', default='testing',
+    help='Key to authenticate with (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--devices', type=int, default=6,
+    help='Number of devices in the rings (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--part-power', type=int, default=8,
+    help='Partition power of the rings (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--replicas', type=int, default=3,
+    help='Replica count of the account, container and replicated object '
+    'rings (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--ec-type', default='liberasurecode_rs_vand',
+    help='EC type of the erasure coded policy (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--ec-ndata', type=int, default=4,
+    help='Number of EC data fragments (default: %(default)s)')
+ARG_PARSER.add_argument(
+    '--ec-nparity', type=int, default=2,
+    help='Number of EC parity fragments (default: %(default)s)')
+
+
+class InMemoryCache(object):
+    """
+    A process local stand-in for :class:`~swift.common.memcached.MemcacheRing`.
+
+    Values are serialized with JSON, as they would be for memcache, so
+    callers never share the cached objects.
+    """
+
+    def __init__(self):
+        self._store = {}
+
+    def _expiry(self, timeout):
+        if not timeout:
+            return None
+        # like memcache, timeouts of more than 30 days are absolute times
+        return timeout if timeout > 30 * 24 * 60 * 60 else \
+            time.time() + timeout
+
+    def _get(self, key):
+        try:
+            value, serialized, expires = self._store[key]
+        except KeyError:
+            return None
+        if expires is not None and expires <= time.time():
+            del self._store[key]
+            return None
+        return json.loads(value) if serialized else value
+
+    def get(self, key):
+        return self._get(key)
+
+    def get_multi(self, keys, server_key):
+        return [self._get('%s/%s' % (server_key, key)) for key in keys]
+
+    def set(self, key, value, serialize=True, time=0, min_compress_len=0):
+        if serialize:
+            value = json.dumps(value)
+        self._store[key] = (value, serialize, self._expiry(time))
+
+    def set_multi(self, mapping, server_key, serialize=True, time=0,
+                  min_compress_len=0):
+        for key, value in mapping.items():
+            self.set('%s/%s' % (server_key, key), value, serialize, time)
+
+    def incr(self, key, delta=1, time=0):
+        value = max(0, int(self._get(key) or 0) + delta)
+        self._store[key] = (str(value), False, self._expiry(time))
+        return value
+
+    def decr(self, key, delta=1, time=0):
+        return self.incr(key, -delta, time)
+
+    def delete(self, key):
+        self._store.pop(key, None)
+
+
+def dechunk(data):
+    """
+    Strip chunked transfer-encoding from a request body.  Multiphase PUTs
+    send more chunks after a zero-size chunk, so all chunks are kept.
+    """
+    body = []
+    pos = 0
+    while pos < len(data):
+        line_end = data.index('\r\n', pos)
+        size = int(data[pos:line_end].split(';', 1)[0], 16)
+        body.append(data[line_end + 2:line_end + 2 + size])
+        pos = line_end + 2 + size + 2
+    return ''.join(body)
+
+
+class InMemoryConnection(WSGIContext):
+    """
+    Stands in for the HTTPConnection to a backend server.  The request body
+    is buffered, and the server's WSGI application is called when the
+    response is asked for.
+    """
+
+    def __init__(self, app, method, path, headers):
+        super(InMemoryConnection, self).__init__(app)
+        self.method = method
+        self.path = path
+        self.req_headers = HeaderKeyDict(headers or {})
+        self.data = []
+
+    def getexpect(self):
+        # the servers support all the features a PUT can ask them for
+        headers = [('X-' + name[len('X-Backend-'):], 'yes') for name in (
+            'X-Backend-Obj-Metadata-Footer',
+            'X-Backend-Obj-Multiphase-Commit') if name in self.req_headers]
+        return InformationalResponse(headers)
+
+    def send(self, data):
+        self.data.append(data)
+
+    def getresponse(self):
+        body = ''.join(self.data)
+        env = {'REQUEST_METHOD': self.method}
+        if self.req_headers.get('Transfer-Encoding') == 'chunked':
+            # the server reads the request to the end of wsgi.input, as
+            # it would from eventlet's de-chunking input
+            env['wsgi.input'] = WsgiBytesIO(dechunk(body))
+            body = None
+        req = Request.blank(self.path, env, headers=self.req_headers,
+                            body=body)
+        self.resp_iter = iter(self._app_call(req.environ))
+        status, self.reason = self._response_status.split(' ', 1)
+        self.status = int(status)
+        return self
+
+    def getheaders(self):
+        return self._response_headers or []
+
+    def getheader(self, name, default=None):
+        return self._response_header_value(name) or default
+
+    def read(self, amt=None):
+        return next(self.resp_iter, '')
+
+    def close(self):
+        close_iter = getattr(getattr(self, 'resp_iter', None), 'close', None)
+        if close_iter:
+            close_iter()
+
+
+class InformationalResponse(object):
+    status = 100
+    reason = 'Continue'
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def getheaders(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return dict(self.headers).get(name, default)
+
+
+class InMemoryCluster(object):
+    """
+    Account, container and object servers running in this process, with
+    rings and storage policies in a temporary swift_dir.
+
+    Use as a context manager: while it is active, the proxy and the servers
+    send their backend requests to the servers in this cluster.
+
+    :param devices: number of devices in each ring
+    :param part_power: partition power of the rings
+    :param replicas: replica count of the account, container and policy 0
+                     object rings
+    :param ec_type: EC type of policy 1, or None for no EC policy
+    :param ec_ndata: number of EC data fragments
+    :param ec_nparity: number of EC parity fragments
+    """
+
+    def __init__(self, devices=6, part_power=8, replicas=3,
+                 ec_type='liberasurecode_rs_vand', ec_ndata=4, ec_nparity=2):
+        if devices < replicas or (ec_type and devices < ec_ndata + ec_nparity):
+            raise ValueError('Not enough devices (%d) for %d replicas or '
+                             '%d+%d fragments' % (devices, replicas,
+                                                  ec_ndata, ec_nparity))
+        self.swift_dir = tempfile.mkdtemp()
+        self.devices = os.path.join(self.swift_dir, 'node')
+        conf = {'devices': self.devices, 'mount_check': 'false',
+                'swift_dir': self.swift_dir, 'log_requests': 'false'}
+        self.device_names = ['sd%s' % chr(ord('b') + i)
+                             for i in range(devices)]
+        self.apps = {ACCOUNT_PORT: account_server.AccountController(conf),
+                     CONTAINER_PORT: container_server.ContainerController(
+                         conf)}
+        for device in self.device_names:
+            self.apps[OBJECT_PORT, device] = mem_server.ObjectController(conf)
+
+        self._build_ring('account.ring.gz', ACCOUNT_PORT, part_power,
+                         replicas)
+        self._build_ring('container.ring.gz', CONTAINER_PORT, part_power,
+                         replicas)
+        policy_conf = configparser.RawConfigParser()
+        policy_conf.add_section('swift-hash')
+        policy_conf.set('swift-hash', 'swift_hash_path_suffix', 'bench')
+        policy_conf.add_section('storage-policy:0')
+        policy_conf.set('storage-policy:0', 'name', 'replicated')
+        policy_conf.set('storage-policy:0', 'default', 'yes')
+        self._build_ring('object.ring.gz', OBJECT_PORT, part_power, replicas)
+        if ec_type:
+            section = 'storage-policy:1'
+            policy_conf.add_section(section)
+            policy_conf.set(section, 'name', 'ec')
+            policy_conf.set(section, 'policy_type', 'erasure_coding')
+            policy_conf.set(section, 'ec_type', ec_type)
+            policy_conf.set(section, 'ec_num_data_fragments', ec_ndata)
+            policy_conf.set(section, 'ec_num_parity_fragments', ec_nparity)
+            self._build_ring('object-1.ring.gz', OBJECT_PORT, part_power,
+                             ec_ndata + ec_nparity)
+        self.swift_conf = os.path.join(self.swift_dir, 'swift.conf')
+        with open(self.swift_conf, 'w') as fp:
+            policy_conf.write(fp)
+        self._saved = []
+
+    def _build_ring(self, filename, port, part_power, replicas):
+        builder = RingBuilder(part_power, replicas, 1)
+        for i, device in enumerate(self.device_names):
+            builder.add_dev({'id': i, 'region': 1, 'zone': i, 'weight': 1,
+                             'ip': '127.0.0.1', 'port': port,
+                             'device': device})
+        builder.rebalance()
+        builder.get_ring().save(os.path.join(self.swift_dir, filename))
+
+    def http_connect(self, ipaddr, port, device, partition, method, path,
+                     headers=None, query_string=None, ssl=False):
+        """
+        Same signature as :func:`swift.common.bufferedhttp.http_connect`;
+        returns a connection to the server in this cluster.
+        """
+        # servers' container and account updates give the port as a string
+        port = int(port)
+        app = self.apps[port] if port != OBJECT_PORT else \
+            self.apps[port, device]
+        path = quote('/%s/%s%s' % (device, partition, path))
+        if query_string:
+            path += '?' + query_string
+        return InMemoryConnection(app, method, path, headers)
+
+    def create_account(self, account):
+        """
+        PUT an account straight to the account servers, so proxies do not
+        need account_autocreate.
+        """
+        headers = {'X-Timestamp': Timestamp(time.time()).internal}
+        ring = Ring(self.swift_dir, ring_name='account')
+        part, nodes = ring.get_nodes(account)
+        for node in nodes:
+            conn = self.http_connect(node['ip'], node['port'], node['device'],
+                                     part, 'PUT', '/' + account, headers)
+            conn.getresponse().close()
+
+    def __enter__(self):
+        self._saved = [(utils, 'SWIFT_CONF_FILE', utils.SWIFT_CONF_FILE),
+                       (storage_policy, 'SWIFT_CONF_FILE',
+                        storage_policy.SWIFT_CONF_FILE),
+                       (storage_policy, '_POLICIES',
+                        storage_policy._POLICIES)]
+        for name in HTTP_CONNECT_USERS:
+            module = importlib.import_module(name)
+            self._saved.append((module, 'http_connect', module.http_connect))
+            module.http_connect = self.http_connect
+        utils.SWIFT_CONF_FILE = self.swift_conf
+        storage_policy.SWIFT_CONF_FILE = self.swift_conf
+        storage_policy.reload_storage_policies()
+        return self
+
+    def __exit__(self, *exc_info):
+        for module, attr, value in reversed(self._saved):
+            setattr(module, attr, value)
+        self._saved = []
+
+    def close(self):
+        shutil.rmtree(self.swift_dir, ignore_errors=True)
+
+
+def _swift_is_installed():
+    try:
+        pkg_resources.get_distribution('swift')
+    except pkg_resources.DistributionNotFound:
+        return False
+    return True
+
+
+def _entry_point_refs():
+    """
+    Maps ``egg:swift#name`` references to ``call:`` references, read from
+    the setup.cfg of the source tree this module was loaded from.
+    """
+    parser = configparser.RawConfigParser()
+    parser.read(os.path.join(os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))), 'setup.cfg'))
+    refs = {}
+    for group in ('paste.app_factory', 'paste.filter_factory'):
+        for line in parser.get('entry_points', group).splitlines():
+            if '=' in line:
+                name, ref = [part.strip() for part in line.split('=', 1)]
+                refs['egg:swift#' + name] = 'call:' + ref
+    return refs
+
+
+def load_proxy_app(conf_contents, swift_dir, cache):
+    """
+    Load a proxy pipeline from the contents of a proxy server config.
+
+    :param conf_contents: the contents of the config
+    :param swift_dir: the swift_dir to use, whatever the config says
+    :param cache: the cache that replaces memcache in the pipeline
+    :returns: the WSGI application at the start of the pipeline
+    """
+    allow_modify_pipeline = _swift_is_installed()
+    if not allow_modify_pipeline:
+        # running from a source tree; there is no egg to find the entry
+        # points in, and the proxy can't find its required filters by entry
+        # point name, so the pipeline must have them already
+        for egg, call in _entry_point_refs().items():
+            conf_contents = conf_contents.replace(
+                'use = %s\n' % egg, 'use = %s\n' % call)
+    loader = ConfigString(conf_contents)
+    for section in loader.parser.sections():
+        if loader.parser.has_option(section, 'swift_dir'):
+            loader.parser.set(section, 'swift_dir', swift_dir)
+    loader.parser.set('DEFAULT', 'swift_dir', swift_dir)
+    app = loadapp(loader, allow_modify_pipeline=allow_modify_pipeline)
+    pipeline_app = app
+    while pipeline_app is not None:
+        if isinstance(pipeline_app, MemcacheMiddleware):
+            pipeline_app.memcache = cache
+        pipeline_app = getattr(pipeline_app, 'app', None)
+    return app
+
+
+def percentile(sorted_values, percent):
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class Workload(object):
+    """
+    Sends requests for one workload through the proxy, timing each.
+
+    :param name: the workload name
+    :param app: the proxy pipeline
+    :param method: the request method
+    :param paths: request paths, used in turn
+    :param headers: headers for every request
+    :param body: request body, or None
+    """
+
+    def __init__(self, name, app, method, paths, headers, body=None):
+        self.name = name
+        self.app = app
+        self.method = method
+        self.paths = paths
+        self.headers = headers
+        self.body = body
+        self.failures = 0
+
+    def request(self, i):
+        start = time.time()
+        req = Request.blank(self.paths[i % len(self.paths)],
+                            method=self.method, headers=self.headers,
+                            body=self.body)
+        resp = req.get_response(self.app)
+        for _chunk in resp.app_iter or ():
+            pass
+        if not resp.is_success:
+            self.failures += 1
+        return time.time() - start
+
+    def run(self, requests, concurrency):
+        """
+        :returns: a dict of throughput and latency statistics
+        """
+        pool = GreenPool(concurrency)
+        start = time.time()
+        latencies = sorted(pool.imap(self.request, range(requests)))
+        elapsed = time.time() - start
+        stats = {'workload': self.name, 'requests': requests,
+                 'failures': self.failures,
+                 'rate': requests / elapsed if elapsed else float('inf'),
+                 'max': latencies[-1]}
+        for percent in PERCENTILES:
+            stats['p%d' % percent] = percentile(latencies, percent)
+        return stats
+
+
+def print_stats(stats):
+    print('%-10s %8d %8d %10.1f' % (
+        stats['workload'], stats['requests'], stats['failures'],
+        stats['rate']) + ''.join(
+        ' %8.2f' % (stats['p%d' % percent] * 1000)
+        for percent in PERCENTILES) + ' %8.2f' % (stats['max'] * 1000))
+
+
+def setup_workloads(app, container, headers, args):
+    """
+    Create a container and put the objects the workloads use in it.
+
+    :returns: a dict mapping workload names, without any ``ec-`` prefix, to
+              :class:`Workload` instances for the container
+    """
+    resp = Request.blank(container, method='PUT',
+                         headers=headers).get_response(app)
+    if not resp.is_success:
+        raise ValueError('Could not create %s: %s' % (container, resp.status))
+    paths = ['%s/obj-%d' % (container, i) for i in range(args.objects)]
+    body = 'x' * args.object_size
+    Workload('setup', app, 'PUT', paths, headers, body).run(
+        len(paths), args.concurrency)
+    return {'put': Workload('put', app, 'PUT', paths, headers, body),
+            'get': Workload('get', app, 'GET', paths, headers),
+            'head': Workload('head', app, 'HEAD', paths, headers),
+            'listing': Workload('listing', app, 'GET',
+                                [container + '?format=json'], headers)}
+
+
+def run_benchmark(args):
+    ec_workloads = [name for name in args.workloads if name.startswith('ec-')]
+    cluster = InMemoryCluster(
+        devices=args.devices, part_power=args.part_power,
+        replicas=args.replicas,
+        ec_type=args.ec_type if ec_workloads else None,
+        ec_ndata=args.ec_ndata, ec_nparity=args.ec_nparity)
+    try:
+        with cluster:
+            if args.proxy_config:
+                with open(args.proxy_config) as fp:
+                    conf_contents = fp.read()
+            else:
+                conf_contents = DEFAULT_PROXY_CONF
+            app = load_proxy_app(conf_contents, cluster.swift_dir,
+                                 InMemoryCache())
+
+            headers = {}
+            resp = Request.blank('/auth/v1.0', headers={
+                'X-Auth-User': args.user,
+                'X-Auth-Key': args.key}).get_response(app)
+            if resp.is_success:
+                headers['X-Auth-Token'] = resp.headers['X-Auth-Token']
+                account_path = urlparse(resp.headers['X-Storage-Url']).path
+            else:
+                # no tempauth in the pipeline
+                account_path = '/v1/AUTH_bench'
+            cluster.create_account(account_path.rsplit('/', 1)[1])
+
+            workloads = {}
+            if len(ec_workloads) < len(args.workloads):
+                workloads.update(setup_workloads(
+                    app, account_path + '/bench', dict(
+                        headers, **{'X-Storage-Policy': 'replicated'}),
+                    args))
+            if ec_workloads:
+                workloads.update(
+                    ('ec-' + name, workload) for name, workload in
+                    setup_workloads(app, account_path + '/bench-ec', dict(
+                        headers, **{'X-Storage-Policy': 'ec'}),
+                        args).items())
+
+            print('%-10s %8s %8s %10s' % (
+                'workload', 'requests', 'failures', 'req/s') + ''.join(
+                ' %8s' % ('p%d ms' % percent) for percent in PERCENTILES) +
+                ' %8s' % 'max ms')
+            for name in args.workloads:
+                stats = workloads[name].run(args.requests, args.concurrency)
+                stats['workload'] = name
+                print_stats(stats)
+    finally:
+        cluster.close()
+
+
+def main(argv=None):
+    args = ARG_PARSER.parse_args(argv)
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        sys.stderr.write('Unknown workloads: %s\n' % ', '.join(
+            sorted(unknown)))
+        return 1
+    if args.requests < 1 or args.concurrency < 1:
+        sys.stderr.write('--requests and --concurrency must be positive\n')
+        return 1
+    try:
+        run_benchmark(args)
+    except (IOError, ValueError) as err:
+        sys.stderr.write('Error: %s\n' % err)
+        return 1
+    return 0
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import bisect
 import os
 import random
 import math
@@ -21,18 +22,26 @@ import shutil
 import uuid
 import errno
 import re
+import zlib
 from contextlib import contextmanager
 from swift import gettext_ as _
 
-from eventlet import GreenPool, sleep, Timeout
+from eventlet import GreenPool, sleep, spawn, Timeout
 from eventlet.green import subprocess
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 import swift.common.db
 from swift.common.direct_client import quote
 from swift.common.utils import get_logger, whataremyips, storage_directory, \
-    renamer, mkdirs, lock_parent_directory, config_true_value, \
+    renamer, mkdirs, lock_file, lock_parent_directory, config_true_value, \
     unlink_older_than, dump_recon_cache, rsync_module_interpolation, ismount, \
-    json, Timestamp
+    json, Timestamp, ThreadPool
 from swift.common import ring
 from swift.common.ring.utils import is_local_device
 from swift.common.http import HTTP_NOT_FOUND, HTTP_INSUFFICIENT_STORAGE
@@ -44,6 +53,10 @@ from swift.common.swob import Response, HTTPNotFound, HTTPNoContent, \
 
 
 DEBUG_TIMINGS_THRESHOLD = 10
+# Change journals stop growing at this size, so one that no replicator
+# empties cannot fill the device; changes that don't fit are picked up by
+# the next sweep.
+MAX_CHANGE_JOURNAL_SIZE = 16 * 1024 * 1024
 
 
 def quarantine_db(object_file, server_type):
@@ -124,6 +137,235 @@ def roundrobin_datadirs(datadirs):
                 its.remove(it)
 
 
+def _list_dir(path):
+    """
+    Returns the names of the entries of a directory, and the names of those
+    that are directories. With scandir() available, telling directories
+    apart takes no stat() calls on most filesystems.
+
+    :param path: path to the directory
+    :returns: a tuple of (names, directory names)
+    """
+    if scandir is None:
+        names = os.listdir(path)
+        return names, [name for name in names
+                       if os.path.isdir(os.path.join(path, name))]
+    names = []
+    dir_names = []
+    for entry in scandir(path):
+        names.append(entry.name)
+        if entry.is_dir():
+            dir_names.append(entry.name)
+    return names, dir_names
+
+
+def _list_partition(part_dir):
+    """
+    Returns the .db files found (in their proper places) in a partition dir,
+    removing empty suffix, hash and partition dirs like
+    :func:`roundrobin_datadirs` does. Meant to run in a worker thread.
+
+    :param part_dir: path to the partition dir
+    :returns: a list of paths to .db files
+    """
+    try:
+        suffixes, suffix_dirs = _list_dir(part_dir)
+    except OSError as e:
+        if e.errno not in (errno.ENOTDIR, errno.ENOENT):
+            raise
+        return []
+    if not suffixes:
+        os.rmdir(part_dir)
+        return []
+    db_files = []
+    for suffix in suffix_dirs:
+        suff_dir = os.path.join(part_dir, suffix)
+        hashes, hash_dirs = _list_dir(suff_dir)
+        if not hashes:
+            os.rmdir(suff_dir)
+            continue
+        for hsh in hash_dirs:
+            hash_dir = os.path.join(suff_dir, hsh)
+            object_file = os.path.join(hash_dir, hsh + '.db')
+            if os.path.exists(object_file):
+                db_files.append(object_file)
+            else:
+                try:
+                    os.rmdir(hash_dir)
+                except OSError as e:
+                    if e.errno is not errno.ENOTEMPTY:
+                        raise
+    return db_files
+
+
+def get_walk_cursor(datadir):
+    """
+    Returns the path of the file holding the last partition walked by
+    :func:`threaded_roundrobin_datadirs` in a data dir; it sits beside the
+    data dir on the same device, e.g. /srv/node/sda/containers.cursor.
+
+    :param datadir: path to the data dir
+    """
+    return os.path.normpath(datadir) + '.cursor'
+
+
+def _load_cursor(cursor_file):
+    try:
+        with open(cursor_file) as fp:
+            return fp.read().strip()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return ''
+
+
+def _save_cursor(cursor_file, partition):
+    tmp_file = cursor_file + '.tmp'
+    with open(tmp_file, 'w') as fp:
+        fp.write(partition)
+    os.rename(tmp_file, cursor_file)
+
+
+def threaded_roundrobin_datadirs(datadirs, pools):
+    """
+    Generator like :func:`roundrobin_datadirs`, but with each data dir's
+    directory I/O done in a worker thread of its own, one partition ahead of
+    the DBs being yielded, and with the partitions walked in order starting
+    after the one recorded in the data dir's cursor file. The cursor is
+    updated as each partition is finished, so a walk that is cut short, by a
+    restart for instance, is picked up where it stopped by the next one.
+
+    :param datadirs: a list of (path, node_id) to walk
+    :param pools: a dict of data dir path to the
+                  :class:`~swift.common.utils.ThreadPool` to use for it;
+                  missing pools are added with a single thread each
+    :returns: A generator of (partition, path_to_db_file, node_id)
+    """
+
+    def walk_datadir(datadir, node_id, pool):
+        cursor_file = get_walk_cursor(datadir)
+        cursor = pool.run_in_thread(_load_cursor, cursor_file)
+        partitions = sorted(pool.run_in_thread(os.listdir, datadir))
+        start = bisect.bisect_right(partitions, cursor)
+        partitions = partitions[start:] + partitions[:start]
+        pending = None
+        for i, partition in enumerate(partitions):
+            if pending is None:
+                pending = spawn(pool.run_in_thread, _list_partition,
+                                os.path.join(datadir, partition))
+            db_files = pending.wait()
+            pending = None
+            if i + 1 < len(partitions):
+                pending = spawn(pool.run_in_thread, _list_partition,
+                                os.path.join(datadir, partitions[i + 1]))
+            for object_file in db_files:
+                yield (partition, object_file, node_id)
+            pool.run_in_thread(_save_cursor, cursor_file, partition)
+
+    its = []
+    for datadir, node_id in datadirs:
+        if datadir not in pools:
+            pools[datadir] = ThreadPool(nthreads=1)
+        its.append(walk_datadir(datadir, node_id, pools[datadir]))
+    while its:
+        for it in its:
+            try:
+                yield next(it)
+            except StopIteration:
+                its.remove(it)
+
+
+def get_change_journal(datadir):
+    """
+    Returns the path of the change journal for a data dir; it sits beside
+    the data dir on the same device, e.g. /srv/node/sda/containers.journal.
+
+    :param datadir: path to the data dir
+    """
+    return os.path.normpath(datadir) + '.journal'
+
+
+def journal_db_change(db_file):
+    """
+    Records in its device's change journal that a DB was modified, so that
+    a replicator reading the journal picks it up on its next pass. Nothing
+    is recorded once the journal has reached MAX_CHANGE_JOURNAL_SIZE.
+
+    :param db_file: path to the DB file, in its place under the data dir
+    """
+    hash_dir = os.path.dirname(db_file)
+    datadir = os.path.dirname(os.path.dirname(os.path.dirname(hash_dir)))
+    with lock_file(get_change_journal(datadir), append=True,
+                   unlink=False) as fp:
+        fp.seek(0, os.SEEK_END)
+        if fp.tell() < MAX_CHANGE_JOURNAL_SIZE:
+            fp.write(os.path.relpath(db_file, datadir) + '\n')
+
+
+def read_change_journal(datadir):
+    """
+    Reads and empties the change journal of a data dir.
+
+    :param datadir: path to the data dir
+    :returns: a set of paths to DB files modified since the journal was last
+              read; some may have been removed since
+    """
+    journal = get_change_journal(datadir)
+    if not os.path.exists(journal):
+        return set()
+    with lock_file(journal, unlink=False) as fp:
+        lines = fp.read().splitlines()
+        fp.seek(0)
+        fp.truncate()
+    return set(os.path.join(datadir, line) for line in lines if line)
+
+
+def roundrobin_journals(datadirs):
+    """
+    Generator like :func:`roundrobin_datadirs`, but yielding only the .db
+    files recorded in each data dir's change journal. The journals are all
+    read, and emptied, before the first DB is yielded.
+
+    :param datadirs: a list of (path, node_id) to read the journals of
+    :returns: A generator of (partition, path_to_db_file, node_id)
+    """
+
+    def walk_journal(datadir, node_id, db_files):
+        for object_file in db_files:
+            if os.path.exists(object_file):
+                partition = os.path.relpath(
+                    object_file, datadir).split(os.path.sep)[0]
+                yield (partition, object_file, node_id)
+
+    its = [walk_journal(datadir, node_id, read_change_journal(datadir))
+           for datadir, node_id in datadirs]
+    while its:
+        for it in its:
+            try:
+                yield next(it)
+            except StopIteration:
+                its.remove(it)
+
+
+def load_replicate_args(req):
+    """
+    Decodes the json-encoded RPC call in the body of a REPLICATE request,
+    inflating the body first if it was sent with ``Content-Encoding:
+    deflate``.
+
+    :param req: the REPLICATE request
+    :returns: the list of RPC arguments
+    :raises ValueError: if the body can not be decoded
+    """
+    body = req.environ['wsgi.input'].read()
+    if req.headers.get('Content-Encoding', '').lower() == 'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error as err:
+            raise ValueError(str(err))
+    return json.loads(body)
+
+
 class ReplConnection(BufferedHTTPConnection):
     """
     Helper to simplify REPLICATEing to a remote server.
@@ -144,10 +386,41 @@ class ReplConnection(BufferedHTTPConnection):
 
         :returns: bufferedhttp response object
         """
+        if not self.send_replicate(args):
+            return None
+        return self.get_replicate_response()
+
+    def send_replicate(self, args, compress=False):
+        """
+        Send an HTTP REPLICATE request without waiting for its response, so
+        that the caller can get on with other work while the remote server
+        handles it.
+
+        :param args: list of json-encodable objects
+        :param compress: if True, deflate the request body
+
+        :returns: True if the request was sent
+        """
         try:
             body = json.dumps(args)
-            self.request('REPLICATE', self.path, body,
-                         {'Content-Type': 'application/json'})
+            headers = {'Content-Type': 'application/json'}
+            if compress:
+                body = zlib.compress(body, 1)
+                headers['Content-Encoding'] = 'deflate'
+            self.request('REPLICATE', self.path, body, headers)
+            return True
+        except (Exception, Timeout):
+            self.logger.exception(
+                _('ERROR reading HTTP response from %s'), self.node)
+            return False
+
+    def get_replicate_response(self):
+        """
+        Read the response to a REPLICATE request sent by send_replicate.
+
+        :returns: bufferedhttp response object
+        """
+        try:
             response = self.getresponse()
             response.data = response.read()
             return response
@@ -176,8 +449,19 @@ class Replicator(Daemon):
         self._local_device_ids = set()
         self.per_diff = int(conf.get('per_diff', 1000))
         self.max_diffs = int(conf.get('max_diffs') or 100)
+        self.usync_stream = config_true_value(
+            conf.get('usync_stream', 'no'))
+        self.usync_batches = max(
+            1, int(conf.get('usync_batches', 10)))
         self.interval = int(conf.get('interval') or
                             conf.get('run_pause') or 30)
+        self.change_journal = config_true_value(
+            conf.get('change_journal', 'no'))
+        self.sweep_interval = float(conf.get('sweep_interval', 3600))
+        self._last_sweep = 0
+        self.threaded_walk = config_true_value(
+            conf.get('threaded_walk', 'no'))
+        self._walk_pools = {}
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.rsync_compress = config_true_value(
@@ -326,6 +610,13 @@ class Replicator(Daemon):
         self.logger.increment('diffs')
         self.logger.debug('Syncing chunks with %s, starting at %s',
                           http.host, point)
+        if self.usync_stream:
+            success = self._usync_db_stream(
+                point, broker, http, remote_id, local_id)
+            if success is not None:
+                return success
+            self.logger.debug('Streaming usync not supported by %s, falling '
+                              'back to syncing chunks', http.host)
         sync_table = broker.get_syncs()
         objects = broker.get_items_since(point, self.per_diff)
         diffs = 0
@@ -361,6 +652,65 @@ class Replicator(Daemon):
                 return True
         return False
 
+    def _usync_db_stream(self, point, broker, http, remote_id, local_id):
+        """
+        Sync a db by streaming all records since the last sync in large,
+        deflated merge_items requests, each usync_batches times the
+        size of a per_diff chunk.  The next request's records are read from
+        the db while the remote server merges the previous ones.
+
+        :param point: synchronization high water mark between the replicas
+        :param broker: database broker object
+        :param http: ReplConnection object for the remote server
+        :param remote_id: database id for the remote replica
+        :param local_id: database id for the local replica
+
+        :returns: boolean indicating completion and success, or None if the
+                  remote server does not accept deflated requests
+        """
+        rows_per_request = self.per_diff * self.usync_batches
+        timeout = self.node_timeout * self.usync_batches
+        sync_table = broker.get_syncs()
+        objects = broker.get_items_since(point, rows_per_request)
+        diffs = 0
+        while len(objects) and diffs < self.max_diffs:
+            diffs += 1
+            with Timeout(timeout):
+                if not http.send_replicate(['merge_items', objects, local_id],
+                                           compress=True):
+                    return False
+            sent_point = objects[-1]['ROWID']
+            objects = broker.get_items_since(sent_point, rows_per_request)
+            with Timeout(timeout):
+                response = http.get_replicate_response()
+            if not response or response.status >= 300 or response.status < 200:
+                if response and response.status == 400 and diffs == 1:
+                    # an older server that can not inflate the body
+                    return None
+                if response:
+                    self.logger.error(_('ERROR Bad response %(status)s from '
+                                        '%(host)s'),
+                                      {'status': response.status,
+                                       'host': http.host})
+                return False
+            point = sent_point
+        if objects:
+            self.logger.debug(
+                'Synchronization for %s has fallen more than '
+                '%s rows behind; moving on and will try again next pass.',
+                broker, self.max_diffs * rows_per_request)
+            self.stats['diff_capped'] += 1
+            self.logger.increment('diff_caps')
+        else:
+            with Timeout(self.node_timeout):
+                response = http.replicate('merge_syncs', sync_table)
+            if response and 200 <= response.status < 300:
+                broker.merge_syncs([{'remote_id': remote_id,
+                                     'sync_point': point}],
+                                   incoming=False)
+                return True
+        return False
+
     def _in_sync(self, rinfo, info, broker, local_sync):
         """
         Determine whether or not two replicas of a databases are considered
@@ -590,6 +940,13 @@ class Replicator(Daemon):
                                 for target_dev in repl_nodes])
         self.stats['success'] += len(target_devs_info - failure_devs_info)
         self._add_failure_stats(failure_devs_info)
+        if self.change_journal and failure_devs_info and \
+                os.path.exists(object_file):
+            # try it again on the next pass rather than the next sweep
+            try:
+                journal_db_change(object_file)
+            except (Exception, Timeout):
+                self.logger.exception(_('ERROR journaling %s'), object_file)
 
         self.logger.timing_since('timing', start_time)
 
@@ -626,6 +983,11 @@ class Replicator(Daemon):
     def report_up_to_date(self, full_info):
         return True
 
+    def _walk_datadirs(self, dirs):
+        if self.threaded_walk:
+            return threaded_roundrobin_datadirs(dirs, self._walk_pools)
+        return roundrobin_datadirs(dirs)
+
     def run_once(self, *args, **kwargs):
         """Run a replication pass once."""
         self._zero_stats()
@@ -662,9 +1024,27 @@ class Replicator(Daemon):
                               "file, not replicating",
                               ", ".join(ips), self.port)
         self.logger.info(_('Beginning replication run'))
-        for part, object_file, node_id in roundrobin_datadirs(dirs):
-            self.cpool.spawn_n(
-                self._replicate_object, part, object_file, node_id)
+        if self.change_journal:
+            # DBs changed since the last pass go first; the rest are only
+            # swept every sweep_interval, and on the first pass
+            changed = set()
+            for part, object_file, node_id in roundrobin_journals(dirs):
+                changed.add(object_file)
+                self.cpool.spawn_n(
+                    self._replicate_object, part, object_file, node_id)
+            self.logger.info(_('Replicating %d changed dbs'), len(changed))
+            begin = time.time()
+            if begin - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = begin
+                self.logger.info(_('Sweeping unchanged dbs'))
+                for part, object_file, node_id in self._walk_datadirs(dirs):
+                    if object_file not in changed:
+                        self.cpool.spawn_n(self._replicate_object, part,
+                                           object_file, node_id)
+        else:
+            for part, object_file, node_id in self._walk_datadirs(dirs):
+                self.cpool.spawn_n(
+                    self._replicate_object, part, object_file, node_id)
         self.cpool.waitall()
         self.logger.info(_('Replication run OVER'))
         self._report_stats()
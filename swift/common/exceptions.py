@@ -105,10 +105,18 @@ class DiskFileXattrNotSupported(DiskFileError):
     pass
 
 
+class DiskFileDeviceBusy(DiskFileError):
+    pass
+
+
 class DeviceUnavailable(SwiftException):
     pass
 
 
+class ThreadPoolDead(SwiftException):
+    pass
+
+
 class InvalidAccountInfo(SwiftException):
     pass
 
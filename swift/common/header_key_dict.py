@@ -20,14 +20,20 @@ class HeaderKeyDict(dict):
     """
     A dict that title-cases all keys on the way in, so as to be
     case-insensitive.
+
+    Copying a HeaderKeyDict, or building or updating one from another, copies
+    the already normalized items directly.
     """
     def __init__(self, base_headers=None, **kwargs):
         if base_headers:
             self.update(base_headers)
-        self.update(kwargs)
+        if kwargs:
+            self.update(kwargs)
 
     def update(self, other):
-        if hasattr(other, 'keys'):
+        if isinstance(other, HeaderKeyDict):
+            dict.update(self, other)
+        elif hasattr(other, 'keys'):
             for key in other.keys():
                 self[key.title()] = other[key]
         else:
@@ -38,6 +44,8 @@ class HeaderKeyDict(dict):
         return dict.get(self, key.title())
 
     def __setitem__(self, key, value):
+        if type(value) is str:
+            return dict.__setitem__(self, key.title(), value)
         if value is None:
             self.pop(key.title(), None)
         elif six.PY2 and isinstance(value, six.text_type):
@@ -63,3 +71,8 @@ class HeaderKeyDict(dict):
 
     def pop(self, key, default=None):
         return dict.pop(self, key.title(), default)
+
+    def copy(self):
+        copied = HeaderKeyDict()
+        dict.update(copied, self)
+        return copied
@@ -134,7 +134,8 @@ from swift.common.swob import Request, Response, \
 from swift.common.utils import get_logger, \
     RateLimitedIterator, read_conf_dir, quote, close_if_possible, \
     closing_if_possible
-from swift.common.request_helpers import SegmentedIterable
+from swift.common.request_helpers import SegmentedIterable, \
+    DEFAULT_READ_AHEAD_BYTES
 from swift.common.wsgi import WSGIContext, make_subrequest
 
 
@@ -325,7 +326,9 @@ class GetContext(WSGIContext):
                 req, self.dlo.app, listing_iter, ua_suffix="DLO MultipartGET",
                 swift_source="DLO", name=req.path, logger=self.logger,
                 max_get_time=self.dlo.max_get_time,
-                response_body_length=actual_content_length)
+                response_body_length=actual_content_length,
+                read_ahead_segments=self.dlo.read_ahead_segments,
+                read_ahead_bytes=self.dlo.read_ahead_bytes)
 
             try:
                 app_iter.validate_first_segment()
@@ -375,6 +378,10 @@ class DynamicLargeObject(object):
             'rate_limit_after_segment', '10'))
         self.rate_limit_segments_per_sec = int(conf.get(
             'rate_limit_segments_per_sec', '1'))
+        self.read_ahead_segments = max(0, int(conf.get(
+            'read_ahead_segments', '0')))
+        self.read_ahead_bytes = int(conf.get(
+            'read_ahead_bytes', DEFAULT_READ_AHEAD_BYTES))
 
     def _populate_config_from_old_location(self, conf):
         if ('rate_limit_after_segment' in conf or
@@ -69,11 +69,32 @@ needed. With the doubled proxy logs, any consumer/processor of swift's proxy
 logs should look at the swift.source field, the rightmost log value, to decide
 if this is a middleware subrequest or not. A log processor calculating
 bandwidth usage will want to only sum up logs with no swift.source.
+
+By default each access log line is formatted and emitted through the logging
+stack while the request is being completed. Setting ``access_log_buffer_size``
+to a positive number enables a buffered pipeline instead: the raw log fields
+are kept in a bounded buffer and a background greenthread formats and emits
+them in batches every ``access_log_buffer_flush_interval`` seconds, either
+through the configured access logger (syslog/UDP) or, if
+``access_log_buffer_file`` is set, by appending each batch to that file with
+a single write.  When the buffer is full, ``access_log_buffer_overflow``
+decides what happens:
+
+* ``drop_newest`` (the default) discards the line being logged.
+* ``drop_oldest`` discards the oldest buffered line to make room.
+* ``flush`` emits the buffered lines synchronously on the request path,
+  applying backpressure rather than losing any lines.
+
+Every flush reports ``access_log.buffered`` (lines accepted into the buffer)
+and ``access_log.dropped`` (lines discarded on overflow) to StatsD.
 """
 
+import os
 import sys
 import time
+from collections import deque
 
+from eventlet import sleep, spawn
 import six
 from six.moves.urllib.parse import quote, unquote
 from swift.common.swob import Request
@@ -84,6 +105,105 @@ from swift.common.utils import (get_logger, get_remote_client,
 from swift.common.storage_policy import POLICIES
 
 QUOTE_SAFE = '/:'
+ACCESS_LOG_OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'flush')
+
+
+class AccessLogBuffer(object):
+    """
+    Bounded buffer of access log records which are formatted and emitted in
+    batches by a background greenthread.
+
+    :param logger: logger used to emit the lines (unless ``log_file`` is
+                   set) and to report buffer metrics
+    :param formatter: callable turning a buffered record into a log line
+    :param size: maximum number of records held in the buffer
+    :param flush_interval: seconds between background flushes
+    :param overflow: one of ``drop_newest``, ``drop_oldest`` or ``flush``
+    :param log_file: optional path; if given, each batch is appended to this
+                     file instead of being sent through ``logger``
+    """
+
+    def __init__(self, logger, formatter, size, flush_interval=1.0,
+                 overflow='drop_newest', log_file=None):
+        if size < 1:
+            raise ValueError('access log buffer size must be positive')
+        if overflow not in ACCESS_LOG_OVERFLOW_POLICIES:
+            raise ValueError('Invalid access_log_buffer_overflow %r, '
+                             'must be one of %s' % (
+                                 overflow,
+                                 ', '.join(ACCESS_LOG_OVERFLOW_POLICIES)))
+        self.logger = logger
+        self.formatter = formatter
+        self.size = size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.log_file = log_file
+        self.records = deque()
+        # counters since the last flush, reported as metrics on flush
+        self.buffered = 0
+        self.dropped = 0
+        self._flusher = None
+        self._flusher_pid = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        """
+        Add a record to the buffer, applying the overflow policy if the
+        buffer is full.
+
+        :returns: True if the record was buffered, False if it was dropped
+        """
+        if len(self.records) >= self.size:
+            if self.overflow == 'drop_newest':
+                self.dropped += 1
+                return False
+            elif self.overflow == 'drop_oldest':
+                self.records.popleft()
+                self.dropped += 1
+            else:
+                self.flush()
+        self.records.append(record)
+        self.buffered += 1
+        self._ensure_flusher()
+        return True
+
+    def _ensure_flusher(self):
+        # The middleware may be instantiated before the wsgi server forks its
+        # workers, so the flusher is started lazily in each worker process.
+        pid = os.getpid()
+        if self._flusher is None or self._flusher_pid != pid:
+            self._flusher_pid = pid
+            self._flusher = spawn(self._run)
+
+    def _run(self):
+        while True:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception('Error flushing access log buffer')
+
+    def flush(self):
+        """
+        Format and emit all buffered records and report buffer metrics.
+        """
+        records, self.records = self.records, deque()
+        buffered, self.buffered = self.buffered, 0
+        dropped, self.dropped = self.dropped, 0
+        if records:
+            lines = [self.formatter(record) for record in records]
+            if self.log_file:
+                with open(self.log_file, 'a') as fp:
+                    fp.write(''.join(line + '\n' for line in lines))
+            else:
+                for line in lines:
+                    self.logger.info(line)
+        if buffered:
+            self.logger.update_stats('access_log.buffered', buffered)
+        if dropped:
+            self.logger.update_stats('access_log.dropped', dropped)
 
 
 class ProxyLoggingMiddleware(object):
@@ -114,7 +234,9 @@ class ProxyLoggingMiddleware(object):
                     'log_udp_port', 'log_statsd_host', 'log_statsd_port',
                     'log_statsd_default_sample_rate',
                     'log_statsd_sample_rate_factor',
-                    'log_statsd_metric_prefix'):
+                    'log_statsd_metric_prefix', 'log_statsd_aggregate',
+                    'log_statsd_flush_interval', 'log_statsd_max_packet_size',
+                    'log_statsd_reservoir_size', 'log_statsd_max_metrics'):
             value = conf.get('access_' + key, conf.get(key, None))
             if value:
                 access_log_conf[key] = value
@@ -123,6 +245,16 @@ class ProxyLoggingMiddleware(object):
         self.access_logger.set_statsd_prefix('proxy-server')
         self.reveal_sensitive_prefix = int(
             conf.get('reveal_sensitive_prefix', 16))
+        self.log_buffer = None
+        buffer_size = int(conf.get('access_log_buffer_size', 0))
+        if buffer_size > 0:
+            self.log_buffer = AccessLogBuffer(
+                self.access_logger, self.format_log_line, buffer_size,
+                flush_interval=float(conf.get(
+                    'access_log_buffer_flush_interval', 1.0)),
+                overflow=conf.get('access_log_buffer_overflow',
+                                  'drop_newest').strip().lower(),
+                log_file=conf.get('access_log_buffer_file') or None)
 
     def method_from_req(self, req):
         return req.environ.get('swift.orig_req_method', req.method)
@@ -152,10 +284,6 @@ class ProxyLoggingMiddleware(object):
         :param resp_headers: dict of the response headers
         """
         resp_headers = resp_headers or {}
-        req_path = get_valid_utf8_str(req.path)
-        the_request = quote(unquote(req_path), QUOTE_SAFE)
-        if req.query_string:
-            the_request = the_request + '?' + req.query_string
         logged_headers = None
         if self.log_hdrs:
             if self.log_hdrs_only:
@@ -167,37 +295,32 @@ class ProxyLoggingMiddleware(object):
                                            for k, v in req.headers.items())
 
         method = self.method_from_req(req)
-        end_gmtime_str = time.strftime('%d/%b/%Y/%H/%M/%S',
-                                       time.gmtime(end_time))
-        duration_time_str = "%.4f" % (end_time - start_time)
-        start_time_str = "%.9f" % start_time
-        end_time_str = "%.9f" % end_time
         policy_index = get_policy_index(req.headers, resp_headers)
-        self.access_logger.info(' '.join(
-            quote(str(x) if x else '-', QUOTE_SAFE)
-            for x in (
-                get_remote_client(req),
-                req.remote_addr,
-                end_gmtime_str,
-                method,
-                the_request,
-                req.environ.get('SERVER_PROTOCOL'),
-                status_int,
-                req.referer,
-                req.user_agent,
-                self.obscure_sensitive(req.headers.get('x-auth-token')),
-                bytes_received,
-                bytes_sent,
-                req.headers.get('etag', None),
-                req.environ.get('swift.trans_id'),
-                logged_headers,
-                duration_time_str,
-                req.environ.get('swift.source'),
-                ','.join(req.environ.get('swift.log_info') or ''),
-                start_time_str,
-                end_time_str,
-                policy_index
-            )))
+        record = (
+            get_remote_client(req),
+            req.remote_addr,
+            method,
+            req.path,
+            req.query_string,
+            req.environ.get('SERVER_PROTOCOL'),
+            status_int,
+            req.referer,
+            req.user_agent,
+            self.obscure_sensitive(req.headers.get('x-auth-token')),
+            bytes_received,
+            bytes_sent,
+            req.headers.get('etag', None),
+            req.environ.get('swift.trans_id'),
+            logged_headers,
+            req.environ.get('swift.source'),
+            ','.join(req.environ.get('swift.log_info') or ''),
+            start_time,
+            end_time,
+            policy_index)
+        if self.log_buffer is None:
+            self.access_logger.info(self.format_log_line(record))
+        else:
+            self.log_buffer.append(record)
 
         # Log timing and bytes-transferred data to StatsD
         metric_name = self.statsd_metric_name(req, status_int, method)
@@ -218,6 +341,48 @@ class ProxyLoggingMiddleware(object):
             self.access_logger.update_stats(metric_name_policy + '.xfer',
                                             bytes_received + bytes_sent)
 
+    def format_log_line(self, record):
+        """
+        Format the access log line for a record built by log_request.
+
+        :param record: tuple of the raw log fields
+        :returns: the space-separated, url-encoded log line
+        """
+        (client_ip, remote_addr, method, req_path, query_string, protocol,
+         status_int, referer, user_agent, auth_token, bytes_received,
+         bytes_sent, etag, trans_id, logged_headers, source, log_info,
+         start_time, end_time, policy_index) = record
+        the_request = quote(unquote(get_valid_utf8_str(req_path)), QUOTE_SAFE)
+        if query_string:
+            the_request = the_request + '?' + query_string
+        end_gmtime_str = time.strftime('%d/%b/%Y/%H/%M/%S',
+                                       time.gmtime(end_time))
+        return ' '.join(
+            quote(str(x) if x else '-', QUOTE_SAFE)
+            for x in (
+                client_ip,
+                remote_addr,
+                end_gmtime_str,
+                method,
+                the_request,
+                protocol,
+                status_int,
+                referer,
+                user_agent,
+                auth_token,
+                bytes_received,
+                bytes_sent,
+                etag,
+                trans_id,
+                logged_headers,
+                "%.4f" % (end_time - start_time),
+                source,
+                log_info,
+                "%.9f" % start_time,
+                "%.9f" % end_time,
+                policy_index
+            ))
+
     def get_metric_name_type(self, req):
         if req.path.startswith('/v1/'):
             try:
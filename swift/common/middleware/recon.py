@@ -159,7 +159,9 @@ class ReconMiddleware(object):
                                           self.container_recon_cache)
         elif recon_type == 'object':
             replication_list += ['object_replication_time',
-                                 'object_replication_last']
+                                 'object_replication_last',
+                                 'object_replication_queue',
+                                 'object_reconstruction_plan']
             return self._from_recon_cache(replication_list,
                                           self.object_recon_cache)
         else:
@@ -217,7 +217,7 @@ from swift.common.utils import get_logger, config_true_value, \
     register_swift_info, RateLimitedIterator, quote, close_if_possible, \
     closing_if_possible, LRUCache, StreamingPile
 from swift.common.request_helpers import SegmentedIterable, \
-    get_sys_meta_prefix, update_etag_is_at_header
+    get_sys_meta_prefix, update_etag_is_at_header, DEFAULT_READ_AHEAD_BYTES
 from swift.common.constraints import check_utf8, MAX_BUFFERED_SLO_SEGMENTS
 from swift.common.http import HTTP_NOT_FOUND, HTTP_UNAUTHORIZED, is_success
 from swift.common.wsgi import WSGIContext, make_subrequest
@@ -780,7 +780,9 @@ class SloGetContext(WSGIContext):
             name=req.path, logger=self.slo.logger,
             ua_suffix="SLO MultipartGET",
             swift_source="SLO",
-            max_get_time=self.slo.max_get_time)
+            max_get_time=self.slo.max_get_time,
+            read_ahead_segments=self.slo.read_ahead_segments,
+            read_ahead_bytes=self.slo.read_ahead_bytes)
 
         try:
             segmented_iter.validate_first_segment()
@@ -831,6 +833,10 @@ class StaticLargeObject(object):
             'rate_limit_segments_per_sec', '1'))
         self.concurrency = min(1000, max(0, int(self.conf.get(
             'concurrency', '2'))))
+        self.read_ahead_segments = max(0, int(self.conf.get(
+            'read_ahead_segments', '0')))
+        self.read_ahead_bytes = int(self.conf.get(
+            'read_ahead_bytes', DEFAULT_READ_AHEAD_BYTES))
         delete_concurrency = int(self.conf.get(
             'delete_concurrency', self.concurrency))
         self.bulk_deleter = Bulk(
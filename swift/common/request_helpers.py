@@ -24,8 +24,10 @@ import hashlib
 import itertools
 import sys
 import time
+from collections import deque
 
 import six
+from eventlet import Timeout, spawn
 from six.moves.urllib.parse import unquote
 from swift.common.header_key_dict import HeaderKeyDict
 
@@ -45,6 +47,7 @@ from swift.common.wsgi import make_subrequest
 
 
 OBJECT_TRANSIENT_SYSMETA_PREFIX = 'x-object-transient-sysmeta-'
+DEFAULT_READ_AHEAD_BYTES = 16 * 1024 * 1024  # 16 MiB
 
 
 def get_param(req, name, default=None):
@@ -298,6 +301,73 @@ def copy_header_subset(from_r, to_r, condition):
             to_r.headers[k] = v
 
 
+class SegmentReadAhead(object):
+    """
+    A segment GET started before the client has reached the segment. The
+    GET runs in its own greenthread, which goes on to buffer the body until
+    the segment is needed or the buffer space it shares with the other
+    segments being read ahead runs out. Iterating over it yields the
+    buffered body, then the rest of it.
+
+    :param app: WSGI application from which the segment will come
+    :param seg_req: the segment's subrequest
+    :param budget: a dict whose 'bytes' are the buffer space left, shared
+                   between segments
+    """
+
+    def __init__(self, app, seg_req, budget):
+        self.budget = budget
+        self.chunks = deque()
+        self.resp = None
+        self.body = None
+        self.exc_info = None
+        self.stopping = False
+        self.thread = spawn(self._read, app, seg_req)
+
+    def _read(self, app, seg_req):
+        try:
+            self.resp = seg_req.get_response(app)
+            if not is_success(self.resp.status_int):
+                return
+            self.body = iter(self.resp.app_iter)
+            while not self.stopping and self.budget['bytes'] > 0:
+                try:
+                    chunk = next(self.body)
+                except StopIteration:
+                    self.body = None
+                    break
+                self.chunks.append(chunk)
+                self.budget['bytes'] -= len(chunk)
+        except (Exception, Timeout):
+            self.exc_info = sys.exc_info()
+
+    def get_response(self):
+        """
+        Stops reading ahead and returns the segment's response.
+        """
+        self.stopping = True
+        self.thread.wait()
+        if self.exc_info:
+            six.reraise(*self.exc_info)
+        return self.resp
+
+    def __iter__(self):
+        while self.chunks:
+            chunk = self.chunks.popleft()
+            self.budget['bytes'] += len(chunk)
+            yield chunk
+        if self.body is not None:
+            for chunk in self.body:
+                yield chunk
+
+    def close(self):
+        self.thread.kill()
+        while self.chunks:
+            self.budget['bytes'] += len(self.chunks.popleft())
+        if self.resp is not None:
+            close_if_possible(self.resp.app_iter)
+
+
 class SegmentedIterable(object):
     """
     Iterable that returns the object contents for a large object.
@@ -324,11 +394,17 @@ class SegmentedIterable(object):
     :param name: name of manifest (used in logging only)
     :param response_body_length: optional response body length for
                                  the response being sent to the client.
+    :param read_ahead_segments: the number of segments after the one being
+                                sent whose GETs are started early, so that
+                                their latency overlaps with sending
+    :param read_ahead_bytes: the most body data that segments read ahead
+                             may buffer between them
     """
 
     def __init__(self, req, app, listing_iter, max_get_time,
                  logger, ua_suffix, swift_source,
-                 name='<not specified>', response_body_length=None):
+                 name='<not specified>', response_body_length=None,
+                 read_ahead_segments=0, read_ahead_bytes=0):
         self.req = req
         self.app = app
         self.listing_iter = listing_iter
@@ -338,6 +414,8 @@ class SegmentedIterable(object):
         self.swift_source = swift_source
         self.name = name
         self.response_body_length = response_body_length
+        self.read_ahead_segments = read_ahead_segments
+        self.read_ahead_bytes = read_ahead_bytes
         self.peeked_chunk = None
         self.app_iter = self._internal_iter()
         self.validated_first_segment = False
@@ -428,14 +506,67 @@ class SegmentedIterable(object):
         if pending_req:
             yield pending_req, pending_etag, pending_size
 
+    def _fetch_segments(self):
+        """
+        Yields each segment's request, etag and size, its response, and the
+        iterable to read its body from.
+        """
+        if self.read_ahead_segments <= 0:
+            for seg_req, seg_etag, seg_size in self._coalesce_requests():
+                seg_resp = seg_req.get_response(self.app)
+                yield seg_req, seg_etag, seg_size, seg_resp, seg_resp.app_iter
+            return
+
+        start_time = time.time()
+        budget = {'bytes': self.read_ahead_bytes}
+        requests = self._coalesce_requests()
+        listing_exc_info = None
+        pending = deque()
+        try:
+            while True:
+                while requests and \
+                        len(pending) <= self.read_ahead_segments:
+                    try:
+                        seg_req, seg_etag, seg_size = next(requests)
+                    except StopIteration:
+                        requests = None
+                    except (ListingIterError, SegmentError):
+                        # the segments before the bad one still get sent
+                        listing_exc_info = sys.exc_info()
+                        requests = None
+                    else:
+                        pending.append((seg_req, seg_etag, seg_size,
+                                        SegmentReadAhead(
+                                            self.app, seg_req, budget)))
+                if not pending:
+                    break
+                seg_req, seg_etag, seg_size, read_ahead = pending.popleft()
+                if time.time() - start_time > self.max_get_time:
+                    read_ahead.close()
+                    raise SegmentError(
+                        'ERROR: While processing manifest %s, '
+                        'max LO GET time of %ds exceeded' %
+                        (self.name, self.max_get_time))
+                try:
+                    seg_resp = read_ahead.get_response()
+                except BaseException:
+                    read_ahead.close()
+                    raise
+                yield seg_req, seg_etag, seg_size, seg_resp, read_ahead
+            if listing_exc_info:
+                six.reraise(*listing_exc_info)
+        finally:
+            for _seg_req, _seg_etag, _seg_size, read_ahead in pending:
+                read_ahead.close()
+
     def _internal_iter(self):
         bytes_left = self.response_body_length
 
         try:
-            for seg_req, seg_etag, seg_size in self._coalesce_requests():
-                seg_resp = seg_req.get_response(self.app)
+            for seg_req, seg_etag, seg_size, seg_resp, seg_app_iter in \
+                    self._fetch_segments():
                 if not is_success(seg_resp.status_int):
-                    close_if_possible(seg_resp.app_iter)
+                    close_if_possible(seg_app_iter)
                     raise SegmentError(
                         'ERROR: While processing manifest %s, '
                         'got %d while retrieving %s' %
@@ -451,7 +582,7 @@ class SegmentedIterable(object):
                     # object many times which would hammer our obj servers. If
                     # this is a range request, don't check content-length
                     # because it won't match.
-                    close_if_possible(seg_resp.app_iter)
+                    close_if_possible(seg_app_iter)
                     raise SegmentError(
                         'Object segment no longer valid: '
                         '%(path)s etag: %(r_etag)s != %(s_etag)s or '
@@ -469,7 +600,7 @@ class SegmentedIterable(object):
                     seg_hash = hashlib.md5()
 
                 document_iters = maybe_multipart_byteranges_to_document_iters(
-                    seg_resp.app_iter,
+                    seg_app_iter,
                     seg_resp.headers['Content-Type'])
 
                 for chunk in itertools.chain.from_iterable(document_iters):
@@ -484,13 +615,13 @@ class SegmentedIterable(object):
                     else:
                         yield chunk[:bytes_left]
                         bytes_left -= len(chunk)
-                        close_if_possible(seg_resp.app_iter)
+                        close_if_possible(seg_app_iter)
                         raise SegmentError(
                             'Too many bytes for %(name)s; truncating in '
                             '%(seg)s with %(left)d bytes left' %
                             {'name': self.name, 'seg': seg_req.path,
                              'left': bytes_left})
-                close_if_possible(seg_resp.app_iter)
+                close_if_possible(seg_app_iter)
 
                 if seg_hash and seg_hash.hexdigest() != seg_resp.etag:
                     raise SegmentError(
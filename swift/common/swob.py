@@ -218,13 +218,67 @@ def _header_int_property(header):
                     doc="Retrieve and set the %s header as an int" % header)
 
 
+# Environ keys are cached for the header names Swift itself sends and looks
+# up, and vice versa. Other header names come from clients, so they are
+# converted on every use rather than cached.
+WELL_KNOWN_HEADERS = (
+    'Accept', 'Accept-Ranges', 'Authorization', 'Connection',
+    'Content-Disposition', 'Content-Encoding', 'Content-Length',
+    'Content-Range', 'Content-Type', 'Date', 'Destination', 'Etag', 'Expect',
+    'Host', 'If-Match', 'If-Modified-Since', 'If-None-Match',
+    'If-Unmodified-Since', 'Last-Modified', 'Location', 'Range', 'Referer',
+    'Transfer-Encoding', 'User-Agent', 'X-Account-Device',
+    'X-Account-Host', 'X-Account-Partition', 'X-Auth-Token',
+    'X-Backend-Etag-Is-At', 'X-Backend-Replication',
+    'X-Backend-Storage-Policy-Index', 'X-Backend-Timestamp',
+    'X-Container-Device', 'X-Container-Host', 'X-Container-Partition',
+    'X-Content-Type', 'X-Copy-From', 'X-Delete-After', 'X-Delete-At',
+    'X-Delete-At-Container', 'X-Delete-At-Device', 'X-Delete-At-Host',
+    'X-Delete-At-Partition', 'X-Etag', 'X-Newest', 'X-Object-Manifest',
+    'X-Openstack-Request-Id', 'X-Put-Timestamp', 'X-Size',
+    'X-Static-Large-Object', 'X-Storage-Token', 'X-Timestamp', 'X-Trans-Id')
+
+
+def _header_to_environ_key(header_name):
+    environ_key = 'HTTP_' + header_name.replace('-', '_').upper()
+    if environ_key == 'HTTP_CONTENT_LENGTH':
+        environ_key = 'CONTENT_LENGTH'
+    elif environ_key == 'HTTP_CONTENT_TYPE':
+        environ_key = 'CONTENT_TYPE'
+    return environ_key
+
+
+_environ_keys = {}
+_header_names = {}
+for _name in WELL_KNOWN_HEADERS:
+    _environ_keys[_name] = _environ_keys[_name.lower()] = \
+        _header_to_environ_key(_name)
+    _header_names['HTTP_' + _name.replace('-', '_').upper()] = _name.title()
+del _name
+
+
 def header_to_environ_key(header_name):
-    header_name = 'HTTP_' + header_name.replace('-', '_').upper()
-    if header_name == 'HTTP_CONTENT_LENGTH':
-        return 'CONTENT_LENGTH'
-    if header_name == 'HTTP_CONTENT_TYPE':
-        return 'CONTENT_TYPE'
-    return header_name
+    try:
+        return _environ_keys[header_name]
+    except KeyError:
+        return _header_to_environ_key(header_name)
+
+
+def _environ_key_to_header(environ_key):
+    try:
+        return _header_names[environ_key]
+    except KeyError:
+        return environ_key[5:].replace('_', '-').title()
+
+
+# Values parsed from a request's environ (path, query parameters, ...) are
+# memoised in environ['swob.parsed'], keyed on their inputs; the memo is
+# cleared once it grows past this many entries.
+MAX_PARSED_CACHE_SIZE = 64
+
+
+def _parse_params(query_string):
+    return dict(urllib.parse.parse_qsl(query_string, True))
 
 
 class HeaderEnvironProxy(MutableMapping):
@@ -263,7 +317,7 @@ class HeaderEnvironProxy(MutableMapping):
         del self.environ[header_to_environ_key(key)]
 
     def keys(self):
-        keys = [key[5:].replace('_', '-').title()
+        keys = [_environ_key_to_header(key)
                 for key in self.environ if key.startswith('HTTP_')]
         if 'CONTENT_LENGTH' in self.environ:
             keys.append('Content-Length')
@@ -810,7 +864,7 @@ class Request(object):
     body = _req_body_property()
     charset = None
     _params_cache = None
-    _timestamp = None
+    _params_query_string = None
     acl = _req_environ_property('swob.ACL')
 
     def __init__(self, environ):
@@ -880,15 +934,43 @@ class Request(object):
             raise TypeError("got unexpected keyword argument %r" % key)
         return req
 
+    def _memoised(self, key, parse, *args):
+        """
+        Returns ``parse(*args)``, memoised in the environ so that every
+        Request object built on the same environ shares the result.
+
+        Entries are keyed on ``key``, which must include every input the
+        result depends on (e.g. PATH_INFO), so changing those inputs is
+        never served a stale result.  Exceptions are not memoised.
+        """
+        try:
+            memo = self.environ['swob.parsed']
+        except KeyError:
+            memo = self.environ['swob.parsed'] = {}
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        value = parse(*args)
+        if len(memo) >= MAX_PARSED_CACHE_SIZE:
+            memo.clear()
+        memo[key] = value
+        return value
+
     @property
     def params(self):
         "Provides QUERY_STRING parameters as a dictionary"
-        if self._params_cache is None:
-            if 'QUERY_STRING' in self.environ:
-                self._params_cache = dict(
-                    urllib.parse.parse_qsl(self.environ['QUERY_STRING'], True))
-            else:
+        query_string = self.environ.get('QUERY_STRING')
+        if self._params_cache is None or \
+                query_string != self._params_query_string:
+            if query_string is None:
                 self._params_cache = {}
+            else:
+                # callers may modify the dict they get, so each Request
+                # has its own copy of the shared parse
+                self._params_cache = dict(self._memoised(
+                    ('params', query_string), _parse_params, query_string))
+            self._params_query_string = query_string
         return self._params_cache
     str_params = params
 
@@ -902,16 +984,15 @@ class Request(object):
         """
         Provides HTTP_X_TIMESTAMP as a :class:`~swift.common.utils.Timestamp`
         """
-        if self._timestamp is None:
-            try:
-                raw_timestamp = self.environ['HTTP_X_TIMESTAMP']
-            except KeyError:
-                raise InvalidTimestamp('Missing X-Timestamp header')
-            try:
-                self._timestamp = Timestamp(raw_timestamp)
-            except ValueError:
-                raise InvalidTimestamp('Invalid X-Timestamp header')
-        return self._timestamp
+        try:
+            raw_timestamp = self.environ['HTTP_X_TIMESTAMP']
+        except KeyError:
+            raise InvalidTimestamp('Missing X-Timestamp header')
+        try:
+            return self._memoised(('timestamp', raw_timestamp),
+                                  Timestamp.from_internal, raw_timestamp)
+        except ValueError:
+            raise InvalidTimestamp('Invalid X-Timestamp header')
 
     @property
     def path_qs(self):
@@ -924,8 +1005,8 @@ class Request(object):
     @property
     def path(self):
         "Provides the full path of the request, excluding the QUERY_STRING"
-        return urllib.parse.quote(self.environ.get('SCRIPT_NAME', '') +
-                                  self.environ['PATH_INFO'])
+        path = self.environ.get('SCRIPT_NAME', '') + self.environ['PATH_INFO']
+        return self._memoised(('path', path), urllib.parse.quote, path)
 
     @property
     def swift_entity_path(self):
@@ -1031,9 +1112,10 @@ class Request(object):
                   segments will return as None)
         :raises: ValueError if given an invalid path
         """
-        return split_path(
-            self.environ.get('SCRIPT_NAME', '') + self.environ['PATH_INFO'],
-            minsegs, maxsegs, rest_with_last)
+        path = self.environ.get('SCRIPT_NAME', '') + self.environ['PATH_INFO']
+        return list(self._memoised(
+            ('split_path', path, minsegs, maxsegs, rest_with_last),
+            split_path, path, minsegs, maxsegs, rest_with_last))
 
     def message_length(self):
         """
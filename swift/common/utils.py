@@ -17,6 +17,7 @@
 
 from __future__ import print_function
 
+import binascii
 import errno
 import fcntl
 import grp
@@ -49,7 +50,7 @@ import datetime
 
 import eventlet
 import eventlet.semaphore
-from eventlet import GreenPool, sleep, Timeout, tpool
+from eventlet import GreenPool, sleep, Timeout, tpool, greenio, event
 from eventlet.green import socket, threading
 import eventlet.queue
 import netifaces
@@ -71,6 +72,7 @@ from swift.common.http import is_success, is_redirection, HTTP_NOT_FOUND, \
     HTTP_PRECONDITION_FAILED, HTTP_REQUESTED_RANGE_NOT_SATISFIABLE
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.linkat import linkat
+from swift.common.splice import splice
 
 if six.PY3:
     stdlib_queue = eventlet.patcher.original('queue')
@@ -95,6 +97,7 @@ _posix_fadvise = None
 _libc_socket = None
 _libc_bind = None
 _libc_accept = None
+_libc_send = None
 # see man -s 2 setpriority
 _libc_setpriority = None
 # see man -s 2 syscall
@@ -168,6 +171,7 @@ SWIFT_CONF_FILE = '/etc/swift/swift.conf'
 # The values were copied from the Linux 3.x kernel headers.
 AF_ALG = getattr(socket, 'AF_ALG', 38)
 F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+MSG_MORE = getattr(socket, 'MSG_MORE', 0x8000)
 O_TMPFILE = getattr(os, 'O_TMPFILE', 0o20000000 | os.O_DIRECTORY)
 
 # Used by the parse_socket_string() function to validate IPv6 addresses
@@ -806,6 +810,7 @@ PRECISION = 1e-5
 # This isn't ideal during an upgrade when some servers might not understand
 # the new time format - but flipping it to True works great for testing.
 FORCE_INTERNAL = False  # or True
+RE_INTERNAL_TIMESTAMP = re.compile(r'^\d{10}\.\d{5}(?:_[0-9a-f]{16})?$')
 
 
 @functools.total_ordering
@@ -844,8 +849,14 @@ class Timestamp(object):
     timestamp regardless of it's offset.  String comparison and ordering
     is guaranteed for the internalized string format, and is backwards
     compatible for normalized timestamps which do not include an offset.
+
+    Timestamps are immutable; their string forms are formatted on first use
+    and cached.
     """
 
+    __slots__ = ('timestamp', 'offset', 'raw', '_normal', '_internal',
+                 '_isoformat')
+
     def __init__(self, timestamp, offset=0, delta=0):
         """
         Create a new Timestamp.
@@ -889,6 +900,39 @@ class Timestamp(object):
             raise ValueError('timestamp cannot be negative')
         if self.timestamp >= 10000000000:
             raise ValueError('timestamp too large')
+        self._normal = self._internal = self._isoformat = None
+
+    @classmethod
+    def from_internal(cls, internal):
+        """
+        Create a Timestamp from its normalized or internalized string form,
+        e.g. a file name or a container DB row.
+
+        Strings in the canonical fixed width form are sliced rather than
+        parsed and validated, and are kept as the Timestamp's cached string
+        forms; anything else is passed to the regular constructor.
+
+        :param internal: a normalized or internalized timestamp string
+        :raises ValueError: if internal is not a valid timestamp
+        """
+        if not isinstance(internal, str) or \
+                not RE_INTERNAL_TIMESTAMP.match(internal):
+            return cls(internal)
+        self = cls.__new__(cls)
+        normal = self._normal = internal[:16]
+        self.timestamp = float(normal)
+        self.raw = int(normal[:10] + normal[11:])
+        if len(internal) > 16:
+            self.offset = int(internal[17:], 16)
+            self._internal = internal
+        else:
+            self.offset = 0
+            self._internal = None
+        self._isoformat = None
+        return self
+
+    def __reduce__(self):
+        return Timestamp, (self.timestamp, self.offset)
 
     def __repr__(self):
         return INTERNAL_FORMAT % (self.timestamp, self.offset)
@@ -910,12 +954,17 @@ class Timestamp(object):
 
     @property
     def normal(self):
-        return NORMAL_FORMAT % self.timestamp
+        if self._normal is None:
+            self._normal = NORMAL_FORMAT % self.timestamp
+        return self._normal
 
     @property
     def internal(self):
         if self.offset or FORCE_INTERNAL:
-            return INTERNAL_FORMAT % (self.timestamp, self.offset)
+            if self._internal is None:
+                self._internal = INTERNAL_FORMAT % (
+                    self.timestamp, self.offset)
+            return self._internal
         else:
             return self.normal
 
@@ -928,6 +977,11 @@ class Timestamp(object):
 
     @property
     def isoformat(self):
+        if self._isoformat is None:
+            self._isoformat = self._format_isoformat()
+        return self._isoformat
+
+    def _format_isoformat(self):
         t = float(self.normal)
         if six.PY3:
             # On Python 3, round manually using ROUND_HALF_EVEN rounding
@@ -1035,6 +1089,12 @@ def decode_timestamps(encoded, explicit=False):
     if not isinstance(encoded, six.string_types):
         ts = Timestamp(encoded)
         return ts, ts, ts
+    if '+' not in encoded and '-' not in encoded:
+        # most encoded values are a single timestamp
+        t1 = Timestamp.from_internal(encoded)
+        if explicit:
+            return t1, None, None
+        return t1, t1, t1
 
     parts = []
     signs = []
@@ -1045,7 +1105,7 @@ def decode_timestamps(encoded, explicit=False):
         neg_parts = part.split('-')
         parts = parts + neg_parts
         signs = signs + [1] + [-1] * (len(neg_parts) - 1)
-    t1 = Timestamp(parts[0])
+    t1 = Timestamp.from_internal(parts[0])
     t2 = t3 = None
     if len(parts) > 1:
         t2 = t1
@@ -1067,6 +1127,28 @@ def decode_timestamps(encoded, explicit=False):
     return t1, t2, t3
 
 
+def bulk_decode_timestamps(encoded_timestamps, explicit=False):
+    """
+    Decode a sequence of strings of the form generated by encode_timestamps,
+    such as the created_at values of container listing rows.
+
+    Equivalent to calling :func:`decode_timestamps` on each item, but the
+    common case of a single encoded timestamp is handled inline.
+
+    :param encoded_timestamps: an iterable of encoded timestamps
+    :param explicit: see :func:`decode_timestamps`
+    :returns: an iterator of tuples of three timestamps, in the same order
+    """
+    from_internal = Timestamp.from_internal
+    for encoded in encoded_timestamps:
+        if isinstance(encoded, str) and '+' not in encoded and \
+                '-' not in encoded:
+            t1 = from_internal(encoded)
+            yield (t1, None, None) if explicit else (t1, t1, t1)
+        else:
+            yield decode_timestamps(encoded, explicit=explicit)
+
+
 def normalize_timestamp(timestamp):
     """
     Format a timestamp (string or numeric) into a standardized
@@ -1577,6 +1659,266 @@ class StatsdClient(object):
                                sample_rate)
 
 
+class AggregatingStatsdClient(StatsdClient):
+    """
+    A StatsdClient that aggregates metrics in process and sends them in
+    batches instead of sending one UDP packet per metric call.
+
+    Counters are summed per metric name and timings are kept in a fixed-size
+    reservoir sample per metric name.  A background greenthread flushes the
+    aggregated values every ``flush_interval`` seconds as newline separated
+    multi-metric packets of at most ``max_packet_size`` bytes.  Timings that
+    overflowed their reservoir are sent with the effective sample rate so
+    the statsd server scales the counts back up.
+
+    Because aggregation already bounds the per-call cost, per-call sample
+    rates are not applied.  Memory is bounded by ``max_metrics`` distinct
+    metric names and ``reservoir_size`` timing samples per name; reaching
+    ``max_metrics`` triggers an immediate flush.
+    """
+
+    def __init__(self, host, port, base_prefix='', tail_prefix='',
+                 default_sample_rate=1, sample_rate_factor=1, logger=None,
+                 flush_interval=1.0, max_packet_size=1400,
+                 reservoir_size=100, max_metrics=10000):
+        super(AggregatingStatsdClient, self).__init__(
+            host, port, base_prefix=base_prefix, tail_prefix=tail_prefix,
+            default_sample_rate=default_sample_rate,
+            sample_rate_factor=sample_rate_factor, logger=logger)
+        self.flush_interval = flush_interval
+        self.max_packet_size = max_packet_size
+        self.reservoir_size = reservoir_size
+        self.max_metrics = max_metrics
+        self._counters = {}
+        # (name, type) -> [number of values seen, reservoir of samples]
+        self._timers = {}
+        self._flusher = None
+        self._flusher_pid = None
+
+    def _send(self, m_name, m_value, m_type, sample_rate):
+        name = self._prefix + m_name
+        if m_type == 'c':
+            self._counters[name] = self._counters.get(name, 0) + m_value
+        else:
+            key = (name, m_type)
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = [0, []]
+            timer[0] += 1
+            samples = timer[1]
+            if len(samples) < self.reservoir_size:
+                samples.append(m_value)
+            else:
+                i = int(self.random() * timer[0])
+                if i < self.reservoir_size:
+                    samples[i] = m_value
+        if len(self._counters) + len(self._timers) >= self.max_metrics:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        # Loggers are commonly created before a server forks its workers, so
+        # the flusher is started lazily in whichever process uses it.
+        pid = os.getpid()
+        if self._flusher is None or self._flusher_pid != pid:
+            self._flusher_pid = pid
+            self._flusher = eventlet.spawn(self._run)
+
+    def _run(self):
+        while True:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # keep flushing; metrics sent later may still get through
+                if self.logger:
+                    self.logger.exception(_('Error flushing StatsD metrics'))
+
+    def _build_lines(self, counters, timers):
+        lines = ['%s:%s|c' % (name, value)
+                 for name, value in counters.items()]
+        for (name, m_type), (seen, samples) in timers.items():
+            if seen > len(samples):
+                suffix = '|%s|@%s' % (m_type, float(len(samples)) / seen)
+            else:
+                suffix = '|%s' % m_type
+            lines.extend('%s:%s%s' % (name, value, suffix)
+                         for value in samples)
+        return lines
+
+    def _build_packets(self, lines):
+        packets = []
+        current = []
+        current_size = 0
+        for line in lines:
+            if current and \
+                    current_size + 1 + len(line) > self.max_packet_size:
+                packets.append('\n'.join(current))
+                current = []
+                current_size = 0
+            if current:
+                current_size += 1
+            current.append(line)
+            current_size += len(line)
+        if current:
+            packets.append('\n'.join(current))
+        return packets
+
+    def flush(self):
+        """
+        Send all aggregated metrics.
+
+        :returns: the number of packets sent
+        """
+        counters, self._counters = self._counters, {}
+        timers, self._timers = self._timers, {}
+        packets = self._build_packets(self._build_lines(counters, timers))
+        if not packets:
+            return 0
+        with closing(self._open_socket()) as sock:
+            for packet in packets:
+                if six.PY3:
+                    packet = packet.encode('utf-8')
+                try:
+                    sock.sendto(packet, self._target)
+                except IOError as err:
+                    if self.logger:
+                        self.logger.warning(
+                            _('Error sending UDP message to %(target)r: '
+                              '%(err)s'),
+                            {'target': self._target, 'err': err})
+        return len(packets)
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of non-negative integer values with a fixed relative
+    precision, in the style of HdrHistogram.
+
+    Values are counted in log-linear buckets: every power-of-two range is
+    split into enough linear sub-buckets that any value is reported with at
+    least ``significant_figures`` decimal digits of precision.  Memory is
+    therefore bounded by the number of distinct buckets hit rather than by
+    the number or range of recorded values, and percentiles of both
+    sub-millisecond and multi-second latencies stay accurate.
+
+    :param significant_figures: decimal digits of precision to keep (1-5)
+    """
+
+    def __init__(self, significant_figures=2):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError('significant_figures must be between 1 and 5')
+        self.significant_figures = significant_figures
+        self._sub_bucket_bits = int(math.ceil(
+            math.log(2 * 10 ** significant_figures, 2)))
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._sub_bucket_half_count = self._sub_bucket_count >> 1
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_bucket_count:
+            return value
+        shift = value.bit_length() - self._sub_bucket_bits
+        return (self._sub_bucket_count +
+                (shift - 1) * self._sub_bucket_half_count +
+                (value >> shift) - self._sub_bucket_half_count)
+
+    def _highest_equivalent_value(self, index):
+        if index < self._sub_bucket_count:
+            return index
+        shift, sub_bucket = divmod(index - self._sub_bucket_count,
+                                   self._sub_bucket_half_count)
+        shift += 1
+        lowest = (sub_bucket + self._sub_bucket_half_count) << shift
+        return lowest + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        """
+        Record a value.
+
+        :param value: a non-negative number; it is truncated to an integer
+        :param count: how many times to record it
+        """
+        value = int(value)
+        if value < 0:
+            raise ValueError('LatencyHistogram values must be non-negative')
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add the counts of another LatencyHistogram to this one.
+
+        :param other: a LatencyHistogram with the same significant_figures
+        """
+        if other.significant_figures != self.significant_figures:
+            raise ValueError('Cannot merge histograms of different precision')
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or
+                                      other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or
+                                      other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, percentile):
+        """
+        Get the value at a percentile of the recorded values.
+
+        :param percentile: a percentile between 0 and 100
+        :returns: the highest value equivalent (within the histogram's
+                  precision) to the value at ``percentile``, or 0 if nothing
+                  has been recorded
+        """
+        if not self.count:
+            return 0
+        target = max(1, int(math.ceil(self.count * percentile / 100.0)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent_value(index), self.max)
+        return self.max
+
+    def summary(self, percentiles=(50, 90, 99, 99.9), scale=1):
+        """
+        Summarise the histogram.
+
+        :param percentiles: the percentiles to include, as ``p<percentile>``
+        :param scale: divisor applied to every reported value, e.g. 1000 to
+                      report values recorded in microseconds as milliseconds
+        :returns: a dict with count, min, max, mean and the percentiles
+        """
+        scale = float(scale)
+        summary = {
+            'count': self.count,
+            'min': (self.min or 0) / scale,
+            'max': (self.max or 0) / scale,
+            'mean': (float(self.total) / self.count / scale
+                     if self.count else 0.0),
+        }
+        for percentile in percentiles:
+            summary['p%s' % percentile] = self.percentile(percentile) / scale
+        return summary
+
+
 def server_handled_successfully(status_int):
     """
     True for successful responses *or* error codes that are not Swift's fault,
@@ -1889,9 +2231,22 @@ def get_logger(conf, name=None, log_to_console=False, log_route=None,
             'log_statsd_default_sample_rate', 1))
         sample_rate_factor = float(conf.get(
             'log_statsd_sample_rate_factor', 1))
-        statsd_client = StatsdClient(statsd_host, statsd_port, base_prefix,
-                                     name, default_sample_rate,
-                                     sample_rate_factor, logger=logger)
+        if config_true_value(conf.get('log_statsd_aggregate', 'false')):
+            statsd_client = AggregatingStatsdClient(
+                statsd_host, statsd_port, base_prefix, name,
+                default_sample_rate, sample_rate_factor, logger=logger,
+                flush_interval=float(conf.get(
+                    'log_statsd_flush_interval', 1.0)),
+                max_packet_size=int(conf.get(
+                    'log_statsd_max_packet_size', 1400)),
+                reservoir_size=int(conf.get(
+                    'log_statsd_reservoir_size', 100)),
+                max_metrics=int(conf.get('log_statsd_max_metrics', 10000)))
+        else:
+            statsd_client = StatsdClient(statsd_host, statsd_port,
+                                         base_prefix, name,
+                                         default_sample_rate,
+                                         sample_rate_factor, logger=logger)
         logger.statsd_client = statsd_client
     else:
         logger.statsd_client = None
@@ -3518,6 +3873,178 @@ def tpool_reraise(func, *args, **kwargs):
     return resp
 
 
+class ThreadPool(object):
+    """
+    Perform blocking operations in background OS threads.
+
+    Each instance owns its own set of worker threads and its own run queue,
+    which is what lets the object server keep one pool per disk: a slow or
+    failing disk only backs up the requests that want that disk instead of
+    starving every other disk of the shared eventlet tpool.
+
+    Results travel back from the worker threads through a real queue, and a
+    byte written to a pipe wakes up a consumer greenthread in the calling OS
+    thread which hands each result to the waiting greenthread. The worker
+    threads and the consumer greenthread are started lazily on first use, so
+    a pool built before a server forks its workers still works in them.
+
+    :param nthreads: number of worker threads; if zero or less, functions
+                     passed to :func:`run_in_thread` are run inline
+    :param max_queue_depth: number of calls allowed to wait for a worker
+                            thread before the pool reports itself as
+                            :attr:`full`; zero or less means unbounded
+    """
+    BYTE = 'a'.encode('utf-8')
+
+    def __init__(self, nthreads=2, max_queue_depth=0):
+        self.nthreads = nthreads
+        self.max_queue_depth = max_queue_depth
+        self._run_queue = stdlib_queue.Queue()
+        self._result_queue = stdlib_queue.Queue()
+        self._threads = []
+        self._alive = True
+        self._pid = None
+        self.rpipe = self.wpipe = None
+
+    def _start(self):
+        """
+        Start the worker threads and the result-consuming greenthread for
+        the current process, if that has not been done yet.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._threads = []
+        _raw_rpipe, self.wpipe = os.pipe()
+        self.rpipe = greenio.GreenPipe(_raw_rpipe, 'rb', bufsize=0)
+        for _junk in range(self.nthreads):
+            thr = stdlib_threading.Thread(
+                target=self._worker,
+                args=(self._run_queue, self._result_queue, self.wpipe))
+            thr.daemon = True
+            thr.start()
+            self._threads.append(thr)
+        eventlet.spawn_n(self._consume_results, self._result_queue,
+                         self.rpipe)
+
+    def _worker(self, work_queue, result_queue, wpipe):
+        """
+        Pulls an item from the queue and runs it, then puts the result into
+        the result queue and pokes the pipe. Repeats until it pulls None.
+
+        :param work_queue: queue from which to pull work
+        :param result_queue: queue into which to place results
+        :param wpipe: write end of the pipe used to wake up the consumer
+        """
+        while True:
+            item = work_queue.get()
+            if item is None:
+                break
+            ev, func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+                result_queue.put((ev, True, result))
+            except BaseException:
+                result_queue.put((ev, False, sys.exc_info()))
+            finally:
+                work_queue.task_done()
+                os.write(wpipe, self.BYTE)
+
+    def _consume_results(self, queue, rpipe):
+        """
+        Runs as a greenthread in the same OS thread as callers of
+        :func:`run_in_thread`. Takes results from the worker OS threads and
+        sends them to the waiting greenthreads.
+        """
+        while True:
+            if not rpipe.read(1):
+                # terminate() closed the write end of the pipe
+                rpipe.close()
+                break
+            while True:
+                try:
+                    ev, success, result = queue.get(block=False)
+                except stdlib_queue.Empty:
+                    break
+                try:
+                    if success:
+                        ev.send(result)
+                    else:
+                        ev.send_exception(*result)
+                finally:
+                    queue.task_done()
+
+    @property
+    def queue_depth(self):
+        """
+        The number of calls waiting for a worker thread to pick them up.
+        """
+        return self._run_queue.qsize()
+
+    @property
+    def full(self):
+        """
+        True if the pool has worker threads and the number of calls waiting
+        for them has reached max_queue_depth.
+        """
+        return (self.nthreads > 0 and self.max_queue_depth > 0 and
+                self.queue_depth >= self.max_queue_depth)
+
+    def run_in_thread(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) in a worker thread, blocking only the
+        calling greenthread until the result is available. If the pool has
+        no worker threads the function is simply run inline.
+
+        Exceptions raised by func are re-raised in the calling greenthread.
+
+        :returns: result of calling func
+        """
+        if not self._alive:
+            raise swift.common.exceptions.ThreadPoolDead()
+        if self.nthreads <= 0:
+            return func(*args, **kwargs)
+        return self._run_in_worker(func, args, kwargs)
+
+    def force_run_in_thread(self, func, *args, **kwargs):
+        """
+        Like :func:`run_in_thread`, but always runs func in some OS thread:
+        if the pool has no worker threads, eventlet's shared tpool is used.
+        Meant for calls that must not stall the hub, such as fsync().
+
+        :returns: result of calling func
+        """
+        if not self._alive:
+            raise swift.common.exceptions.ThreadPoolDead()
+        if self.nthreads <= 0:
+            return tpool_reraise(func, *args, **kwargs)
+        return self._run_in_worker(func, args, kwargs)
+
+    def _run_in_worker(self, func, args, kwargs):
+        self._start()
+        ev = event.Event()
+        self._run_queue.put((ev, func, args, kwargs), block=False)
+        # blocks this greenthread (and only this greenthread) until the
+        # consumer greenthread calls ev.send()
+        return ev.wait()
+
+    def terminate(self):
+        """
+        Stops the worker threads and the consumer greenthread; calls made
+        after this raise :class:`~swift.common.exceptions.ThreadPoolDead`.
+        """
+        self._alive = False
+        if self._pid != os.getpid():
+            return
+        for _junk in self._threads:
+            self._run_queue.put(None)
+        for thr in self._threads:
+            thr.join()
+        self._threads = []
+        self._pid = None
+        os.close(self.wpipe)
+
+
 def ismount(path):
     """
     Test whether a path is a mount point. This will catch any
@@ -4111,6 +4638,131 @@ def get_md5_socket():
     return md5_sockfd
 
 
+class KernelMD5(object):
+    """
+    A hashlib-compatible MD5 object that does its hashing in the kernel,
+    through an AF_ALG socket from :func:`get_md5_socket`.
+
+    Data can be fed in from userspace with :meth:`update`, or moved straight
+    from a pipe with :meth:`update_from_pipe` so that it never has to be
+    copied into userspace at all. Asking for the digest finalizes the hash
+    and releases the socket; further updates raise ValueError.
+
+    :raises IOError: if an MD5 socket cannot be had
+    """
+    name = 'md5'
+    digest_size = 16
+    block_size = 64
+
+    def __init__(self, data=b''):
+        global _libc_send
+        if _libc_send is None:
+            _libc_send = load_libc_function('send', fail_if_missing=True)
+            _libc_send.restype = ctypes.c_ssize_t
+        self._sockfd = get_md5_socket()
+        self._digest = None
+        self.bytes_hashed = 0
+        if data:
+            self.update(data)
+
+    def _check_open(self):
+        if self._sockfd is None:
+            raise ValueError('Kernel MD5 hash has already been finalized')
+
+    def update(self, data):
+        self._check_open()
+        data = bytes(data)
+        while data:
+            sent = _libc_send(ctypes.c_int(self._sockfd), data,
+                              ctypes.c_size_t(len(data)),
+                              ctypes.c_int(MSG_MORE))
+            if sent < 0:
+                raise IOError(ctypes.get_errno(),
+                              "Failed to write to MD5 socket")
+            self.bytes_hashed += sent
+            data = data[sent:]
+
+    def update_from_pipe(self, rpipe, length):
+        """
+        Hash exactly ``length`` bytes that are waiting in a pipe, moving them
+        into the kernel's hash with splice() rather than reading them.
+
+        :param rpipe: read end of a pipe holding at least ``length`` bytes
+        :param length: number of bytes to take from the pipe
+        """
+        self._check_open()
+        # The MD5 socket hashes synchronously and the data is already in the
+        # pipe, so this neither blocks nor comes up short.
+        hashed = splice(rpipe, None, self._sockfd, None, length,
+                        splice.SPLICE_F_MORE)[0]
+        if hashed != length:
+            raise IOError(errno.EIO, "MD5 socket only took %d of %d bytes" %
+                          (hashed, length))
+        self.bytes_hashed += hashed
+
+    def digest(self):
+        if self._digest is None:
+            self._check_open()
+            # Linux MD5 sockets return all zeros rather than the right answer
+            # if nothing was ever written to them.
+            if self.bytes_hashed:
+                self._digest = os.read(self._sockfd, self.digest_size)
+            else:
+                self._digest = md5().digest()
+            self.close()
+        return self._digest
+
+    def hexdigest(self):
+        return binascii.hexlify(self.digest()).decode('ascii')
+
+    def close(self):
+        """Release the MD5 socket without computing a digest."""
+        if self._sockfd is not None:
+            sockfd, self._sockfd = self._sockfd, None
+            os.close(sockfd)
+
+    def __del__(self):
+        # __init__ may have failed before there was a socket
+        if getattr(self, '_sockfd', None) is not None:
+            self.close()
+
+
+def kernel_md5_available():
+    """
+    Find out whether this system can hash in the kernel with AF_ALG MD5
+    sockets.
+
+    :returns: True if :class:`KernelMD5` can be used, False otherwise
+    """
+    try:
+        KernelMD5().close()
+    except (IOError, AttributeError):
+        # AF_ALG socket support was introduced in kernel 2.6.38; older or
+        # custom-built kernels may lack it, and non-Linux libcs may lack the
+        # functions altogether.
+        return False
+    return True
+
+
+def md5_hasher(use_kernel=False):
+    """
+    Get a new MD5 hash object, done in the kernel if asked for and possible.
+
+    Kernel hashing is a best effort: when an MD5 socket cannot be had (for
+    example because the process is out of file descriptors) a plain
+    :func:`hashlib.md5` object is returned instead, so callers can always
+    rely on getting something with ``update()`` and ``hexdigest()``.
+
+    :param use_kernel: if True, try to hash with :class:`KernelMD5`
+    """
+    if use_kernel:
+        try:
+            return KernelMD5()
+        except (IOError, AttributeError):
+            pass
+    return md5()
+
+
 def modify_priority(conf, logger):
     """
     Modify priority by nice and ionice.
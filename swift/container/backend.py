@@ -26,7 +26,7 @@ from six.moves import range
 import sqlite3
 
 from swift.common.utils import Timestamp, encode_timestamps, decode_timestamps, \
-    extract_swift_bytes
+    bulk_decode_timestamps, extract_swift_bytes
 from swift.common.db import DatabaseBroker, utf8encode
 
 
@@ -749,7 +749,7 @@ class ContainerBroker(DatabaseBroker):
                 # is no delimiter then we can simply return the result as
                 # prefixes are now handled in the SQL statement.
                 if prefix is None or not delimiter:
-                    return [self._transform_record(r) for r in curs]
+                    return self._transform_records(curs.fetchall())
 
                 # We have a delimiter and a prefix (possibly empty string) to
                 # handle
@@ -802,6 +802,16 @@ class ContainerBroker(DatabaseBroker):
         t_data, t_ctype, t_meta = decode_timestamps(record[1])
         return (record[0], t_meta.internal) + record[2:]
 
+    def _transform_records(self, records):
+        """
+        Apply :func:`_transform_record` to a list of records, decoding their
+        timestamps in bulk.
+        """
+        decoded = bulk_decode_timestamps(record[1] for record in records)
+        return [(record[0], t_meta.internal) + record[2:]
+                for record, (t_data, t_ctype, t_meta)
+                in six.moves.zip(records, decoded)]
+
     def _record_to_dict(self, rec):
         if rec:
             keys = ('name', 'created_at', 'size', 'content_type', 'etag',
@@ -27,6 +27,8 @@ import swift.common.db
 from swift.container.sync_store import ContainerSyncStore
 from swift.container.backend import ContainerBroker, DATADIR
 from swift.container.replicator import ContainerReplicatorRpc
+from swift.common.db_replicator import journal_db_change, \
+    load_replicate_args
 from swift.common.db import DatabaseAlreadyExists
 from swift.common.container_sync_realms import ContainerSyncRealms
 from swift.common.request_helpers import get_param, get_listing_content_type, \
@@ -116,6 +118,8 @@ class ContainerController(BaseStorageServer):
         self.sync_store = ContainerSyncStore(self.root,
                                              self.logger,
                                              self.mount_check)
+        self.change_journal = config_true_value(
+            conf.get('change_journal', 'no'))
 
     def _get_container_broker(self, drive, part, account, container, **kwargs):
         """
@@ -256,6 +260,16 @@ class ContainerController(BaseStorageServer):
             self.logger.exception('Failed to update sync_store %s during %s' %
                                   (broker.db_file, method))
 
+    def _journal_change(self, req):
+        drive, part, account, container, obj = split_and_validate_path(
+            req, 4, 5, True)
+        broker = self._get_container_broker(drive, part, account, container)
+        try:
+            journal_db_change(broker.db_file)
+        except Exception:
+            self.logger.exception('Failed to journal change to %s during %s' %
+                                  (broker.db_file, req.method))
+
     @public
     @timing_stats()
     def DELETE(self, req):
@@ -548,7 +562,7 @@ class ContainerController(BaseStorageServer):
         if self.mount_check and not check_mount(self.root, drive):
             return HTTPInsufficientStorage(drive=drive, request=req)
         try:
-            args = json.load(req.environ['wsgi.input'])
+            args = load_replicate_args(req)
         except ValueError as err:
             return HTTPBadRequest(body=str(err), content_type='text/plain')
         ret = self.replicator_rpc.dispatch(post_args, args)
@@ -609,6 +623,9 @@ class ContainerController(BaseStorageServer):
                     'ERROR __call__ error with %(method)s %(path)s '),
                     {'method': req.method, 'path': req.path})
                 res = HTTPInternalServerError(body=traceback.format_exc())
+        if self.change_journal and req.method in ('PUT', 'POST', 'DELETE') \
+                and is_success(res.status_int):
+            self._journal_change(req)
         if self.log_requests:
             trans_time = time.time() - start_time
             log_message = get_log_line(req, res, trans_time, '')
@@ -27,7 +27,8 @@ from eventlet import Timeout
 from swift.obj import diskfile, replicator
 from swift.common.utils import (
     get_logger, ratelimit_sleep, dump_recon_cache, list_from_csv, listdir,
-    unlink_paths_older_than, readconf, config_auto_int_value)
+    unlink_paths_older_than, readconf, config_auto_int_value,
+    config_true_value)
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist,\
     DiskFileDeleted, DiskFileExpired
 from swift.common.daemon import Daemon
@@ -79,6 +80,10 @@ class AuditorWorker(object):
             self.max_files_per_second = float(self.zero_byte_only_at_fps)
             self.auditor_type = 'ZBF'
         self.log_time = int(conf.get('log_time', 3600))
+        # the zero byte auditor reads no data, so always audits everything
+        self.incremental = not self.zero_byte_only_at_fps and \
+            config_true_value(conf.get('incremental', 'false'))
+        self.reverify_age = int(conf.get('reverify_age', 2592000))
         self.last_logged = 0
         self.files_running_time = 0
         self.bytes_running_time = 0
@@ -127,10 +132,16 @@ class AuditorWorker(object):
         # will require a sizable refactor, but currently all diskfile managers
         # can find all diskfile locations regardless of policy -- so for now
         # just use Policy-0's manager.
+        location_kwargs = {}
+        if self.incremental:
+            # only objects not verified by the object server or by this
+            # auditor in the last reverify_age seconds, oldest first
+            location_kwargs['verified_before'] = \
+                time.time() - self.reverify_age
         all_locs = (self.diskfile_router[POLICIES[0]]
                     .object_audit_location_generator(
                         device_dirs=device_dirs,
-                        auditor_type=self.auditor_type))
+                        auditor_type=self.auditor_type, **location_kwargs))
         for location in all_locs:
             loop_time = time.time()
             self.failsafe_object_audit(location)
@@ -232,6 +243,14 @@ class AuditorWorker(object):
         def raise_dfq(msg):
             raise DiskFileQuarantined(msg)
 
+        def account_bytes(chunk_len):
+            self.bytes_running_time = ratelimit_sleep(
+                self.bytes_running_time,
+                self.max_bytes_per_second,
+                incr_by=chunk_len)
+            self.bytes_processed += chunk_len
+            self.total_bytes_processed += chunk_len
+
         diskfile_mgr = self.diskfile_router[location.policy]
         # this method doesn't normally raise errors, even if the audit
         # location does not exist; if this raises an unexpected error it
@@ -248,14 +267,17 @@ class AuditorWorker(object):
                     reader = df.reader(_quarantine_hook=raise_dfq)
             if reader:
                 with closing(reader):
-                    for chunk in reader:
-                        chunk_len = len(chunk)
-                        self.bytes_running_time = ratelimit_sleep(
-                            self.bytes_running_time,
-                            self.max_bytes_per_second,
-                            incr_by=chunk_len)
-                        self.bytes_processed += chunk_len
-                        self.total_bytes_processed += chunk_len
+                    # not every DiskFile implementation's reader can do this
+                    checker = getattr(reader, 'can_zero_copy_hash', None)
+                    if checker and checker():
+                        reader.zero_copy_hash(account_bytes)
+                    else:
+                        for chunk in reader:
+                            account_bytes(len(chunk))
+            if self.incremental:
+                diskfile_mgr.record_verified(df._data_file)
+            if diskfile_mgr.compact_metadata and df.migrate_metadata():
+                self.logger.increment('metadata_migrations')
         except DiskFileQuarantined as err:
             self.quarantines += 1
             self.logger.error(_('ERROR Object %(obj)s failed audit and was'
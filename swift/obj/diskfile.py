@@ -36,9 +36,12 @@ import fcntl
 import json
 import os
 import re
+import stat
+import struct
 import time
 import uuid
 import hashlib
+import itertools
 import logging
 import traceback
 import xattr
@@ -46,7 +49,7 @@ from os.path import basename, dirname, exists, getmtime, join, splitext
 from random import shuffle
 from tempfile import mkstemp
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from eventlet import Timeout
 from eventlet.hubs import trampoline
@@ -63,12 +66,14 @@ from swift.common.utils import mkdirs, Timestamp, \
     config_true_value, listdir, split_path, ismount, remove_file, \
     get_md5_socket, F_SETPIPE_SZ, decode_timestamps, encode_timestamps, \
     tpool_reraise, MD5_OF_EMPTY_STRING, link_fd_to_path, o_tmpfile_supported, \
-    O_TMPFILE, makedirs_count
+    O_TMPFILE, makedirs_count, ThreadPool, KernelMD5, kernel_md5_available, \
+    md5_hasher
 from swift.common.splice import splice, tee
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist, \
     DiskFileCollision, DiskFileNoSpace, DiskFileDeviceUnavailable, \
     DiskFileDeleted, DiskFileError, DiskFileNotOpen, PathNotDir, \
-    ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported
+    ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported, \
+    DiskFileDeviceBusy
 from swift.common.swob import multi_range_iterator
 from swift.common.storage_policy import (
     get_policy_string, split_policy_string, PolicyError, POLICIES,
@@ -77,10 +82,34 @@ from functools import partial
 
 
 PICKLE_PROTOCOL = 2
+PICKLE_STOP = b'.'
 ONE_WEEK = 604800
 HASH_FILE = 'hashes.pkl'
 HASH_INVALIDATIONS_FILE = 'hashes.invalid'
+# Per-suffix hashes of the objects in each hash-prefix bucket, cached along
+# with the suffix hash they were computed with.
+BUCKETS_FILE = 'buckets.pkl'
+# When each object in a partition was last found to match its etag, and the
+# verifications recorded since that was last consolidated.
+VERIFIED_FILE = 'verified.pkl'
+VERIFIED_JOURNAL_FILE = 'verified.journal'
+# Verifications are dropped once a partition's journal reaches this size;
+# those objects are then just verified again sooner.
+MAX_VERIFIED_JOURNAL_SIZE = 256 * 1024
 METADATA_KEY = 'user.swift.metadata'
+# Compact metadata starts with a NUL byte, which no pickle does, followed by
+# a header of (format version, xattr chunk count, typed pair count, length).
+COMPACT_METADATA_MAGIC = b'\x00SM'
+COMPACT_METADATA_HEADER = struct.Struct('!BBHI')
+COMPACT_METADATA_HEADER_LEN = \
+    len(COMPACT_METADATA_MAGIC) + COMPACT_METADATA_HEADER.size
+COMPACT_METADATA_VERSION = 1
+COMPACT_METADATA_MAX_CHUNKS = 255
+COMPACT_METADATA_MAX_TYPED = 65535
+MIN_XATTR_SIZE = 1024
+# Hash dirs modified more recently than this many seconds are not cached, so
+# that a change within the filesystem's mtime granularity cannot go unseen.
+METADATA_CACHE_MIN_AGE = 1
 DROP_CACHE_WINDOW = 1024 * 1024
 # These are system-set metadata keys that cannot be changed with a POST.
 # They should be lowercase.
@@ -94,6 +123,8 @@ get_tmp_dir = partial(get_policy_string, TMP_BASE)
 MIN_TIME_UPDATE_AUDITOR_STATUS = 60
 # This matches rsync tempfiles, like ".<timestamp>.data.Xy095a"
 RE_RSYNC_TEMPFILE = re.compile(r'^\..*\.([a-zA-Z0-9_]){6}$')
+# <timestamp>#<frag_index>[#d].data, as written by ECDiskFileManager
+RE_EC_DATA_FILENAME = re.compile(r'^([^#]+)#(\d+)(#d)?\.data$')
 
 
 def _get_filename(fd):
@@ -112,9 +143,113 @@ def _get_filename(fd):
     return fd
 
 
+def _reraise_xattr_error(fd, err):
+    """
+    Translate an IOError from an xattr call into the matching DiskFile
+    exception, if there is one.
+    """
+    for name in 'ENOTSUP', 'EOPNOTSUPP':
+        if hasattr(errno, name) and err.errno == getattr(errno, name):
+            msg = "Filesystem at %s does not support xattr" % \
+                  _get_filename(fd)
+            logging.exception(msg)
+            raise DiskFileXattrNotSupported(err)
+
+
+def encode_compact_metadata(metadata):
+    """
+    Serialize a metadata dictionary in the compact metadata format.
+
+    The encoded form is the keys and values joined with NUL bytes, so that
+    decoding is a single split. Values that are not byte strings (unicode
+    strings and integers) are tagged with their type and placed ahead of
+    the plain byte string pairs.
+
+    :param metadata: dictionary of metadata to encode
+    :returns: the encoded metadata, without the header, and the number of
+              typed pairs at the start of it; or (None, None) if the
+              dictionary can only be represented as a pickle
+    """
+    try:
+        # fast path: nothing but byte strings, which is the common case
+        body = b'\x00'.join(itertools.chain.from_iterable(metadata.items()))
+    except TypeError:
+        body = None
+    if isinstance(body, six.binary_type):
+        if body.count(b'\x00') == max(0, 2 * len(metadata) - 1):
+            return body, 0
+        # a NUL inside a key or value would shift every following field
+        return None, None
+    typed = []
+    plain = []
+    for key, value in metadata.items():
+        if not isinstance(key, six.binary_type) or b'\x00' in key:
+            return None, None
+        if isinstance(value, six.binary_type):
+            plain.append(key)
+            plain.append(value)
+            continue
+        if isinstance(value, six.text_type):
+            value = b'u' + value.encode('utf-8')
+        elif type(value) in six.integer_types:
+            value = b'i' + str(value).encode('ascii')
+        else:
+            return None, None
+        typed.append(key)
+        typed.append(value)
+    if len(typed) // 2 > COMPACT_METADATA_MAX_TYPED:
+        return None, None
+    fields = typed + plain
+    body = b'\x00'.join(fields)
+    if fields and body.count(b'\x00') != len(fields) - 1:
+        # a NUL inside a key or value would shift every following field
+        return None, None
+    return body, len(typed) // 2
+
+
+def decode_compact_metadata(header, body):
+    """
+    Deserialize metadata written by :func:`encode_compact_metadata`.
+
+    :param header: tuple of (version, chunk count, typed pair count, body
+                   length) unpacked from the compact metadata header
+    :param body: the encoded metadata
+    :returns: dictionary of metadata
+    :raises ValueError: if the encoded metadata is not valid
+    """
+    version, _junk, ntyped, length = header
+    if version != COMPACT_METADATA_VERSION:
+        raise ValueError('Unknown compact metadata version %d' % version)
+    if len(body) != length:
+        raise ValueError('Compact metadata is %d bytes, expected %d' %
+                         (len(body), length))
+    if not body:
+        return {}
+    fields = body.split(b'\x00')
+    if len(fields) % 2:
+        raise ValueError('Compact metadata has an odd number of fields')
+    fields = iter(fields)
+    metadata = {}
+    for _junk in range(ntyped):
+        key = next(fields)
+        value = next(fields)
+        tag, value = value[:1], value[1:]
+        if tag == b'u':
+            metadata[key] = value.decode('utf-8')
+        elif tag == b'i':
+            metadata[key] = int(value)
+        else:
+            raise ValueError('Unknown compact metadata type %r' % tag)
+    metadata.update(zip(fields, fields))
+    return metadata
+
+
 def read_metadata(fd):
     """
-    Helper function to read the pickled metadata from an object file.
+    Helper function to read the metadata from an object file. Both the
+    compact format and the legacy pickled format are understood, and in the
+    common case of metadata that fits in one xattr only one getxattr() call
+    is made.
 
     :param fd: file descriptor or filename to load the metadata from
 
@@ -123,46 +258,90 @@ def read_metadata(fd):
     metadata = b''
     key = 0
     try:
+        metadata = xattr.getxattr(fd, METADATA_KEY)
+        if metadata.startswith(COMPACT_METADATA_MAGIC):
+            header = COMPACT_METADATA_HEADER.unpack_from(
+                metadata, len(COMPACT_METADATA_MAGIC))
+            # the header tells us how many xattrs to read, so unlike the
+            # pickle path below there is no trailing failed getxattr()
+            for key in range(1, header[1]):
+                metadata += xattr.getxattr(fd, '%s%d' % (METADATA_KEY, key))
+            return decode_compact_metadata(
+                header, metadata[COMPACT_METADATA_HEADER_LEN:])
+        if metadata.endswith(PICKLE_STOP):
+            # A pickle ends with a STOP opcode and no prefix of one can be
+            # loaded, so if the first xattr loads it holds the whole pickle
+            # and the getxattr() that would fail on the next key is saved.
+            try:
+                return pickle.loads(metadata)
+            except Exception:
+                pass
+        key += 1
         while True:
             metadata += xattr.getxattr(fd, '%s%s' % (METADATA_KEY,
                                                      (key or '')))
             key += 1
     except (IOError, OSError) as e:
-        for err in 'ENOTSUP', 'EOPNOTSUPP':
-            if hasattr(errno, err) and e.errno == getattr(errno, err):
-                msg = "Filesystem at %s does not support xattr" % \
-                      _get_filename(fd)
-                logging.exception(msg)
-                raise DiskFileXattrNotSupported(e)
+        _reraise_xattr_error(fd, e)
         if e.errno == errno.ENOENT:
             raise DiskFileNotExist()
+        if metadata.startswith(COMPACT_METADATA_MAGIC):
+            raise ValueError('Compact metadata is missing xattr %s%s' %
+                             (METADATA_KEY, key))
         # TODO: we might want to re-raise errors that don't denote a missing
         # xattr here.  Seems to be ENODATA on linux and ENOATTR on BSD/OSX.
     return pickle.loads(metadata)
 
 
-def write_metadata(fd, metadata, xattr_size=65536):
+def _serialize_metadata(metadata, xattr_size, compact):
+    """
+    Serialize metadata and work out how to split it across xattrs.
+
+    Compact metadata is cut into as few chunks as xattr_size allows, with
+    the chunks evened out rather than leaving a small trailing one; pickled
+    metadata keeps the historical xattr_size-sized chunks.
+
+    :returns: a tuple of (serialized metadata, chunk size)
     """
-    Helper function to write pickled metadata for an object file.
+    if compact:
+        body, ntyped = encode_compact_metadata(metadata)
+        if body is not None:
+            total = COMPACT_METADATA_HEADER_LEN + len(body)
+            nchunks = (total + xattr_size - 1) // xattr_size
+            if nchunks <= COMPACT_METADATA_MAX_CHUNKS:
+                metastr = COMPACT_METADATA_MAGIC + \
+                    COMPACT_METADATA_HEADER.pack(
+                        COMPACT_METADATA_VERSION, nchunks, ntyped,
+                        len(body)) + body
+                return metastr, (total + nchunks - 1) // nchunks
+    return pickle.dumps(metadata, PICKLE_PROTOCOL), xattr_size
+
+
+def write_metadata(fd, metadata, xattr_size=65536, compact=False):
+    """
+    Helper function to write metadata for an object file.
 
     :param fd: file descriptor or filename to write the metadata
     :param metadata: metadata to write
+    :param xattr_size: the largest value to store in a single xattr
+    :param compact: if True, use the compact metadata format rather than a
+                    pickle whenever the metadata can be represented in it
     """
-    metastr = pickle.dumps(metadata, PICKLE_PROTOCOL)
+    metastr, chunk_size = _serialize_metadata(metadata, xattr_size, compact)
     key = 0
     while metastr:
         try:
             xattr.setxattr(fd, '%s%s' % (METADATA_KEY, key or ''),
-                           metastr[:xattr_size])
-            metastr = metastr[xattr_size:]
+                           metastr[:chunk_size])
+            metastr = metastr[chunk_size:]
             key += 1
         except IOError as e:
-            for err in 'ENOTSUP', 'EOPNOTSUPP':
-                if hasattr(errno, err) and e.errno == getattr(errno, err):
-                    msg = "Filesystem at %s does not support xattr" % \
-                          _get_filename(fd)
-                    logging.exception(msg)
-                    raise DiskFileXattrNotSupported(e)
+            _reraise_xattr_error(fd, e)
+            if e.errno == errno.E2BIG and key == 0 and \
+                    xattr_size > MIN_XATTR_SIZE:
+                # the filesystem has a smaller limit on xattr values than
+                # we were told; retry with smaller chunks
+                return write_metadata(fd, metadata, xattr_size // 2, compact)
             if e.errno in (errno.ENOSPC, errno.EDQUOT):
                 msg = "No space left on device for %s" % _get_filename(fd)
                 logging.exception(msg)
@@ -170,6 +349,50 @@ def write_metadata(fd, metadata, xattr_size=65536):
             raise
 
 
+def migrate_metadata(path, xattr_size=65536):
+    """
+    Rewrite the pickled metadata of an object file in the compact format.
+
+    Only metadata that fits in a single xattr in both formats is migrated,
+    so the switch is one atomic setxattr() and concurrent readers see
+    either the old or the new metadata, never a mix of the two.
+
+    :param path: path of the object file to migrate
+    :param xattr_size: the largest value to store in a single xattr
+    :returns: True if the metadata was rewritten, False otherwise
+    """
+    try:
+        metastr = xattr.getxattr(path, METADATA_KEY)
+    except (IOError, OSError) as e:
+        _reraise_xattr_error(path, e)
+        if e.errno == errno.ENOENT:
+            raise DiskFileNotExist()
+        return False
+    if metastr.startswith(COMPACT_METADATA_MAGIC):
+        return False
+    try:
+        xattr.getxattr(path, '%s1' % METADATA_KEY)
+    except (IOError, OSError):
+        pass
+    else:
+        return False
+    metadata = pickle.loads(metastr)
+    compact, _junk = _serialize_metadata(metadata, xattr_size, True)
+    if not compact.startswith(COMPACT_METADATA_MAGIC) or \
+            len(compact) > xattr_size:
+        return False
+    write_metadata(path, metadata, xattr_size, compact=True)
+    return True
+
+
+def _internal_timestamp(file_info):
+    """
+    Sort key for file info dicts that orders them by timestamp, like their
+    Timestamps would, but formats each Timestamp only once.
+    """
+    return file_info['timestamp'].internal
+
+
 def extract_policy(obj_path):
     """
     Extracts the policy for an object (based on the name of the objects
@@ -319,6 +542,141 @@ def invalidate_hash(suffix_dir):
             inv_fh.write(suffix + "\n")
 
 
+def record_verified(data_file, verified_time=None):
+    """
+    Records that an object's data was found to match its etag, in the
+    partition's verified.journal. Nothing is recorded once the journal has
+    reached MAX_VERIFIED_JOURNAL_SIZE.
+
+    :param data_file: absolute path to the .data file that was verified
+    :param verified_time: when the object was verified, defaults to now
+    """
+    object_dir = dirname(data_file)
+    partition_dir = dirname(dirname(object_dir))
+    if verified_time is None:
+        verified_time = time.time()
+    journal_file = join(partition_dir, VERIFIED_JOURNAL_FILE)
+    with lock_path(partition_dir):
+        with open(journal_file, 'a') as journal_fh:
+            journal_fh.seek(0, os.SEEK_END)
+            if journal_fh.tell() < MAX_VERIFIED_JOURNAL_SIZE:
+                journal_fh.write('%s %s %d\n' % (
+                    basename(object_dir),
+                    _data_file_timestamp(basename(data_file)).internal,
+                    verified_time))
+
+
+def _data_file_timestamp(filename):
+    return Timestamp(filename[:-len('.data')].split('#', 1)[0])
+
+
+def consolidate_verified(partition_dir, object_hashes=None):
+    """
+    Take what's in verified.pkl and verified.journal, combine them, write the
+    result back to verified.pkl, and clear out verified.journal.
+
+    :param partition_dir: absolute path to partition dir containing
+                          verified.pkl and verified.journal
+    :param object_hashes: if given, the hashes of the objects in the
+                          partition; the times of any other objects are
+                          dropped
+    :returns: a dict of object hash to a tuple of the timestamp of the .data
+              file last verified and the time it was verified
+    """
+    verified_file = join(partition_dir, VERIFIED_FILE)
+    journal_file = join(partition_dir, VERIFIED_JOURNAL_FILE)
+    with lock_path(partition_dir):
+        try:
+            with open(verified_file, 'rb') as verified_fp:
+                stored = pickle.load(verified_fp)
+            if not isinstance(stored, dict):
+                stored = {}
+        except Exception:
+            # missing or unreadable; everything will be verified again
+            stored = {}
+        if object_hashes is None:
+            entries = dict(stored)
+        else:
+            entries = dict((hsh, entry) for hsh, entry in stored.items()
+                           if hsh in object_hashes)
+
+        journaled = False
+        try:
+            with open(journal_file, 'r') as journal_fh:
+                for line in journal_fh:
+                    journaled = True
+                    try:
+                        hsh, timestamp, when = line.split()
+                        when = int(when)
+                    except ValueError:
+                        continue
+                    if object_hashes is not None and \
+                            hsh not in object_hashes:
+                        continue
+                    if when >= entries.get(hsh, (None, 0))[1]:
+                        entries[hsh] = (timestamp, when)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+        if entries != stored:
+            write_pickle(entries, verified_file, partition_dir,
+                         PICKLE_PROTOCOL)
+        if journaled:
+            with open(journal_file, 'w'):
+                pass
+        return entries
+
+
+def get_oldest_verified(partition_dir):
+    """
+    Returns the time that the least recently verified object in a partition
+    was last verified, as of the last consolidation of its verified.pkl, or
+    0 if there is no record of any verified object.
+
+    :param partition_dir: absolute path to the partition dir
+    """
+    try:
+        with open(join(partition_dir, VERIFIED_FILE), 'rb') as verified_fp:
+            return min(when for _, when in pickle.load(verified_fp).values())
+    except Exception:
+        return 0
+
+
+def get_hash_bucket(object_hash):
+    """
+    Returns the bucket that an object hash falls into within its suffix;
+    each suffix is split into 16 buckets by the first hex digit of the
+    object hash.
+
+    :param object_hash: the object's hash
+    """
+    return object_hash[:1]
+
+
+class _TeeHashes(object):
+    """
+    Looks like a dict of md5 hashers, but updates the hashers of the same
+    key in each of several dicts of hashers.
+    """
+
+    def __init__(self, *hashes):
+        self.hashes = hashes
+
+    def __getitem__(self, key):
+        return _TeeHasher([hashes[key] for hashes in self.hashes])
+
+
+class _TeeHasher(object):
+
+    def __init__(self, hashers):
+        self.hashers = hashers
+
+    def update(self, data):
+        for hasher in self.hashers:
+            hasher.update(data)
+
+
 class AuditLocation(object):
     """
     Represents an object location to be audited.
@@ -336,7 +694,8 @@ class AuditLocation(object):
 
 
 def object_audit_location_generator(devices, mount_check=True, logger=None,
-                                    device_dirs=None, auditor_type="ALL"):
+                                    device_dirs=None, auditor_type="ALL",
+                                    verified_before=None):
     """
     Given a devices path (e.g. "/srv/node"), yield an AuditLocation for all
     objects stored under that directory if device_dirs isn't set.  If
@@ -352,6 +711,13 @@ def object_audit_location_generator(devices, mount_check=True, logger=None,
     :param logger: a logger object
     :param device_dirs: a list of directories under devices to traverse
     :param auditor_type: either ALL or ZBF
+    :param verified_before: if set, only yield AuditLocation for the objects
+                            not verified since this time (see
+                            record_verified), the least recently verified
+                            first; partitions are visited in the order of
+                            their least recently verified object. Otherwise
+                            the verified.journal of each partition walked is
+                            consolidated.
     """
     if not device_dirs:
         device_dirs = listdir(devices)
@@ -393,17 +759,27 @@ def object_audit_location_generator(devices, mount_check=True, logger=None,
             datadir_path = os.path.join(devices, device, dir_)
 
             partitions = get_auditor_status(datadir_path, logger, auditor_type)
+            if verified_before is not None:
+                partitions.sort(key=lambda partition: get_oldest_verified(
+                    os.path.join(datadir_path, partition)))
 
             for pos, partition in enumerate(partitions):
                 update_auditor_status(datadir_path, logger,
                                       partitions[pos:], auditor_type)
                 part_path = os.path.join(datadir_path, partition)
+                if verified_before is not None:
+                    for location in _unverified_audit_locations(
+                            part_path, device, partition, policy,
+                            verified_before):
+                        yield location
+                    continue
                 try:
                     suffixes = listdir(part_path)
                 except OSError as e:
                     if e.errno != errno.ENOTDIR:
                         raise
                     continue
+                object_hashes = set()
                 for asuffix in suffixes:
                     suff_path = os.path.join(part_path, asuffix)
                     try:
@@ -413,13 +789,75 @@ def object_audit_location_generator(devices, mount_check=True, logger=None,
                             raise
                         continue
                     for hsh in hashes:
+                        object_hashes.add(hsh)
                         hsh_path = os.path.join(suff_path, hsh)
                         yield AuditLocation(hsh_path, device, partition,
                                             policy)
+                if VERIFIED_JOURNAL_FILE in suffixes:
+                    # fold in what object servers tracking verified objects
+                    # journaled, so the journal doesn't grow while no
+                    # incremental auditor reads it
+                    consolidate_verified(part_path, object_hashes)
 
             update_auditor_status(datadir_path, logger, [], auditor_type)
 
 
+def _unverified_audit_locations(part_path, device, partition, policy,
+                                verified_before):
+    object_paths = {}
+    try:
+        suffixes = listdir(part_path)
+    except OSError as e:
+        if e.errno != errno.ENOTDIR:
+            raise
+        return
+    for asuffix in suffixes:
+        suff_path = os.path.join(part_path, asuffix)
+        try:
+            hashes = listdir(suff_path)
+        except OSError as e:
+            if e.errno != errno.ENOTDIR:
+                raise
+            continue
+        for hsh in hashes:
+            object_paths[hsh] = os.path.join(suff_path, hsh)
+    if not object_paths:
+        return
+    verified = consolidate_verified(part_path, object_paths)
+    unverified = []
+    for hsh, object_path in object_paths.items():
+        timestamp, when = verified.get(hsh, (None, 0))
+        if when >= verified_before and \
+                _newest_data_timestamp(object_path) != timestamp:
+            # the .data has been replaced since, e.g. by rsync
+            when = 0
+        if when < verified_before:
+            unverified.append((when, hsh))
+    for when, hsh in sorted(unverified):
+        yield AuditLocation(object_paths[hsh], device, partition, policy)
+
+
+def _newest_data_timestamp(object_path):
+    """
+    Returns the internal form of the timestamp of the newest .data file in
+    the hash dir at object_path, or None if there is none.
+    """
+    try:
+        files = listdir(object_path)
+    except OSError:
+        return None
+    timestamps = []
+    for filename in files:
+        if filename.endswith('.data'):
+            try:
+                timestamps.append(_data_file_timestamp(filename))
+            except ValueError:
+                pass
+    if not timestamps:
+        return None
+    return max(timestamps).internal
+
+
 def get_auditor_status(datadir_path, logger, auditor_type):
     auditor_status = os.path.join(
         datadir_path, "auditor_status_%s.json" % auditor_type)
@@ -515,7 +953,10 @@ class DiskFileRouter(object):
         self.policy_to_manager = {}
         for policy in POLICIES:
             manager_cls = self.policy_type_to_manager_cls[policy.policy_type]
-            self.policy_to_manager[policy] = manager_cls(*args, **kwargs)
+            manager = manager_cls(*args, **kwargs)
+            # objects of every policy on a device share its thread pool
+            kwargs['threadpools'] = manager.threadpools
+            self.policy_to_manager[policy] = manager
 
     def __getitem__(self, policy):
         return self.policy_to_manager[policy]
@@ -542,15 +983,19 @@ class BaseDiskFileManager(object):
 
     :param conf: caller provided configuration object
     :param logger: caller provided logger
+    :param threadpools: a defaultdict mapping device paths to the thread pool
+                        that does their disk I/O, to share with other
+                        managers; by default the manager makes its own
     """
 
     diskfile_cls = None  # must be set by subclasses
 
     invalidate_hash = strip_self(invalidate_hash)
     consolidate_hashes = strip_self(consolidate_hashes)
+    record_verified = strip_self(record_verified)
     quarantine_renamer = strip_self(quarantine_renamer)
 
-    def __init__(self, conf, logger):
+    def __init__(self, conf, logger, threadpools=None):
         self.logger = logger
         self.devices = conf.get('devices', '/srv/node')
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
@@ -562,6 +1007,27 @@ class BaseDiskFileManager(object):
             conf.get('replication_one_per_device', 'true'))
         self.replication_lock_timeout = int(conf.get(
             'replication_lock_timeout', 15))
+        self.compact_metadata = config_true_value(
+            conf.get('compact_metadata', 'false'))
+        self.track_verified = config_true_value(
+            conf.get('track_verified', 'false'))
+        self.not_found_cache_time = float(
+            conf.get('not_found_cache_time', 0))
+        self.not_found_cache_size = int(
+            conf.get('not_found_cache_size', 10000))
+        self._not_found = OrderedDict()
+        self.not_found_generation = 0
+        self.metadata_cache_size = int(conf.get('metadata_cache_size', 0))
+        self._metadata_cache = OrderedDict()
+        self.metadata_cache_hits = 0
+        self.metadata_cache_misses = 0
+        if threadpools is None:
+            threads_per_disk = int(conf.get('threads_per_disk', 0))
+            max_queue_depth = int(conf.get('max_queue_depth_per_disk', 0))
+            threadpools = defaultdict(
+                lambda: ThreadPool(nthreads=threads_per_disk,
+                                   max_queue_depth=max_queue_depth))
+        self.threadpools = threadpools
 
         self.use_splice = False
         self.pipe_size = None
@@ -591,8 +1057,129 @@ class BaseDiskFileManager(object):
                 with open('/proc/sys/fs/pipe-max-size') as f:
                     max_pipe_size = int(f.read())
                 self.pipe_size = min(max_pipe_size, self.disk_chunk_size)
+
+        self.use_kernel_md5 = False
+        conf_wants_kernel_md5 = config_true_value(
+            conf.get('kernel_md5', 'no'))
+        if conf_wants_kernel_md5 and not kernel_md5_available():
+            self.logger.warning(
+                "Use of kernel MD5 requested (config says \"kernel_md5 = "
+                "%s\"), but MD5 sockets are not supported. "
+                "hashlib will be used." % conf.get('kernel_md5'))
+        elif conf_wants_kernel_md5:
+            self.use_kernel_md5 = True
+            if splice.available and self.pipe_size is None:
+                with open('/proc/sys/fs/pipe-max-size') as f:
+                    max_pipe_size = int(f.read())
+                self.pipe_size = min(max_pipe_size, self.disk_chunk_size)
         self.use_linkat = o_tmpfile_supported()
 
+    def cached_not_found(self, datadir):
+        """
+        Check the negative cache for an object hash directory.
+
+        :param datadir: the object's hash directory
+        :returns: True if the directory was found to hold no files less than
+                  not_found_cache_time seconds ago, False otherwise
+        """
+        if not self.not_found_cache_time:
+            return False
+        expires = self._not_found.get(datadir)
+        if expires is None:
+            return False
+        if expires > time.time():
+            return True
+        del self._not_found[datadir]
+        return False
+
+    def remember_not_found(self, datadir, generation):
+        """
+        Record in the negative cache that an object hash directory holds no
+        files, evicting the oldest entries once not_found_cache_size is
+        reached.
+
+        :param datadir: the object's hash directory
+        :param generation: the value of not_found_generation taken before the
+                           directory was listed; nothing is recorded if
+                           :func:`forget_not_found` was called since, as a
+                           file may have been written after the listing
+        """
+        if not self.not_found_cache_time:
+            return
+        if generation != self.not_found_generation:
+            return
+        self._not_found.pop(datadir, None)
+        while len(self._not_found) >= self.not_found_cache_size:
+            self._not_found.popitem(last=False)
+        self._not_found[datadir] = time.time() + self.not_found_cache_time
+
+    def forget_not_found(self, datadir):
+        """
+        Drop an object hash directory from the negative cache; called before
+        anything is written to it.
+
+        :param datadir: the object's hash directory
+        """
+        self.not_found_generation += 1
+        self._not_found.pop(datadir, None)
+
+    def get_cached_listing(self, datadir, dir_key):
+        """
+        Look up an object hash directory in the metadata cache.
+
+        :param datadir: the object's hash directory
+        :param dir_key: (inode, mtime) of the directory as it is now
+        :returns: the cache entry, a dict with the directory's ``files`` and
+                  the ``metadata`` read so far keyed by file path, or None
+                  if the directory is not cached or has changed since
+        """
+        entry = self._metadata_cache.pop(datadir, None)
+        if entry is not None and entry['key'] == dir_key:
+            self._metadata_cache[datadir] = entry
+            self.metadata_cache_hits += 1
+            self.logger.increment('metadata_cache.hits')
+            return entry
+        self.metadata_cache_misses += 1
+        self.logger.increment('metadata_cache.misses')
+        return None
+
+    def cache_listing(self, datadir, dir_key, files):
+        """
+        Add an object hash directory listing to the metadata cache, evicting
+        the least recently used entries once metadata_cache_size is reached.
+
+        :param datadir: the object's hash directory
+        :param dir_key: (inode, mtime) of the directory, taken before it
+                        was listed
+        :param files: the directory listing
+        :returns: the new cache entry
+        """
+        while len(self._metadata_cache) >= self.metadata_cache_size:
+            self._metadata_cache.popitem(last=False)
+        entry = {'key': dir_key, 'files': files, 'metadata': {}}
+        self._metadata_cache[datadir] = entry
+        return entry
+
+    def forget_cached_listing(self, datadir):
+        """
+        Drop an object hash directory from the metadata cache.
+
+        :param datadir: the object's hash directory
+        """
+        self._metadata_cache.pop(datadir, None)
+
+    def metadata_cache_stats(self):
+        """
+        :returns: a dict with the metadata cache's hits, misses, hit_ratio
+                  and current size
+        """
+        lookups = self.metadata_cache_hits + self.metadata_cache_misses
+        return {'hits': self.metadata_cache_hits,
+                'misses': self.metadata_cache_misses,
+                'hit_ratio': (float(self.metadata_cache_hits) / lookups
+                              if lookups else 0.0),
+                'size': len(self._metadata_cache)}
+
     def make_on_disk_filename(self, timestamp, ext=None,
                               ctype_timestamp=None, *a, **kw):
         """
@@ -656,7 +1243,7 @@ class BaseDiskFileManager(object):
                 timestamp, ts_ctype = decode_timestamps(
                     fname, explicit=True)[:2]
             else:
-                timestamp = Timestamp(fname)
+                timestamp = Timestamp.from_internal(fname)
         except ValueError:
             raise DiskFileError('Invalid Timestamp value in filename %r'
                                 % filename)
@@ -725,8 +1312,11 @@ class BaseDiskFileManager(object):
         :param timestamp: a Timestamp.
         :return: a tuple of two lists.
         """
+        # Comparing Timestamps formats both sides as strings, so compare
+        # each file's internal form with one formatted copy of timestamp.
+        internal = timestamp.internal
         return self._split_list(
-            file_info_list, lambda x: x['timestamp'] > timestamp)
+            file_info_list, lambda x: x['timestamp'].internal > internal)
 
     def _split_gte_timestamp(self, file_info_list, timestamp):
         """
@@ -738,8 +1328,9 @@ class BaseDiskFileManager(object):
         :param timestamp: a Timestamp.
         :return: a tuple of two lists.
         """
+        internal = timestamp.internal
         return self._split_list(
-            file_info_list, lambda x: x['timestamp'] >= timestamp)
+            file_info_list, lambda x: x['timestamp'].internal >= internal)
 
     def get_ondisk_files(self, files, datadir, verify=True, **kwargs):
         """
@@ -807,10 +1398,11 @@ class BaseDiskFileManager(object):
                 else:
                     self.logger.warning('Unexpected file %s: %s',
                                         file_path, e)
-        for ext in exts:
-            # For each extension sort files into reverse chronological order.
-            exts[ext] = sorted(
-                exts[ext], key=lambda info: info['timestamp'], reverse=True)
+        for ext, file_infos in exts.items():
+            # For each extension sort files into reverse chronological order;
+            # a hash dir usually holds a single file of each type.
+            if len(file_infos) > 1:
+                file_infos.sort(key=_internal_timestamp, reverse=True)
 
         if exts.get('.ts'):
             # non-tombstones older than or equal to latest tombstone are
@@ -932,11 +1524,14 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
-    def _hash_suffix_dir(self, path, reclaim_age):
+    def _hash_suffix_dir(self, path, reclaim_age, bucket_hashes=None):
         """
 
         :param path: full path to directory
         :param reclaim_age: age in seconds at which to remove tombstones
+        :param bucket_hashes: if given, a dict that is filled in with a dict
+                              of md5 hashers for each hash-prefix bucket,
+                              updated just as the suffix's hashers are
         """
         hashes = defaultdict(hashlib.md5)
         try:
@@ -968,6 +1563,11 @@ class BaseDiskFileManager(object):
                     pass
                 continue
 
+            obj_hashes = hashes
+            if bucket_hashes is not None:
+                obj_hashes = _TeeHashes(hashes, bucket_hashes.setdefault(
+                    get_hash_bucket(hsh), defaultdict(hashlib.md5)))
+
             # ondisk_info has info dicts containing timestamps for those
             # files that could determine the state of the diskfile if it were
             # to be opened. We update the suffix hash with the concatenation of
@@ -980,10 +1580,11 @@ class BaseDiskFileManager(object):
             for key in (k for k in ('meta_info', 'ts_info')
                         if k in ondisk_info):
                 info = ondisk_info[key]
-                hashes[None].update(info['timestamp'].internal + info['ext'])
+                obj_hashes[None].update(
+                    info['timestamp'].internal + info['ext'])
 
             # delegate to subclass for data file related updates...
-            self._update_suffix_hashes(hashes, ondisk_info)
+            self._update_suffix_hashes(obj_hashes, ondisk_info)
 
             if 'ctype_info' in ondisk_info:
                 # We have a distinct content-type timestamp so update the
@@ -992,8 +1593,8 @@ class BaseDiskFileManager(object):
                 # the hash in future. There is no .ctype file so use _ctype to
                 # avoid any confusion.
                 info = ondisk_info['ctype_info']
-                hashes[None].update(info['ctype_timestamp'].internal
-                                    + '_ctype')
+                obj_hashes[None].update(info['ctype_timestamp'].internal
+                                        + '_ctype')
 
         try:
             os.rmdir(path)
@@ -1017,6 +1618,74 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
+    def _hash_suffix_buckets(self, path, reclaim_age):
+        """
+        Performs reclamation and returns the hash of the suffix along with
+        the hashes of each of its hash-prefix buckets.
+
+        :param path: full path to directory
+        :param reclaim_age: age in seconds at which to remove tombstones
+        :raises PathNotDir: if given path is not a valid directory
+        :raises OSError: for non-ENOTDIR errors
+        :returns: a 2-tuple of the suffix hash and a dict mapping bucket to
+                  bucket hash, each in the form returned by
+                  :meth:`_hash_suffix`
+        """
+        raise NotImplementedError
+
+    def _get_bucket_hashes(self, partition_path, suffixes,
+                           reclaim_age=None):
+        """
+        Get the hashes of the hash-prefix buckets of some suffix dirs in a
+        partition. Bucket hashes are cached in the partition's buckets.pkl
+        along with the suffix hash they were computed with, and are only
+        recomputed once the suffix hash has changed.
+
+        :param partition_path: absolute path of partition to get hashes for
+        :param suffixes: list of suffixes to get bucket hashes for
+        :param reclaim_age: age at which to remove tombstones
+
+        :returns: dict mapping each suffix to a dict of bucket hashes; a
+                  suffix that does not exist has no buckets
+        """
+        reclaim_age = reclaim_age or self.reclaim_age
+        _junk, hashes = self._get_hashes(
+            partition_path, reclaim_age=reclaim_age)
+        buckets_file = join(partition_path, BUCKETS_FILE)
+        try:
+            with open(buckets_file, 'rb') as fp:
+                cached = pickle.load(fp)
+        except Exception:
+            cached = {}
+        modified = False
+        for suffix in list(cached):
+            if suffix not in hashes:
+                del cached[suffix]
+                modified = True
+        result = {}
+        for suffix in suffixes:
+            if suffix not in hashes:
+                result[suffix] = {}
+                continue
+            suffix_hash, buckets = cached.get(suffix, (None, None))
+            if suffix_hash is None or suffix_hash != hashes[suffix]:
+                try:
+                    suffix_hash, buckets = self._hash_suffix_buckets(
+                        join(partition_path, suffix), reclaim_age)
+                except PathNotDir:
+                    cached.pop(suffix, None)
+                    result[suffix] = {}
+                    modified = True
+                    continue
+                cached[suffix] = (suffix_hash, buckets)
+                modified = True
+            result[suffix] = buckets
+        if modified:
+            with lock_path(partition_path):
+                write_pickle(
+                    cached, buckets_file, partition_path, PICKLE_PROTOCOL)
+        return result
+
     def _get_hashes(self, partition_path, recalculate=None, do_listdir=False,
                     reclaim_age=None):
         """
@@ -1191,16 +1860,19 @@ class BaseDiskFileManager(object):
                                  use_linkat=self.use_linkat, **kwargs)
 
     def object_audit_location_generator(self, device_dirs=None,
-                                        auditor_type="ALL"):
+                                        auditor_type="ALL",
+                                        verified_before=None):
         """
         Yield an AuditLocation for all objects stored under device_dirs.
 
         :param device_dirs: directory of target device
         :param auditor_type: either ALL or ZBF
+        :param verified_before: if set, only objects not verified since this
+                                time, least recently verified first
         """
         return object_audit_location_generator(self.devices, self.mount_check,
                                                self.logger, device_dirs,
-                                               auditor_type)
+                                               auditor_type, verified_before)
 
     def get_diskfile_from_audit_location(self, audit_location):
         """
@@ -1285,6 +1957,26 @@ class BaseDiskFileManager(object):
             self._get_hashes, partition_path, recalculate=suffixes)
         return hashes
 
+    def get_bucket_hashes(self, device, partition, suffixes, policy):
+        """
+
+        :param device: name of target device
+        :param partition: partition name
+        :param suffixes: a list of suffix directories to get bucket hashes for
+        :param policy: the StoragePolicy instance
+        :returns: a dictionary that maps each suffix to a dictionary of its
+                  hash-prefix buckets' hashes
+        """
+        dev_path = self.get_dev_path(device)
+        if not dev_path:
+            raise DiskFileDeviceUnavailable()
+        partition_path = os.path.join(dev_path, get_data_dir(policy),
+                                      partition)
+        if not os.path.exists(partition_path):
+            return dict((suffix, {}) for suffix in suffixes)
+        return tpool_reraise(
+            self._get_bucket_hashes, partition_path, suffixes)
+
     def _listdir(self, path):
         """
         :param path: full path to directory
@@ -1322,7 +2014,7 @@ class BaseDiskFileManager(object):
             yield (os.path.join(partition_path, suffix), suffix)
 
     def yield_hashes(self, device, partition, policy,
-                     suffixes=None, **kwargs):
+                     suffixes=None, buckets=None, **kwargs):
         """
         Yields tuples of (full_path, hash_only, timestamps) for object
         information stored for the given device, partition, and
@@ -1345,6 +2037,10 @@ class BaseDiskFileManager(object):
         :param partition: partition name
         :param policy: the StoragePolicy instance
         :param suffixes: optional list of suffix directories to be searched
+        :param buckets: optional dict mapping suffix to the hash-prefix
+                        buckets to be searched in that suffix; object
+                        dirs in other buckets are skipped without being
+                        listed
         """
         dev_path = self.get_dev_path(device)
         if not dev_path:
@@ -1365,7 +2061,13 @@ class BaseDiskFileManager(object):
             ('ts_ctype', 'ctype_info', 'ctype_timestamp'),
         )
         for suffix_path, suffix in suffixes:
+            suffix_buckets = None
+            if buckets is not None:
+                suffix_buckets = buckets.get(suffix)
             for object_hash in self._listdir(suffix_path):
+                if suffix_buckets is not None and \
+                        get_hash_bucket(object_hash) not in suffix_buckets:
+                    continue
                 object_path = os.path.join(suffix_path, object_hash)
                 try:
                     results = self.cleanup_ondisk_files(
@@ -1431,6 +2133,7 @@ class BaseDiskFileWriter(object):
         self._last_sync = 0
         self._extension = '.data'
         self._put_succeeded = False
+        self._pipes = None
 
     @property
     def manager(self):
@@ -1440,6 +2143,15 @@ class BaseDiskFileWriter(object):
     def put_succeeded(self):
         return self._put_succeeded
 
+    def close(self):
+        """
+        Release anything held for zero-copy writes. The file descriptor
+        itself is closed by :func:`swift.obj.diskfile.DiskFile.create`.
+        """
+        pipes, self._pipes = self._pipes, None
+        for fd in pipes or ():
+            os.close(fd)
+
     def write(self, chunk):
         """
         Write a chunk of data to disk. All invocations of this method must
@@ -1452,24 +2164,95 @@ class BaseDiskFileWriter(object):
         :returns: the total number of bytes written to an object
         """
 
-        while chunk:
-            written = os.write(self._fd, chunk)
-            self._upload_size += written
-            chunk = chunk[written:]
+        def _write_entire_chunk(chunk):
+            while chunk:
+                written = os.write(self._fd, chunk)
+                self._upload_size += written
+                chunk = chunk[written:]
+
+        self._diskfile._threadpool.run_in_thread(_write_entire_chunk, chunk)
+        self._sync_if_needed()
+        return self._upload_size
 
+    def _sync_if_needed(self):
         # For large files sync every 512MB (by default) written
         diff = self._upload_size - self._last_sync
         if diff >= self._bytes_per_sync:
-            tpool_reraise(fdatasync, self._fd)
+            self._diskfile._threadpool.force_run_in_thread(
+                fdatasync, self._fd)
             drop_buffer_cache(self._fd, self._last_sync, diff)
             self._last_sync = self._upload_size
 
+    def can_zero_copy_write(self):
+        return self._diskfile._use_splice
+
+    def zero_copy_write(self, rsockfd, length, hasher):
+        """
+        Moves data straight from a socket into the file with splice() and
+        tee(), without it ever touching userspace. Whatever is written is
+        also fed to ``hasher`` through its ``update_from_pipe()`` method, e.g.
+        a :class:`swift.common.utils.KernelMD5`.
+
+        At most ``length`` bytes (and at most one pipe's worth) are moved per
+        call. This waits for the socket to become readable, so callers that
+        want a timeout should wrap the call in one.
+
+        :param rsockfd: file descriptor (integer) of the socket to read from
+        :param length: maximum number of bytes to move
+        :param hasher: hash object to feed the data to
+        :returns: the total number of bytes written to the object, as
+                  :func:`write` does; if this did not change the socket is
+                  at EOF
+        """
+        if self._pipes is None:
+            client_rpipe, client_wpipe = os.pipe()
+            hash_rpipe, hash_wpipe = os.pipe()
+            self._pipes = (client_rpipe, client_wpipe, hash_rpipe, hash_wpipe)
+            # Note: this will raise IOError on failure, so we don't bother
+            # checking the return value.
+            self._pipe_size = fcntl.fcntl(client_rpipe, F_SETPIPE_SZ,
+                                          self._diskfile._pipe_size)
+            fcntl.fcntl(hash_rpipe, F_SETPIPE_SZ, self._pipe_size)
+        client_rpipe, client_wpipe, hash_rpipe, hash_wpipe = self._pipes
+
+        while True:
+            try:
+                (bytes_in_pipe, _1, _2) = splice(
+                    rsockfd, None, client_wpipe, None,
+                    min(length, self._pipe_size), 0)
+                break
+            except IOError as exc:
+                if exc.errno != errno.EWOULDBLOCK:
+                    raise
+                trampoline(rsockfd, read=True)
+        if bytes_in_pipe == 0:
+            return self._upload_size
+
+        # Both pipes are empty between calls, so a short tee() means
+        # something is badly wrong; carrying on would give a bad etag.
+        bytes_copied = tee(client_rpipe, hash_wpipe, bytes_in_pipe, 0)
+        if bytes_copied != bytes_in_pipe:
+            raise Exception("tee() failed: tried to move %d bytes, but only "
+                            "moved %d" % (bytes_in_pipe, bytes_copied))
+        hasher.update_from_pipe(hash_rpipe, bytes_in_pipe)
+
+        def _splice_entire_pipe(bytes_in_pipe):
+            while bytes_in_pipe > 0:
+                (written, _1, _2) = splice(
+                    client_rpipe, None, self._fd, None, bytes_in_pipe, 0)
+                self._upload_size += written
+                bytes_in_pipe -= written
+
+        self._diskfile._threadpool.run_in_thread(
+            _splice_entire_pipe, bytes_in_pipe)
+        self._sync_if_needed()
         return self._upload_size
 
     def _finalize_put(self, metadata, target_path, cleanup):
         # Write the metadata before calling fsync() so that both data and
         # metadata are flushed to disk.
-        write_metadata(self._fd, metadata)
+        write_metadata(self._fd, metadata,
+                       compact=self.manager.compact_metadata)
         # We call fsync() before calling drop_cache() to lower the amount of
         # redundant work the drop cache code will perform on the pages (now
         # that after fsync the pages will be all clean).
@@ -1492,6 +2275,13 @@ class BaseDiskFileWriter(object):
         # unnecessary os.unlink() of tempfile later. As renamer() has
         # succeeded, the tempfile would no longer exist at its original path.
         self._put_succeeded = True
+        if self.manager.track_verified and self._extension == '.data':
+            # the object server only puts data whose etag it has checked
+            try:
+                self.manager.record_verified(target_path)
+            except (Exception, Timeout):
+                logging.exception(_('Problem recording verification of %s'),
+                                  self._datadir)
         if cleanup:
             try:
                 self.manager.cleanup_ondisk_files(self._datadir)['files']
@@ -1523,7 +2313,8 @@ class BaseDiskFileWriter(object):
         metadata['name'] = self._name
         target_path = join(self._datadir, filename)
 
-        tpool_reraise(self._finalize_put, metadata, target_path, cleanup)
+        self._diskfile._threadpool.force_run_in_thread(
+            self._finalize_put, metadata, target_path, cleanup)
 
     def put(self, metadata):
         """
@@ -1615,7 +2406,7 @@ class BaseDiskFileReader(object):
     def _init_checks(self):
         if self._fp.tell() == 0:
             self._started_at_0 = True
-            self._iter_etag = hashlib.md5()
+            self._iter_etag = md5_hasher(self.manager.use_kernel_md5)
 
     def _update_checks(self, chunk):
         if self._iter_etag:
@@ -1630,7 +2421,8 @@ class BaseDiskFileReader(object):
             self._read_to_eof = False
             self._init_checks()
             while True:
-                chunk = self._fp.read(self._disk_chunk_size)
+                chunk = self._diskfile._threadpool.run_in_thread(
+                    self._fp.read, self._disk_chunk_size)
                 if chunk:
                     self._update_checks(chunk)
                     self._bytes_read += len(chunk)
@@ -1651,6 +2443,55 @@ class BaseDiskFileReader(object):
     def can_zero_copy_send(self):
         return self._use_splice
 
+    def can_zero_copy_hash(self):
+        return bool(self.manager.use_kernel_md5 and splice.available and
+                    self._pipe_size)
+
+    def zero_copy_hash(self, progress=None):
+        """
+        Verifies the whole data file without reading it into userspace: the
+        data is spliced from disk into a pipe and from there into an
+        in-kernel MD5 socket. The usual size and etag checks happen on
+        close, exactly as if the reader had been iterated.
+
+        :param progress: optional 1-arg callable, called with the number of
+                         bytes hashed each time through the loop
+        """
+        self._started_at_0 = True
+        self._read_to_eof = False
+        self._bytes_read = 0
+
+        rfd = self._fp.fileno()
+        rpipe, wpipe = os.pipe()
+        try:
+            hasher = KernelMD5()
+            try:
+                pipe_size = fcntl.fcntl(rpipe, F_SETPIPE_SZ, self._pipe_size)
+                dropped_cache = 0
+                while True:
+                    (bytes_in_pipe, _1, _2) = splice(
+                        rfd, None, wpipe, None, pipe_size, 0)
+                    if bytes_in_pipe == 0:
+                        self._read_to_eof = True
+                        self._drop_cache(rfd, dropped_cache,
+                                         self._bytes_read - dropped_cache)
+                        break
+                    hasher.update_from_pipe(rpipe, bytes_in_pipe)
+                    self._bytes_read += bytes_in_pipe
+                    if self._bytes_read - dropped_cache > DROP_CACHE_WINDOW:
+                        self._drop_cache(rfd, dropped_cache,
+                                         self._bytes_read - dropped_cache)
+                        dropped_cache = self._bytes_read
+                    if progress:
+                        progress(bytes_in_pipe)
+                self._md5_of_sent_bytes = hasher.hexdigest()
+            finally:
+                hasher.close()
+        finally:
+            os.close(rpipe)
+            os.close(wpipe)
+            self.close()
+
     def zero_copy_send(self, wsockfd):
         """
         Does some magic with splice() and tee() to move stuff from disk to
@@ -1839,6 +2680,12 @@ class BaseDiskFileReader(object):
             try:
                 if self._started_at_0 and self._read_to_eof:
                     self._handle_close_quarantine()
+                    if self.manager.track_verified and \
+                            self._md5_of_sent_bytes and \
+                            not self._quarantined_dir:
+                        # a full read has checked the md5 of the whole file
+                        self._diskfile._threadpool.run_in_thread(
+                            self.manager.record_verified, self._data_file)
             except DiskFileQuarantined:
                 raise
             except (Exception, Timeout) as e:
@@ -1890,6 +2737,7 @@ class BaseDiskFile(object):
                  use_linkat=False, **kwargs):
         self._manager = mgr
         self._device_path = device_path
+        self._threadpool = mgr.threadpools[device_path]
         self._logger = mgr.logger
         self._disk_chunk_size = mgr.disk_chunk_size
         self._bytes_per_sync = mgr.bytes_per_sync
@@ -1927,6 +2775,7 @@ class BaseDiskFile(object):
         self._metafile_metadata = None
         self._data_file = None
         self._fp = None
+        self._metadata_cache_entry = None
         self._quarantined_dir = None
         self._content_length = None
         if _datadir:
@@ -2008,9 +2857,9 @@ class BaseDiskFile(object):
     @classmethod
     def from_hash_dir(cls, mgr, hash_dir_path, device_path, partition, policy):
         return cls(mgr, device_path, None, partition, _datadir=hash_dir_path,
-                   policy=policy)
+                   policy=policy, pipe_size=mgr.pipe_size)
 
-    def open(self):
+    def open(self, read_body=True):
         """
         Open the object.
 
@@ -2024,31 +2873,27 @@ class BaseDiskFile(object):
             exceptions, but is only required to raise `DiskFileNotExist` when
             the object representation does not exist.
 
+        :param read_body: if False and the metadata was cached, the data file
+                          is only stat'ed and is opened by :func:`reader`
         :raises DiskFileCollision: on name mis-match with metadata
         :raises DiskFileNotExist: if the object does not exist
         :raises DiskFileDeleted: if the object was previously deleted
         :raises DiskFileQuarantined: if while reading metadata of the file
                                      some data did pass cross checks
+        :raises DiskFileDeviceBusy: if too many requests are already queued
+                                    for the device's thread pool
         :returns: itself for use as a context manager
         """
-        # First figure out if the data directory exists
-        try:
-            files = os.listdir(self._datadir)
-        except OSError as err:
-            if err.errno == errno.ENOTDIR:
-                # If there's a file here instead of a directory, quarantine
-                # it; something's gone wrong somewhere.
-                raise self._quarantine(
-                    # hack: quarantine_renamer actually renames the directory
-                    # enclosing the filename you give it, but here we just
-                    # want this one file and not its parent.
-                    os.path.join(self._datadir, "made-up-filename"),
-                    "Expected directory, found file at %s" % self._datadir)
-            elif err.errno != errno.ENOENT:
-                raise DiskFileError(
-                    "Error listing directory %s: %s" % (self._datadir, err))
-            # The data directory does not exist, so the object cannot exist.
+        if self._manager.cached_not_found(self._datadir):
+            # This directory was empty or missing a moment ago; there is no
+            # need to touch the disk to find that out again.
             files = []
+        else:
+            self._check_threadpool()
+            generation = self._manager.not_found_generation
+            files = self._list_datadir()
+            if not files:
+                self._manager.remember_not_found(self._datadir, generation)
 
         # gather info about the valid files to use to open the DiskFile
         file_info = self._get_ondisk_files(files)
@@ -2056,7 +2901,8 @@ class BaseDiskFile(object):
         self._data_file = file_info.get('data_file')
         if not self._data_file:
             raise self._construct_exception_from_ts_file(**file_info)
-        self._fp = self._construct_from_data_file(**file_info)
+        self._fp = self._construct_from_data_file(read_body=read_body,
+                                                  **file_info)
         # This method must populate the internal _metadata attribute.
         self._metadata = self._metadata or {}
         return self
@@ -2105,6 +2951,69 @@ class BaseDiskFile(object):
         self._logger.increment('quarantines')
         return DiskFileQuarantined(msg)
 
+    def _list_datadir(self):
+        """
+        List the object's hash directory, quarantining it if it turns out to
+        be a file.
+
+        With the metadata cache enabled the directory is stat'ed first; if
+        its inode and mtime match the cached entry, the cached listing and
+        the metadata already read from its files are used instead.
+
+        :returns: a list of file names, empty if the directory is missing
+        """
+        if not self._manager.metadata_cache_size:
+            return self._listdir()
+        try:
+            st = self._threadpool.run_in_thread(os.stat, self._datadir)
+        except OSError as err:
+            if err.errno == errno.ENOENT:
+                return []
+            return self._listdir()
+        if not stat.S_ISDIR(st.st_mode):
+            return self._listdir()
+        dir_key = (st.st_ino, st.st_mtime)
+        entry = self._manager.get_cached_listing(self._datadir, dir_key)
+        if entry is None:
+            files = self._listdir()
+            if time.time() - st.st_mtime < METADATA_CACHE_MIN_AGE:
+                return files
+            entry = self._manager.cache_listing(self._datadir, dir_key, files)
+        self._metadata_cache_entry = entry
+        return list(entry['files'])
+
+    def _listdir(self):
+        try:
+            return self._threadpool.run_in_thread(os.listdir, self._datadir)
+        except OSError as err:
+            if err.errno == errno.ENOTDIR:
+                # If there's a file here instead of a directory, quarantine
+                # it; something's gone wrong somewhere.
+                raise self._quarantine(
+                    # hack: quarantine_renamer actually renames the directory
+                    # enclosing the filename you give it, but here we just
+                    # want this one file and not its parent.
+                    os.path.join(self._datadir, "made-up-filename"),
+                    "Expected directory, found file at %s" % self._datadir)
+            elif err.errno != errno.ENOENT:
+                raise DiskFileError(
+                    "Error listing directory %s: %s" % (self._datadir, err))
+            # The data directory does not exist, so the object cannot exist.
+            return []
+
+    def _check_threadpool(self):
+        """
+        Refuse new work for a device whose thread pool already has
+        max_queue_depth_per_disk calls waiting, so that requests against an
+        overloaded disk fail fast instead of piling up behind it.
+
+        :raises DiskFileDeviceBusy: if the device's thread pool is full
+        """
+        if self._threadpool.full:
+            self._logger.increment('device_busy')
+            raise DiskFileDeviceBusy(
+                'Too many requests queued for %s' % self._device_path)
+
     def _get_ondisk_files(self, files):
         """
         Determine the on-disk files to use.
@@ -2163,7 +3072,8 @@ class BaseDiskFile(object):
         :param data_file: data file name being consider, used when quarantines
                           occur
         :param fp: open file pointer so that we can `fstat()` the file to
-                   verify the on-disk size with Content-Length metadata value
+                   verify the on-disk size with Content-Length metadata value;
+                   if None, the data file is stat'ed by name instead
         :raises DiskFileCollision: if the metadata stored name does not match
                                    the referenced name of the file
         :raises DiskFileExpired: if the object has expired
@@ -2207,10 +3117,16 @@ class BaseDiskFile(object):
             raise self._quarantine(
                 data_file, "bad metadata content-length value %s" % (
                     self._metadata['Content-Length']))
-        fd = fp.fileno()
         try:
-            statbuf = os.fstat(fd)
+            if fp is None:
+                statbuf = self._threadpool.run_in_thread(os.stat, data_file)
+            else:
+                statbuf = self._threadpool.run_in_thread(
+                    os.fstat, fp.fileno())
         except OSError as err:
+            if fp is None and err.errno == errno.ENOENT:
+                # cleaned up since the cached listing was taken
+                raise DiskFileNotExist()
             # Quarantine, we can't successfully stat the file.
             raise self._quarantine(data_file, "not stat-able: %s" % err)
         else:
@@ -2234,14 +3150,20 @@ class BaseDiskFile(object):
         :param source: file descriptor or filename to load the metadata from
         :param quarantine_filename: full path of file to load the metadata from
         """
+        cache = self._metadata_cache_entry
+        if cache is not None and quarantine_filename in cache['metadata']:
+            return dict(cache['metadata'][quarantine_filename])
         try:
-            return read_metadata(source)
+            metadata = self._threadpool.run_in_thread(read_metadata, source)
         except (DiskFileXattrNotSupported, DiskFileNotExist):
             raise
         except Exception as err:
             raise self._quarantine(
                 quarantine_filename,
                 "Exception reading metadata: %s" % err)
+        if cache is not None and quarantine_filename:
+            cache['metadata'][quarantine_filename] = dict(metadata)
+        return metadata
 
     def _merge_content_type_metadata(self, ctype_file):
         """
@@ -2263,7 +3185,7 @@ class BaseDiskFile(object):
                 ctypefile_metadata.get('Content-Type-Timestamp')
 
     def _construct_from_data_file(self, data_file, meta_file, ctype_file,
-                                  **kwargs):
+                                  read_body=True, **kwargs):
         """
         Open the `.data` file to fetch its metadata, and fetch the metadata
         from fast-POST `.meta` files as well if any exist, merging them
@@ -2273,12 +3195,24 @@ class BaseDiskFile(object):
         :param meta_file: on-disk fast-POST `.meta` file being considered
         :param ctype_file: on-disk fast-POST `.meta` file being considered that
                            contains content-type and content-type timestamp
-        :returns: an opened data file pointer
+        :param read_body: if False, a data file whose metadata was cached is
+                          not opened
+        :returns: an opened data file pointer, or None if the data file's
+                  metadata was cached and read_body is False, in which case
+                  the file is opened by :func:`reader`
         :raises DiskFileError: various exceptions from
                     :func:`swift.obj.diskfile.DiskFile._verify_data_file`
         """
-        fp = open(data_file, 'rb')
-        self._datafile_metadata = self._failsafe_read_metadata(fp, data_file)
+        cache = self._metadata_cache_entry
+        if (not read_body and cache is not None and
+                data_file in cache['metadata']):
+            fp = None
+            self._datafile_metadata = self._failsafe_read_metadata(
+                data_file, data_file)
+        else:
+            fp = open(data_file, 'rb')
+            self._datafile_metadata = self._failsafe_read_metadata(
+                fp, data_file)
         self._metadata = {}
         if meta_file:
             self._metafile_metadata = self._failsafe_read_metadata(
@@ -2312,6 +3246,46 @@ class BaseDiskFile(object):
         self._verify_data_file(data_file, fp)
         return fp
 
+    def migrate_metadata(self):
+        """
+        Rewrite pickled metadata of the files found by the last call to
+        :func:`open` in the compact metadata format.
+
+        :returns: the number of files whose metadata was rewritten
+        """
+        migrated = 0
+        for key in ('data_file', 'meta_file', 'ctype_file'):
+            filename = (self._ondisk_info or {}).get(key)
+            if filename and (key != 'ctype_file' or
+                             filename != self._ondisk_info['meta_file']):
+                try:
+                    migrated += migrate_metadata(filename)
+                except DiskFileNotExist:
+                    # cleaned up under us since it was opened
+                    pass
+        return migrated
+
+    def _open_data_file(self):
+        """
+        Open the data file found by :func:`open` when its metadata came from
+        the metadata cache, and check it the way :func:`open` would have.
+
+        :returns: an opened data file pointer
+        :raises DiskFileNotExist: if the data file has gone away since
+        """
+        try:
+            fp = open(self._data_file, 'rb')
+        except IOError as err:
+            if err.errno == errno.ENOENT:
+                raise DiskFileNotExist()
+            raise
+        try:
+            self._verify_data_file(self._data_file, fp)
+        except BaseException:
+            fp.close()
+            raise
+        return fp
+
     def get_metafile_metadata(self):
         """
         Provide the metafile metadata for a previously opened object as a
@@ -2365,7 +3339,7 @@ class BaseDiskFile(object):
         :raises DiskFileError: this implementation will raise the same
                             errors as the `open()` method.
         """
-        with self.open():
+        with self.open(read_body=False):
             return self.get_metadata()
 
     def reader(self, keep_cache=False,
@@ -2386,6 +3360,8 @@ class BaseDiskFile(object):
                                  Not needed by the REST layer.
         :returns: a :class:`swift.obj.diskfile.DiskFileReader` object
         """
+        if self._fp is None and self._metadata_cache_entry is not None:
+            self._fp = self._open_data_file()
         dr = self.reader_cls(
             self._fp, self._data_file, int(self._metadata['Content-Length']),
             self._metadata['ETag'], self._disk_chunk_size,
@@ -2434,9 +3410,14 @@ class BaseDiskFile(object):
         :param size: optional initial size of file to explicitly allocate on
                      disk
         :raises DiskFileNoSpace: if a size is specified and allocation fails
+        :raises DiskFileDeviceBusy: if too many requests are already queued
+                                    for the device's thread pool
         """
+        self._check_threadpool()
+        self._manager.forget_not_found(self._datadir)
+        self._manager.forget_cached_listing(self._datadir)
         try:
-            fd, tmppath = self._get_tempfile()
+            fd, tmppath = self._threadpool.run_in_thread(self._get_tempfile)
         except OSError as err:
             if err.errno in (errno.ENOSPC, errno.EDQUOT):
                 # No more inodes in filesystem
@@ -2456,6 +3437,8 @@ class BaseDiskFile(object):
                                   diskfile=self)
             yield dfw
         finally:
+            if dfw is not None:
+                dfw.close()
             try:
                 os.close(fd)
             except OSError:
@@ -2594,6 +3577,23 @@ class DiskFileManager(BaseDiskFileManager):
         hashes = self._hash_suffix_dir(path, reclaim_age)
         return hashes[None].hexdigest()
 
+    def _hash_suffix_buckets(self, path, reclaim_age):
+        """
+        Performs reclamation and returns an md5 of all (remaining) files
+        along with an md5 of the files in each hash-prefix bucket.
+
+        :param path: full path to directory
+        :param reclaim_age: age in seconds at which to remove tombstones
+        :raises PathNotDir: if given path is not a valid directory
+        :raises OSError: for non-ENOTDIR errors
+        :returns: a 2-tuple of the suffix md5 and a dict of bucket md5s
+        """
+        bucket_hashes = {}
+        hashes = self._hash_suffix_dir(path, reclaim_age, bucket_hashes)
+        return hashes[None].hexdigest(), dict(
+            (bucket, md5s[None].hexdigest())
+            for bucket, md5s in bucket_hashes.items())
+
 
 class ECDiskFileReader(BaseDiskFileReader):
     def __init__(self, fp, data_file, obj_size, etag,
@@ -2619,6 +3619,10 @@ class ECDiskFileReader(BaseDiskFileReader):
         else:
             self.frag_buf = None
 
+    def can_zero_copy_hash(self):
+        # the fragment checks need the data in userspace
+        return False
+
     def _check_frag(self, frag):
         if not frag:
             return
@@ -2723,7 +3727,7 @@ class ECDiskFileWriter(BaseDiskFileWriter):
         durable_data_file_path = os.path.join(
             self._datadir, self.manager.make_on_disk_filename(
                 timestamp, '.data', self._diskfile._frag_index, durable=True))
-        tpool_reraise(
+        self._diskfile._threadpool.force_run_in_thread(
             self._finalize_durable, data_file_path, durable_data_file_path)
 
     def put(self, metadata):
@@ -2948,12 +3952,28 @@ class ECDiskFileManager(BaseDiskFileManager):
         :raises DiskFileError: if any part of the filename is not able to be
                                validated.
         """
+        match = RE_EC_DATA_FILENAME.match(filename)
+        if match:
+            # fast path for the common, well-formed data file name
+            timestamp, frag_index, durable = match.groups()
+            try:
+                timestamp = Timestamp.from_internal(timestamp)
+            except ValueError:
+                raise DiskFileError('Invalid Timestamp value in filename %r'
+                                    % filename)
+            return {
+                'timestamp': timestamp,
+                'frag_index': int(frag_index),
+                'ext': '.data',
+                'ctype_timestamp': None,
+                'durable': durable is not None
+            }
         frag_index = None
         float_frag, ext = splitext(filename)
         if ext == '.data':
             parts = float_frag.split('#')
             try:
-                timestamp = Timestamp(parts[0])
+                timestamp = Timestamp.from_internal(parts[0])
             except ValueError:
                 raise DiskFileError('Invalid Timestamp value in filename %r'
                                     % filename)
@@ -3036,14 +4056,13 @@ class ECDiskFileManager(BaseDiskFileManager):
         # To do this we can take advantage of the list of .data files being
         # reverse-time ordered. Keep the resulting per-timestamp frag sets in
         # a frag_sets dict mapping a Timestamp instance -> frag_set.
-        all_frags = exts.get('.data')
+        all_frags = exts.get('.data') or []
         frag_sets = {}
         durable_frag_set = None
-        while all_frags:
-            frag_set, all_frags = self._split_gte_timestamp(
-                all_frags, all_frags[0]['timestamp'])
+        for _junk, frag_set in itertools.groupby(
+                all_frags, key=_internal_timestamp):
             # sort the frag set into ascending frag_index order
-            frag_set.sort(key=lambda info: info['frag_index'])
+            frag_set = sorted(frag_set, key=lambda info: info['frag_index'])
             timestamp = frag_set[0]['timestamp']
             frag_sets[timestamp] = frag_set
             for frag in frag_set:
@@ -3213,3 +4232,24 @@ class ECDiskFileManager(BaseDiskFileManager):
 
         hash_per_fi = self._hash_suffix_dir(path, reclaim_age)
         return dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items())
+
+    def _hash_suffix_buckets(self, path, reclaim_age):
+        """
+        Performs reclamation and returns a dict of md5 hex digests per
+        fragment index for the suffix and for each of its hash-prefix
+        buckets.
+
+        :param path: full path to directory
+        :param reclaim_age: age in seconds at which to remove tombstones
+        :raises PathNotDir: if given path is not a valid directory
+        :raises OSError: for non-ENOTDIR errors
+        :returns: a 2-tuple of the suffix's dict of md5 hex digests and a
+                  dict mapping bucket to dict of md5 hex digests
+        """
+        bucket_hashes = {}
+        hash_per_fi = self._hash_suffix_dir(path, reclaim_age, bucket_hashes)
+        return (
+            dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items()),
+            dict((bucket, dict((fi, md5.hexdigest())
+                               for fi, md5 in md5s.items()))
+                 for bucket, md5s in bucket_hashes.items()))
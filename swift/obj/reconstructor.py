@@ -13,26 +13,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
 import json
 import os
 from os.path import join
 import random
 import time
 import itertools
-from collections import defaultdict
+from collections import defaultdict, deque
 import six
 import six.moves.cPickle as pickle
 import shutil
 
 from eventlet import (GreenPile, GreenPool, Timeout, sleep, hubs, tpool,
                       spawn)
+from eventlet.event import Event
+from eventlet.queue import Queue
 from eventlet.support.greenlets import GreenletExit
 
 from swift import gettext_ as _
 from swift.common.utils import (
     whataremyips, unlink_older_than, compute_eta, get_logger,
     dump_recon_cache, mkdirs, config_true_value, list_from_csv, get_hub,
-    tpool_reraise, GreenAsyncPile, Timestamp, remove_file)
+    tpool_reraise, GreenAsyncPile, Timestamp, remove_file, ThreadPool,
+    write_pickle)
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
@@ -47,6 +51,7 @@ from swift.common.exceptions import ConnectionTimeout, DiskFileError, \
     SuffixSyncError
 
 SYNC, REVERT = ('sync_only', 'sync_revert')
+RECONSTRUCTION_PLAN_FILE = 'object_reconstructor_plan.pkl'
 
 
 hubs.use_hub(get_hub())
@@ -103,6 +108,140 @@ class RebuildingECDiskFileStream(object):
             yield chunk
 
 
+class RebuildPlanner(object):
+    """
+    Orders each reconstruction pass's jobs by how endangered their data is,
+    and remembers across passes and restarts what the last sync of each
+    partition found.
+
+    Revert jobs go first: the fragments they hold are missing from the
+    primary node they belong on. Then come sync jobs for partitions whose
+    last sync could not bring every partner node in sync, the worst first:
+    the most partners left out of sync, then the most fragments the sync had
+    to rebuild for them. Everything else goes last, in its original order.
+
+    :param path: the file the planner's state is kept in between passes
+    :param logger: the logger to use
+    """
+
+    HANDOFF, DEGRADED, NORMAL = range(3)
+    PRIORITY_NAMES = ('handoff', 'degraded', 'normal')
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        self.entries = self.load()
+        self.pending = dict((name, 0) for name in self.PRIORITY_NAMES)
+        self._rebuilt = defaultdict(int)
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as fp:
+                entries = pickle.load(fp)
+            if isinstance(entries, dict):
+                return entries
+        except IOError as err:
+            if err.errno == errno.ENOENT:
+                return {}
+            self.logger.exception(
+                _('Error loading reconstruction plan %s'), self.path)
+        except Exception:
+            self.logger.exception(
+                _('Error loading reconstruction plan %s'), self.path)
+        return {}
+
+    def save(self):
+        try:
+            write_pickle(self.entries, self.path)
+        except Exception:
+            self.logger.exception(
+                _('Error saving reconstruction plan %s'), self.path)
+
+    @staticmethod
+    def key(job):
+        return '%d/%s/%s' % (int(job['policy']), job['device'],
+                             job['partition'])
+
+    def priority(self, job):
+        if job['job_type'] == REVERT:
+            return self.HANDOFF
+        if self.key(job) in self.entries:
+            return self.DEGRADED
+        return self.NORMAL
+
+    def score(self, job):
+        """
+        Returns the sort key of a job; lower goes first.
+        """
+        entry = self.entries.get(self.key(job), {})
+        return (self.priority(job), -entry.get('failed', 0),
+                -entry.get('rebuilt', 0))
+
+    def plan(self, jobs, prune=False):
+        """
+        Sorts a pass's jobs into the order they should run in. The sort is
+        stable, so jobs of equal score keep their order.
+
+        :param jobs: a list of jobs, as built by the reconstructor
+        :param prune: forget about partitions that are not in jobs; only
+                      set this when jobs covers every local partition
+        """
+        if prune:
+            seen = set(self.key(job) for job in jobs
+                       if job['job_type'] == SYNC)
+            for key in set(self.entries) - seen:
+                del self.entries[key]
+        jobs.sort(key=self.score)
+        self.pending = dict((name, 0) for name in self.PRIORITY_NAMES)
+        for job in jobs:
+            self.pending[self.PRIORITY_NAMES[self.priority(job)]] += 1
+
+    def rebuilt(self, job):
+        """
+        Records that a job's sync rebuilt a fragment missing from a partner.
+        """
+        self._rebuilt[self.key(job)] += 1
+
+    def done(self, job, failed=0):
+        """
+        Records the outcome of a job.
+
+        :param job: the job that ran
+        :param failed: the number of nodes the job did not sync with
+        """
+        name = self.PRIORITY_NAMES[self.priority(job)]
+        self.pending[name] = max(0, self.pending[name] - 1)
+        if job['job_type'] != SYNC:
+            return
+        key = self.key(job)
+        rebuilt = self._rebuilt.pop(key, 0)
+        if failed:
+            self.entries[key] = {'failed': failed, 'rebuilt': rebuilt}
+        else:
+            self.entries.pop(key, None)
+
+    def stats(self, job_time, concurrency, now=None):
+        """
+        Returns a summary of the plan for recon: the number of jobs of each
+        priority still to run this pass, the number of partitions known to
+        be degraded, and a prediction of the seconds until every handoff and
+        degraded partition has been dealt with.
+
+        :param job_time: the mean time taken by a job, or None if unknown
+        :param concurrency: the number of jobs run at once
+        :param now: the current time, defaults to time.time()
+        """
+        stats = dict(self.pending)
+        stats['degraded_partitions'] = len(self.entries)
+        stats['time_to_redundancy'] = None
+        if job_time is not None:
+            stats['time_to_redundancy'] = (
+                (stats['handoff'] + stats['degraded']) * job_time /
+                max(1, concurrency))
+        stats['updated'] = time.time() if now is None else now
+        return stats
+
+
 class ObjectReconstructor(Daemon):
     """
     Reconstruct objects using erasure code.  And also rebalance EC Fragment
@@ -145,6 +284,25 @@ class ObjectReconstructor(Daemon):
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_pipeline = config_true_value(
+            conf.get('ssync_pipeline', False))
+        self.ssync_streams = max(1, int(conf.get('ssync_streams', 1)))
+        # decoding of rebuilt fragments; with no threads it runs inline
+        self.rebuild_threads = int(conf.get('rebuild_threads', 0))
+        self.rebuild_batch_size = max(
+            1, int(conf.get('rebuild_batch_size', 1)))
+        self.rebuild_prefetch = int(conf.get('rebuild_prefetch', 0))
+        self.rebuild_bytes_per_second = float(
+            conf.get('rebuild_bytes_per_second', 0))
+        self._rebuild_pool = ThreadPool(nthreads=self.rebuild_threads)
+        self._rebuild_next_time = {}
+        self.rebuild_planner = None
+        if config_true_value(conf.get('priority_queue', False)):
+            self.rebuild_planner = RebuildPlanner(
+                os.path.join(self.recon_cache_path, RECONSTRUCTION_PLAN_FILE),
+                self.logger)
+        self.max_jobs_per_device = int(conf.get('max_jobs_per_device', 0))
+        self._last_job_time = None
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
         self.headers = {
             'Content-Length': '0',
@@ -292,9 +450,11 @@ class ObjectReconstructor(Daemon):
                     etag))
             raise DiskFileError('Unable to reconstruct EC archive')
 
+        if self.rebuild_planner:
+            self.rebuild_planner.rebuilt(job)
         rebuilt_fragment_iter = self.make_rebuilt_fragment_iter(
             responses[:job['policy'].ec_ndata], path, job['policy'],
-            fi_to_rebuild)
+            fi_to_rebuild, device=job.get('device'))
         return RebuildingECDiskFileStream(datafile_metadata, fi_to_rebuild,
                                           rebuilt_fragment_iter)
 
@@ -302,10 +462,34 @@ class ObjectReconstructor(Daemon):
         return policy.pyeclib_driver.reconstruct(fragment_payload,
                                                  [frag_index])[0]
 
-    def make_rebuilt_fragment_iter(self, responses, path, policy, frag_index):
+    def _throttle_rebuild(self, device, nbytes):
+        """
+        Sleeps as long as needed to keep the rebuilding of fragments for a
+        local device under rebuild_bytes_per_second; concurrent rebuilds for
+        the same device share the allowance.
+
+        :param device: name of the local device being rebuilt for
+        :param nbytes: number of bytes just rebuilt
+        """
+        if self.rebuild_bytes_per_second <= 0 or device is None:
+            return
+        now = time.time()
+        start = max(now, self._rebuild_next_time.get(device, 0))
+        self._rebuild_next_time[device] = \
+            start + nbytes / self.rebuild_bytes_per_second
+        if start > now:
+            sleep(start - now)
+
+    def make_rebuilt_fragment_iter(self, responses, path, policy, frag_index,
+                                   device=None):
         """
         Turn a set of connections from backend object servers into a generator
         that yields up the rebuilt fragment archive for frag_index.
+
+        Segments are read from the connections in batches of
+        rebuild_batch_size, up to rebuild_prefetch batches ahead of the
+        decoding, and each batch is decoded in one call on the rebuild thread
+        pool.
         """
 
         def _get_one_fragment(resp):
@@ -319,10 +503,11 @@ class ObjectReconstructor(Daemon):
                 buff += chunk
             return buff
 
-        def fragment_payload_iter():
+        def fragment_payload_batch_iter():
             # We need a fragment from each connections, so best to
             # use a GreenPile to keep them ordered and in sync
             pile = GreenPile(len(responses))
+            batch = []
             while True:
                 for resp in responses:
                     pile.spawn(_get_one_fragment, resp)
@@ -340,11 +525,52 @@ class ObjectReconstructor(Daemon):
                     break
                 if not all(fragment_payload):
                     break
-                rebuilt_fragment = self._reconstruct(
-                    policy, fragment_payload, frag_index)
-                yield rebuilt_fragment
+                batch.append(fragment_payload)
+                if len(batch) >= self.rebuild_batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
 
-        return fragment_payload_iter()
+        def prefetch_iter(batches):
+            queue = Queue(self.rebuild_prefetch)
+
+            def fetch():
+                try:
+                    for batch in batches:
+                        queue.put(batch)
+                except (Exception, Timeout):
+                    self.logger.exception(
+                        _("Error trying to rebuild %(path)s "
+                          "policy#%(policy)d frag#%(frag_index)s"),
+                        {'path': path,
+                         'policy': policy,
+                         'frag_index': frag_index,
+                         })
+                queue.put(None)
+
+            fetcher = spawn(fetch)
+            try:
+                for batch in iter(queue.get, None):
+                    yield batch
+            finally:
+                fetcher.kill()
+
+        def reconstruct_batch(batch):
+            return [self._reconstruct(policy, fragment_payload, frag_index)
+                    for fragment_payload in batch]
+
+        def rebuilt_fragment_iter():
+            batches = fragment_payload_batch_iter()
+            if self.rebuild_prefetch > 0:
+                batches = prefetch_iter(batches)
+            for batch in batches:
+                for rebuilt_fragment in self._rebuild_pool.run_in_thread(
+                        reconstruct_batch, batch):
+                    self._throttle_rebuild(device, len(rebuilt_fragment))
+                    yield rebuilt_fragment
+
+        return rebuilt_fragment_iter()
 
     def stats_line(self):
         """
@@ -413,6 +639,8 @@ class ObjectReconstructor(Daemon):
         while True:
             sleep(self.stats_interval)
             self.stats_line()
+            if self.rebuild_planner:
+                self.dump_plan_stats()
 
     def detect_lockups(self):
         """
@@ -636,6 +864,9 @@ class ObjectReconstructor(Daemon):
             self.logger.update_stats('suffix.syncs', len(suffixes))
             if success:
                 syncd_with += 1
+        if self.rebuild_planner:
+            self.rebuild_planner.done(
+                job, failed=max(0, len(job['sync_to']) - syncd_with))
         self.logger.timing_since('partition.update.timing', begin)
 
     def _revert(self, job, begin):
@@ -668,6 +899,8 @@ class ObjectReconstructor(Daemon):
         if syncd_with >= len(job['sync_to']):
             self.delete_reverted_objs(
                 job, reverted_objs, job['frag_index'])
+        if self.rebuild_planner:
+            self.rebuild_planner.done(job)
         self.logger.timing_since('partition.delete.timing', begin)
 
     def _get_part_jobs(self, local_dev, part_path, partition, policy):
@@ -913,6 +1146,7 @@ class ObjectReconstructor(Daemon):
 
         try:
             self.run_pool = GreenPool(size=self.concurrency)
+            planned = [] if self.rebuild_planner else None
             for part_info in self.collect_parts(**kwargs):
                 if not self.check_ring(part_info['policy'].object_ring):
                     self.logger.info(_("Ring change detected. Aborting "
@@ -929,8 +1163,19 @@ class ObjectReconstructor(Daemon):
                     # this node and b) doesn't have any suffixes in it.
                     self.run_pool.spawn(self.delete_partition,
                                         part_info['part_path'])
+                if planned is not None:
+                    planned.extend(jobs)
+                    continue
                 for job in jobs:
                     self.run_pool.spawn(self.process_job, job)
+            if planned is not None:
+                self.rebuild_planner.plan(planned, prune=not any(
+                    kwargs.get(key) for key in ('override_devices',
+                                                'override_partitions')))
+                self.rebuild_planner.save()
+                self.dump_plan_stats()
+                if not self.run_planned_jobs(planned):
+                    return
             with Timeout(self.lockup_timeout):
                 self.run_pool.waitall()
         except (Exception, Timeout):
@@ -941,6 +1186,71 @@ class ObjectReconstructor(Daemon):
             stats.kill()
             lockup_detector.kill()
             self.stats_line()
+            if self.partition_times:
+                self._last_job_time = (sum(self.partition_times) /
+                                       len(self.partition_times))
+            if self.rebuild_planner:
+                self.rebuild_planner.save()
+                self.dump_plan_stats()
+
+    def run_planned_jobs(self, jobs):
+        """
+        Spawns a pass's planned jobs in order, except that while a device
+        already has max_jobs_per_device jobs running its jobs are passed
+        over for those of other devices.
+
+        :param jobs: the jobs, in the order they should run in
+        :returns: False if the pass was aborted by a ring change
+        """
+        queues = {}
+        for rank, job in enumerate(jobs):
+            queues.setdefault(job['device'], deque()).append((rank, job))
+        running = defaultdict(int)
+        state = {'released': Event()}
+
+        def run_job(job):
+            try:
+                self.process_job(job)
+            finally:
+                running[job['device']] -= 1
+                released, state['released'] = state['released'], Event()
+                released.send()
+
+        while queues:
+            ready = [(queue[0][0], device)
+                     for device, queue in queues.items()
+                     if self.max_jobs_per_device <= 0 or
+                     running[device] < self.max_jobs_per_device]
+            if not ready:
+                state['released'].wait()
+                continue
+            device = min(ready)[1]
+            job = queues[device].popleft()[1]
+            if not queues[device]:
+                del queues[device]
+            if not self.check_ring(job['policy'].object_ring):
+                self.logger.info(_("Ring change detected. Aborting "
+                                   "current reconstruction pass."))
+                return False
+            running[device] += 1
+            self.run_pool.spawn(run_job, job)
+        return True
+
+    def dump_plan_stats(self):
+        """
+        Reports the state of the reconstruction plan to recon.
+        """
+        job_time = self._last_job_time
+        if self.partition_times:
+            job_time = sum(self.partition_times) / len(self.partition_times)
+        concurrency = self.concurrency
+        if self.max_jobs_per_device > 0:
+            concurrency = min(concurrency, self.max_jobs_per_device *
+                              max(1, self.reconstruction_device_count))
+        dump_recon_cache(
+            {'object_reconstruction_plan': self.rebuild_planner.stats(
+                job_time, concurrency)},
+            self.rcache, self.logger)
 
     def run_once(self, *args, **kwargs):
         start = time.time()
@@ -15,17 +15,19 @@
 
 import os
 import errno
-from os.path import isdir, isfile, join, dirname
+from os.path import isdir, isfile, join, dirname, relpath
 import random
 import shutil
 import time
 import itertools
+from tempfile import mkstemp
 from six import viewkeys
 import six.moves.cPickle as pickle
 from swift import gettext_ as _
 
 import eventlet
 from eventlet import GreenPool, tpool, Timeout, sleep, hubs
+from eventlet.event import Event
 from eventlet.green import subprocess
 from eventlet.support.greenlets import GreenletExit
 
@@ -33,7 +35,8 @@ from swift.common.ring.utils import is_local_device
 from swift.common.utils import whataremyips, unlink_older_than, \
     compute_eta, get_logger, dump_recon_cache, ismount, \
     rsync_module_interpolation, mkdirs, config_true_value, list_from_csv, \
-    get_hub, tpool_reraise, config_auto_int_value, storage_directory
+    get_hub, tpool_reraise, config_auto_int_value, storage_directory, \
+    write_pickle
 from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_OK, HTTP_INSUFFICIENT_STORAGE
@@ -42,6 +45,7 @@ from swift.obj.diskfile import DiskFileManager, get_data_dir, get_tmp_dir
 from swift.common.storage_policy import POLICIES, REPL_POLICY
 
 DEFAULT_RSYNC_TIMEOUT = 900
+REPLICATION_QUEUE_FILE = 'object_replicator_queue.pkl'
 
 hubs.use_hub(get_hub())
 
@@ -50,6 +54,209 @@ def _do_listdir(partition, replication_cycle):
     return (((partition + replication_cycle) % 10) == 0)
 
 
+class ReplicationQueue(object):
+    """
+    Orders the object replicator's jobs by priority, and remembers across
+    passes and restarts why and for how long each partition has waited.
+
+    Handoff partitions go first, then partitions that failed to replicate
+    to some node, then partitions whose primary nodes changed since they
+    were last seen, which is how a ring reload that moved them shows up,
+    and then everything else.  A partition moves up one priority level for
+    every ``aging`` seconds since it was last replicated successfully, so
+    nothing starves behind a steady stream of more urgent partitions.
+
+    :param path: the file the queue is kept in between passes
+    :param aging: seconds of waiting worth one priority level, or 0 to
+                  disable aging
+    :param logger: the logger to use
+    """
+
+    HANDOFF, FAILED, MOVED, NORMAL = range(4)
+    PRIORITY_NAMES = ('handoff', 'failed', 'moved', 'normal')
+
+    def __init__(self, path, aging, logger):
+        self.path = path
+        self.aging = aging
+        self.logger = logger
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as fp:
+                entries = pickle.load(fp)
+            if isinstance(entries, dict):
+                return entries
+        except IOError as err:
+            if err.errno == errno.ENOENT:
+                return {}
+            self.logger.exception(
+                _('Error loading replication queue %s'), self.path)
+        except Exception:
+            self.logger.exception(
+                _('Error loading replication queue %s'), self.path)
+        return {}
+
+    def save(self):
+        try:
+            write_pickle(self.entries, self.path)
+        except Exception:
+            self.logger.exception(
+                _('Error saving replication queue %s'), self.path)
+
+    @staticmethod
+    def key(job):
+        return '%d/%s/%s' % (int(job['policy']), job['device'],
+                             job['partition'])
+
+    def score(self, entry, now):
+        """
+        Returns the sort key of a queued partition; lower goes first.
+        """
+        if not self.aging:
+            return entry['priority']
+        return entry['priority'] - (now - entry['last']) / float(self.aging)
+
+    def sort(self, jobs, prune=False, now=None):
+        """
+        Updates the queue with a new list of jobs and sorts them into the
+        order they should run in.  The sort is stable, so jobs of equal
+        priority keep their order.
+
+        :param jobs: a list of jobs, as built by the replicator
+        :param prune: forget about partitions that are not in jobs; only
+                      set this when jobs covers every local partition
+        :param now: the current time, defaults to time.time()
+        """
+        now = time.time() if now is None else now
+        seen = set()
+        for job in jobs:
+            key = self.key(job)
+            seen.add(key)
+            nodes = sorted(node['id'] for node in job['nodes'])
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {
+                    'priority': self.NORMAL, 'last': now, 'nodes': nodes}
+            if job['delete']:
+                entry['priority'] = self.HANDOFF
+            elif entry['priority'] == self.HANDOFF or (
+                    entry['nodes'] != nodes and
+                    entry['priority'] != self.FAILED):
+                entry['priority'] = self.MOVED
+            entry['nodes'] = nodes
+        if prune:
+            for key in set(self.entries) - seen:
+                del self.entries[key]
+        jobs.sort(key=lambda job: self.score(self.entries[self.key(job)],
+                                             now))
+
+    def done(self, job, failed=False, removed=False, now=None):
+        """
+        Records the outcome of a job.
+
+        :param job: the job that ran
+        :param failed: True if the partition failed to replicate to any node
+        :param removed: True if the partition was removed from this node
+        :param now: the current time, defaults to time.time()
+        """
+        key = self.key(job)
+        if removed:
+            self.entries.pop(key, None)
+            return
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        if failed:
+            entry['priority'] = min(entry['priority'], self.FAILED)
+        else:
+            if entry['priority'] != self.HANDOFF:
+                entry['priority'] = self.NORMAL
+            entry['last'] = time.time() if now is None else now
+
+    def stats(self, now=None):
+        """
+        Returns a summary of the queue for recon: the number of partitions
+        at each priority, the number that aging has moved up at least one
+        level, and the longest time any partition has waited.
+        """
+        now = time.time() if now is None else now
+        stats = dict((name, 0) for name in self.PRIORITY_NAMES)
+        stats.update({'aged': 0, 'oldest': 0, 'updated': now})
+        for entry in self.entries.values():
+            stats[self.PRIORITY_NAMES[entry['priority']]] += 1
+            waited = max(0, now - entry['last'])
+            stats['oldest'] = max(stats['oldest'], waited)
+            if self.aging and waited >= self.aging:
+                stats['aged'] += 1
+        return stats
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limits the number of concurrent operations against one target and
+    tunes the limit, between 1 and ``maximum``, by hill climbing on the
+    observed throughput.
+
+    Every ``interval`` seconds the rate of completed work is compared with
+    the rate of the previous interval; the limit keeps moving the same way
+    while the rate holds up and turns round when it drops.  A failed
+    operation halves the limit.
+
+    :param maximum: the most concurrent operations to allow
+    :param interval: seconds between adjustments of the limit
+    """
+
+    def __init__(self, maximum, interval=30):
+        self.maximum = max(1, maximum)
+        self.interval = interval
+        self.limit = 1
+        self.active = 0
+        self.step = 1
+        self.done = 0
+        self.last_rate = None
+        self.window_start = time.time()
+        self._waiters = []
+
+    def acquire(self):
+        while self.active >= self.limit:
+            waiter = Event()
+            self._waiters.append(waiter)
+            waiter.wait()
+        self.active += 1
+
+    def release(self, done=1, success=True, now=None):
+        """
+        Ends an operation.
+
+        :param done: the amount of work the operation completed
+        :param success: False if the operation failed
+        :param now: the current time, defaults to time.time()
+        """
+        now = time.time() if now is None else now
+        self.active -= 1
+        if success:
+            self.done += done
+        else:
+            self.limit = max(1, self.limit // 2)
+            self.step = 1
+            self.last_rate = None
+        elapsed = now - self.window_start
+        if elapsed >= self.interval:
+            rate = self.done / float(elapsed)
+            if self.last_rate is not None and rate < self.last_rate:
+                self.step = -self.step
+            if not 1 <= self.limit + self.step <= self.maximum:
+                self.step = -self.step
+            self.limit = max(1, min(self.maximum, self.limit + self.step))
+            self.last_rate = rate
+            self.done = 0
+            self.window_start = now
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            waiter.send()
+
+
 class ObjectReplicator(Daemon):
     """
     Replicate objects.
@@ -88,6 +295,12 @@ class ObjectReplicator(Daemon):
         self.rsync_bwlimit = conf.get('rsync_bwlimit', '0')
         self.rsync_compress = config_true_value(
             conf.get('rsync_compress', 'no'))
+        self.rsync_batch_size = max(1, int(conf.get('rsync_batch_size', 1)))
+        self.rsync_batch_wait = float(conf.get('rsync_batch_wait', 0.5))
+        self.rsync_max_concurrency = int(
+            conf.get('rsync_max_concurrency', 0))
+        self._rsync_batches = {}
+        self._rsync_limiters = {}
         self.rsync_module = conf.get('rsync_module', '').rstrip('/')
         if not self.rsync_module:
             self.rsync_module = '{replication_ip}::object'
@@ -107,6 +320,11 @@ class ObjectReplicator(Daemon):
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.sync_method = getattr(self, conf.get('sync_method') or 'rsync')
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_pipeline = config_true_value(
+            conf.get('ssync_pipeline', False))
+        self.ssync_streams = max(1, int(conf.get('ssync_streams', 1)))
+        self.ssync_hash_buckets = config_true_value(
+            conf.get('ssync_hash_buckets', False))
         self.default_headers = {
             'Content-Length': '0',
             'user-agent': 'object-replicator %s' % os.getpid()}
@@ -121,6 +339,11 @@ class ObjectReplicator(Daemon):
                                 'operation, please disable handoffs_first and '
                                 'handoff_delete before the next '
                                 'normal rebalance')
+        self.replication_queue = None
+        if config_true_value(conf.get('priority_queue', False)):
+            self.replication_queue = ReplicationQueue(
+                os.path.join(self.recon_cache_path, REPLICATION_QUEUE_FILE),
+                int(conf.get('priority_aging', 86400)), self.logger)
         self._diskfile_mgr = DiskFileManager(conf, self.logger)
 
     def _zero_stats(self):
@@ -171,16 +394,19 @@ class ObjectReplicator(Daemon):
         policy.load_ring(self.swift_dir)
         return policy.object_ring
 
-    def _rsync(self, args):
+    def _rsync(self, args, timeout=None):
         """
         Execute the rsync binary to replicate a partition.
 
+        :param args: the rsync command line
+        :param timeout: seconds before rsync is killed, defaults to
+                        rsync_timeout
         :returns: return code of rsync process. 0 is successful
         """
         start_time = time.time()
         ret_val = None
         try:
-            with Timeout(self.rsync_timeout):
+            with Timeout(timeout or self.rsync_timeout):
                 proc = subprocess.Popen(args,
                                         stdout=subprocess.PIPE,
                                         stderr=subprocess.STDOUT)
@@ -239,22 +465,161 @@ class ObjectReplicator(Daemon):
             # a different region than the local one.
             args.append('--compress')
         rsync_module = rsync_module_interpolation(self.rsync_module, node)
-        had_any = False
+        spaths = []
         for suffix in suffixes:
             spath = join(job['path'], suffix)
             if os.path.exists(spath):
-                args.append(spath)
-                had_any = True
-        if not had_any:
+                spaths.append(spath)
+        if not spaths:
             return False, {}
         data_dir = get_data_dir(job['policy'])
-        args.append(join(rsync_module, node['device'],
-                    data_dir, job['partition']))
-        return self._rsync(args) == 0, {}
+        dest = join(rsync_module, node['device'], data_dir)
+        if self.rsync_batch_size > 1:
+            return self._rsync_batched(node, job, args, spaths, dest), {}
+        args.extend(spaths)
+        args.append(join(dest, job['partition']))
+        return self._limited_rsync(node, args) == 0, {}
+
+    def _limited_rsync(self, node, args, partitions=1):
+        """
+        Runs an rsync to a remote node, within that node's concurrency limit
+        when rsync_max_concurrency is set.
+
+        :param node: the "dev" entry for the remote node
+        :param args: the rsync command line
+        :param partitions: the number of partitions the rsync covers
+        :returns: return code of rsync process. 0 is successful
+        """
+        kwargs = {}
+        if partitions > 1:
+            kwargs['timeout'] = self.rsync_timeout * partitions
+        if not self.rsync_max_concurrency:
+            return self._rsync(args, **kwargs)
+        limiter = self._rsync_limiters.get(node['replication_ip'])
+        if limiter is None:
+            limiter = self._rsync_limiters[node['replication_ip']] = \
+                AdaptiveConcurrency(self.rsync_max_concurrency)
+        limiter.acquire()
+        ret_val = 1
+        try:
+            ret_val = self._rsync(args, **kwargs)
+        finally:
+            limiter.release(partitions, success=ret_val == 0)
+        return ret_val
+
+    def _rsync_batched(self, node, job, args, spaths, dest):
+        """
+        Adds a partition to the batch of partitions bound for the same
+        remote device, and waits for the batch to be synced.
+
+        The batch is synced once it holds rsync_batch_size partitions, or
+        rsync_batch_wait seconds after its first partition was added.
+
+        :returns: True if the partition was synced
+        """
+        key = (job['obj_path'], dest, tuple(args))
+        batch = self._rsync_batches.get(key)
+        if batch is None:
+            batch = self._rsync_batches[key] = {'items': []}
+            batch['timer'] = eventlet.spawn_after(
+                self.rsync_batch_wait, self._flush_rsync_batch, key, batch)
+        result = Event()
+        batch['items'].append((node, job, spaths, result))
+        if len(batch['items']) >= self.rsync_batch_size:
+            batch['timer'].cancel()
+            eventlet.spawn(self._flush_rsync_batch, key, batch)
+        return result.wait()
 
-    def ssync(self, node, job, suffixes, remote_check_objs=None):
+    def _flush_rsync_batch(self, key, batch):
+        """
+        Syncs a batch of partitions with one rsync, using --files-from to
+        list their suffixes.  If that rsync fails each partition is synced
+        again on its own, so that every partition gets its own result.
+        """
+        if self._rsync_batches.get(key) is batch:
+            del self._rsync_batches[key]
+        obj_path, dest, args = key
+        items = batch['items']
+        node, job = items[0][:2]
+        pending = list(items)
+        try:
+            tmp_path = join(dirname(obj_path), get_tmp_dir(job['policy']))
+            mkdirs(tmp_path)
+            fd, files_from = mkstemp(dir=tmp_path, suffix='.rsync')
+            try:
+                with os.fdopen(fd, 'w') as fp:
+                    for _node, _job, spaths, _result in items:
+                        for spath in spaths:
+                            fp.write(relpath(spath, obj_path) + '\n')
+                ret_val = self._limited_rsync(
+                    node, list(args) + ['--files-from=%s' % files_from,
+                                        obj_path + '/', dest + '/'],
+                    partitions=len(items))
+            finally:
+                os.unlink(files_from)
+            if ret_val == 0 or len(items) == 1:
+                while pending:
+                    pending.pop()[3].send(ret_val == 0)
+                return
+            self.logger.info(
+                _("Batched rsync failed, retrying %d partitions one at a "
+                  "time"), len(items))
+            while pending:
+                node, job, spaths, result = pending[0]
+                ret_val = self._limited_rsync(
+                    node, list(args) + spaths + [join(dest, job['partition'])])
+                pending.pop(0)
+                result.send(ret_val == 0)
+        except (Exception, Timeout):
+            self.logger.exception(_("Error syncing rsync batch to %s"), dest)
+            for item in pending:
+                item[3].send(False)
+
+    def ssync(self, node, job, suffixes, remote_check_objs=None,
+              buckets=None):
         return ssync_sender.Sender(
-            self, node, job, suffixes, remote_check_objs)()
+            self, node, job, suffixes, remote_check_objs, buckets)()
+
+    def diff_buckets(self, node, job, suffixes, headers):
+        """
+        Narrows a list of out of sync suffixes down to the hash-prefix
+        buckets of each suffix whose hashes differ from the remote node's.
+
+        :param node: the "dev" entry for the remote node
+        :param job: information about the partition being synced
+        :param suffixes: a list of suffixes that are out of sync
+        :param headers: headers for the REPLICATE request
+        :returns: a dict mapping each suffix to a set of buckets, or None if
+                  the remote node did not return bucket hashes
+        """
+        headers = dict(headers)
+        headers['X-Backend-Hash-Buckets'] = 'yes'
+        try:
+            with Timeout(self.http_timeout):
+                resp = http_connect(
+                    node['replication_ip'], node['replication_port'],
+                    node['device'], job['partition'], 'REPLICATE',
+                    '/' + '-'.join(suffixes), headers=headers).getresponse()
+                body = resp.read()
+            if resp.status != HTTP_OK or not config_true_value(
+                    resp.getheader('X-Backend-Hash-Buckets')):
+                return None
+            remote_buckets = pickle.loads(body)
+            local_buckets = tpool_reraise(
+                self._diskfile_mgr._get_bucket_hashes, job['path'],
+                suffixes, reclaim_age=self.reclaim_age)
+        except (Exception, Timeout):
+            self.logger.exception(
+                _("Error getting bucket hashes from node: %s") % node)
+            return None
+        buckets = {}
+        for suffix in suffixes:
+            local = local_buckets.get(suffix, {})
+            remote = remote_buckets.get(suffix, {})
+            buckets[suffix] = set(
+                bucket for bucket in set(local) | set(remote)
+                if local.get(bucket) != remote.get(bucket))
+        return buckets
 
     def check_ring(self, object_ring):
         """
@@ -367,6 +732,10 @@ class ObjectReplicator(Daemon):
             self.stats['success'] += len(target_devs_info - failure_devs_info)
             if not handoff_partition_deleted:
                 self.handoffs_remaining += 1
+            if self.replication_queue:
+                self.replication_queue.done(
+                    job, failed=bool(failure_devs_info),
+                    removed=handoff_partition_deleted)
             self.partition_times.append(time.time() - begin)
             self.logger.timing_since('partition.delete.timing', begin)
 
@@ -471,7 +840,15 @@ class ObjectReplicator(Daemon):
                                 local_hash[suffix] !=
                                 remote_hash.get(suffix, -1)]
                     self.stats['rsync'] += 1
-                    success, _junk = self.sync(node, job, suffixes)
+                    sync_kwargs = {}
+                    if self.ssync_hash_buckets and \
+                            self.sync_method == self.ssync:
+                        buckets = self.diff_buckets(
+                            node, job, suffixes, headers)
+                        if buckets is not None:
+                            sync_kwargs['buckets'] = buckets
+                    success, _junk = self.sync(
+                        node, job, suffixes, **sync_kwargs)
                     with Timeout(self.http_timeout):
                         conn = http_connect(
                             node['replication_ip'], node['replication_port'],
@@ -499,6 +876,9 @@ class ObjectReplicator(Daemon):
             self.logger.exception(_("Error syncing partition"))
         finally:
             self.stats['success'] += len(target_devs_info - failure_devs_info)
+            if self.replication_queue:
+                self.replication_queue.done(
+                    job, failed=bool(failure_devs_info))
             self.partition_times.append(time.time() - begin)
             self.logger.timing_since('partition.update.timing', begin)
 
@@ -684,12 +1064,26 @@ class ObjectReplicator(Daemon):
                     policy, ips, override_devices=override_devices,
                     override_partitions=override_partitions)
         random.shuffle(jobs)
+        if self.replication_queue:
+            self.replication_queue.sort(jobs, prune=(
+                override_devices is None and override_partitions is None and
+                override_policies is None))
+            self.replication_queue.save()
+            self.dump_queue_stats()
         if self.handoffs_first:
             # Move the handoff parts to the front of the list
             jobs.sort(key=lambda job: not job['delete'])
         self.job_count = len(jobs)
         return jobs
 
+    def dump_queue_stats(self):
+        """
+        Reports the state of the replication queue to recon.
+        """
+        dump_recon_cache(
+            {'object_replication_queue': self.replication_queue.stats()},
+            self.rcache, self.logger)
+
     def replicate(self, override_devices=None, override_partitions=None,
                   override_policies=None):
         """Run a replication pass"""
@@ -773,6 +1167,9 @@ class ObjectReplicator(Daemon):
             stats.kill()
             lockup_detector.kill()
             self.stats_line()
+            if self.replication_queue:
+                self.replication_queue.save()
+                self.dump_queue_stats()
             self.stats['attempted'] = self.replication_count
 
     def run_once(self, *args, **kwargs):
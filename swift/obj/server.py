@@ -22,25 +22,28 @@ import multiprocessing
 import time
 import traceback
 import socket
+import ssl
 import math
 from swift import gettext_ as _
 from hashlib import md5
 
 from eventlet import sleep, wsgi, Timeout
+from eventlet.green import ssl as green_ssl
 from eventlet.greenthread import spawn
 
 from swift.common.utils import public, get_logger, \
     config_true_value, timing_stats, replication, \
     normalize_delete_at_timestamp, get_log_line, Timestamp, \
     get_expirer_container, parse_mime_headers, \
-    iter_multipart_mime_documents, extract_swift_bytes, safe_json_loads
+    iter_multipart_mime_documents, extract_swift_bytes, safe_json_loads, \
+    md5_hasher
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_object_creation, \
     valid_timestamp, check_utf8
 from swift.common.exceptions import ConnectionTimeout, DiskFileQuarantined, \
     DiskFileNotExist, DiskFileCollision, DiskFileNoSpace, DiskFileDeleted, \
     DiskFileDeviceUnavailable, DiskFileExpired, ChunkReadTimeout, \
-    ChunkReadError, DiskFileXattrNotSupported
+    ChunkReadError, DiskFileXattrNotSupported, DiskFileDeviceBusy
 from swift.obj import ssync_receiver
 from swift.common.http import is_success
 from swift.common.base_storage_server import BaseStorageServer
@@ -53,7 +56,8 @@ from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPCreated, \
     HTTPPreconditionFailed, HTTPRequestTimeout, HTTPUnprocessableEntity, \
     HTTPClientDisconnect, HTTPMethodNotAllowed, Request, Response, \
     HTTPInsufficientStorage, HTTPForbidden, HTTPException, HTTPConflict, \
-    HTTPServerError
+    HTTPServerError, HTTPServiceUnavailable
+from swift.common.storage_policy import REPL_POLICY
 from swift.obj.diskfile import DATAFILE_SYSTEM_META, DiskFileRouter
 
 
@@ -110,6 +114,7 @@ class ObjectController(BaseStorageServer):
     """Implements the WSGI application for the Swift Object Server."""
 
     server_type = 'object-server'
+    use_kernel_md5 = False
 
     def __init__(self, conf, logger=None):
         """
@@ -132,6 +137,9 @@ class ObjectController(BaseStorageServer):
         self.slow = int(conf.get('slow', 0))
         self.keep_cache_private = \
             config_true_value(conf.get('keep_cache_private', 'false'))
+        # with TLS the client sockets carry ciphertext, which can't be
+        # spliced into object files
+        self.ssl_enabled = 'cert_file' in conf
 
         default_allowed_headers = '''
             content-disposition,
@@ -186,6 +194,10 @@ class ObjectController(BaseStorageServer):
         # Common on-disk hierarchy shared across account, container and object
         # servers.
         self._diskfile_router = DiskFileRouter(conf, self.logger)
+        # Every manager saw the same kernel_md5 option and probe result.
+        self.use_kernel_md5 = any(
+            mgr.use_kernel_md5
+            for mgr in self._diskfile_router.policy_to_manager.values())
         # This is populated by global_conf_callback way below as the semaphore
         # is shared by all workers.
         if 'replication_semaphore' in conf:
@@ -197,6 +209,8 @@ class ObjectController(BaseStorageServer):
             conf.get('replication_failure_threshold') or 100)
         self.replication_failure_ratio = float(
             conf.get('replication_failure_ratio') or 1.0)
+        self.ssync_receiver_concurrency = max(1, int(
+            conf.get('ssync_receiver_concurrency') or 4))
 
     def get_diskfile(self, device, partition, account, container, obj,
                      policy, **kwargs):
@@ -410,6 +424,40 @@ class ObjectController(BaseStorageServer):
                 return file_like.read(self.network_chunk_size)
         return timeout_reader
 
+    def _zero_copy_put_sockfd(self, request, writer, policy):
+        """
+        Work out whether the body of a PUT can be spliced straight from the
+        client's socket into the object file.
+
+        That takes a replicated policy, a request body that is neither
+        chunked nor MIME, a DiskFile writer that can do zero-copy writes and
+        an Eventlet input object whose read buffer we can see into, over a
+        plain TCP connection.
+
+        :returns: the socket's file descriptor, or None if the body has to
+                  be read the usual way
+        """
+        wsgi_input = request.environ['wsgi.input']
+        if self.ssl_enabled or policy.policy_type != REPL_POLICY or \
+                not isinstance(wsgi_input, wsgi.Input) or \
+                wsgi_input.chunked_input or \
+                'transfer-encoding' in request.headers:
+            return None
+        checker = getattr(writer, 'can_zero_copy_write', None)
+        if not (checker and checker()):
+            return None
+        # Eventlet may have read the start of the body into its buffer along
+        # with the request headers; only a Python 2 socket file object lets
+        # us see how much.
+        if getattr(wsgi_input.rfile, '_rbuf', None) is None:
+            return None
+        sock = wsgi_input.get_socket()
+        # the file descriptor of a TLS socket gives us the ciphertext
+        if isinstance(getattr(sock, 'fd', sock),
+                      (ssl.SSLSocket, green_ssl.GreenSSLSocket)):
+            return None
+        return sock.fileno()
+
     def _read_put_commit_message(self, mime_documents_iter):
         rcvd_commit = False
         try:
@@ -707,7 +755,7 @@ class ObjectController(BaseStorageServer):
                 headers={'X-Backend-Timestamp': orig_timestamp.internal})
         orig_delete_at = int(orig_metadata.get('X-Delete-At') or 0)
         upload_expiration = time.time() + self.max_upload_time
-        etag = md5()
+        etag = md5_hasher(self.use_kernel_md5)
         elapsed_time = 0
         try:
             with disk_file.create(size=fsize) as writer:
@@ -757,16 +805,54 @@ class ObjectController(BaseStorageServer):
                     except ChunkReadTimeout:
                         return HTTPRequestTimeout(request=request)
 
+                zero_copy_sockfd = None
+                if fsize and not (have_metadata_footer or
+                                  use_multiphase_commit):
+                    zero_copy_sockfd = self._zero_copy_put_sockfd(
+                        request, writer, policy)
+                if zero_copy_sockfd is not None and \
+                        not hasattr(etag, 'update_from_pipe'):
+                    # the data only ever reaches an in-kernel hash
+                    etag = md5_hasher(use_kernel=True)
+                    if not hasattr(etag, 'update_from_pipe'):
+                        zero_copy_sockfd = None
+
                 timeout_reader = self._make_timeout_reader(obj_input)
                 try:
-                    for chunk in iter(timeout_reader, ''):
-                        start_time = time.time()
-                        if start_time > upload_expiration:
-                            self.logger.increment('PUT.timeouts')
-                            return HTTPRequestTimeout(request=request)
+                    if zero_copy_sockfd is not None:
+                        # Anything Eventlet already buffered has to be read
+                        # the usual way; the rest is still in the socket.
+                        rbuf = obj_input.rfile._rbuf
+                        rbuf.seek(0, os.SEEK_END)
+                        buffered = min(rbuf.tell(), fsize)
+                        # this also sends any 100 Continue
+                        chunk = obj_input.read(buffered)
                         etag.update(chunk)
                         upload_size = writer.write(chunk)
-                        elapsed_time += time.time() - start_time
+                        while upload_size < fsize:
+                            start_time = time.time()
+                            if start_time > upload_expiration:
+                                self.logger.increment('PUT.timeouts')
+                                return HTTPRequestTimeout(request=request)
+                            with ChunkReadTimeout(self.client_timeout):
+                                new_size = writer.zero_copy_write(
+                                    zero_copy_sockfd, fsize - upload_size,
+                                    etag)
+                            if new_size == upload_size:
+                                raise ChunkReadError()
+                            # keep Eventlet from trying to drain the body
+                            obj_input.position += new_size - upload_size
+                            upload_size = new_size
+                            elapsed_time += time.time() - start_time
+                    else:
+                        for chunk in iter(timeout_reader, ''):
+                            start_time = time.time()
+                            if start_time > upload_expiration:
+                                self.logger.increment('PUT.timeouts')
+                                return HTTPRequestTimeout(request=request)
+                            etag.update(chunk)
+                            upload_size = writer.write(chunk)
+                            elapsed_time += time.time() - start_time
                 except ChunkReadError:
                     return HTTPClientDisconnect(request=request)
                 except ChunkReadTimeout:
@@ -1066,17 +1152,30 @@ class ObjectController(BaseStorageServer):
         Note that the name REPLICATE is preserved for historical reasons as
         this verb really just returns the hashes information for the specified
         parameters and is used, for example, by both replication and EC.
+
+        With an ``X-Backend-Hash-Buckets`` header the hashes of the
+        hash-prefix buckets of the given suffixes are returned instead, and
+        the header is echoed back so the caller can tell that an older
+        server has not returned suffix hashes.
         """
         device, partition, suffix_parts, policy = \
             get_name_and_placement(request, 2, 3, True)
         suffixes = suffix_parts.split('-') if suffix_parts else []
+        want_buckets = config_true_value(
+            request.headers.get('X-Backend-Hash-Buckets'))
         try:
-            hashes = self._diskfile_router[policy].get_hashes(
-                device, partition, suffixes, policy)
+            if want_buckets:
+                hashes = self._diskfile_router[policy].get_bucket_hashes(
+                    device, partition, suffixes, policy)
+            else:
+                hashes = self._diskfile_router[policy].get_hashes(
+                    device, partition, suffixes, policy)
         except DiskFileDeviceUnavailable:
             resp = HTTPInsufficientStorage(drive=device, request=request)
         else:
             resp = Response(body=pickle.dumps(hashes))
+            if want_buckets:
+                resp.headers['X-Backend-Hash-Buckets'] = 'yes'
         return resp
 
     @public
@@ -1102,6 +1201,8 @@ class ObjectController(BaseStorageServer):
                     res = getattr(self, req.method)(req)
             except DiskFileCollision:
                 res = HTTPForbidden(request=req)
+            except DiskFileDeviceBusy:
+                res = HTTPServiceUnavailable(request=req)
             except HTTPException as error_response:
                 res = error_response
             except (Exception, Timeout):
@@ -17,6 +17,7 @@
 import eventlet
 import eventlet.wsgi
 import eventlet.greenio
+from six import BytesIO
 from six.moves import urllib
 
 from swift.common import exceptions
@@ -119,6 +120,12 @@ class Receiver(object):
         3. Updates: Sender sends the object information requested.
 
         4. Close down: Release semaphore lock, etc.
+
+    A sender may ask for a pipelined request with the
+    ``X-Backend-Ssync-Pipeline`` header, in which case the receiver checks
+    offered objects and runs subrequests with a concurrency of up to the
+    object-server.conf [object-server] ssync_receiver_concurrency setting,
+    and sends back wanted hashes while the sender is still offering them.
     """
 
     def __init__(self, app, request):
@@ -246,6 +253,8 @@ class Receiver(object):
         if not self.diskfile_mgr.get_dev_path(self.device):
             raise swob.HTTPInsufficientStorage(drive=self.device)
         self.fp = self.request.environ['wsgi.input']
+        self.pipelined = utils.config_true_value(
+            self.request.headers.get('X-Backend-Ssync-Pipeline'))
 
     def _check_local(self, remote, make_durable=True):
         """
@@ -262,6 +271,9 @@ class Receiver(object):
             return {}
         try:
             df.open()
+        except exceptions.DiskFileDeviceBusy:
+            # don't have the sender send again what may well be here
+            raise swob.HTTPServiceUnavailable()
         except exceptions.DiskFileDeleted as err:
             result = {'ts_data': err.timestamp}
         except exceptions.DiskFileError:
@@ -283,6 +295,8 @@ class Receiver(object):
                 with df.create() as writer:
                     writer.commit(remote['ts_data'])
                 return self._check_local(remote, make_durable=False)
+            except exceptions.DiskFileDeviceBusy:
+                raise swob.HTTPServiceUnavailable()
             except Exception:
                 # if commit fails then log exception and fall back to wanting
                 # a full update
@@ -344,6 +358,10 @@ class Receiver(object):
         The collection and then response is so the sender doesn't
         have to read while it writes to ensure network buffers don't
         fill up and block everything.
+
+        A pipelined sender does read while it writes, so for a pipelined
+        request the receiver responds with `:MISSING_CHECK: START` straight
+        away and sends back wanted hashes in batches as it finds them.
         """
         with exceptions.MessageTimeout(
                 self.app.client_timeout, 'missing_check start'):
@@ -351,6 +369,10 @@ class Receiver(object):
         if line.strip() != ':MISSING_CHECK: START':
             raise Exception(
                 'Looking for :MISSING_CHECK: START got %r' % line[:1024])
+        if self.pipelined:
+            for data in self._pipelined_missing_check():
+                yield data
+            return
         object_hashes = []
         while True:
             with exceptions.MessageTimeout(
@@ -367,6 +389,47 @@ class Receiver(object):
         yield '\r\n'
         yield ':MISSING_CHECK: END\r\n'
 
+    def _pipelined_missing_check(self):
+        """
+        Checks offered objects in a pool of greenthreads and yields the
+        wanted hashes found so far each time another line is read.
+        """
+        pool = eventlet.GreenPool(self.app.ssync_receiver_concurrency)
+        results = []
+
+        def check(line):
+            try:
+                results.append(self._check_missing(line))
+            except Exception as err:
+                results.append(err)
+
+        def flush():
+            object_hashes = []
+            while results:
+                want = results.pop(0)
+                if isinstance(want, Exception):
+                    raise want
+                if want:
+                    object_hashes.append('%s\r\n' % want)
+            return ''.join(object_hashes)
+
+        yield ':MISSING_CHECK: START\r\n'
+        while True:
+            with exceptions.MessageTimeout(
+                    self.app.client_timeout, 'missing_check line'):
+                line = self.fp.readline(self.app.network_chunk_size)
+            if not line or line.strip() == ':MISSING_CHECK: END':
+                break
+            pool.spawn(check, line)
+            data = flush()
+            if data:
+                yield data
+        pool.waitall()
+        data = flush()
+        if data:
+            yield data
+        yield ':MISSING_CHECK: END\r\n'
+
     def updates(self):
         """
         Handles the UPDATES step of an SSYNC request.
@@ -410,103 +473,166 @@ class Receiver(object):
             line = self.fp.readline(self.app.network_chunk_size)
         if line.strip() != ':UPDATES: START':
             raise Exception('Looking for :UPDATES: START got %r' % line[:1024])
-        successes = 0
-        failures = 0
-        while True:
-            with exceptions.MessageTimeout(
-                    self.app.client_timeout, 'updates line'):
-                line = self.fp.readline(self.app.network_chunk_size)
-            if not line or line.strip() == ':UPDATES: END':
-                break
-            # Read first line METHOD PATH of subrequest.
-            method, path = line.strip().split(' ', 1)
-            subreq = swob.Request.blank(
-                '/%s/%s%s' % (self.device, self.partition, path),
-                environ={'REQUEST_METHOD': method})
-            # Read header lines.
-            content_length = None
-            replication_headers = []
+        pool = None
+        if self.pipelined:
+            pool = eventlet.GreenPool(self.app.ssync_receiver_concurrency)
+        # the last subrequest run in the pool for each object path, which
+        # any later subrequest to the same object must wait for
+        in_flight = {}
+        results = []
+        self._successes = self._failures = 0
+        try:
             while True:
-                with exceptions.MessageTimeout(self.app.client_timeout):
+                with exceptions.MessageTimeout(
+                        self.app.client_timeout, 'updates line'):
                     line = self.fp.readline(self.app.network_chunk_size)
-                if not line:
-                    raise Exception(
-                        'Got no headers for %s %s' % (method, path))
-                line = line.strip()
-                if not line:
+                if not line or line.strip() == ':UPDATES: END':
                     break
-                header, value = line.split(':', 1)
-                header = header.strip().lower()
-                value = value.strip()
-                subreq.headers[header] = value
-                if header != 'etag':
-                    # make sure ssync doesn't cause 'Etag' to be added to
-                    # obj metadata in addition to 'ETag' which object server
-                    # sets (note capitalization)
-                    replication_headers.append(header)
-                if header == 'content-length':
-                    content_length = int(value)
-            # Establish subrequest body, if needed.
-            if method in ('DELETE', 'POST'):
-                if content_length not in (None, 0):
-                    raise Exception(
-                        '%s subrequest with content-length %s'
-                        % (method, path))
-            elif method == 'PUT':
-                if content_length is None:
-                    raise Exception(
-                        'No content-length sent for %s %s' % (method, path))
-
-                def subreq_iter():
-                    left = content_length
-                    while left > 0:
-                        with exceptions.MessageTimeout(
-                                self.app.client_timeout,
-                                'updates content'):
-                            chunk = self.fp.read(
-                                min(left, self.app.network_chunk_size))
-                        if not chunk:
-                            raise exceptions.ChunkReadError(
-                                'Early termination for %s %s' % (method, path))
-                        left -= len(chunk)
-                        yield chunk
-                subreq.environ['wsgi.input'] = utils.FileLikeIter(
-                    subreq_iter())
-            else:
-                raise Exception('Invalid subrequest method %s' % method)
-            subreq.headers['X-Backend-Storage-Policy-Index'] = int(self.policy)
-            subreq.headers['X-Backend-Replication'] = 'True'
-            if self.node_index is not None:
-                # primary node should not 409 if it has a non-primary fragment
-                subreq.headers['X-Backend-Ssync-Frag-Index'] = self.node_index
-            if replication_headers:
-                subreq.headers['X-Backend-Replication-Headers'] = \
-                    ' '.join(replication_headers)
+                subreq, content_length = self._read_subrequest(line)
+                if pool is not None and (
+                        content_length is None or
+                        content_length <= self.app.network_chunk_size):
+                    if content_length:
+                        subreq.environ['wsgi.input'] = BytesIO(
+                            ''.join(subreq.environ['wsgi.input']))
+                    in_flight[subreq.path] = pool.spawn(
+                        self._run_subrequest, subreq, results,
+                        in_flight.get(subreq.path))
+                else:
+                    self._run_subrequest(
+                        subreq, results, in_flight.pop(subreq.path, None))
+                    # The subreq may have failed, but we want to read the
+                    # rest of the body from the remote side so we can
+                    # continue on with the next subreq.
+                    for junk in subreq.environ['wsgi.input']:
+                        pass
+                self._count_results(results)
+        finally:
+            if pool is not None:
+                pool.waitall()
+        self._count_results(results)
+        successes, failures = self._successes, self._failures
+        if failures:
+            raise swob.HTTPInternalServerError(
+                'ERROR: With :UPDATES: %d failures to %d successes' %
+                (failures, successes))
+        yield ':UPDATES: START\r\n'
+        yield ':UPDATES: END\r\n'
+
+    def _read_subrequest(self, line):
+        """
+        Reads the headers of an UPDATES subrequest and establishes its body,
+        if needed.
+
+        :param line: the first line, METHOD PATH, of the subrequest
+        :returns: a 2-tuple of the subrequest and its content length
+        """
+        method, path = line.strip().split(' ', 1)
+        subreq = swob.Request.blank(
+            '/%s/%s%s' % (self.device, self.partition, path),
+            environ={'REQUEST_METHOD': method})
+        # Read header lines.
+        content_length = None
+        replication_headers = []
+        while True:
+            with exceptions.MessageTimeout(self.app.client_timeout):
+                line = self.fp.readline(self.app.network_chunk_size)
+            if not line:
+                raise Exception(
+                    'Got no headers for %s %s' % (method, path))
+            line = line.strip()
+            if not line:
+                break
+            header, value = line.split(':', 1)
+            header = header.strip().lower()
+            value = value.strip()
+            subreq.headers[header] = value
+            if header != 'etag':
+                # make sure ssync doesn't cause 'Etag' to be added to
+                # obj metadata in addition to 'ETag' which object server
+                # sets (note capitalization)
+                replication_headers.append(header)
+            if header == 'content-length':
+                content_length = int(value)
+        # Establish subrequest body, if needed.
+        if method in ('DELETE', 'POST'):
+            if content_length not in (None, 0):
+                raise Exception(
+                    '%s subrequest with content-length %s'
+                    % (method, path))
+        elif method == 'PUT':
+            if content_length is None:
+                raise Exception(
+                    'No content-length sent for %s %s' % (method, path))
+
+            def subreq_iter():
+                left = content_length
+                while left > 0:
+                    with exceptions.MessageTimeout(
+                            self.app.client_timeout,
+                            'updates content'):
+                        chunk = self.fp.read(
+                            min(left, self.app.network_chunk_size))
+                    if not chunk:
+                        raise exceptions.ChunkReadError(
+                            'Early termination for %s %s' % (method, path))
+                    left -= len(chunk)
+                    yield chunk
+            subreq.environ['wsgi.input'] = utils.FileLikeIter(
+                subreq_iter())
+        else:
+            raise Exception('Invalid subrequest method %s' % method)
+        subreq.headers['X-Backend-Storage-Policy-Index'] = int(self.policy)
+        subreq.headers['X-Backend-Replication'] = 'True'
+        if self.node_index is not None:
+            # primary node should not 409 if it has a non-primary fragment
+            subreq.headers['X-Backend-Ssync-Frag-Index'] = self.node_index
+        if replication_headers:
+            subreq.headers['X-Backend-Replication-Headers'] = \
+                ' '.join(replication_headers)
+        return subreq, content_length
+
+    def _run_subrequest(self, subreq, results, previous=None):
+        """
+        Routes a subrequest to the object server and appends whether it
+        succeeded, or any exception it raised, to ``results``.
+
+        :param previous: a greenthread running an earlier subrequest to the
+                         same object, to wait for first
+        """
+        try:
+            if previous is not None:
+                previous.wait()
             # Route subrequest and translate response.
             resp = subreq.get_response(self.app)
             if http.is_success(resp.status_int) or \
                     resp.status_int == http.HTTP_NOT_FOUND:
-                successes += 1
+                results.append(True)
             else:
                 self.app.logger.warning(
                     'ssync subrequest failed with %s: %s %s' %
-                    (resp.status_int, method, subreq.path))
-                failures += 1
-            if failures >= self.app.replication_failure_threshold and (
-                    not successes or
-                    float(failures) / successes >
+                    (resp.status_int, subreq.method, subreq.path))
+                results.append(False)
+        except Exception as err:
+            results.append(err)
+
+    def _count_results(self, results):
+        """
+        Counts the outcomes of finished subrequests and raises if there have
+        been too many failures.
+        """
+        while results:
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            if result:
+                self._successes += 1
+            else:
+                self._failures += 1
+            if self._failures >= self.app.replication_failure_threshold and (
+                    not self._successes or
+                    float(self._failures) / self._successes >
                     self.app.replication_failure_ratio):
                 raise Exception(
                     'Too many %d failures to %d successes' %
-                    (failures, successes))
-            # The subreq may have failed, but we want to read the rest of the
-            # body from the remote side so we can continue on with the next
-            # subreq.
-            for junk in subreq.environ['wsgi.input']:
-                pass
-        if failures:
-            raise swob.HTTPInternalServerError(
-                'ERROR: With :UPDATES: %d failures to %d successes' %
-                (failures, successes))
-        yield ':UPDATES: START\r\n'
-        yield ':UPDATES: END\r\n'
+                    (self._failures, self._successes))
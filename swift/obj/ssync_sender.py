@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import eventlet
+import eventlet.queue
 import six
 from six.moves import urllib
 
@@ -78,7 +80,8 @@ class Sender(object):
     process is there.
     """
 
-    def __init__(self, daemon, node, job, suffixes, remote_check_objs=None):
+    def __init__(self, daemon, node, job, suffixes, remote_check_objs=None,
+                 buckets=None):
         self.daemon = daemon
         self.df_mgr = self.daemon._diskfile_mgr
         self.node = node
@@ -95,10 +98,19 @@ class Sender(object):
         # When remote_check_objs is given in job, ssync_sender trys only to
         # make sure those objects exist or not in remote.
         self.remote_check_objs = remote_check_objs
+        # When buckets is given only the objects in the given hash-prefix
+        # buckets of each suffix are offered to the receiver.
+        self.buckets = buckets
         # send_map has an entry for each object that the receiver wants to
         # be sync'ed; each entry maps an object hash => dict of wanted parts
         self.send_map = {}
         self.failures = 0
+        # In pipelined mode the missing_check lines are batched and the
+        # UPDATES subrequests are sent as the receiver's wanted lines arrive.
+        # Only a full sync is pipelined, remote_check_objs never sends.
+        self.pipeline = (getattr(daemon, 'ssync_pipeline', False) and
+                         remote_check_objs is None)
+        self.streams = max(1, getattr(daemon, 'ssync_streams', 1))
 
     def __call__(self):
         """
@@ -112,6 +124,8 @@ class Sender(object):
         """
         if not self.suffixes:
             return True, {}
+        if self.streams > 1 and len(self.suffixes) > 1:
+            return self.call_streams()
         try:
             # Double try blocks in case our main error handler fails.
             try:
@@ -121,11 +135,15 @@ class Sender(object):
                 # abort the replication attempt and log a simple error. All
                 # other exceptions will be logged with a full stack trace.
                 self.connect()
-                self.missing_check()
-                if self.remote_check_objs is None:
+                if self.pipeline:
+                    self.pipelined_updates()
+                    can_delete_obj = self.available_map
+                elif self.remote_check_objs is None:
+                    self.missing_check()
                     self.updates()
                     can_delete_obj = self.available_map
                 else:
+                    self.missing_check()
                     # when we are initialized with remote_check_objs we don't
                     # *send* any requested updates; instead we only collect
                     # what's already in sync and safe for deletion
@@ -166,6 +184,32 @@ class Sender(object):
             self.daemon.logger.exception('EXCEPTION in ssync.Sender')
         return False, {}
 
+    def call_streams(self):
+        """
+        Splits the suffixes between ``ssync_streams`` senders, each with its
+        own SSYNC request to the remote node, and runs them concurrently.
+
+        :returns: a 2-tuple as for :meth:`__call__`; success is only True if
+                  every stream succeeded
+        """
+        suffixes = list(self.suffixes)
+        streams = min(self.streams, len(suffixes))
+        pile = eventlet.GreenPile(streams)
+        for i in range(streams):
+            sender = self.__class__(
+                self.daemon, self.node, self.job, suffixes[i::streams],
+                self.remote_check_objs, self.buckets)
+            sender.streams = 1
+            pile.spawn(sender)
+        success = True
+        can_delete_obj = {}
+        for stream_success, stream_can_delete_obj in pile:
+            success = success and stream_success
+            can_delete_obj.update(stream_can_delete_obj)
+        if not success:
+            return False, {}
+        return True, can_delete_obj
+
     def connect(self):
         """
         Establishes a connection and starts an SSYNC request
@@ -197,6 +241,8 @@ class Sender(object):
             # a revert job to a handoff will not have a node index
             self.connection.putheader('X-Backend-Ssync-Node-Index',
                                       self.node.get('index', ''))
+            if self.pipeline:
+                self.connection.putheader('X-Backend-Ssync-Pipeline', '1')
             self.connection.endheaders()
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'connect receive'):
@@ -261,34 +307,66 @@ class Sender(object):
         :py:meth:`.Receiver.missing_check`.
         """
         # First, send our list.
+        self.send_missing_check()
+        # Now, retrieve the list of what they want.
+        self.read_missing_check(self.daemon.http_timeout)
+
+    def send_missing_check(self):
+        """
+        Sends the hashes and timestamps of the objects available to be
+        sync'd. In pipelined mode the lines are batched into chunks of up to
+        ``network_chunk_size`` bytes rather than sent one per chunk.
+        """
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'missing_check start'):
             msg = ':MISSING_CHECK: START\r\n'
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        kwargs = {'frag_index': self.job.get('frag_index')}
+        if self.buckets is not None:
+            kwargs['buckets'] = self.buckets
         hash_gen = self.df_mgr.yield_hashes(
             self.job['device'], self.job['partition'],
-            self.job['policy'], self.suffixes,
-            frag_index=self.job.get('frag_index'))
+            self.job['policy'], self.suffixes, **kwargs)
         if self.remote_check_objs is not None:
             hash_gen = six.moves.filter(
                 lambda path_objhash_timestamps:
                 path_objhash_timestamps[1] in
                 self.remote_check_objs, hash_gen)
+        batch = ''
         for path, object_hash, timestamps in hash_gen:
             self.available_map[object_hash] = timestamps
+            batch += '%s\r\n' % encode_missing(object_hash, **timestamps)
+            if self.pipeline and \
+                    len(batch) < self.daemon.network_chunk_size:
+                continue
             with exceptions.MessageTimeout(
                     self.daemon.node_timeout,
                     'missing_check send line'):
-                msg = '%s\r\n' % encode_missing(object_hash, **timestamps)
-                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+                self.connection.send('%x\r\n%s\r\n' % (len(batch), batch))
+            batch = ''
+        if batch:
+            with exceptions.MessageTimeout(
+                    self.daemon.node_timeout,
+                    'missing_check send line'):
+                self.connection.send('%x\r\n%s\r\n' % (len(batch), batch))
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'missing_check end'):
             msg = ':MISSING_CHECK: END\r\n'
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
-        # Now, retrieve the list of what they want.
+
+    def read_missing_check(self, timeout, wanted_callback=None):
+        """
+        Reads the receiver's list of wanted hashes into the send_map.
+
+        :param timeout: seconds to wait for each line, or None to wait
+                        indefinitely
+        :param wanted_callback: if given, called with the object hash and
+                                the dict of wanted parts as each wanted line
+                                is read
+        """
         while True:
             with exceptions.MessageTimeout(
-                    self.daemon.http_timeout, 'missing_check start wait'):
+                    timeout, 'missing_check start wait'):
                 line = self.readline()
             if not line:
                 raise exceptions.ReplicationException('Early disconnect')
@@ -300,16 +378,22 @@ class Sender(object):
                     'Unexpected response: %r' % line[:1024])
         while True:
             with exceptions.MessageTimeout(
-                    self.daemon.http_timeout, 'missing_check line wait'):
+                    timeout, 'missing_check line wait'):
                 line = self.readline()
             if not line:
                 raise exceptions.ReplicationException('Early disconnect')
             line = line.strip()
             if line == ':MISSING_CHECK: END':
                 break
+            elif line.startswith(':ERROR:'):
+                # a pipelined receiver may fail after starting its reply
+                raise exceptions.ReplicationException(
+                    'Unexpected response: %r' % line[:1024])
             parts = line.split()
             if parts:
                 self.send_map[parts[0]] = decode_wanted(parts[1:])
+                if wanted_callback:
+                    wanted_callback(parts[0], self.send_map[parts[0]])
 
     def updates(self):
         """
@@ -325,42 +409,111 @@ class Sender(object):
             msg = ':UPDATES: START\r\n'
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
         for object_hash, want in self.send_map.items():
-            object_hash = urllib.parse.unquote(object_hash)
-            try:
-                df = self.df_mgr.get_diskfile_from_hash(
-                    self.job['device'], self.job['partition'], object_hash,
-                    self.job['policy'], frag_index=self.job.get('frag_index'))
-            except exceptions.DiskFileNotExist:
-                continue
-            url_path = urllib.parse.quote(
-                '/%s/%s/%s' % (df.account, df.container, df.obj))
-            try:
-                df.open()
-                if want.get('data'):
-                    # EC reconstructor may have passed a callback to build an
-                    # alternative diskfile - construct it using the metadata
-                    # from the data file only.
-                    df_alt = self.job.get(
-                        'sync_diskfile_builder', lambda *args: df)(
-                            self.job, self.node, df.get_datafile_metadata())
-                    self.send_put(url_path, df_alt)
-                if want.get('meta') and df.data_timestamp != df.timestamp:
-                    self.send_post(url_path, df)
-            except exceptions.DiskFileDeleted as err:
-                if want.get('data'):
-                    self.send_delete(url_path, err.timestamp)
-            except exceptions.DiskFileError:
-                # DiskFileErrors are expected while opening the diskfile,
-                # before any data is read and sent. Since there is no partial
-                # state on the receiver it's ok to ignore this diskfile and
-                # continue. The diskfile may however be deleted after a
-                # successful ssync since it remains in the send_map.
-                pass
+            self.send_update(object_hash, want)
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'updates end'):
             msg = ':UPDATES: END\r\n'
             self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
         # Now, read their response for any issues.
+        self.read_updates()
+
+    def pipelined_updates(self):
+        """
+        Handles the sender-side of both the MISSING_CHECK and UPDATES steps
+        of a pipelined SSYNC request.
+
+        The receiver's wanted lines are read by a separate greenthread while
+        the list of available objects is still being sent, and each
+        subrequest is sent as soon as its wanted line arrives rather than
+        once the whole list has been received.
+        """
+        wanted = eventlet.queue.Queue()
+
+        def read_wanted():
+            try:
+                # the main greenthread times out waiting on the queue instead
+                # as the receiver may have nothing to say while we are still
+                # listing a large partition
+                self.read_missing_check(
+                    None, lambda *item: wanted.put(item))
+                wanted.put(None)
+            except (Exception, exceptions.Timeout) as err:
+                wanted.put(err)
+
+        reader = eventlet.spawn(read_wanted)
+        try:
+            self.send_missing_check()
+            with exceptions.MessageTimeout(
+                    self.daemon.node_timeout, 'updates start'):
+                msg = ':UPDATES: START\r\n'
+                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+            while True:
+                try:
+                    item = wanted.get(timeout=self.daemon.http_timeout)
+                except eventlet.queue.Empty:
+                    err = exceptions.MessageTimeout(
+                        self.daemon.http_timeout, 'missing_check line wait')
+                    # only raised here, not by the hub once it expires
+                    err.cancel()
+                    raise err
+                if item is None:
+                    break
+                if not isinstance(item, tuple):
+                    raise item
+                self.send_update(*item)
+            with exceptions.MessageTimeout(
+                    self.daemon.node_timeout, 'updates end'):
+                msg = ':UPDATES: END\r\n'
+                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        finally:
+            reader.kill()
+        self.read_updates()
+
+    def send_update(self, object_hash, want):
+        """
+        Sends the PUT, POST and/or DELETE subrequests for one object that
+        the receiver wants.
+
+        :param object_hash: the (quoted) hash of the object
+        :param want: a dict of wanted parts, as returned by
+                     :func:`decode_wanted`
+        """
+        object_hash = urllib.parse.unquote(object_hash)
+        try:
+            df = self.df_mgr.get_diskfile_from_hash(
+                self.job['device'], self.job['partition'], object_hash,
+                self.job['policy'], frag_index=self.job.get('frag_index'))
+        except exceptions.DiskFileNotExist:
+            return
+        url_path = urllib.parse.quote(
+            '/%s/%s/%s' % (df.account, df.container, df.obj))
+        try:
+            df.open()
+            if want.get('data'):
+                # EC reconstructor may have passed a callback to build an
+                # alternative diskfile - construct it using the metadata
+                # from the data file only.
+                df_alt = self.job.get(
+                    'sync_diskfile_builder', lambda *args: df)(
+                        self.job, self.node, df.get_datafile_metadata())
+                self.send_put(url_path, df_alt)
+            if want.get('meta') and df.data_timestamp != df.timestamp:
+                self.send_post(url_path, df)
+        except exceptions.DiskFileDeleted as err:
+            if want.get('data'):
+                self.send_delete(url_path, err.timestamp)
+        except exceptions.DiskFileError:
+            # DiskFileErrors are expected while opening the diskfile,
+            # before any data is read and sent. Since there is no partial
+            # state on the receiver it's ok to ignore this diskfile and
+            # continue. The diskfile may however be deleted after a
+            # successful ssync since it remains in the send_map.
+            pass
+
+    def read_updates(self):
+        """
+        Reads the receiver's response to the UPDATES step.
+        """
         while True:
             with exceptions.MessageTimeout(
                     self.daemon.http_timeout, 'updates start wait'):
@@ -726,6 +726,10 @@ def bytes_to_skip(record_size, range_start):
 
 
 class ResumingGetter(object):
+    # stage under which the time spent handing data downstream is recorded;
+    # for EC fragment getters that is the decoder, not the client
+    send_stage = 'fragment_send'
+
     def __init__(self, app, req, server_type, node_iter, partition, path,
                  backend_headers, concurrency=1, client_chunk_size=None,
                  newest=None, header_provider=None):
@@ -748,6 +752,7 @@ class ResumingGetter(object):
         self.req_method = req.method
         self.req_path = req.path
         self.req_query_string = req.query_string
+        self.req_env = req.environ
         if newest is None:
             self.newest = config_true_value(req.headers.get('x-newest', 'f'))
         else:
@@ -883,6 +888,9 @@ class ResumingGetter(object):
         # Someday we can replace this [mess] with python 3's "nonlocal"
         source = [source]
         node = [node]
+        send_time = [0]
+        # only time sends when the timing will be recorded
+        stage_timing = self.app.stage_timing
 
         try:
             client_chunk_size = self.client_chunk_size
@@ -992,10 +1000,14 @@ class ResumingGetter(object):
 
                         if not chunk:
                             if buf:
+                                if stage_timing:
+                                    send_start = time.time()
                                 with ChunkWriteTimeout(
                                         self.app.client_timeout):
                                     self.bytes_used_from_backend += len(buf)
                                     yield buf
+                                if stage_timing:
+                                    send_time[0] += time.time() - send_start
                                 buf = ''
                             break
 
@@ -1003,15 +1015,23 @@ class ResumingGetter(object):
                             while len(buf) >= client_chunk_size:
                                 client_chunk = buf[:client_chunk_size]
                                 buf = buf[client_chunk_size:]
+                                if stage_timing:
+                                    send_start = time.time()
                                 with ChunkWriteTimeout(
                                         self.app.client_timeout):
                                     self.bytes_used_from_backend += \
                                         len(client_chunk)
                                     yield client_chunk
+                                if stage_timing:
+                                    send_time[0] += time.time() - send_start
                         else:
+                            if stage_timing:
+                                send_start = time.time()
                             with ChunkWriteTimeout(self.app.client_timeout):
                                 self.bytes_used_from_backend += len(buf)
                                 yield buf
+                            if stage_timing:
+                                send_time[0] += time.time() - send_start
                             buf = ''
 
                         # This is for fairness; if the network is outpacing
@@ -1083,6 +1103,8 @@ class ResumingGetter(object):
             # Close-out the connection as best as possible.
             if getattr(source[0], 'swift_conn', None):
                 close_swift_conn(source[0])
+            self.app.record_stage_timing(self.send_stage, send_time[0],
+                                         req.environ)
 
     @property
     def last_status(self):
@@ -1114,12 +1136,17 @@ class ResumingGetter(object):
                     self.partition, self.req_method, self.path,
                     headers=req_headers,
                     query_string=self.req_query_string)
-            self.app.set_node_timing(node, time.time() - start_node_timing)
+            connected = time.time()
+            self.app.set_node_timing(node, connected - start_node_timing)
+            self.app.record_stage_timing(
+                'connect', connected - start_node_timing, self.req_env)
 
             with Timeout(node_timeout):
                 possible_source = conn.getresponse()
                 # See NOTE: swift_conn at top of file about this.
                 possible_source.swift_conn = conn
+            self.app.record_stage_timing(
+                'first_byte', time.time() - connected, self.req_env)
         except (Exception, Timeout):
             self.app.exception_occurred(
                 node, self.server_type,
@@ -1223,6 +1250,8 @@ class ResumingGetter(object):
 
 
 class GetOrHeadHandler(ResumingGetter):
+    send_stage = 'client_send'
+
     def _make_app_iter(self, req, node, source):
         """
         Returns an iterator over the contents of the source (via its read
@@ -1374,6 +1403,7 @@ class NodeIter(object):
             if not self.app.error_limited(node):
                 handoffs += 1
                 self.log_handoffs(handoffs)
+                self.app.record_handoff(handoffs)
                 yield node
                 if not self.app.error_limited(node):
                     self.nodes_left -= 1
@@ -1493,7 +1523,9 @@ class Controller(object):
         path_env = env.copy()
         path_env['PATH_INFO'] = "/v1/%s" % (account,)
 
+        start = time.time()
         info = get_account_info(path_env, self.app)
+        self.app.record_stage_timing('info', time.time() - start, env)
         if (not info
                 or not is_success(info['status'])
                 or not info.get('account_really_exists', True)):
@@ -1523,7 +1555,9 @@ class Controller(object):
         env.setdefault('swift.infocache', {})
         path_env = env.copy()
         path_env['PATH_INFO'] = "/v1/%s/%s" % (account, container)
+        start = time.time()
         info = get_container_info(path_env, self.app)
+        self.app.record_stage_timing('info', time.time() - start, env)
         if not info or not is_success(info.get('status')):
             info = headers_to_container_info({}, 0)
             info['partition'] = None
@@ -1562,9 +1596,14 @@ class Controller(object):
                                         node['device'], part, method, path,
                                         headers=headers, query_string=query)
                     conn.node = node
-                self.app.set_node_timing(node, time.time() - start_node_timing)
+                connected = time.time()
+                self.app.set_node_timing(node, connected - start_node_timing)
+                self.app.record_stage_timing('connect',
+                                             connected - start_node_timing)
                 with Timeout(self.app.node_timeout):
                     resp = conn.getresponse()
+                    self.app.record_stage_timing('first_byte',
+                                                 time.time() - connected)
                     if not is_informational(resp.status) and \
                             not is_server_error(resp.status):
                         return resp.status, resp.reason, resp.getheaders(), \
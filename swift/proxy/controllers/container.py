@@ -240,9 +240,9 @@ class ContainerController(Controller):
                 int(POLICIES.default)
         else:
             additional['X-Backend-Storage-Policy-Index'] = str(policy_index)
-        headers = [self.generate_request_headers(req, transfer=True,
-                                                 additional=additional)
-                   for _junk in range(n_outgoing)]
+        base_headers = self.generate_request_headers(req, transfer=True,
+                                                     additional=additional)
+        headers = [base_headers.copy() for _junk in range(n_outgoing)]
 
         for i, account in enumerate(accounts):
             i = i % len(headers)
@@ -27,11 +27,13 @@ class InfoController(Controller):
     server_type = 'Info'
 
     def __init__(self, app, version, expose_info, disallowed_sections,
-                 admin_key):
+                 admin_key, stage_timings=None):
         Controller.__init__(self, app)
         self.expose_info = expose_info
         self.disallowed_sections = disallowed_sections
         self.admin_key = admin_key
+        # optional callable returning this worker's request stage timings
+        self.stage_timings = stage_timings
         self.allowed_hmac_methods = {
             'HEAD': ['HEAD', 'GET'],
             'GET': ['GET']}
@@ -98,8 +100,11 @@ class InfoController(Controller):
             headers['Access-Control-Expose-Headers'] = ', '.join(
                 ['x-trans-id'])
 
-        info = json.dumps(get_swift_info(
-            admin=admin_request, disallowed_sections=self.disallowed_sections))
+        info = get_swift_info(
+            admin=admin_request, disallowed_sections=self.disallowed_sections)
+        if admin_request and self.stage_timings:
+            info['admin']['stage_timings'] = self.stage_timings()
+        info = json.dumps(info)
 
         return HTTPOk(request=req,
                       headers=headers,
@@ -28,6 +28,7 @@ import six
 from six.moves.urllib.parse import unquote
 
 import collections
+import functools
 import itertools
 import json
 import mimetypes
@@ -251,8 +252,10 @@ class BaseObjectController(Controller):
                           delete_at_nodes=None):
         policy_index = req.headers['X-Backend-Storage-Policy-Index']
         policy = POLICIES.get_by_index(policy_index)
-        headers = [self.generate_request_headers(req, additional=req.headers)
-                   for _junk in range(n_outgoing)]
+        # the per-node headers only differ by what is added below
+        base_headers = self.generate_request_headers(
+            req, additional=req.headers)
+        headers = [base_headers.copy() for _junk in range(n_outgoing)]
 
         def set_container_update(index, container):
             headers[index]['X-Container-Partition'] = container_partition
@@ -521,6 +524,8 @@ class BaseObjectController(Controller):
             try:
                 putter = self._make_putter(node, part, req, headers)
                 self.app.set_node_timing(node, putter.connect_duration)
+                self.app.record_stage_timing(
+                    'connect', putter.connect_duration, req.environ)
                 return putter
             except InsufficientStorage:
                 self.app.error_limit(node, _('ERROR Insufficient Storage'))
@@ -915,9 +920,12 @@ class ECAppIter(object):
         headers in the GET response from the object server.
 
     :param logger: a logger
+
+    :param stage_timer: optional callable taking a stage name and a duration
+        in seconds, used to report the time spent decoding
     """
     def __init__(self, path, policy, internal_parts_iters, range_specs,
-                 fa_length, obj_length, logger):
+                 fa_length, obj_length, logger, stage_timer=None):
         self.path = path
         self.policy = policy
         self.internal_parts_iters = internal_parts_iters
@@ -926,6 +934,7 @@ class ECAppIter(object):
         self.obj_length = obj_length if obj_length is not None else 0
         self.boundary = ''
         self.logger = logger
+        self.stage_timer = stage_timer
 
         self.mime_boundary = None
         self.learned_content_type = None
@@ -1268,33 +1277,41 @@ class ECAppIter(object):
                 queue.put(None)
                 frag_iter.close()
 
+        decode_time = 0
         with ContextPool(len(fragment_iters)) as pool:
             for frag_iter, queue in zip(fragment_iters, queues):
                 pool.spawn(put_fragments_in_queue, frag_iter, queue)
 
-            while True:
-                fragments = []
-                for queue in queues:
-                    fragment = queue.get()
-                    queue.task_done()
-                    fragments.append(fragment)
-
-                # If any object server connection yields out a None; we're
-                # done.  Either they are all None, and we've finished
-                # successfully; or some un-recoverable failure has left us
-                # with an un-reconstructible list of fragments - so we'll
-                # break out of the iter so WSGI can tear down the broken
-                # connection.
-                if not all(fragments):
-                    break
-                try:
-                    segment = self.policy.pyeclib_driver.decode(fragments)
-                except ECDriverError:
-                    self.logger.exception(_("Error decoding fragments for"
-                                            " %r"), self.path)
-                    raise
-
-                yield segment
+            try:
+                while True:
+                    fragments = []
+                    for queue in queues:
+                        fragment = queue.get()
+                        queue.task_done()
+                        fragments.append(fragment)
+
+                    # If any object server connection yields out a None;
+                    # we're done.  Either they are all None, and we've
+                    # finished successfully; or some un-recoverable failure
+                    # has left us with an un-reconstructible list of
+                    # fragments - so we'll break out of the iter so WSGI can
+                    # tear down the broken connection.
+                    if not all(fragments):
+                        break
+                    decode_start = time.time()
+                    try:
+                        segment = self.policy.pyeclib_driver.decode(
+                            fragments)
+                    except ECDriverError:
+                        self.logger.exception(_("Error decoding fragments for"
+                                                " %r"), self.path)
+                        raise
+                    decode_time += time.time() - decode_start
+
+                    yield segment
+            finally:
+                if self.stage_timer:
+                    self.stage_timer('ec_decode', decode_time)
 
     def app_iter_range(self, start, end):
         return self
@@ -2260,7 +2277,9 @@ class ECObjectController(BaseObjectController):
                 [parts_iter for
                  _getter, parts_iter in best_bucket.get_responses()],
                 range_specs, fa_length, obj_length,
-                self.app.logger)
+                self.app.logger,
+                stage_timer=functools.partial(self.app.record_stage_timing,
+                                              env=req.environ))
             resp = Response(
                 request=req,
                 headers=resp_headers,
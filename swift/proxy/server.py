@@ -32,7 +32,7 @@ from swift.common.ring import Ring
 from swift.common.utils import cache_from_env, get_logger, \
     get_remote_client, split_path, config_true_value, generate_trans_id, \
     affinity_key_function, affinity_locality_predicate, list_from_csv, \
-    register_swift_info
+    register_swift_info, LatencyHistogram
 from swift.common.constraints import check_utf8, valid_api_version
 from swift.proxy.controllers import AccountController, ContainerController, \
     ObjectControllerRouter, InfoController
@@ -151,6 +151,11 @@ class Application(object):
             conf.get('strict_cors_mode', 't'))
         self.node_timings = {}
         self.timing_expiry = int(conf.get('timing_expiry', 300))
+        self.stage_timing = config_true_value(
+            conf.get('stage_timing', 'false'))
+        self.stage_timing_statsd = config_true_value(
+            conf.get('stage_timing_statsd', 'false'))
+        self.stage_histograms = {}
         self.sorting_method = conf.get('sorting_method', 'shuffle').lower()
         self.concurrent_gets = \
             config_true_value(conf.get('concurrent_gets'))
@@ -264,7 +269,9 @@ class Application(object):
             d = dict(version=None,
                      expose_info=self.expose_info,
                      disallowed_sections=self.disallowed_sections,
-                     admin_key=self.admin_key)
+                     admin_key=self.admin_key,
+                     stage_timings=(self.get_stage_timings
+                                    if self.stage_timing else None))
             return InfoController, d
 
         version, account, container, obj = split_path(req.path, 1, 4, True)
@@ -275,7 +282,9 @@ class Application(object):
         if account and not valid_api_version(version):
             raise APIVersionError('Invalid path')
         if obj and container and account:
+            start = time()
             info = get_container_info(req.environ, self)
+            self.record_stage_timing('info', time() - start, req.environ)
             policy_index = req.headers.get('X-Backend-Storage-Policy-Index',
                                            info['storage_policy'])
             policy = POLICIES.get_by_index(policy_index)
@@ -395,7 +404,9 @@ class Application(object):
                 # again. If not authorized, we return the denial unless the
                 # controller's method indicates it'd like to gather more
                 # information and try again later.
+                start = time()
                 resp = req.environ['swift.authorize'](req)
+                self.record_stage_timing('auth', time() - start, req.environ)
                 if not resp:
                     # No resp means authorized, no delayed recheck required.
                     old_authorize = req.environ['swift.authorize']
@@ -450,6 +461,62 @@ class Application(object):
         timing = round(timing, 3)  # sort timings to the millisecond
         self.node_timings[node['ip']] = (timing, now + self.timing_expiry)
 
+    def _stage_histogram(self, stage):
+        histogram = self.stage_histograms.get(stage)
+        if histogram is None:
+            histogram = self.stage_histograms[stage] = LatencyHistogram()
+        return histogram
+
+    def record_stage_timing(self, stage, elapsed, env=None):
+        """
+        Record the time spent in one stage of handling a request, such as
+        connecting to a backend node or waiting for its first byte.
+
+        Timings are aggregated into per-stage histograms for this worker
+        process and, if ``stage_timing_statsd`` is enabled, also sent to
+        StatsD as ``stage.<stage>.timing``.
+
+        :param stage: name of the stage
+        :param elapsed: seconds spent in the stage
+        :param env: optional WSGI environment of the request; if given, the
+                    time is also added to its ``swift.proxy_stage_timings``
+                    dict so the whole request's breakdown is available
+        """
+        if not self.stage_timing:
+            return
+        # histograms hold microseconds
+        self._stage_histogram(stage).record(elapsed * 1000000)
+        if env is not None:
+            timings = env.setdefault('swift.proxy_stage_timings', {})
+            timings[stage] = timings.get(stage, 0) + elapsed
+        if self.stage_timing_statsd:
+            self.logger.timing('stage.%s.timing' % stage, elapsed * 1000)
+
+    def record_handoff(self, depth):
+        """
+        Record that a handoff node was used.
+
+        :param depth: 1 for the first handoff tried by a request, 2 for the
+                      second, and so on
+        """
+        if not self.stage_timing:
+            return
+        self._stage_histogram('handoff_depth').record(depth)
+        if self.stage_timing_statsd:
+            self.logger.increment('stage.handoff')
+
+    def get_stage_timings(self):
+        """
+        Summarise the stage histograms of this worker process.
+
+        :returns: a dict mapping each stage to the summary of its histogram;
+                  timings are given in milliseconds
+        """
+        return dict(
+            (stage, histogram.summary(
+                scale=1 if stage == 'handoff_depth' else 1000))
+            for stage, histogram in self.stage_histograms.items())
+
     def _error_limit_node_key(self, node):
         return "{ip}:{port}/{device}".format(**node)
 
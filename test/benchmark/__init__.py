@@ -0,0 +1,52 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmarks for Swift internals.
+
+These are not unit tests and are not collected by the test runners; run a
+benchmark module directly, e.g.::
+
+    python -m test.benchmark.bench_statsd
+"""
+
+from __future__ import print_function
+
+import time
+
+
+def timeit(func, iterations):
+    """
+    Call ``func`` ``iterations`` times.
+
+    :returns: the mean wall clock time per call, in seconds
+    """
+    start = time.time()
+    for _ in range(iterations):
+        func()
+    return (time.time() - start) / iterations
+
+
+def report(name, per_call, unit='call'):
+    """
+    Print one benchmark result line.
+
+    :param name: name of the benchmark case
+    :param per_call: mean time per call, in seconds
+    :param unit: what one call represents
+    """
+    print('%-50s %10.2f us/%s %12.0f %ss/s' % (
+        name, per_call * 1e6, unit,
+        1.0 / per_call if per_call else float('inf'), unit))
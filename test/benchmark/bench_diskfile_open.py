@@ -0,0 +1,160 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Filesystem calls and time per DiskFile.read_metadata(), as used by HEAD.
+
+Counts the filesystem calls made while opening (and reading the metadata
+of) an existing object, an object with a fast-POST .meta file and a missing
+object, for replicated and EC policies, with and without the negative cache
+for missing objects and the metadata cache.  Calls are counted by wrapping
+the os, xattr and open() entry points the diskfile module uses; each counts
+as one system call, except listdir(), which is at least three (open,
+getdents, close).
+"""
+
+from __future__ import print_function
+
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+
+from swift.common.storage_policy import (
+    StoragePolicy, ECStoragePolicy, StoragePolicyCollection, EC_POLICY)
+from swift.common.utils import mkdirs, Timestamp
+from swift.obj import diskfile
+from test.benchmark import timeit, report
+
+
+POLICIES = StoragePolicyCollection([
+    StoragePolicy(0, 'zero', True),
+    ECStoragePolicy(1, 'ec', ec_type='liberasurecode_rs_vand',
+                    ec_ndata=4, ec_nparity=2)])
+
+
+class CallCounter(object):
+    """
+    Wraps the filesystem entry points used by DiskFile.open() and counts
+    calls to them.
+    """
+
+    targets = ('os.listdir', 'os.fstat', 'os.stat', 'os.close',
+               'xattr.getxattr', 'swift.obj.diskfile.open')
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self._patchers = []
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.counts[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        for target in self.targets:
+            module, attr = target.rsplit('.', 1)
+            if module == 'swift.obj.diskfile':
+                func = open
+            else:
+                func = getattr(sys.modules[module], attr)
+            patcher = mock.patch(target, self._wrap(attr, func), create=True)
+            patcher.start()
+            self._patchers.append(patcher)
+        return self
+
+    def __exit__(self, *exc_info):
+        for patcher in self._patchers:
+            patcher.stop()
+
+    def __str__(self):
+        return ', '.join('%s=%d' % item for item in
+                         sorted(self.counts.items())) or 'no calls'
+
+
+def head(df):
+    try:
+        df.read_metadata()
+    except diskfile.DiskFileNotExist:
+        pass
+
+
+def make_objects(mgr, policy):
+    frag_index = 0 if policy.policy_type == EC_POLICY else None
+    objects = {}
+    for name, with_meta in (('plain', False), ('posted', True)):
+        df = mgr.get_diskfile('sda1', '0', 'a', 'c', name, policy=policy,
+                              frag_index=frag_index)
+        timestamp = Timestamp(time.time())
+        with df.create() as writer:
+            writer.write('x' * 1024)
+            writer.put({'ETag': 'a' * 32, 'Content-Length': '1024',
+                        'X-Timestamp': timestamp.internal,
+                        'Content-Type': 'text/plain'})
+            writer.commit(timestamp)
+        if with_meta:
+            df.write_metadata({
+                'X-Timestamp': Timestamp(time.time() + 1).internal,
+                'X-Object-Meta-Color': 'blue'})
+        objects[name] = df
+    objects['missing'] = mgr.get_diskfile(
+        'sda1', '0', 'a', 'c', 'missing', policy=policy,
+        frag_index=frag_index)
+    return objects
+
+
+def main(iterations=5000):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for policy in POLICIES:
+            mkdirs(os.path.join(tmpdir, 'sda1', diskfile.get_tmp_dir(policy)))
+        for cache_time, cache_size in (('0', '0'), ('10', '0'),
+                                       ('10', '1000')):
+            conf = {'devices': tmpdir, 'mount_check': 'false',
+                    'not_found_cache_time': cache_time,
+                    'metadata_cache_size': cache_size}
+            router = diskfile.DiskFileRouter(conf, None)
+            for policy in POLICIES:
+                mgr = router[policy]
+                mgr.logger = mock.MagicMock()
+                objects = make_objects(mgr, policy)
+                # hash dirs younger than this are not put in the metadata
+                # cache
+                time.sleep(diskfile.METADATA_CACHE_MIN_AGE)
+                for name, df in sorted(objects.items()):
+                    label = ('%s %s, not_found_cache_time=%s, '
+                             'metadata_cache_size=%s' % (
+                                 policy.name, name, cache_time, cache_size))
+                    head(df)  # warm up any caches
+                    with CallCounter() as counter:
+                        head(df)
+                    report(label, timeit(lambda: head(df), iterations),
+                           'open')
+                    print('    %s' % counter)
+                if int(cache_size):
+                    print('    metadata cache: %s' %
+                          mgr.metadata_cache_stats())
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    with mock.patch('swift.obj.diskfile.POLICIES', POLICIES):
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,108 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+MD5 throughput of hashlib against the kernel's AF_ALG MD5 sockets.
+
+Hashes an object body the way the object server's PUT path does, one
+network chunk at a time, and hashes a file on disk the way the auditor
+does: read into userspace and hashed with hashlib, or spliced straight
+into an MD5 socket.  Results are per MiB.  The kernel cases are skipped
+when MD5 sockets or splice() are not available.
+"""
+
+import fcntl
+import os
+import shutil
+import sys
+import tempfile
+
+from swift.common.splice import splice
+from swift.common.utils import F_SETPIPE_SZ, KernelMD5, \
+    kernel_md5_available, md5_hasher
+from test.benchmark import timeit, report
+
+
+MiB = 1024 * 1024
+CHUNK_SIZE = 65536
+
+
+def bench_update(size, iterations, use_kernel):
+    chunk = b'x' * CHUNK_SIZE
+
+    def hash_body():
+        hasher = md5_hasher(use_kernel)
+        for _ in range(size // CHUNK_SIZE):
+            hasher.update(chunk)
+        hasher.hexdigest()
+
+    name = 'update(), %d MiB: %s' % (
+        size // MiB, 'kernel' if use_kernel else 'hashlib')
+    report(name, timeit(hash_body, iterations) / (size // MiB), 'MiB')
+
+
+def bench_file(path, size, iterations):
+    def read_and_hash():
+        hasher = md5_hasher()
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        hasher.hexdigest()
+
+    def splice_and_hash():
+        hasher = KernelMD5()
+        rpipe, wpipe = os.pipe()
+        try:
+            pipe_size = fcntl.fcntl(rpipe, F_SETPIPE_SZ, CHUNK_SIZE)
+            with open(path, 'rb') as fp:
+                while True:
+                    count = splice(fp.fileno(), None, wpipe, None,
+                                   pipe_size, 0)[0]
+                    if not count:
+                        break
+                    hasher.update_from_pipe(rpipe, count)
+            hasher.hexdigest()
+        finally:
+            hasher.close()
+            os.close(rpipe)
+            os.close(wpipe)
+
+    cases = [('read + hashlib', read_and_hash)]
+    if kernel_md5_available() and splice.available:
+        cases.append(('splice + kernel', splice_and_hash))
+    for name, func in cases:
+        report('file, %d MiB: %s' % (size // MiB, name),
+               timeit(func, iterations) / (size // MiB), 'MiB')
+
+
+def main(iterations=20):
+    kernel = kernel_md5_available()
+    if not kernel:
+        print('MD5 sockets are not available; kernel cases skipped')
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for size in (MiB, 16 * MiB):
+            for use_kernel in (False, True) if kernel else (False,):
+                bench_update(size, iterations, use_kernel)
+            path = os.path.join(tmpdir, 'object')
+            with open(path, 'wb') as fp:
+                fp.write(os.urandom(size))
+            bench_file(path, size, iterations)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,95 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Object metadata read/write cost, pickled vs compact xattrs.
+
+Measures read_metadata()/write_metadata() on their own and object server
+HEAD requests for an object with a configurable number of user metadata
+headers.  The object server uses a real filesystem under the temporary
+directory, which must support user xattrs.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from swift.common.swob import Request
+from swift.common.utils import mkdirs, Timestamp
+from swift.obj import diskfile, server as object_server
+from test.benchmark import timeit, report
+
+
+def make_metadata(user_headers):
+    metadata = {
+        'name': '/AUTH_test/container/object',
+        'X-Timestamp': Timestamp(time.time()).internal,
+        'Content-Length': '1024',
+        'Content-Type': 'application/octet-stream',
+        'ETag': 'd41d8cd98f00b204e9800998ecf8427e',
+    }
+    for i in range(user_headers):
+        metadata['X-Object-Meta-Header-%d' % i] = 'value-%d' % i * 4
+    return metadata
+
+
+def bench_functions(tmpdir, metadata, iterations):
+    path = tempfile.mkstemp(dir=tmpdir)[1]
+    for compact in (False, True):
+        fmt = 'compact' if compact else 'pickle'
+        report('write_metadata (%s)' % fmt, timeit(
+            lambda: diskfile.write_metadata(path, metadata, compact=compact),
+            iterations))
+        report('read_metadata (%s)' % fmt, timeit(
+            lambda: diskfile.read_metadata(path), iterations))
+
+
+def bench_head(tmpdir, user_headers, iterations):
+    for compact in ('false', 'true'):
+        devices = tempfile.mkdtemp(dir=tmpdir)
+        mkdirs(os.path.join(devices, 'sda1'))
+        app = object_server.ObjectController({
+            'devices': devices, 'mount_check': 'false',
+            'log_requests': 'false', 'compact_metadata': compact})
+        headers = {'X-Timestamp': Timestamp(time.time()).internal,
+                   'Content-Type': 'application/octet-stream'}
+        for i in range(user_headers):
+            headers['X-Object-Meta-Header-%d' % i] = 'value-%d' % i * 4
+        req = Request.blank('/sda1/0/a/c/o', method='PUT', headers=headers,
+                            body='x' * 1024)
+        assert req.get_response(app).status_int == 201
+
+        def head():
+            resp = Request.blank('/sda1/0/a/c/o', method='HEAD').get_response(
+                app)
+            assert resp.status_int == 200
+        fmt = 'compact' if compact == 'true' else 'pickle'
+        report('object server HEAD, %d user headers (%s)' % (
+            user_headers, fmt), timeit(head, iterations), 'request')
+
+
+def main(iterations=5000, user_headers=20):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        bench_functions(tmpdir, make_metadata(user_headers), iterations)
+        bench_head(tmpdir, user_headers, iterations)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
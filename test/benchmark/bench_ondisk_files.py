@@ -0,0 +1,87 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cost of classifying the files in an object hash directory.
+
+Times get_ondisk_files() for replicated and EC policies, over typical hash
+dirs (a single .data or .ts, a .data with a fast-POST .meta) and
+pathological ones left behind by a rebalance (dozens of fragments over
+several timestamps, stacked tombstones and .meta files).  No filesystem is
+involved; only the file names are classified.
+"""
+
+import sys
+import time
+
+import mock
+
+from swift.common.storage_policy import (
+    StoragePolicy, ECStoragePolicy, StoragePolicyCollection)
+from swift.common.utils import Timestamp, encode_timestamps
+from swift.obj import diskfile
+from test.benchmark import timeit, report
+
+
+POLICIES = StoragePolicyCollection([
+    StoragePolicy(0, 'zero', True),
+    ECStoragePolicy(1, 'ec', ec_type='liberasurecode_rs_vand',
+                    ec_ndata=10, ec_nparity=4)])
+
+
+def make_hash_dirs(ec):
+    now = time.time()
+    ts = [Timestamp(now - 3600 * i).internal for i in range(10)]
+
+    def data(i, frag_index=0, durable=True):
+        if not ec:
+            return ts[i] + '.data'
+        return '%s#%d%s.data' % (ts[i], frag_index, '#d' if durable else '')
+
+    hash_dirs = {
+        'single .data': [data(0)],
+        'single .ts': [ts[0] + '.ts'],
+        '.data + .meta': [data(1), ts[0] + '.meta'],
+        'stacked .ts + .meta': (
+            [t + '.ts' for t in ts[5:]] +
+            [encode_timestamps(Timestamp(t), Timestamp(ts[9]),
+                               explicit=True) + '.meta' for t in ts[:5]]),
+    }
+    if ec:
+        hash_dirs['rebalance, 3 x 14 frags'] = [
+            data(i, frag_index, durable=(i == 2))
+            for i in range(3) for frag_index in range(14)]
+    else:
+        hash_dirs['rebalance, 10 .data'] = [data(i) for i in range(10)]
+    for files in hash_dirs.values():
+        files.sort(reverse=True)
+    return hash_dirs
+
+
+def main(iterations=20000):
+    conf = {'devices': '/srv/node', 'mount_check': 'false'}
+    router = diskfile.DiskFileRouter(conf, mock.MagicMock())
+    for policy in POLICIES:
+        mgr = router[policy]
+        hash_dirs = make_hash_dirs(policy.policy_type == diskfile.EC_POLICY)
+        for name, files in sorted(hash_dirs.items()):
+            report('%s %s (%d files)' % (policy.name, name, len(files)),
+                   timeit(lambda: mgr.get_ondisk_files(files, '/hash/dir'),
+                          iterations), 'dir')
+
+
+if __name__ == '__main__':
+    with mock.patch('swift.obj.diskfile.POLICIES', POLICIES):
+        main(*[int(arg) for arg in sys.argv[1:]])
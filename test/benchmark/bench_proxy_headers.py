@@ -0,0 +1,93 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Header handling overhead of a proxy object PUT.
+
+Times the steps that build backend request headers for an object PUT:
+reading the client request's headers through swob, building a
+HeaderKeyDict from them and generating the per-node backend headers, for
+a 3 replica policy and a 14 fragment EC policy.
+"""
+
+import sys
+import time
+
+import mock
+
+from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.storage_policy import (
+    StoragePolicy, ECStoragePolicy, StoragePolicyCollection)
+from swift.common.swob import Request
+from swift.common.utils import Timestamp
+from swift.proxy import server as proxy_server
+from swift.proxy.controllers.obj import ObjectControllerRouter
+from test.benchmark import timeit, report
+from test.unit import FakeRing, FakeMemcache, debug_logger
+
+
+POLICIES = StoragePolicyCollection([
+    StoragePolicy(0, 'replicated', True, object_ring=FakeRing(replicas=3)),
+    ECStoragePolicy(1, 'ec', ec_type='liberasurecode_rs_vand',
+                    ec_ndata=10, ec_nparity=4,
+                    object_ring=FakeRing(replicas=14))])
+
+
+def make_request(policy):
+    headers = {
+        'X-Auth-Token': 'AUTH_tk' + 'a' * 32,
+        'Content-Type': 'application/octet-stream',
+        'Content-Length': '1048576',
+        'Etag': 'd41d8cd98f00b204e9800998ecf8427e',
+        'User-Agent': 'python-swiftclient-3.3.0',
+        'X-Object-Meta-Color': 'blue',
+        'X-Object-Meta-Shape': 'round',
+        'X-Timestamp': Timestamp(time.time()).internal,
+        'X-Backend-Storage-Policy-Index': str(int(policy)),
+    }
+    return Request.blank('/v1/a/c/o', method='PUT', headers=headers)
+
+
+def main(iterations=20000):
+    app = proxy_server.Application(
+        None, FakeMemcache(), logger=debug_logger(),
+        account_ring=FakeRing(), container_ring=FakeRing())
+    containers = [{'ip': '10.0.0.%d' % i, 'port': 1000 + i,
+                   'device': 'sd%s' % chr(ord('a') + i)} for i in range(3)]
+    for policy in POLICIES:
+        req = make_request(policy)
+        controller = ObjectControllerRouter()[policy](app, 'a', 'c', 'o')
+        controller.trans_id = 'tx' + 'a' * 32
+        n_nodes = policy.object_ring.replicas
+        prefix = '%s, %d nodes: ' % (policy.name, n_nodes)
+        report(prefix + 'list(req.headers.items())', timeit(
+            lambda: list(req.headers.items()), iterations))
+        report(prefix + 'HeaderKeyDict(req.headers)', timeit(
+            lambda: HeaderKeyDict(req.headers), iterations))
+        headers = HeaderKeyDict(req.headers)
+        report(prefix + 'HeaderKeyDict.copy()', timeit(
+            lambda: headers.copy(), iterations))
+        report(prefix + 'generate_request_headers', timeit(
+            lambda: controller.generate_request_headers(
+                req, additional=req.headers), iterations))
+        report(prefix + '_backend_requests', timeit(
+            lambda: controller._backend_requests(
+                req, n_nodes, 1, containers), iterations), 'PUT')
+
+
+if __name__ == '__main__':
+    with mock.patch('swift.proxy.server.POLICIES', POLICIES), \
+            mock.patch('swift.proxy.controllers.obj.POLICIES', POLICIES):
+        main(*[int(arg) for arg in sys.argv[1:]])
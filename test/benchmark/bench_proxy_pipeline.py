@@ -0,0 +1,101 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-request overhead of the default proxy pipeline.
+
+Loads the pipeline from etc/proxy-server.conf-sample and runs HEAD, GET
+and container listing requests through it, and through the bare proxy
+application, against a :class:`~swift.cli.bench_local.InMemoryCluster`;
+the difference is the cost of the middleware.  Also times the swob Request
+properties that every middleware re-reads from the same environ.
+"""
+
+import os
+import sys
+import time
+
+from swift.cli.bench_local import InMemoryCluster, InMemoryCache, \
+    load_proxy_app
+from swift.common.swob import Request
+from swift.common.utils import Timestamp
+from swift.proxy import server as proxy_server
+from test.benchmark import timeit, report
+
+
+SAMPLE_CONF = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                           'etc', 'proxy-server.conf-sample')
+
+
+def bench_requests(name, app, token, iterations):
+    def make_call(method, path):
+        def call():
+            resp = Request.blank(path, method=method, headers={
+                'X-Auth-Token': token}).get_response(app)
+            assert resp.status_int == 200, resp.status
+            resp.body
+        return call
+
+    for method, path in (('HEAD', '/v1/AUTH_test/c/o'),
+                         ('GET', '/v1/AUTH_test/c/o'),
+                         ('GET', '/v1/AUTH_test/c?format=json')):
+        report('%s %s %s' % (name, method, path), timeit(
+            make_call(method, path), iterations), 'request')
+
+
+def bench_request_properties(iterations, middlewares=16):
+    env = Request.blank('/v1/AUTH_test/c/o?multipart-manifest=get', headers={
+        'X-Timestamp': Timestamp(time.time()).internal}).environ
+
+    def parse():
+        # each middleware builds its own Request on the shared environ
+        for _ in range(middlewares):
+            req = Request(env)
+            req.split_path(2, 4, rest_with_last=True)
+            req.path
+            req.params.get('multipart-manifest')
+            req.timestamp
+    report('%d x Request(env) + path/split_path/params/timestamp' %
+           middlewares, timeit(parse, iterations), 'request')
+
+
+def main(iterations=2000):
+    cluster = InMemoryCluster(ec_type=None)
+    try:
+        with cluster:
+            cache = InMemoryCache()
+            with open(SAMPLE_CONF) as fp:
+                pipeline = load_proxy_app(fp.read(), cluster.swift_dir, cache)
+            proxy_app = proxy_server.Application(
+                {'swift_dir': cluster.swift_dir}, cache)
+            resp = Request.blank('/auth/v1.0', headers={
+                'X-Auth-User': 'test:tester',
+                'X-Auth-Key': 'testing'}).get_response(pipeline)
+            token = resp.headers['X-Auth-Token']
+            cluster.create_account('AUTH_test')
+            for path, body in (('/v1/AUTH_test/c', None),
+                               ('/v1/AUTH_test/c/o', 'x' * 1024)):
+                resp = Request.blank(path, method='PUT', body=body, headers={
+                    'X-Auth-Token': token}).get_response(proxy_app)
+                assert resp.status_int // 100 == 2, resp.status
+            bench_requests('pipeline', pipeline, token, iterations)
+            bench_requests('proxy app', proxy_app, token, iterations)
+    finally:
+        cluster.close()
+    bench_request_properties(iterations * 10)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,106 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+GET of a static large object made of many segments.
+
+The SLO middleware sits in front of a stub app that answers each segment
+GET after a fixed delay, which stands in for the auth, info lookups and
+node connects of a real backend GET, then streams the body a chunk at a
+time with a short pause between chunks.  Each run downloads the whole
+object with segments fetched one after another, and with the GETs of the
+following segments read ahead.  Results are per MiB.
+"""
+
+import json
+import sys
+from hashlib import md5
+
+import eventlet
+
+from swift.common import swob
+from swift.common.middleware import slo
+from test.benchmark import timeit, report
+
+
+MiB = 1024 * 1024
+CHUNK_SIZE = 65536
+
+
+class SegmentApp(object):
+    """
+    Serves a manifest of ``count`` segments of ``size`` bytes each.
+    """
+
+    def __init__(self, count, size, latency, chunk_delay):
+        self.size = size
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.body = b'x' * size
+        etag = md5(self.body).hexdigest()
+        self.manifest = json.dumps([
+            {'name': '/c/seg%d' % i, 'hash': etag, 'bytes': size,
+             'content_type': 'application/octet-stream'}
+            for i in range(count)])
+
+    def _body_iter(self):
+        for offset in range(0, self.size, CHUNK_SIZE):
+            eventlet.sleep(self.chunk_delay)
+            yield self.body[offset:offset + CHUNK_SIZE]
+
+    def __call__(self, env, start_response):
+        if env['PATH_INFO'] == '/v1/a/c/manifest':
+            return swob.Response(
+                body=self.manifest,
+                headers={'X-Static-Large-Object': 'true',
+                         'Content-Type': 'application/json'})(
+                env, start_response)
+        eventlet.sleep(self.latency)
+        return swob.Response(
+            app_iter=self._body_iter(), content_length=self.size,
+            etag=md5(self.body).hexdigest(),
+            content_type='application/octet-stream')(env, start_response)
+
+
+def bench_get(name, app, conf, total, iterations):
+    conf = dict(conf, rate_limit_after_segment='1000000')
+    slo_app = slo.filter_factory(conf)(app)
+
+    def get():
+        req = swob.Request.blank('/v1/a/c/manifest')
+        resp = req.get_response(slo_app)
+        got = sum(len(chunk) for chunk in resp.app_iter)
+        assert got == total, (got, total)
+
+    report(name, timeit(get, iterations) / (total // MiB), 'MiB')
+
+
+def main(iterations=3, count=32, size_mib=2, latency_ms=20):
+    size = size_mib * MiB
+    app = SegmentApp(count, size, latency_ms / 1000.0, 0.0005)
+    for name, conf in (
+            ('sequential', {}),
+            ('read ahead 2', {'read_ahead_segments': '2'}),
+            ('read ahead 4', {'read_ahead_segments': '4'}),
+            ('read ahead 4, 4 MiB buffer', {
+                'read_ahead_segments': '4',
+                'read_ahead_bytes': str(4 * MiB)})):
+        bench_get('%d x %d MiB, %d ms: %s' % (
+            count, size_mib, latency_ms, name),
+            app, conf, count * size, iterations)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,124 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+ssync of a partition of small objects between two local object servers.
+
+The sending side is an object replicator over one set of devices, the
+receiving side an object server on another, served by eventlet.wsgi on
+localhost.  Each run syncs the whole partition to an empty receiver, with
+the legacy protocol, pipelined, and pipelined over several streams.
+Results are per object.  On localhost there is no round trip to hide, so
+most of any gain comes from the receiver running subrequests concurrently.
+"""
+
+from hashlib import md5
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import eventlet
+import eventlet.wsgi
+
+from swift.common.storage_policy import POLICIES
+from swift.common.utils import Timestamp, mkdirs
+from swift.obj import server
+from swift.obj.diskfile import get_data_dir
+from swift.obj.replicator import ObjectReplicator
+from swift.obj.ssync_sender import Sender
+from test.benchmark import report
+from test.unit import debug_logger
+
+
+DEVICE = 'sda1'
+PARTITION = '0'
+
+
+def make_objects(df_mgr, count, size):
+    body = b'x' * size
+    etag = md5(body).hexdigest()
+    suffixes = set()
+    for i in range(count):
+        df = df_mgr.get_diskfile(DEVICE, PARTITION, 'a', 'c', 'o%d' % i,
+                                 POLICIES.default)
+        with df.create() as writer:
+            writer.write(body)
+            writer.put({'X-Timestamp': Timestamp(time.time()).internal,
+                        'Content-Length': str(size),
+                        'Content-Type': 'application/octet-stream',
+                        'ETag': etag})
+            writer.commit(None)
+        suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+    return sorted(suffixes)
+
+
+def bench_sync(name, tx_conf, rx_node, rx_partdir, suffixes, count,
+               iterations):
+    replicator = ObjectReplicator(tx_conf, logger=debug_logger())
+    job = {'device': DEVICE, 'partition': PARTITION,
+           'policy': POLICIES.default}
+    elapsed = 0
+    for _ in range(iterations):
+        shutil.rmtree(rx_partdir, ignore_errors=True)
+        start = time.time()
+        success, in_sync = Sender(replicator, rx_node, job, suffixes)()
+        elapsed += time.time() - start
+        assert success and len(in_sync) == count, (success, len(in_sync))
+    report(name, elapsed / iterations / count, 'object')
+
+
+def main(iterations=5, count=500, size=1024):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tx_devices = os.path.join(tmpdir, 'tx')
+        rx_devices = os.path.join(tmpdir, 'rx')
+        mkdirs(os.path.join(tx_devices, DEVICE))
+        mkdirs(os.path.join(rx_devices, DEVICE))
+        rx_app = server.ObjectController({
+            'devices': rx_devices, 'mount_check': 'false',
+            'replication_one_per_device': 'false',
+            'log_requests': 'false'}, logger=debug_logger())
+        sock = eventlet.listen(('127.0.0.1', 0))
+        rx_server = eventlet.spawn(
+            eventlet.wsgi.server, sock, rx_app, log_output=False)
+        rx_node = {'replication_ip': '127.0.0.1',
+                   'replication_port': sock.getsockname()[1],
+                   'device': DEVICE}
+        rx_partdir = os.path.join(rx_devices, DEVICE,
+                                  get_data_dir(POLICIES.default), PARTITION)
+        tx_conf = {'devices': tx_devices, 'mount_check': 'false'}
+        tx_df_mgr = ObjectReplicator(
+            tx_conf, logger=debug_logger())._diskfile_mgr
+        suffixes = make_objects(tx_df_mgr, count, size)
+        try:
+            for name, conf in (
+                    ('legacy', {}),
+                    ('pipelined', {'ssync_pipeline': 'yes'}),
+                    ('pipelined, 4 streams', {'ssync_pipeline': 'yes',
+                                              'ssync_streams': '4'})):
+                conf.update(tx_conf)
+                bench_sync('%d x %d B objects: %s' % (count, size, name),
+                           conf, rx_node, rx_partdir, suffixes, count,
+                           iterations)
+        finally:
+            rx_server.kill()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
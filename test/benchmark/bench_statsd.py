@@ -0,0 +1,69 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-request StatsD overhead of StatsdClient vs AggregatingStatsdClient.
+
+Each simulated proxy request emits the metrics a typical object GET does:
+proxy_logging timing/first-byte/xfer for the request and its policy, plus a
+controller timing and a few error-limiting style counters.  Packets are sent
+to a local UDP port nobody listens on.
+"""
+
+import sys
+
+from swift.common.utils import StatsdClient, AggregatingStatsdClient
+from test.benchmark import timeit, report
+
+
+def simulated_request(client):
+    client.timing('object.GET.200.first-byte.timing', 1.5)
+    client.timing('object.policy.0.GET.200.first-byte.timing', 1.5)
+    client.timing('object.GET.200.timing', 12.25)
+    client.update_stats('object.GET.200.xfer', 65536)
+    client.timing('object.policy.0.GET.200.timing', 12.25)
+    client.update_stats('object.policy.0.GET.200.xfer', 65536)
+    client.timing('GET.timing', 11.5)
+    client.increment('object.client_timeouts')
+    client.increment('error_limiter.checks')
+    client.increment('memcache.hits')
+
+
+def main(iterations=20000):
+    plain = StatsdClient('127.0.0.1', 9, tail_prefix='proxy-server')
+    aggregating = AggregatingStatsdClient(
+        '127.0.0.1', 9, tail_prefix='proxy-server', flush_interval=3600)
+
+    report('StatsdClient', timeit(lambda: simulated_request(plain),
+                                  iterations), 'request')
+
+    def aggregated_request():
+        simulated_request(aggregating)
+    per_request = timeit(aggregated_request, iterations)
+    report('AggregatingStatsdClient (record only)', per_request, 'request')
+
+    # amortise one flush over a flush interval's worth of requests
+    for batch in (100, 1000):
+        def batch_and_flush():
+            for _ in range(batch):
+                simulated_request(aggregating)
+            aggregating.flush()
+        report('AggregatingStatsdClient (flush every %d)' % batch,
+               timeit(batch_and_flush, max(1, iterations // batch)) / batch,
+               'request')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,85 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Timestamp construction, formatting, comparison and decoding.
+
+Covers the paths that build Timestamps from strings (X-Timestamp headers,
+object file names, container listing rows) and format or compare them
+afterwards.
+"""
+
+import random
+import sys
+import time
+
+from swift.common.utils import Timestamp, encode_timestamps, \
+    decode_timestamps, bulk_decode_timestamps
+from test.benchmark import timeit, report
+
+
+def main(iterations=100000, rows=10000):
+    now = time.time()
+    internal = Timestamp(now, offset=3).internal
+    normal = Timestamp(now).normal
+
+    report('Timestamp(normal)', timeit(lambda: Timestamp(normal), iterations))
+    report('Timestamp.from_internal(normal)',
+           timeit(lambda: Timestamp.from_internal(normal), iterations))
+    report('Timestamp.from_internal(internal)',
+           timeit(lambda: Timestamp.from_internal(internal), iterations))
+    report('Timestamp(float)', timeit(lambda: Timestamp(now), iterations))
+
+    ts = Timestamp(now, offset=3)
+    for attr in ('normal', 'internal', 'isoformat'):
+        report('Timestamp.%s, repeated' % attr,
+               timeit(lambda: getattr(ts, attr), iterations))
+        report('Timestamp.%s, new Timestamp' % attr, timeit(
+            lambda: getattr(Timestamp.from_internal(internal), attr),
+            iterations))
+
+    other = Timestamp(now + 1)
+    report('Timestamp < Timestamp', timeit(lambda: ts < other, iterations))
+    report('Timestamp == Timestamp', timeit(lambda: ts == other, iterations))
+
+    encoded_plain = normal
+    encoded_meta = encode_timestamps(Timestamp(now), Timestamp(now + 1),
+                                     Timestamp(now + 2))
+    report('decode_timestamps(plain)',
+           timeit(lambda: decode_timestamps(encoded_plain), iterations))
+    report('decode_timestamps(with deltas)',
+           timeit(lambda: decode_timestamps(encoded_meta), iterations))
+
+    # a container listing: mostly plain created_at values, some POSTed
+    listing = [Timestamp(now - random.randint(0, 86400 * 30)).internal
+               for _ in range(rows)]
+    for i in range(0, rows, 10):
+        listing[i] = encode_timestamps(Timestamp(listing[i]),
+                                       Timestamp(now), Timestamp(now))
+    listing_iterations = max(1, iterations // rows)
+    report('decode_timestamps per row, %d rows' % rows, timeit(
+        lambda: [decode_timestamps(row)[2].internal for row in listing],
+        listing_iterations), 'listing')
+    report('bulk_decode_timestamps, %d rows' % rows, timeit(
+        lambda: [t[2].internal for t in bulk_decode_timestamps(listing)],
+        listing_iterations), 'listing')
+
+    timestamps = [Timestamp.from_internal(row) for row in listing[1::10]]
+    report('sorted(%d Timestamps)' % len(timestamps), timeit(
+        lambda: sorted(timestamps), listing_iterations), 'sort')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
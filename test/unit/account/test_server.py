@@ -19,10 +19,12 @@ import mock
 import unittest
 from tempfile import mkdtemp
 from shutil import rmtree
+import time
 from time import gmtime
 from test.unit import FakeLogger
 import itertools
 import random
+import zlib
 
 import json
 from six import BytesIO
@@ -33,6 +35,7 @@ from swift import __version__ as swift_version
 from swift.common.swob import (Request, WsgiBytesIO, HTTPNoContent)
 from swift.common import constraints
 from swift.account.server import AccountController
+from swift.common import db_replicator
 from swift.common.utils import (normalize_timestamp, replication, public,
                                 mkdirs, storage_directory)
 from swift.common.request_helpers import get_sys_meta_prefix
@@ -201,6 +204,66 @@ class TestAccountController(unittest.TestCase):
             resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 204)
 
+    def test_REPLICATE_deflated_body(self):
+        def fake_complete_rsync(self, drive, db_file, args):
+            return HTTPNoContent(body=args[0])
+        with mock.patch("swift.common.db_replicator.ReplicatorRpc."
+                        "complete_rsync", fake_complete_rsync):
+            req = Request.blank('/sda1/p/a/',
+                                environ={'REQUEST_METHOD': 'REPLICATE'},
+                                headers={'Content-Encoding': 'deflate'})
+            json_string = '["complete_rsync", "a.db"]'
+            inbuf = WsgiBytesIO(zlib.compress(json_string))
+            req.environ['wsgi.input'] = inbuf
+            resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 204)
+        self.assertEqual(resp.body, 'a.db')
+        # not actually deflated
+        req = Request.blank('/sda1/p/a/',
+                            environ={'REQUEST_METHOD': 'REPLICATE'},
+                            headers={'Content-Encoding': 'deflate'})
+        req.environ['wsgi.input'] = WsgiBytesIO(json_string)
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 400)
+
+    def test_change_journal(self):
+        self.controller = AccountController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'change_journal': 'yes'})
+        datadir = os.path.join(self.testdir, 'sda1', 'accounts')
+        db_file = self.controller._get_account_broker(
+            'sda1', 'p', 'a').db_file
+        ts = (normalize_timestamp(t) for t in itertools.count(time.time()))
+
+        def do_request(path, method, **headers):
+            headers['X-Timestamp'] = next(ts)
+            req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                                headers=headers)
+            return req.get_response(self.controller).status_int
+
+        self.assertEqual(do_request('/sda1/p/a', 'PUT'), 201)
+        self.assertEqual(db_replicator.read_change_journal(datadir),
+                         set([db_file]))
+        self.assertEqual(do_request('/sda1/p/a', 'GET'), 204)
+        self.assertEqual(do_request('/sda1/p/a2/c', 'PUT', **{
+            'X-Put-Timestamp': next(ts), 'X-Delete-Timestamp': '0',
+            'X-Object-Count': '0', 'X-Bytes-Used': '0'}), 404)
+        self.assertEqual(db_replicator.read_change_journal(datadir), set())
+        self.assertEqual(do_request('/sda1/p/a/c', 'PUT', **{
+            'X-Put-Timestamp': next(ts), 'X-Delete-Timestamp': '0',
+            'X-Object-Count': '0', 'X-Bytes-Used': '0'}), 201)
+        self.assertEqual(do_request('/sda1/p/a', 'POST'), 204)
+        with open(db_replicator.get_change_journal(datadir)) as fp:
+            self.assertEqual(len(fp.read().splitlines()), 2)
+        self.assertEqual(db_replicator.read_change_journal(datadir),
+                         set([db_file]))
+
+        # journaling is off by default
+        self.controller = AccountController(
+            {'devices': self.testdir, 'mount_check': 'false'})
+        self.assertEqual(do_request('/sda1/p/a', 'POST'), 204)
+        self.assertEqual(db_replicator.read_change_journal(datadir), set())
+
     def test_REPLICATE_value_error_works(self):
         req = Request.blank('/sda1/p/a/',
                             environ={'REQUEST_METHOD': 'REPLICATE'},
@@ -0,0 +1,150 @@
+# Copyright (c) 2010-2017 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+import mock
+from six import StringIO
+
+from swift.cli import bench_local
+from swift.common import storage_policy
+from swift.obj import server as object_server
+from swift.proxy.controllers import base
+
+
+class TestInMemoryCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = bench_local.InMemoryCache()
+        self.assertIsNone(cache.get('k'))
+        value = {'a': [1, 2]}
+        cache.set('k', value)
+        self.assertEqual(cache.get('k'), value)
+        # values are serialized, callers never share them
+        cache.get('k')['a'].append(3)
+        self.assertEqual(cache.get('k'), value)
+        cache.set('raw', 'abc', serialize=False)
+        self.assertEqual(cache.get('raw'), 'abc')
+        cache.delete('k')
+        self.assertIsNone(cache.get('k'))
+        cache.delete('k')
+
+    def test_multi(self):
+        cache = bench_local.InMemoryCache()
+        cache.set_multi({'a': 1, 'b': 2}, 'server')
+        self.assertEqual(cache.get_multi(['a', 'b', 'c'], 'server'),
+                         [1, 2, None])
+
+    def test_incr_decr(self):
+        cache = bench_local.InMemoryCache()
+        self.assertEqual(cache.incr('n'), 1)
+        self.assertEqual(cache.incr('n', delta=5), 6)
+        self.assertEqual(cache.decr('n', delta=2), 4)
+        self.assertEqual(cache.decr('n', delta=10), 0)
+
+    def test_expiry(self):
+        cache = bench_local.InMemoryCache()
+        with mock.patch('swift.cli.bench_local.time.time', return_value=100):
+            cache.set('k', 'v', time=10)
+            cache.set('forever', 'v')
+            cache.set('absolute', 'v', time=10 ** 9)
+        with mock.patch('swift.cli.bench_local.time.time', return_value=109):
+            self.assertEqual(cache.get('k'), 'v')
+        with mock.patch('swift.cli.bench_local.time.time', return_value=110):
+            self.assertIsNone(cache.get('k'))
+            self.assertEqual(cache.get('forever'), 'v')
+            self.assertEqual(cache.get('absolute'), 'v')
+
+
+class TestDechunk(unittest.TestCase):
+
+    def test_dechunk(self):
+        self.assertEqual(bench_local.dechunk(''), '')
+        self.assertEqual(bench_local.dechunk('3\r\nabc\r\n0\r\n\r\n'), 'abc')
+        # chunks after a zero-size chunk, as in multiphase PUTs
+        self.assertEqual(bench_local.dechunk(
+            '2\r\nab\r\n0\r\n\r\na;ext=1\r\n0123456789\r\n0\r\n\r\n'),
+            'ab0123456789')
+
+
+class TestInMemoryCluster(unittest.TestCase):
+
+    def test_not_enough_devices(self):
+        self.assertRaises(ValueError, bench_local.InMemoryCluster,
+                          devices=2, replicas=3)
+        self.assertRaises(ValueError, bench_local.InMemoryCluster,
+                          devices=5, ec_ndata=4, ec_nparity=2)
+
+    def test_patches_are_undone(self):
+        policies = storage_policy._POLICIES
+        http_connect = base.http_connect
+        cluster = bench_local.InMemoryCluster()
+        try:
+            with cluster:
+                self.assertEqual(base.http_connect, cluster.http_connect)
+                self.assertEqual(object_server.http_connect,
+                                 cluster.http_connect)
+                self.assertEqual(
+                    [p.name for p in storage_policy.POLICIES],
+                    ['replicated', 'ec'])
+        finally:
+            cluster.close()
+        self.assertIs(storage_policy._POLICIES, policies)
+        self.assertIs(base.http_connect, http_connect)
+        self.assertFalse(os.path.exists(cluster.swift_dir))
+
+
+class TestMain(unittest.TestCase):
+
+    def _run(self, *args):
+        with mock.patch('sys.stdout', StringIO()) as stdout, \
+                mock.patch('sys.stderr', StringIO()) as stderr:
+            ret = bench_local.main(list(args))
+        return ret, stdout.getvalue(), stderr.getvalue()
+
+    def test_workloads(self):
+        ret, out, err = self._run('-n', '3', '--objects', '2', '-s', '100',
+                                  '-c', '2', *bench_local.WORKLOADS)
+        self.assertEqual(ret, 0, err)
+        lines = out.splitlines()
+        self.assertEqual(lines[0].split()[:4],
+                         ['workload', 'requests', 'failures', 'req/s'])
+        self.assertEqual([line.split()[:3] for line in lines[1:]],
+                         [[name, '3', '0'] for name in bench_local.WORKLOADS])
+
+    def test_proxy_config(self):
+        conf = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                            os.pardir, 'etc', 'proxy-server.conf-sample')
+        ret, out, err = self._run('-n', '1', '--objects', '1',
+                                  '--proxy-config', conf, 'head')
+        self.assertEqual(ret, 0, err)
+        self.assertEqual(out.splitlines()[1].split()[:3], ['head', '1', '0'])
+
+    def test_bad_args(self):
+        ret, out, err = self._run('bogus')
+        self.assertEqual(ret, 1)
+        self.assertIn('Unknown workloads: bogus', err)
+        ret, out, err = self._run('-n', '0')
+        self.assertEqual(ret, 1)
+        ret, out, err = self._run('--devices', '2')
+        self.assertEqual(ret, 1)
+        self.assertIn('Not enough devices', err)
+        ret, out, err = self._run('--proxy-config', '/does/not/exist')
+        self.assertEqual(ret, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
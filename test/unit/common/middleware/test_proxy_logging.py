@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import unittest
 from logging.handlers import SysLogHandler
 
@@ -20,7 +21,7 @@ import mock
 from six import BytesIO
 from six.moves.urllib.parse import unquote
 
-from test.unit import FakeLogger
+from test.unit import FakeLogger, temptree
 from swift.common.utils import get_logger, split_path
 from swift.common.middleware import proxy_logging
 from swift.common.swob import Request, Response
@@ -1036,6 +1037,98 @@ class TestProxyLogging(unittest.TestCase):
         log_parts = self._log_parts(app)
         self.assertEqual(log_parts[20], '1')
 
+    def _buffered_app(self, **conf):
+        conf.setdefault('access_log_buffer_size', '2')
+        logger = FakeLogger()
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), conf,
+                                                   logger=logger)
+        return app, logger
+
+    def _do_gets(self, app, count):
+        for i in range(count):
+            req = Request.blank('/v1/a/c/o%d' % i,
+                                environ={'REQUEST_METHOD': 'GET'})
+            ''.join(app(req.environ, start_response))
+
+    def test_log_buffer_disabled_by_default(self):
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), {})
+        self.assertIsNone(app.log_buffer)
+
+    def test_log_buffer_bad_config(self):
+        with self.assertRaises(ValueError):
+            self._buffered_app(access_log_buffer_overflow='block')
+
+    def test_log_buffer_defers_formatting(self):
+        app, logger = self._buffered_app()
+        with mock.patch('swift.common.middleware.proxy_logging.spawn') as \
+                mock_spawn:
+            self._do_gets(app, 2)
+        self.assertEqual([mock.call(app.log_buffer._run)],
+                         mock_spawn.mock_calls)
+        # statsd timings are still emitted inline, the lines are not
+        self.assertTiming('object.GET.200.timing', app)
+        self.assertEqual([], logger.log_dict['info'])
+        self.assertEqual(2, len(app.log_buffer))
+
+        app.log_buffer.flush()
+        info_calls = logger.log_dict['info']
+        self.assertEqual(2, len(info_calls))
+        self.assertEqual(
+            ['/v1/a/c/o0', '/v1/a/c/o1'],
+            [call[0][0].split(' ')[4] for call in info_calls])
+        self.assertEqual(21, len(info_calls[0][0][0].split(' ')))
+        self.assertIn((('access_log.buffered', 2), {}),
+                      logger.log_dict['update_stats'])
+        self.assertEqual(0, len(app.log_buffer))
+
+    def test_log_buffer_drop_newest(self):
+        app, logger = self._buffered_app()
+        with mock.patch('swift.common.middleware.proxy_logging.spawn'):
+            self._do_gets(app, 3)
+        app.log_buffer.flush()
+        self.assertEqual(
+            ['/v1/a/c/o0', '/v1/a/c/o1'],
+            [call[0][0].split(' ')[4] for call in logger.log_dict['info']])
+        self.assertIn((('access_log.dropped', 1), {}),
+                      logger.log_dict['update_stats'])
+
+    def test_log_buffer_drop_oldest(self):
+        app, logger = self._buffered_app(
+            access_log_buffer_overflow='drop_oldest')
+        with mock.patch('swift.common.middleware.proxy_logging.spawn'):
+            self._do_gets(app, 3)
+        app.log_buffer.flush()
+        self.assertEqual(
+            ['/v1/a/c/o1', '/v1/a/c/o2'],
+            [call[0][0].split(' ')[4] for call in logger.log_dict['info']])
+        self.assertIn((('access_log.dropped', 1), {}),
+                      logger.log_dict['update_stats'])
+
+    def test_log_buffer_flush_on_overflow(self):
+        app, logger = self._buffered_app(access_log_buffer_overflow='flush')
+        with mock.patch('swift.common.middleware.proxy_logging.spawn'):
+            self._do_gets(app, 3)
+        # the first two lines were flushed to make room for the third
+        self.assertEqual(
+            ['/v1/a/c/o0', '/v1/a/c/o1'],
+            [call[0][0].split(' ')[4] for call in logger.log_dict['info']])
+        self.assertEqual(1, len(app.log_buffer))
+        self.assertNotIn('access_log.dropped',
+                         [call[0][0] for call in
+                          logger.log_dict['update_stats']])
+
+    def test_log_buffer_file(self):
+        with temptree([]) as tempdir:
+            log_file = os.path.join(tempdir, 'access.log')
+            app, logger = self._buffered_app(access_log_buffer_file=log_file)
+            with mock.patch('swift.common.middleware.proxy_logging.spawn'):
+                self._do_gets(app, 2)
+            app.log_buffer.flush()
+            with open(log_file) as fp:
+                lines = fp.read().splitlines()
+        self.assertEqual([], logger.log_dict['info'])
+        self.assertEqual(['/v1/a/c/o0', '/v1/a/c/o1'],
+                         [line.split(' ')[4] for line in lines])
 
 if __name__ == '__main__':
     unittest.main()
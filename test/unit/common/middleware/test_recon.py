@@ -758,7 +758,9 @@ class TestReconSuccess(TestCase):
         self.assertEqual(self.fakecache.fakeout_calls,
                          [((['replication_time', 'replication_stats',
                              'replication_last', 'object_replication_time',
-                             'object_replication_last'],
+                             'object_replication_last',
+                             'object_replication_queue',
+                             'object_reconstruction_plan'],
                              '/var/cache/swift/object.recon'), {})])
         self.assertEqual(rv, {
             "replication_time": 0.2615511417388916,
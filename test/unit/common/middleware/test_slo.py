@@ -2777,6 +2777,35 @@ class TestSloGetManifest(SloTestCase):
             'ERROR: An error occurred while retrieving segments'))
 
 
+class TestSloGetManifestReadAhead(TestSloGetManifest):
+    def setUp(self):
+        super(TestSloGetManifestReadAhead, self).setUp()
+        slo_conf = {'rate_limit_under_size': '0',
+                    'read_ahead_segments': '2', 'read_ahead_bytes': '8'}
+        self.slo = slo.filter_factory(slo_conf)(self.app)
+        self.slo.logger = self.app.logger
+
+    def test_following_segments_read_ahead(self):
+        req = Request.blank(
+            '/v1/AUTH_test/gettest/manifest-abcd',
+            environ={'REQUEST_METHOD': 'GET'})
+        app_resp = self.slo(req.environ, lambda *args: None)
+        body_iter = iter(app_resp)
+        self.assertEqual('aaaaa', next(body_iter))
+        # the two segments after the first were fetched along with it
+        self.assertEqual(self.app.calls, [
+            ('GET', '/v1/AUTH_test/gettest/manifest-abcd'),
+            ('GET', '/v1/AUTH_test/gettest/manifest-bc'),
+            ('GET', '/v1/AUTH_test/gettest/a_5?multipart-manifest=get'),
+            ('GET', '/v1/AUTH_test/gettest/b_10?multipart-manifest=get'),
+            ('GET', '/v1/AUTH_test/gettest/c_15?multipart-manifest=get')])
+        self.assertEqual('b' * 10 + 'c' * 15 + 'd' * 20, ''.join(body_iter))
+        app_resp.close()
+        self.assertEqual(self.app.calls[-1],
+                         ('GET', '/v1/AUTH_test/gettest/d_20'
+                          '?multipart-manifest=get'))
+
+
 class TestSloConditionalGetOldManifest(SloTestCase):
     slo_data = [
         {'name': '/gettest/a_5', 'hash': md5hex("a" * 5),
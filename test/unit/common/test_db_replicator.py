@@ -24,6 +24,7 @@ import time
 from shutil import rmtree, copy
 from tempfile import mkdtemp, NamedTemporaryFile
 import json
+import zlib
 
 import mock
 from mock import patch, call
@@ -34,7 +35,7 @@ from swift.common import db_replicator
 from swift.common.utils import (normalize_timestamp, hash_path,
                                 storage_directory)
 from swift.common.exceptions import DriveNotMounted
-from swift.common.swob import HTTPException
+from swift.common.swob import HTTPException, Request
 
 from test import unit
 from test.unit.common.test_db import ExampleBroker
@@ -159,6 +160,7 @@ class ReplHttp(object):
     def __init__(self, response=None, set_status=200):
         self.response = response
         self.set_status = set_status
+        self.sent = []
     replicated = False
     host = 'localhost'
 
@@ -173,6 +175,13 @@ class ReplHttp(object):
                 return self.response
         return Response()
 
+    def send_replicate(self, args, compress=False):
+        self.sent.append((args, compress))
+        return True
+
+    def get_replicate_response(self):
+        return self.replicate(*self.sent[-1][0])
+
 
 class ChangingMtimesOs(object):
     def __init__(self):
@@ -316,6 +325,57 @@ class TestDBReplicator(unittest.TestCase):
         conn.request = other_req
         self.assertEqual(conn.replicate(1, 2, 3), None)
 
+    def test_repl_connection_send_replicate(self):
+        node = {'replication_ip': '127.0.0.1', 'replication_port': 80,
+                'device': 'sdb1'}
+        conn = db_replicator.ReplConnection(node, '1234567890', 'abcdefg',
+                                            logging.getLogger())
+        requests = []
+
+        def req(method, path, body, headers):
+            requests.append((method, path, body, headers))
+
+        class Resp(object):
+            def read(self):
+                return 'data'
+        resp = Resp()
+        conn.request = req
+        conn.getresponse = lambda *args: resp
+        self.assertTrue(conn.send_replicate(['merge_items', [{'a': 1}], 'id'],
+                                            compress=True))
+        self.assertEqual(1, len(requests))
+        method, path, body, headers = requests[0]
+        self.assertEqual(('REPLICATE', '/sdb1/1234567890/abcdefg'),
+                         (method, path))
+        self.assertEqual({'Content-Type': 'application/json',
+                          'Content-Encoding': 'deflate'}, headers)
+        self.assertEqual(['merge_items', [{'a': 1}], 'id'],
+                         json.loads(zlib.decompress(body)))
+        self.assertEqual(resp, conn.get_replicate_response())
+        self.assertEqual('data', resp.data)
+
+        self.assertTrue(conn.send_replicate(['sync']))
+        self.assertEqual({'Content-Type': 'application/json'},
+                         requests[1][3])
+        self.assertEqual('["sync"]', requests[1][2])
+
+        def bad_getresponse(*args):
+            raise Exception('blah')
+        conn.getresponse = bad_getresponse
+        self.assertIsNone(conn.get_replicate_response())
+
+    def test_load_replicate_args(self):
+        req = Request.blank('/sda/0/abc', body='["sync", 1]')
+        self.assertEqual(['sync', 1], db_replicator.load_replicate_args(req))
+        req = Request.blank('/sda/0/abc', body=zlib.compress('["sync", 1]'),
+                            headers={'Content-Encoding': 'deflate'})
+        self.assertEqual(['sync', 1], db_replicator.load_replicate_args(req))
+        req = Request.blank('/sda/0/abc', body='["sync", 1]',
+                            headers={'Content-Encoding': 'deflate'})
+        self.assertRaises(ValueError, db_replicator.load_replicate_args, req)
+        req = Request.blank('/sda/0/abc', body='not json')
+        self.assertRaises(ValueError, db_replicator.load_replicate_args, req)
+
     def test_rsync_file(self):
         replicator = TestReplicator({})
         with _mock_process(-1):
@@ -584,6 +644,46 @@ class TestDBReplicator(unittest.TestCase):
         self.assertFalse(
             replicator._usync_db(0, FakeBroker(), fake_http, '12345', '67890'))
 
+    def test_usync_stream(self):
+        fake_http = ReplHttp()
+        replicator = TestReplicator({'usync_stream': 'yes',
+                                     'usync_batches': '4',
+                                     'per_diff': '5'})
+        self.assertEqual(4, replicator.usync_batches)
+        broker = FakeBroker()
+        with mock.patch.object(broker, 'get_items_since',
+                               wraps=broker.get_items_since) as mock_items:
+            self.assertTrue(replicator._usync_db(
+                -1, broker, fake_http, '12345', '67890'))
+        self.assertEqual([mock.call(-1, 20), mock.call(2, 20)],
+                         mock_items.call_args_list)
+        self.assertEqual(
+            [(['merge_items', [{'ROWID': 1}, {'ROWID': 2}], '67890'], True)],
+            fake_http.sent)
+        self.assertEqual(([{'remote_id': '12345', 'sync_point': 2}],),
+                         broker.args)
+
+    def test_usync_stream_http_error(self):
+        replicator = TestReplicator({'usync_stream': 'yes'})
+        for status in (301, 101, 500):
+            fake_http = ReplHttp(set_status=status)
+            self.assertFalse(replicator._usync_db(
+                0, FakeBroker(), fake_http, '12345', '67890'))
+            self.assertEqual(1, len(fake_http.sent))
+
+    def test_usync_stream_not_supported(self):
+        fake_http = ReplHttp(set_status=400)
+        replicator = TestReplicator({'usync_stream': 'yes'})
+        with mock.patch.object(fake_http, 'replicate',
+                               wraps=fake_http.replicate) as mock_replicate:
+            self.assertFalse(replicator._usync_db(
+                0, FakeBroker(), fake_http, '12345', '67890'))
+        # the streamed request, then the same records the old way
+        self.assertEqual(1, len(fake_http.sent))
+        self.assertEqual(2, mock_replicate.call_count)
+        self.assertEqual(mock.call('merge_items', [{'ROWID': 1}], '67890'),
+                         mock_replicate.call_args)
+
     def test_stats(self):
         # I'm not sure how to test that this logs the right thing,
         # but we can at least make sure it gets covered.
@@ -1374,6 +1474,226 @@ class TestDBReplicator(unittest.TestCase):
             db_replicator.random.shuffle = orig_shuffle
             db_replicator.os.rmdir = orig_rmdir
 
+    def _make_datadirs(self, tempdir):
+        datadirs = []
+        db_files = {}
+        for node_id, dev in enumerate(('sda', 'sdb')):
+            datadir = os.path.join(tempdir, dev, DATADIR)
+            datadirs.append((datadir, node_id))
+            for part in ('1', '2', '3'):
+                for hsh in ('abc', 'def'):
+                    hash_dir = os.path.join(datadir, part, hsh, part + hsh)
+                    os.makedirs(hash_dir)
+                    db_files[hash_dir] = os.path.join(
+                        hash_dir, part + hsh + '.db')
+                    with open(db_files[hash_dir], 'w'):
+                        pass
+            # an empty partition, an empty suffix and a hash dir without a
+            # db, which the walk cleans up, and a stray file
+            os.makedirs(os.path.join(datadir, '4'))
+            os.makedirs(os.path.join(datadir, '3', 'fff'))
+            os.makedirs(os.path.join(datadir, '3', 'abc', 'nodb'))
+            with open(os.path.join(datadir, '5'), 'w'):
+                pass
+        return datadirs, sorted(db_files.values())
+
+    @with_tempdir
+    def test_threaded_roundrobin_datadirs(self, tempdir):
+        datadirs, db_files = self._make_datadirs(tempdir)
+        pools = {}
+        try:
+            walked = list(db_replicator.threaded_roundrobin_datadirs(
+                datadirs, pools))
+        finally:
+            for pool in pools.values():
+                pool.terminate()
+        self.assertEqual(sorted(pools), [d for d, _ in datadirs])
+        self.assertEqual(sorted(object_file for _, object_file, _ in walked),
+                         db_files)
+        # devices take turns, partitions are walked in order
+        self.assertEqual([(part, node_id) for part, _, node_id in walked],
+                         [('1', 0), ('1', 1)] * 2 + [('2', 0), ('2', 1)] * 2 +
+                         [('3', 0), ('3', 1)] * 2)
+        for part, object_file, node_id in walked:
+            self.assertTrue(object_file.startswith(
+                os.path.join(datadirs[node_id][0], part) + os.path.sep))
+        for datadir, _ in datadirs:
+            self.assertFalse(os.path.exists(os.path.join(datadir, '4')))
+            self.assertFalse(os.path.exists(
+                os.path.join(datadir, '3', 'fff')))
+            self.assertFalse(os.path.exists(
+                os.path.join(datadir, '3', 'abc', 'nodb')))
+            with open(db_replicator.get_walk_cursor(datadir)) as fp:
+                self.assertEqual(fp.read(), '5')
+
+    @with_tempdir
+    def test_threaded_roundrobin_datadirs_resumes(self, tempdir):
+        datadirs, db_files = self._make_datadirs(tempdir)
+        datadirs = datadirs[:1]
+        pools = {}
+        try:
+            walk = db_replicator.threaded_roundrobin_datadirs(
+                datadirs, pools)
+            # stop in the middle of partition 2
+            walked = [next(walk) for _ in range(3)]
+            walk.close()
+            self.assertEqual([part for part, _, _ in walked], ['1', '1', '2'])
+            with open(db_replicator.get_walk_cursor(datadirs[0][0])) as fp:
+                self.assertEqual(fp.read(), '1')
+            # the next walk starts again from partition 2, and wraps around
+            walked = list(db_replicator.threaded_roundrobin_datadirs(
+                datadirs, pools))
+            self.assertEqual([part for part, _, _ in walked],
+                             ['2', '2', '3', '3', '1', '1'])
+            with open(db_replicator.get_walk_cursor(datadirs[0][0])) as fp:
+                self.assertEqual(fp.read(), '1')
+        finally:
+            for pool in pools.values():
+                pool.terminate()
+
+    @with_tempdir
+    def test_list_partition_without_scandir(self, tempdir):
+        datadirs, db_files = self._make_datadirs(tempdir)
+        datadir = datadirs[0][0]
+        with mock.patch.object(db_replicator, 'scandir', None):
+            self.assertEqual(
+                sorted(db_replicator._list_partition(
+                    os.path.join(datadir, '3'))),
+                [f for f in db_files
+                 if f.startswith(os.path.join(datadir, '3') + os.path.sep)])
+            self.assertEqual(db_replicator._list_partition(
+                os.path.join(datadir, '4')), [])
+            self.assertEqual(db_replicator._list_partition(
+                os.path.join(datadir, '5')), [])
+        self.assertEqual(sorted(os.listdir(os.path.join(datadir, '3'))),
+                         ['abc', 'def'])
+        self.assertEqual(sorted(os.listdir(datadir)),
+                         ['1', '2', '3', '5'])
+
+    def test_run_once_threaded_walk(self):
+        db_replicator.ring = FakeRingWithSingleNode()
+        for threaded_walk, walker in (('no', 'roundrobin_datadirs'),
+                                      ('yes', 'threaded_roundrobin_datadirs')):
+            replicator = TestReplicator({'mount_check': 'false',
+                                         'bind_port': 6200,
+                                         'threaded_walk': threaded_walk},
+                                        logger=unit.FakeLogger())
+            with mock.patch.object(db_replicator, 'whataremyips',
+                                   return_value=['1.1.1.1']), \
+                    mock.patch.object(db_replicator, 'unlink_older_than'), \
+                    mock.patch.object(db_replicator.os.path, 'isdir',
+                                      return_value=True), \
+                    mock.patch.object(db_replicator, walker,
+                                      return_value=[]) as mock_walker:
+                replicator.run_once()
+            self.assertEqual(len(mock_walker.call_args_list), 1)
+            if threaded_walk == 'yes':
+                self.assertIs(mock_walker.call_args[0][1],
+                              replicator._walk_pools)
+
+    @with_tempdir
+    def test_change_journal(self, tempdir):
+        datadirs = [os.path.join(tempdir, dev, DATADIR)
+                    for dev in ('sda', 'sdb')]
+        db_files = []
+        for datadir, hsh in zip(datadirs * 2, ('abc', 'def', 'ghi', 'jkl')):
+            hash_dir = os.path.join(datadir, '1', hsh[-3:], hsh)
+            os.makedirs(hash_dir)
+            db_files.append(os.path.join(hash_dir, hsh + '.db'))
+            with open(db_files[-1], 'w'):
+                pass
+        self.assertEqual(db_replicator.get_change_journal(datadirs[0] + '/'),
+                         os.path.join(tempdir, 'sda', DATADIR + '.journal'))
+        self.assertEqual(db_replicator.read_change_journal(datadirs[0]),
+                         set())
+        for db_file in db_files + db_files[:1]:
+            db_replicator.journal_db_change(db_file)
+        with open(db_replicator.get_change_journal(datadirs[0])) as fp:
+            self.assertEqual(fp.read().splitlines(),
+                             ['1/abc/abc/abc.db', '1/ghi/ghi/ghi.db',
+                              '1/abc/abc/abc.db'])
+        self.assertEqual(db_replicator.read_change_journal(datadirs[0]),
+                         set([db_files[0], db_files[2]]))
+        # reading empties the journal
+        self.assertEqual(db_replicator.read_change_journal(datadirs[0]),
+                         set())
+
+        for db_file in db_files:
+            db_replicator.journal_db_change(db_file)
+        os.unlink(db_files[3])
+        self.assertEqual(
+            sorted(db_replicator.roundrobin_journals(
+                [(datadirs[0], 0), (datadirs[1], 1)])),
+            [('1', db_files[0], 0), ('1', db_files[2], 0),
+             ('1', db_files[1], 1)])
+        self.assertEqual(
+            list(db_replicator.roundrobin_journals(
+                [(datadirs[0], 0), (datadirs[1], 1)])), [])
+
+        # the journal stops growing once full
+        with mock.patch('swift.common.db_replicator.MAX_CHANGE_JOURNAL_SIZE',
+                        20):
+            for db_file in db_files[:1] * 3:
+                db_replicator.journal_db_change(db_file)
+        with open(db_replicator.get_change_journal(datadirs[0])) as fp:
+            self.assertEqual(fp.read().splitlines(),
+                             ['1/abc/abc/abc.db', '1/abc/abc/abc.db'])
+
+    def test_run_once_change_journal(self):
+        db_replicator.ring = FakeRingWithSingleNode()
+        replicator = TestReplicator({'mount_check': 'false',
+                                     'bind_port': 6200,
+                                     'change_journal': 'yes',
+                                     'sweep_interval': '60'},
+                                    logger=unit.FakeLogger())
+        replicated = []
+
+        def mock_spawn_n(fn, part, object_file, node_id):
+            replicated.append(object_file)
+
+        self._patch(patch.object, db_replicator, 'whataremyips',
+                    lambda *a, **kw: ['1.1.1.1'])
+        self._patch(patch.object, db_replicator, 'unlink_older_than',
+                    lambda *a: None)
+        self._patch(patch.object, db_replicator.os.path, 'isdir',
+                    lambda *a: True)
+        self._patch(patch.object, db_replicator, 'roundrobin_journals',
+                    lambda *args: [('1', '/srv/node/sda/b.db', 1)])
+        self._patch(patch.object, db_replicator, 'roundrobin_datadirs',
+                    lambda *args: [('1', '/srv/node/sda/a.db', 1),
+                                   ('1', '/srv/node/sda/b.db', 1)])
+        self._patch(patch.object, replicator.cpool, 'spawn_n', mock_spawn_n)
+
+        # the first pass sweeps all the dbs, changed ones first
+        replicator.run_once()
+        self.assertEqual(replicated,
+                         ['/srv/node/sda/b.db', '/srv/node/sda/a.db'])
+        # then only changed ones until the sweep interval has passed
+        del replicated[:]
+        replicator.run_once()
+        self.assertEqual(replicated, ['/srv/node/sda/b.db'])
+        del replicated[:]
+        replicator._last_sweep -= 60
+        replicator.run_once()
+        self.assertEqual(replicated,
+                         ['/srv/node/sda/b.db', '/srv/node/sda/a.db'])
+
+    @with_tempdir
+    def test_replicate_object_failure_journaled(self, tempdir):
+        db_replicator.ring = FakeRingWithNodes()
+        db_file = os.path.join(tempdir, 'file.db')
+        with open(db_file, 'w'):
+            pass
+        for change_journal, success, expected in (
+                ('no', False, []), ('yes', True, []),
+                ('yes', False, [call(db_file)])):
+            replicator = TestReplicator({'change_journal': change_journal})
+            replicator._repl_to_node = mock.Mock(return_value=success)
+            with mock.patch('swift.common.db_replicator.journal_db_change') \
+                    as mock_journal:
+                replicator._replicate_object('0', db_file, 1)
+            self.assertEqual(mock_journal.call_args_list, expected)
+
     @mock.patch("swift.common.db_replicator.ReplConnection", mock.Mock())
     def test_http_connect(self):
         node = "node"
@@ -1516,6 +1836,19 @@ def attach_fake_replication_rpc(rpc, replicate_hook=None):
             self.path = '/%s/%s/%s' % (node['device'], partition, hash_)
             self.host = node['replication_ip']
 
+        def send_replicate(self, args, compress=False):
+            body = json.dumps(args)
+            headers = {}
+            if compress:
+                body = zlib.compress(body)
+                headers['Content-Encoding'] = 'deflate'
+            self._sent = db_replicator.load_replicate_args(
+                Request.blank(self.path, body=body, headers=headers))
+            return True
+
+        def get_replicate_response(self):
+            return self.replicate(*self._sent)
+
         def replicate(self, op, *sync_args):
             print('REPLICATE: %s, %s, %r' % (self.path, op, sync_args))
             replicate_args = self.path.lstrip('/').split('/')
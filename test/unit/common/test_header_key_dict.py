@@ -76,6 +76,21 @@ class TestHeaderKeyDict(unittest.TestCase):
         self.assertEqual('20', headers['Content-Length'])
         self.assertEqual('text/plain', headers['Content-Type'])
 
+    def test_copy(self):
+        headers = HeaderKeyDict({'Content-Length': 20})
+        copied = headers.copy()
+        self.assertIsInstance(copied, HeaderKeyDict)
+        self.assertEqual(headers, copied)
+        copied['content-type'] = 'text/plain'
+        self.assertEqual({'Content-Length': '20',
+                          'Content-Type': 'text/plain'}, copied)
+        self.assertEqual({'Content-Length': '20'}, headers)
+
+    def test_update_from_header_key_dict(self):
+        headers = HeaderKeyDict({'Content-Length': 20})
+        headers.update(HeaderKeyDict({'content-length': 10, 'x-foo': 'bar'}))
+        self.assertEqual({'Content-Length': '10', 'X-Foo': 'bar'}, headers)
+
     def test_set(self):
         # mappings = ((<tuple of input vals>, <expected output val>), ...)
         mappings = (((1.618, '1.618', b'1.618', u'1.618'), '1.618'),
@@ -16,13 +16,14 @@
 """Tests for swift.common.request_helpers"""
 
 import unittest
+from eventlet import sleep
 from swift.common.swob import Request, HTTPException, HeaderKeyDict
 from swift.common.storage_policy import POLICIES, EC_POLICY, REPL_POLICY
 from swift.common.request_helpers import is_sys_meta, is_user_meta, \
     is_sys_or_user_meta, strip_sys_meta_prefix, strip_user_meta_prefix, \
     remove_items, copy_header_subset, get_name_and_placement, \
     http_response_to_document_iters, is_object_transient_sysmeta, \
-    update_etag_is_at_header, resolve_etag_is_at_header
+    update_etag_is_at_header, resolve_etag_is_at_header, SegmentReadAhead
 
 from test.unit import patch_policies
 from test.unit.common.test_utils import FakeResponse
@@ -172,6 +173,44 @@ class TestRequestHelpers(unittest.TestCase):
         self.assertEqual(policy.policy_type, REPL_POLICY)
 
 
+class TestSegmentReadAhead(unittest.TestCase):
+    def _app(self, env, start_response):
+        if env['PATH_INFO'].endswith('/error'):
+            raise ValueError('kaboom')
+        start_response('200 OK', [('Content-Length', '12')])
+        return iter(['abcd', 'efgh', 'ijkl'])
+
+    def test_read_ahead_within_budget(self):
+        budget = {'bytes': 6}
+        read_ahead = SegmentReadAhead(
+            self._app, Request.blank('/v1/a/c/o'), budget)
+        sleep(0)
+        # reading stops once the budget is spent
+        self.assertEqual(['abcd', 'efgh'], list(read_ahead.chunks))
+        self.assertEqual(-2, budget['bytes'])
+        self.assertEqual(200, read_ahead.get_response().status_int)
+        # the buffered body comes first, and its space is given back
+        self.assertEqual('abcdefghijkl', ''.join(read_ahead))
+        self.assertEqual(6, budget['bytes'])
+        read_ahead.close()
+
+    def test_close_gives_back_budget(self):
+        budget = {'bytes': 100}
+        read_ahead = SegmentReadAhead(
+            self._app, Request.blank('/v1/a/c/o'), budget)
+        sleep(0)
+        self.assertEqual(88, budget['bytes'])
+        read_ahead.close()
+        self.assertEqual(100, budget['bytes'])
+
+    def test_get_response_error(self):
+        read_ahead = SegmentReadAhead(
+            self._app, Request.blank('/v1/a/c/error'), {'bytes': 100})
+        with self.assertRaises(ValueError):
+            read_ahead.get_response()
+        read_ahead.close()
+
+
 class TestHTTPResponseToDocumentIters(unittest.TestCase):
     def test_200(self):
         fr = FakeResponse(
@@ -18,6 +18,7 @@
 import datetime
 import unittest
 import re
+import mock
 import time
 
 from six import BytesIO
@@ -47,6 +48,34 @@ class TestHeaderEnvironProxy(unittest.TestCase):
         self.assertEqual(list(iter(proxy)), proxy.keys())
         self.assertEqual(3, len(proxy))
 
+    def test_key_caches_hold_only_well_known_headers(self):
+        environ_keys = dict(swift.common.swob._environ_keys)
+        header_names = dict(swift.common.swob._header_names)
+        environ = {}
+        proxy = swift.common.swob.HeaderEnvironProxy(environ)
+        for i in range(4):
+            proxy['x-header-%d' % i] = str(i)
+            proxy['content-type'] = 'text/plain'
+            proxy['X-Backend-Storage-Policy-Index'] = '1'
+        self.assertEqual(
+            {'HTTP_X_HEADER_0': '0', 'HTTP_X_HEADER_1': '1',
+             'HTTP_X_HEADER_2': '2', 'HTTP_X_HEADER_3': '3',
+             'HTTP_X_BACKEND_STORAGE_POLICY_INDEX': '1',
+             'CONTENT_TYPE': 'text/plain'}, environ)
+        self.assertEqual(
+            set(['X-Header-0', 'X-Header-1', 'X-Header-2', 'X-Header-3',
+                 'X-Backend-Storage-Policy-Index', 'Content-Type']),
+            set(proxy.keys()))
+        self.assertEqual('3', proxy['X-HEADER-3'])
+        self.assertEqual('CONTENT_TYPE',
+                         swift.common.swob._environ_keys['content-type'])
+        self.assertEqual('X-Backend-Storage-Policy-Index',
+                         swift.common.swob._header_names[
+                             'HTTP_X_BACKEND_STORAGE_POLICY_INDEX'])
+        # client supplied names do not grow the caches
+        self.assertEqual(environ_keys, swift.common.swob._environ_keys)
+        self.assertEqual(header_names, swift.common.swob._header_names)
+
     def test_ignored_keys(self):
         # Constructor doesn't normalize keys
         key = 'wsgi.input'
@@ -556,6 +585,81 @@ class TestRequest(unittest.TestCase):
         self.assertEqual(req.timestamp.normal, expected.normal)
         self.assertEqual(req.timestamp.internal, expected.internal)
 
+    def test_parsed_properties_shared_by_environ(self):
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o?a=b', headers={'X-Timestamp': '1402447134.13507'})
+        self.assertEqual(req.path, '/v1/a/c/o')
+        self.assertEqual(req.split_path(4), ['v1', 'a', 'c', 'o'])
+        self.assertEqual(req.params, {'a': 'b'})
+        self.assertEqual(req.timestamp, utils.Timestamp('1402447134.13507'))
+        self.assertIn('swob.parsed', req.environ)
+
+        # another Request on the same environ reuses what was parsed
+        other = swift.common.swob.Request(req.environ)
+        with mock.patch('swift.common.swob.split_path') as mock_split, \
+                mock.patch('swift.common.swob.urllib.parse') as mock_parse, \
+                mock.patch('swift.common.swob.Timestamp') as mock_ts:
+            self.assertEqual(other.path, '/v1/a/c/o')
+            self.assertEqual(other.split_path(4), ['v1', 'a', 'c', 'o'])
+            self.assertEqual(other.params, {'a': 'b'})
+            self.assertEqual(other.timestamp,
+                             utils.Timestamp('1402447134.13507'))
+        self.assertFalse(mock_split.called)
+        self.assertFalse(mock_parse.mock_calls)
+        self.assertFalse(mock_ts.mock_calls)
+
+        # callers can't modify the shared results
+        other.split_path(4).append('x')
+        other.params['c'] = 'd'
+        self.assertEqual(req.split_path(4), ['v1', 'a', 'c', 'o'])
+        self.assertEqual(req.params, {'a': 'b'})
+        self.assertEqual(
+            swift.common.swob.Request(req.environ).params, {'a': 'b'})
+        # but changes to a Request's own params are kept
+        self.assertEqual(other.params, {'a': 'b', 'c': 'd'})
+
+    def test_parsed_properties_follow_environ_changes(self):
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o?a=b', headers={'X-Timestamp': '1402447134.13507'})
+        self.assertEqual(req.path, '/v1/a/c/o')
+        self.assertEqual(req.split_path(3, 4), ['v1', 'a', 'c', 'o'])
+        self.assertEqual(req.params, {'a': 'b'})
+        self.assertEqual(req.timestamp, utils.Timestamp('1402447134.13507'))
+
+        req.environ['PATH_INFO'] = '/v1/a/c'
+        req.environ['QUERY_STRING'] = 'c=d'
+        req.headers['X-Timestamp'] = '1402447135.00000'
+        self.assertEqual(req.path, '/v1/a/c')
+        self.assertEqual(req.split_path(3, 4), ['v1', 'a', 'c', None])
+        self.assertEqual(req.params, {'c': 'd'})
+        self.assertEqual(req.timestamp, utils.Timestamp('1402447135.00000'))
+
+        req.path_info_pop()
+        self.assertEqual(req.path, '/v1/a/c')
+        self.assertEqual(req.split_path(3, 4), ['v1', 'a', 'c', None])
+
+        # errors are raised every time, not remembered as results
+        req.environ['PATH_INFO'] = '/v1/a'
+        req.environ['SCRIPT_NAME'] = ''
+        self.assertRaises(ValueError, req.split_path, 3)
+        self.assertRaises(ValueError, req.split_path, 3)
+        req.headers['X-Timestamp'] = 'asdf'
+        self.assertRaises(exceptions.InvalidTimestamp,
+                          getattr, req, 'timestamp')
+        self.assertRaises(exceptions.InvalidTimestamp,
+                          getattr, req, 'timestamp')
+
+        del req.environ['QUERY_STRING']
+        self.assertEqual(req.params, {})
+
+    def test_parsed_properties_cache_is_bounded(self):
+        req = swift.common.swob.Request.blank('/')
+        with mock.patch('swift.common.swob.MAX_PARSED_CACHE_SIZE', 4):
+            for i in range(10):
+                req.environ['PATH_INFO'] = '/%d' % i
+                self.assertEqual(req.path, '/%d' % i)
+                self.assertLessEqual(len(req.environ['swob.parsed']), 4)
+
     def test_path(self):
         req = swift.common.swob.Request.blank('/hi?a=b&c=d')
         self.assertEqual(req.path, '/hi')
@@ -37,6 +37,7 @@ import math
 import six
 from six import BytesIO, StringIO
 from six.moves.queue import Queue, Empty
+from six.moves import cPickle as pickle
 from six.moves import range
 from textwrap import dedent
 
@@ -57,7 +58,7 @@ from uuid import uuid4
 
 from swift.common.exceptions import Timeout, MessageTimeout, \
     ConnectionTimeout, LockTimeout, ReplicationLockTimeout, \
-    MimeInvalid
+    MimeInvalid, ThreadPoolDead
 from swift.common import utils
 from swift.common.utils import is_valid_ip, is_valid_ipv4, is_valid_ipv6
 from swift.common.container_sync_realms import ContainerSyncRealms
@@ -806,6 +807,50 @@ class TestTimestamp(unittest.TestCase):
         self.assertIn(ts_0, d)  # sanity
         self.assertIn(ts_0_also, d)
 
+    def test_from_internal(self):
+        for value in ('1402444821.72589', '1402444821.72589_00000000000000ab',
+                      '0000000000.00000', '9999999999.99999_ffffffffffffffff'):
+            ts = utils.Timestamp.from_internal(value)
+            expected = utils.Timestamp(value)
+            self.assertEqual(expected, ts)
+            for attr in ('timestamp', 'offset', 'raw', 'normal', 'internal',
+                         'isoformat'):
+                self.assertEqual(getattr(expected, attr), getattr(ts, attr))
+            with mock.patch('swift.common.utils.FORCE_INTERNAL', new=True):
+                self.assertEqual(expected.internal, ts.internal)
+
+        # anything else takes the regular constructor
+        for value in ('1402444821.7', '1402444821.72589_ab', '1402444821',
+                      1402444821.72589, utils.Timestamp(1402444821, 3)):
+            self.assertEqual(utils.Timestamp(value),
+                             utils.Timestamp.from_internal(value))
+        for value in ('', 'junk', '-402444821.72589', '14024448x1.72589',
+                      '1402444821.72589_junk',
+                      '1402444821.72589_10000000000000000'):
+            self.assertRaises(ValueError, utils.Timestamp.from_internal,
+                              value)
+
+    def test_cached_formats(self):
+        ts = utils.Timestamp(1402444821.72589, offset=3)
+        self.assertIs(ts.normal, ts.normal)
+        self.assertIs(ts.internal, ts.internal)
+        self.assertIs(ts.isoformat, ts.isoformat)
+        self.assertEqual('1402444821.72589_0000000000000003', ts.internal)
+        self.assertEqual('2014-06-11T00:00:21.725890', ts.isoformat)
+        # slots, no instance dict
+        self.assertFalse(hasattr(ts, '__dict__'))
+        self.assertRaises(AttributeError, setattr, ts, 'foo', 'bar')
+
+    def test_pickle(self):
+        for ts in (utils.Timestamp(1402444821.72589, offset=3),
+                   utils.Timestamp(1402444821.725891),
+                   utils.Timestamp.from_internal('1402444821.72589')):
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                copied = pickle.loads(pickle.dumps(ts, protocol))
+                self.assertEqual(ts, copied)
+                self.assertEqual(ts.timestamp, copied.timestamp)
+                self.assertEqual(ts.offset, copied.offset)
+
 
 class TestTimestampEncoding(unittest.TestCase):
 
@@ -907,6 +952,16 @@ class TestTimestampEncoding(unittest.TestCase):
                 actual = utils.decode_timestamps(test[0], explicit)
                 self._assertEqual(test[1], actual, test[0])
 
+    def test_bulk_decoding(self):
+        for explicit, decodings in (
+                (True, self.explicit_decodings + self.decodings),
+                (False, self.non_explicit_decodings + self.decodings)):
+            encoded = [test[0] for test in decodings] * 2
+            expected = [test[1] for test in decodings] * 2
+            self.assertEqual(expected, list(utils.bulk_decode_timestamps(
+                iter(encoded), explicit)))
+        self.assertEqual([], list(utils.bulk_decode_timestamps([])))
+
 
 class TestUtils(unittest.TestCase):
     """Tests for swift.common.utils """
@@ -4351,6 +4406,130 @@ class TestStatsdLogging(unittest.TestCase):
         self.assertEqual(logger.logger.statsd_client._sample_rate_factor,
                          0.81)
 
+    def test_get_logger_aggregating_statsd_client(self):
+        logger = utils.get_logger({
+            'log_statsd_host': 'some.host.com',
+            'log_statsd_aggregate': 'yes',
+            'log_statsd_flush_interval': '5',
+            'log_statsd_max_packet_size': '512',
+            'log_statsd_reservoir_size': '10',
+            'log_statsd_max_metrics': '20',
+        }, 'some-name', log_route='some-route')
+        statsd_client = logger.logger.statsd_client
+        self.assertIsInstance(statsd_client, utils.AggregatingStatsdClient)
+        self.assertEqual(statsd_client._prefix, 'some-name.')
+        self.assertEqual(statsd_client.flush_interval, 5.0)
+        self.assertEqual(statsd_client.max_packet_size, 512)
+        self.assertEqual(statsd_client.reservoir_size, 10)
+        self.assertEqual(statsd_client.max_metrics, 20)
+
+    def _aggregating_client(self, **kwargs):
+        statsd_client = utils.AggregatingStatsdClient(
+            'localhost', 9876, tail_prefix='pfx', **kwargs)
+        mock_socket = MockUdpSocket()
+        statsd_client._open_socket = lambda *_: mock_socket
+        return statsd_client, mock_socket
+
+    def test_aggregating_statsd_client_sums_counters(self):
+        statsd_client, mock_socket = self._aggregating_client()
+        with mock.patch.object(utils.eventlet, 'spawn') as mock_spawn:
+            statsd_client.increment('reqs')
+            statsd_client.increment('reqs', sample_rate=0.1)
+            statsd_client.update_stats('bytes', 10)
+            statsd_client.update_stats('bytes', 5)
+            statsd_client.decrement('reqs')
+            statsd_client.timing('time', 12.5)
+            statsd_client.timing('time', 7)
+        # flusher started once
+        self.assertEqual([mock.call(statsd_client._run)],
+                         mock_spawn.mock_calls)
+        self.assertEqual([], mock_socket.sent)
+        self.assertEqual(1, statsd_client.flush())
+        self.assertEqual(1, len(mock_socket.sent))
+        payload, target = mock_socket.sent[0]
+        self.assertEqual(('localhost', 9876), target)
+        self.assertEqual(sorted(payload.split(b'\n')), [
+            b'pfx.bytes:15|c', b'pfx.reqs:1|c',
+            b'pfx.time:12.5|ms', b'pfx.time:7|ms'])
+        # nothing pending after flush
+        self.assertEqual(0, statsd_client.flush())
+        self.assertEqual(1, len(mock_socket.sent))
+
+    def test_aggregating_statsd_client_prefix_change(self):
+        statsd_client, mock_socket = self._aggregating_client()
+        with mock.patch.object(utils.eventlet, 'spawn'):
+            statsd_client.increment('reqs')
+            statsd_client.set_prefix('other')
+            statsd_client.increment('reqs')
+        statsd_client.flush()
+        self.assertEqual(sorted(mock_socket.sent[0][0].split(b'\n')),
+                         [b'other.reqs:1|c', b'pfx.reqs:1|c'])
+
+    def test_aggregating_statsd_client_reservoir(self):
+        statsd_client, mock_socket = self._aggregating_client(
+            reservoir_size=4)
+        statsd_client.random = lambda: 0.99
+        with mock.patch.object(utils.eventlet, 'spawn'):
+            for i in range(8):
+                statsd_client.timing('time', i)
+        statsd_client.flush()
+        lines = mock_socket.sent[0][0].split(b'\n')
+        self.assertEqual(lines, [b'pfx.time:%d|ms|@0.5' % i
+                                 for i in range(4)])
+
+    def test_aggregating_statsd_client_packet_size(self):
+        statsd_client, mock_socket = self._aggregating_client(
+            max_packet_size=40)
+        with mock.patch.object(utils.eventlet, 'spawn'):
+            for i in range(10):
+                statsd_client.increment('metric%d' % i)
+        # each line is 15 bytes, so only two fit in a packet
+        self.assertEqual(5, statsd_client.flush())
+        lines = []
+        for payload, target in mock_socket.sent:
+            self.assertLessEqual(len(payload), 40)
+            lines.extend(payload.split(b'\n'))
+        self.assertEqual(sorted(lines), sorted(
+            b'pfx.metric%d:1|c' % i for i in range(10)))
+
+    def test_aggregating_statsd_client_max_metrics(self):
+        statsd_client, mock_socket = self._aggregating_client(max_metrics=3)
+        with mock.patch.object(utils.eventlet, 'spawn'):
+            statsd_client.increment('a')
+            statsd_client.timing('b', 1)
+            self.assertEqual([], mock_socket.sent)
+            statsd_client.increment('c')
+        self.assertEqual(1, len(mock_socket.sent))
+        self.assertEqual({}, statsd_client._counters)
+        self.assertEqual({}, statsd_client._timers)
+
+    def test_aggregating_statsd_client_send_error(self):
+        logger = debug_logger()
+        statsd_client, mock_socket = self._aggregating_client(logger=logger)
+        mock_socket.sendto_errno = errno.EPERM
+        with mock.patch.object(utils.eventlet, 'spawn'):
+            statsd_client.increment('a')
+        statsd_client.flush()
+        self.assertIn('Error sending UDP message',
+                      logger.get_lines_for_level('warning')[0])
+
+    def test_aggregating_statsd_client_flusher_survives_errors(self):
+        logger = debug_logger()
+        statsd_client, mock_socket = self._aggregating_client(logger=logger)
+
+        class StopFlusher(Exception):
+            pass
+
+        with mock.patch.object(utils, 'sleep',
+                               side_effect=[None, None, StopFlusher]), \
+                mock.patch.object(statsd_client, 'flush',
+                                  side_effect=[socket.error('boom'), 1]) \
+                as mock_flush:
+            self.assertRaises(StopFlusher, statsd_client._run)
+        self.assertEqual(2, mock_flush.call_count)
+        self.assertIn('Error flushing StatsD metrics',
+                      logger.get_lines_for_level('error')[0])
+
     def test_ipv4_or_ipv6_hostname_defaults_to_ipv4(self):
         def stub_getaddrinfo_both_ipv4_and_ipv6(host, port, family, *rest):
             if family == socket.AF_INET:
@@ -4587,6 +4766,81 @@ class TestStatsdLogging(unittest.TestCase):
         self.assertTrue(mock_controller.args[1] > 0)
 
 
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_invalid_precision(self):
+        self.assertRaises(ValueError, utils.LatencyHistogram, 0)
+        self.assertRaises(ValueError, utils.LatencyHistogram, 6)
+
+    def test_empty(self):
+        histogram = utils.LatencyHistogram()
+        self.assertEqual(0, histogram.percentile(99))
+        self.assertEqual({'count': 0, 'min': 0, 'max': 0, 'mean': 0,
+                          'p50': 0, 'p90': 0, 'p99': 0, 'p99.9': 0},
+                         histogram.summary())
+
+    def test_negative_value(self):
+        histogram = utils.LatencyHistogram()
+        self.assertRaises(ValueError, histogram.record, -1)
+
+    def test_small_values_exact(self):
+        histogram = utils.LatencyHistogram()
+        for value in range(1, 101):
+            histogram.record(value)
+        self.assertEqual(100, histogram.count)
+        self.assertEqual(1, histogram.min)
+        self.assertEqual(100, histogram.max)
+        self.assertEqual(50, histogram.percentile(50))
+        self.assertEqual(90, histogram.percentile(90))
+        self.assertEqual(100, histogram.percentile(100))
+        self.assertEqual(1, histogram.percentile(0))
+
+    def test_precision(self):
+        for significant_figures in (1, 2, 3):
+            histogram = utils.LatencyHistogram(significant_figures)
+            max_error = 10.0 ** -significant_figures
+            for value in (999, 12345, 654321, 10 ** 7 + 7, 3600 * 10 ** 6):
+                histogram.reset()
+                histogram.record(value)
+                histogram.record(value * 2)
+                reported = histogram.percentile(50)
+                self.assertGreaterEqual(reported, value)
+                self.assertLessEqual(float(reported - value) / value,
+                                     max_error)
+        # buckets are shared by nearby values
+        histogram = utils.LatencyHistogram(2)
+        for value in range(100000, 100100):
+            histogram.record(value)
+        self.assertLess(len(histogram.counts), 10)
+
+    def test_record_count_and_summary(self):
+        histogram = utils.LatencyHistogram()
+        histogram.record(1000, count=99)
+        histogram.record(50000)
+        summary = histogram.summary(percentiles=(50, 99, 100), scale=1000)
+        self.assertEqual(100, summary['count'])
+        self.assertEqual(1.0, summary['min'])
+        self.assertEqual(50.0, summary['max'])
+        # percentiles report the top of the value's bucket
+        self.assertAlmostEqual(1.0, summary['p50'], delta=0.01)
+        self.assertAlmostEqual(1.0, summary['p99'], delta=0.01)
+        self.assertEqual(50.0, summary['p100'])
+        self.assertAlmostEqual(1.49, summary['mean'])
+
+    def test_merge(self):
+        first = utils.LatencyHistogram()
+        second = utils.LatencyHistogram()
+        for value in range(10):
+            first.record(value)
+            second.record(value + 1000)
+        first.merge(second)
+        self.assertEqual(20, first.count)
+        self.assertEqual(0, first.min)
+        self.assertEqual(1009, first.max)
+        self.assertEqual(9, first.percentile(50))
+        self.assertRaises(ValueError, first.merge, utils.LatencyHistogram(3))
+
+
 class UnsafeXrange(object):
     """
     Like xrange(limit), but with extra context switching to screw things up.
@@ -5432,6 +5686,146 @@ class TestGreenAsyncPile(unittest.TestCase):
             self.assertEqual(0, pile._pending)
 
 
+class TestThreadPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tp = None
+
+    def tearDown(self):
+        if self.tp:
+            self.tp.terminate()
+
+    def _thread_id(self):
+        return threading.current_thread().ident
+
+    def _capture_args(self, *args, **kwargs):
+        return {'args': args, 'kwargs': kwargs}
+
+    def _raise_valueerror(self):
+        return int('fishcakes')
+
+    def test_run_in_thread_with_threads(self):
+        tp = self.tp = utils.ThreadPool(1)
+
+        my_id = self._thread_id()
+        other_id = tp.run_in_thread(self._thread_id)
+        self.assertNotEqual(my_id, other_id)
+
+        result = tp.run_in_thread(self._capture_args, 1, 2, bert='ernie')
+        self.assertEqual(result, {'args': (1, 2),
+                                  'kwargs': {'bert': 'ernie'}})
+
+        caught = False
+        try:
+            tp.run_in_thread(self._raise_valueerror)
+        except ValueError:
+            caught = True
+        self.assertTrue(caught)
+
+    def test_force_run_in_thread_with_threads(self):
+        # with nthreads > 0, force_run_in_thread looks just like run_in_thread
+        tp = self.tp = utils.ThreadPool(1)
+
+        my_id = self._thread_id()
+        other_id = tp.force_run_in_thread(self._thread_id)
+        self.assertNotEqual(my_id, other_id)
+
+        self.assertRaises(ValueError, tp.force_run_in_thread,
+                          self._raise_valueerror)
+
+    def test_run_in_thread_without_threads(self):
+        # with zero threads, run_in_thread doesn't actually do so
+        tp = utils.ThreadPool(0)
+
+        my_id = self._thread_id()
+        other_id = tp.run_in_thread(self._thread_id)
+        self.assertEqual(my_id, other_id)
+
+        result = tp.run_in_thread(self._capture_args, 1, 2, bert='ernie')
+        self.assertEqual(result, {'args': (1, 2),
+                                  'kwargs': {'bert': 'ernie'}})
+        self.assertRaises(ValueError, tp.run_in_thread,
+                          self._raise_valueerror)
+
+    def test_force_run_in_thread_without_threads(self):
+        # with zero threads, force_run_in_thread uses eventlet.tpool
+        tp = utils.ThreadPool(0)
+
+        with mock.patch('swift.common.utils.tpool_reraise') as mock_tpool:
+            mock_tpool.return_value = 'fromtpool'
+            self.assertEqual(
+                'fromtpool', tp.force_run_in_thread(self._thread_id, 1, a=2))
+        mock_tpool.assert_called_once_with(self._thread_id, 1, a=2)
+
+    def test_threads_started_lazily(self):
+        tp = self.tp = utils.ThreadPool(2)
+        self.assertEqual([], tp._threads)
+        tp.run_in_thread(self._thread_id)
+        self.assertEqual(2, len(tp._threads))
+
+    def test_queue_depth(self):
+        tp = self.tp = utils.ThreadPool(1, max_queue_depth=2)
+        self.assertFalse(tp.full)
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocker():
+            started.set()
+            release.wait()
+
+        waiters = [eventlet.spawn(tp.run_in_thread, blocker)]
+        while not started.is_set():
+            eventlet.sleep(0.001)
+        self.assertEqual(0, tp.queue_depth)
+        self.assertFalse(tp.full)
+        waiters.extend(eventlet.spawn(tp.run_in_thread, self._thread_id)
+                       for _junk in range(2))
+        eventlet.sleep(0)
+        self.assertEqual(2, tp.queue_depth)
+        self.assertTrue(tp.full)
+        release.set()
+        for waiter in waiters:
+            waiter.wait()
+        self.assertEqual(0, tp.queue_depth)
+        self.assertFalse(tp.full)
+
+    def test_never_full_without_threads_or_limit(self):
+        self.assertFalse(utils.ThreadPool(0, max_queue_depth=1).full)
+        tp = utils.ThreadPool(1, max_queue_depth=0)
+        tp._run_queue.put('x')
+        self.assertFalse(tp.full)
+
+    def test_terminate(self):
+        initial_thread_count = threading.activeCount()
+
+        tp = utils.ThreadPool(4)
+        # do some work to ensure any lazy initialization happens
+        tp.run_in_thread(os.path.join, 'foo', 'bar')
+        tp.run_in_thread(os.path.join, 'baz', 'quux')
+
+        # 4 threads in the ThreadPool; this also serves as a sanity check
+        # that we're actually allocating some resources to free later
+        self.assertEqual(initial_thread_count, threading.activeCount() - 4)
+        rpipe = tp.rpipe
+        self.assertFalse(rpipe.closed)
+
+        tp.terminate()
+        # let the consumer greenthread notice the closed pipe
+        eventlet.sleep(0)
+        self.assertEqual(initial_thread_count, threading.activeCount())
+        self.assertTrue(rpipe.closed)
+        self.assertRaises(ThreadPoolDead, tp.run_in_thread, self._thread_id)
+        self.assertRaises(ThreadPoolDead, tp.force_run_in_thread,
+                          self._thread_id)
+
+    def test_cant_terminate_twice(self):
+        tp = utils.ThreadPool(1)
+        tp.run_in_thread(self._thread_id)
+        tp.terminate()
+        tp.terminate()
+        self.assertRaises(ThreadPoolDead, tp.run_in_thread, self._thread_id)
+
+
 class TestLRUCache(unittest.TestCase):
 
     def test_maxsize(self):
@@ -5944,6 +6338,86 @@ class TestDocumentItersToHTTPResponseBody(unittest.TestCase):
             body += s
 
 
+class TestKernelMD5(unittest.TestCase):
+    # AF_ALG may not be available, so a socketpair stands in for the kernel:
+    # whatever gets hashed shows up at the far end, and the "digest" is
+    # whatever the far end sends back.
+
+    def setUp(self):
+        self.near, self.far = socket.socketpair()
+        self.far.settimeout(1)
+        patcher = mock.patch('swift.common.utils.get_md5_socket',
+                             side_effect=lambda: os.dup(self.near.fileno()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.near.close()
+        self.far.close()
+
+    def _assert_closed(self, fd):
+        with self.assertRaises(OSError) as cm:
+            os.fstat(fd)
+        self.assertEqual(cm.exception.errno, errno.EBADF)
+
+    def test_update_and_digest(self):
+        hasher = utils.KernelMD5(b'abc')
+        hasher.update(b'defg')
+        hasher.update(bytearray(b'h'))
+        self.assertEqual(hasher.bytes_hashed, 8)
+        self.assertEqual(self.far.recv(100), b'abcdefgh')
+        self.far.sendall(b'\x01' * 16)
+        sockfd = hasher._sockfd
+        self.assertEqual(hasher.hexdigest(), '01' * 16)
+        self.assertEqual(hasher.digest(), b'\x01' * 16)
+        self._assert_closed(sockfd)
+        self.assertRaises(ValueError, hasher.update, b'more')
+
+    def test_empty(self):
+        hasher = utils.KernelMD5()
+        # nothing is read from the socket, which would give all zeros
+        self.assertEqual(hasher.hexdigest(), utils.MD5_OF_EMPTY_STRING)
+
+    def test_update_from_pipe(self):
+        hasher = utils.KernelMD5()
+        rpipe, wpipe = os.pipe()
+        try:
+            os.write(wpipe, b'0123456789')
+            hasher.update_from_pipe(rpipe, 4)
+            hasher.update_from_pipe(rpipe, 6)
+        finally:
+            os.close(rpipe)
+            os.close(wpipe)
+        self.assertEqual(hasher.bytes_hashed, 10)
+        self.assertEqual(self.far.recv(100), b'0123456789')
+
+    def test_close(self):
+        hasher = utils.KernelMD5()
+        sockfd = hasher._sockfd
+        hasher.close()
+        hasher.close()
+        self._assert_closed(sockfd)
+        self.assertRaises(ValueError, hasher.hexdigest)
+
+        hasher = utils.KernelMD5()
+        sockfd = hasher._sockfd
+        del hasher
+        self._assert_closed(sockfd)
+
+    def test_md5_hasher(self):
+        self.assertIsInstance(utils.md5_hasher(True), utils.KernelMD5)
+        self.assertNotIsInstance(utils.md5_hasher(), utils.KernelMD5)
+        self.assertTrue(utils.kernel_md5_available())
+        with mock.patch('swift.common.utils.get_md5_socket',
+                        side_effect=IOError(errno.EAFNOSUPPORT, 'nope')):
+            hasher = utils.md5_hasher(True)
+            self.assertFalse(utils.kernel_md5_available())
+        self.assertNotIsInstance(hasher, utils.KernelMD5)
+        hasher.update(b'abc')
+        self.assertEqual(hasher.hexdigest(),
+                         '900150983cd24fb0d6963f7d28e17f72')
+
+
 class TestPairs(unittest.TestCase):
     def test_pairs(self):
         items = [10, 20, 30, 40, 50, 60]
@@ -362,6 +362,46 @@ class TestReplicatorSync(test_db_replicator.TestReplicatorSync):
         self.assertEqual(len(remote_names), 101)
         self.assertEqual(remote_broker.get_info()['object_count'], 101)
 
+    def test_sync_remote_usync_stream(self):
+        ts = make_timestamp_iter()
+        broker = self._get_broker('a', 'c', node_index=0)
+        put_timestamp = next(ts)
+        broker.initialize(put_timestamp.internal, POLICIES.default.idx)
+        for i in range(100):
+            broker.put_object(
+                'o%s' % i, next(ts).internal, 0, 'content-type', 'etag',
+                storage_policy_index=broker.storage_policy_index)
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        remote_broker.initialize(put_timestamp.internal,
+                                 POLICIES.default.idx)
+        # enough rows on the remote to usync rather than rsync
+        for i in range(60):
+            remote_broker.put_object(
+                'x%s' % i, next(ts).internal, 0, 'content-type', 'etag',
+                storage_policy_index=remote_broker.storage_policy_index)
+        part, node = self._get_broker_part_node(broker)
+        daemon = self._get_daemon(node, conf_updates={
+            'per_diff': 10, 'max_diffs': 3, 'usync_stream': 'yes',
+            'usync_batches': '4'})
+        merges = []
+        orig_merge_items = self.rpc.merge_items
+
+        def fake_merge_items(broker, args):
+            merges.append(len(args[0]))
+            return orig_merge_items(broker, args)
+
+        with mock.patch.object(self.rpc, 'merge_items', fake_merge_items):
+            self._run_once(node, daemon=daemon)
+        self.assertEqual(1, daemon.stats['diff'])
+        self.assertEqual(0, daemon.stats['diff_capped'])
+        # three requests of up to 4 x per_diff rows, each merged at once
+        self.assertEqual([40, 40, 20], merges)
+        self.assertEqual(160, remote_broker.get_info()['object_count'])
+        self.assertEqual(
+            [(broker.get_info()['id'], broker.get_max_row())],
+            [(sync['remote_id'], sync['sync_point'])
+             for sync in remote_broker.get_syncs()])
+
     def test_sync_status_change(self):
         # setup a local container
         broker = self._get_broker('a', 'c', node_index=0)
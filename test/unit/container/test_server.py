@@ -26,6 +26,7 @@ from time import gmtime
 from xml.dom import minidom
 import time
 import random
+import zlib
 
 from eventlet import spawn, Timeout, listen
 import json
@@ -38,6 +39,7 @@ from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.swob import (Request, WsgiBytesIO, HTTPNoContent)
 import swift.container
 from swift.container import server as container_server
+from swift.common import db_replicator
 from swift.common import constraints
 from swift.common.utils import (Timestamp, mkdirs, public, replication,
                                 storage_directory, lock_parent_directory)
@@ -1314,6 +1316,67 @@ class TestContainerController(unittest.TestCase):
             resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 204)
 
+    def test_REPLICATE_deflated_body(self):
+        def fake_complete_rsync(self, drive, db_file, args):
+            return HTTPNoContent(body=args[0])
+        with mock.patch("swift.container.replicator.ContainerReplicatorRpc."
+                        "complete_rsync", fake_complete_rsync):
+            req = Request.blank('/sda1/p/a/',
+                                environ={'REQUEST_METHOD': 'REPLICATE'},
+                                headers={'Content-Encoding': 'deflate'})
+            json_string = '["complete_rsync", "a.db"]'
+            inbuf = WsgiBytesIO(zlib.compress(json_string))
+            req.environ['wsgi.input'] = inbuf
+            resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 204)
+        self.assertEqual(resp.body, 'a.db')
+        # not actually deflated
+        req = Request.blank('/sda1/p/a/',
+                            environ={'REQUEST_METHOD': 'REPLICATE'},
+                            headers={'Content-Encoding': 'deflate'})
+        req.environ['wsgi.input'] = WsgiBytesIO(json_string)
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 400)
+
+    def test_change_journal(self):
+        self.controller = container_server.ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'change_journal': 'yes'})
+        datadir = os.path.join(self.testdir, 'sda1', 'containers')
+        db_file = self.controller._get_container_broker(
+            'sda1', 'p', 'a', 'c').db_file
+        ts = (Timestamp(t).internal for t in itertools.count(time.time()))
+
+        def do_request(path, method, **headers):
+            headers['X-Timestamp'] = next(ts)
+            req = Request.blank(path, environ={'REQUEST_METHOD': method},
+                                headers=headers)
+            return req.get_response(self.controller).status_int
+
+        self.assertEqual(do_request('/sda1/p/a/c', 'PUT'), 201)
+        self.assertEqual(db_replicator.read_change_journal(datadir),
+                         set([db_file]))
+        self.assertEqual(do_request('/sda1/p/a/c', 'GET'), 204)
+        self.assertEqual(do_request('/sda1/p/a/c2/o', 'PUT', **{
+            'X-Size': 1, 'X-Content-Type': 'text/plain', 'X-Etag': 'x'}),
+            404)
+        self.assertEqual(db_replicator.read_change_journal(datadir), set())
+        self.assertEqual(do_request('/sda1/p/a/c/o', 'PUT', **{
+            'X-Size': 1, 'X-Content-Type': 'text/plain', 'X-Etag': 'x'}),
+            201)
+        self.assertEqual(do_request('/sda1/p/a/c', 'POST'), 204)
+        self.assertEqual(do_request('/sda1/p/a/c/o', 'DELETE'), 204)
+        with open(db_replicator.get_change_journal(datadir)) as fp:
+            self.assertEqual(len(fp.read().splitlines()), 3)
+        self.assertEqual(db_replicator.read_change_journal(datadir),
+                         set([db_file]))
+
+        # journaling is off by default
+        self.controller = container_server.ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false'})
+        self.assertEqual(do_request('/sda1/p/a/c', 'POST'), 204)
+        self.assertEqual(db_replicator.read_change_journal(datadir), set())
+
     def test_REPLICATE_value_error_works(self):
         req = Request.blank('/sda1/p/a/',
                             environ={'REQUEST_METHOD': 'REPLICATE'},
@@ -43,6 +43,29 @@ class FakeReplicator(object):
         self._diskfile_mgr = self._diskfile_router[policy]
 
 
+class FakeKernelMD5(object):
+    """
+    Stands in for :class:`swift.common.utils.KernelMD5` where there are no
+    MD5 sockets, hashing what it is given in userspace instead.
+    """
+    def __init__(self):
+        self._md5 = hashlib.md5()
+
+    def update(self, data):
+        self._md5.update(data)
+
+    def update_from_pipe(self, rpipe, length):
+        data = os.read(rpipe, length)
+        assert len(data) == length
+        self._md5.update(data)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def close(self):
+        pass
+
+
 def write_diskfile(df, timestamp, data='test data', frag_index=None,
                    commit=True, legacy_durable=False, extra_metadata=None):
     # Helper method to write some data and metadata to a diskfile.
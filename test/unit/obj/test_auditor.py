@@ -23,6 +23,7 @@ from shutil import rmtree
 from hashlib import md5
 from tempfile import mkdtemp
 import textwrap
+import xattr
 from os.path import dirname, basename
 from test.unit import (FakeLogger, patch_policies, make_timestamp_iter,
                        DEFAULT_TEST_EC_TYPE)
@@ -30,7 +31,9 @@ from swift.obj import auditor, replicator
 from swift.obj.diskfile import (
     DiskFile, write_metadata, invalidate_hash, get_data_dir,
     DiskFileManager, ECDiskFileManager, AuditLocation, clear_auditor_status,
-    get_auditor_status, HASH_FILE, HASH_INVALIDATIONS_FILE)
+    get_auditor_status, HASH_FILE, HASH_INVALIDATIONS_FILE, METADATA_KEY,
+    COMPACT_METADATA_MAGIC, DiskFileReader, ECDiskFileReader,
+    VERIFIED_JOURNAL_FILE)
 from swift.common.utils import (
     mkdirs, normalize_timestamp, Timestamp, readconf)
 from swift.common.storage_policy import (
@@ -228,6 +231,38 @@ class TestAuditor(unittest.TestCase):
                           policy=POLICIES.legacy))
         self.assertEqual(auditor_worker.quarantines, pre_quarantines + 1)
 
+    def test_object_audit_zero_copy_hash(self):
+        auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
+                                               self.rcache, self.devices)
+        readers = []
+
+        def fake_zero_copy_hash(reader, progress=None):
+            readers.append(reader)
+            # hash in userspace, but report progress the way splice would
+            for chunk in reader:
+                progress(len(chunk))
+
+        timestamp = Timestamp(time.time())
+        for etag in (md5(b'0' * 1024).hexdigest(), 'badetag'):
+            with self.disk_file.create() as writer:
+                writer.write(b'0' * 1024)
+                writer.put({
+                    'ETag': etag,
+                    'X-Timestamp': timestamp.internal,
+                    'Content-Length': '1024',
+                })
+                writer.commit(timestamp)
+            with mock.patch.object(DiskFileReader, 'can_zero_copy_hash',
+                                   return_value=True), \
+                    mock.patch.object(DiskFileReader, 'zero_copy_hash',
+                                      fake_zero_copy_hash):
+                auditor_worker.object_audit(
+                    AuditLocation(self.disk_file._datadir, 'sda', '0',
+                                  policy=POLICIES.legacy))
+        self.assertEqual(len(readers), 2)
+        self.assertEqual(auditor_worker.bytes_processed, 2048)
+        self.assertEqual(auditor_worker.quarantines, 1)
+
     def test_object_audit_checks_EC_fragments(self):
         disk_file = self.disk_file_ec
 
@@ -305,6 +340,46 @@ class TestAuditor(unittest.TestCase):
                       'Invalid EC metadata at offset 0x0',
                       log_lines[0])
 
+    def test_object_audit_checks_EC_fragments_with_kernel_md5(self):
+        disk_file = self.disk_file_ec
+        frag_0 = disk_file.policy.pyeclib_driver.encode(
+            'x' * disk_file.policy.ec_segment_size)[0]
+        frag_1 = disk_file.policy.pyeclib_driver.encode(
+            'y' * disk_file.policy.ec_segment_size)[0]
+        data = frag_0 + 'blah' * 16 + frag_1[64:]
+        timestamp = Timestamp(time.time())
+        with disk_file.create() as writer:
+            writer.write(data)
+            writer.put({
+                'ETag': md5(data).hexdigest(),
+                'X-Timestamp': timestamp.internal,
+                'Content-Length': len(data),
+            })
+            writer.commit(timestamp)
+
+        conf = dict(self.conf, kernel_md5='yes')
+        with mock.patch('swift.obj.diskfile.kernel_md5_available',
+                        return_value=True):
+            auditor_worker = auditor.AuditorWorker(conf, FakeLogger(),
+                                                   self.rcache, self.devices)
+        mgr = auditor_worker.diskfile_router[disk_file.policy]
+        self.assertTrue(mgr.use_kernel_md5)
+        mgr.pipe_size = 65536
+        with mock.patch('swift.obj.diskfile.splice') as mock_splice, \
+                mock.patch.object(ECDiskFileReader,
+                                  'zero_copy_hash') as mock_hash:
+            mock_splice.available = True
+            auditor_worker.object_audit(
+                AuditLocation(disk_file._datadir, 'sda', '0',
+                              policy=disk_file.policy))
+        # the fragments can only be checked in userspace
+        self.assertFalse(mock_hash.called)
+        self.assertEqual(1, auditor_worker.quarantines)
+        log_lines = auditor_worker.logger.get_lines_for_level('error')
+        self.assertIn('failed audit and was quarantined: '
+                      'Invalid EC metadata at offset 0x%x' % len(frag_0),
+                      log_lines[0])
+
     def test_object_audit_no_meta(self):
         timestamp = str(normalize_timestamp(time.time()))
         path = os.path.join(self.disk_file._datadir, timestamp + '.data')
@@ -321,6 +396,50 @@ class TestAuditor(unittest.TestCase):
                           policy=POLICIES.legacy))
         self.assertEqual(auditor_worker.quarantines, pre_quarantines + 1)
 
+    def test_object_audit_migrates_metadata(self):
+        data = b'0' * 1024
+        timestamp = Timestamp(time.time())
+        with self.disk_file.create() as writer:
+            writer.write(data)
+            writer.put({
+                'ETag': md5(data).hexdigest(),
+                'X-Timestamp': timestamp.internal,
+                'Content-Length': str(len(data)),
+            })
+        data_file = os.path.join(self.disk_file._datadir,
+                                 timestamp.internal + '.data')
+        location = AuditLocation(self.disk_file._datadir, 'sda', '0',
+                                 policy=POLICIES.legacy)
+
+        def metadata_format():
+            metastr = xattr.getxattr(data_file, METADATA_KEY)
+            if metastr.startswith(COMPACT_METADATA_MAGIC):
+                return 'compact'
+            return 'pickle'
+
+        # not configured, nothing changes
+        auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
+                                               self.rcache, self.devices)
+        auditor_worker.object_audit(location)
+        self.assertEqual('pickle', metadata_format())
+        self.assertNotIn('metadata_migrations',
+                         self.logger.get_increment_counts())
+
+        conf = dict(self.conf, compact_metadata='true')
+        auditor_worker = auditor.AuditorWorker(conf, self.logger,
+                                               self.rcache, self.devices)
+        auditor_worker.object_audit(location)
+        self.assertEqual('compact', metadata_format())
+        self.assertEqual(
+            1, self.logger.get_increment_counts()['metadata_migrations'])
+        self.assertEqual(0, auditor_worker.quarantines)
+
+        # and the migrated object still passes the audit
+        auditor_worker.object_audit(location)
+        self.assertEqual(0, auditor_worker.quarantines)
+        self.assertEqual(
+            1, self.logger.get_increment_counts()['metadata_migrations'])
+
     def test_object_audit_will_not_swallow_errors_in_tests(self):
         timestamp = str(normalize_timestamp(time.time()))
         path = os.path.join(self.disk_file._datadir, timestamp + '.data')
@@ -598,6 +717,57 @@ class TestAuditor(unittest.TestCase):
         self.assertEqual(auditor_worker.stats_buckets[10240], 0)
         self.assertEqual(auditor_worker.stats_buckets['OVER'], 2)
 
+    def test_object_run_once_incremental(self):
+        conf = dict(self.conf, incremental='yes')
+        auditor_worker = auditor.AuditorWorker(conf, self.logger,
+                                               self.rcache, self.devices)
+        self.assertTrue(auditor_worker.incremental)
+        self.assertEqual(2592000, auditor_worker.reverify_age)
+        now = time.time()
+
+        def write_file(df, timestamp=str(normalize_timestamp(now))):
+            data = b'0' * 1024
+            if df.policy.policy_type == EC_POLICY:
+                data = df.policy.pyeclib_driver.encode(data)[0]
+            with df.create() as writer:
+                writer.write(data)
+                metadata = {
+                    'ETag': md5(data).hexdigest(),
+                    'X-Timestamp': timestamp,
+                    'Content-Length': str(os.fstat(writer._fd).st_size),
+                }
+                writer.put(metadata)
+                writer.commit(Timestamp(timestamp))
+
+        for df in (self.disk_file, self.disk_file_p1, self.disk_file_ec):
+            write_file(df)
+
+        auditor_worker.audit_all_objects()
+        self.assertEqual(3, auditor_worker.total_files_processed)
+        for df in (self.disk_file, self.disk_file_p1, self.disk_file_ec):
+            journal = os.path.join(os.path.dirname(os.path.dirname(
+                df._datadir)), VERIFIED_JOURNAL_FILE)
+            with open(journal) as fp:
+                self.assertEqual([os.path.basename(df._datadir)],
+                                 [line.split()[0] for line in fp])
+        # objects verified recently are left alone
+        auditor_worker.audit_all_objects()
+        self.assertEqual(0, auditor_worker.total_files_processed)
+        # unless their .data has been replaced since
+        write_file(self.disk_file, str(normalize_timestamp(now + 1)))
+        auditor_worker.audit_all_objects()
+        self.assertEqual(1, auditor_worker.total_files_processed)
+        auditor_worker.audit_all_objects()
+        self.assertEqual(0, auditor_worker.total_files_processed)
+        auditor_worker.reverify_age = -10
+        auditor_worker.audit_all_objects()
+        self.assertEqual(3, auditor_worker.total_files_processed)
+        # the zero byte auditor always audits everything
+        auditor_worker = auditor.AuditorWorker(conf, self.logger,
+                                               self.rcache, self.devices,
+                                               zero_byte_only_at_fps=50)
+        self.assertFalse(auditor_worker.incremental)
+
     def test_object_run_logging(self):
         logger = FakeLogger()
         auditor_worker = auditor.AuditorWorker(self.conf, logger,
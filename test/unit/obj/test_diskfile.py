@@ -25,6 +25,7 @@ import mock
 import unittest
 import email
 import tempfile
+import socket
 import uuid
 import xattr
 import re
@@ -37,9 +38,11 @@ from hashlib import md5
 from contextlib import closing, contextmanager
 from gzip import GzipFile
 import pyeclib.ec_iface
+import six
 
 from eventlet import hubs, timeout, tpool
 from swift.obj.diskfile import MD5_OF_EMPTY_STRING, update_auditor_status
+from test import unit
 from test.unit import (FakeLogger, mock as unit_mock, temptree,
                        patch_policies, debug_logger, EMPTY_ETAG,
                        make_timestamp_iter, DEFAULT_TEST_EC_TYPE,
@@ -48,17 +51,18 @@ from nose import SkipTest
 from swift.obj import diskfile
 from swift.common import utils
 from swift.common.utils import hash_path, mkdirs, Timestamp, \
-    encode_timestamps, O_TMPFILE
+    encode_timestamps, O_TMPFILE, write_pickle
 from swift.common import ring
 from swift.common.splice import splice
 from swift.common.exceptions import DiskFileNotExist, DiskFileQuarantined, \
     DiskFileDeviceUnavailable, DiskFileDeleted, DiskFileNotOpen, \
     DiskFileError, ReplicationLockTimeout, DiskFileCollision, \
-    DiskFileExpired, SwiftException, DiskFileNoSpace, DiskFileXattrNotSupported
+    DiskFileExpired, SwiftException, DiskFileNoSpace, \
+    DiskFileXattrNotSupported, DiskFileDeviceBusy
 from swift.common.storage_policy import (
     POLICIES, get_policy_string, StoragePolicy, ECStoragePolicy,
     BaseStoragePolicy, REPL_POLICY, EC_POLICY)
-from test.unit.obj.common import write_diskfile
+from test.unit.obj.common import write_diskfile, FakeKernelMD5
 
 test_policies = [
     StoragePolicy(0, name='zero', is_default=True),
@@ -169,6 +173,7 @@ class TestDiskFileModuleMethods(unittest.TestCase):
 
     def tearDown(self):
         rmtree(self.testdir, ignore_errors=1)
+        unit.xattr_data = {}
 
     def _create_diskfile(self, policy):
         return self.df_mgr.get_diskfile(self.existing_device,
@@ -258,6 +263,169 @@ class TestDiskFileModuleMethods(unittest.TestCase):
 
         self.assertRaises(ValueError, diskfile.get_tmp_dir, 99)
 
+    def _xattr_file(self):
+        path = os.path.join(self.testdir, 'xattr_file')
+        with open(path, 'wb'):
+            pass
+        return path
+
+    def test_compact_metadata_round_trip(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'Content-Length': 123,
+                    'X-Timestamp': '1400000000.00000',
+                    'X-Object-Meta-Unicode': u'\u2603',
+                    'X-Object-Meta-Empty': ''}
+        diskfile.write_metadata(path, metadata, compact=True)
+        metastr = xattr.getxattr(path, diskfile.METADATA_KEY)
+        self.assertTrue(metastr.startswith(diskfile.COMPACT_METADATA_MAGIC))
+        read = diskfile.read_metadata(path)
+        self.assertEqual(metadata, read)
+        self.assertIsInstance(read['Content-Length'], int)
+        self.assertIsInstance(read['X-Object-Meta-Unicode'], six.text_type)
+        self.assertIsInstance(read['name'], str)
+
+        diskfile.write_metadata(path, {}, compact=True)
+        self.assertEqual({}, diskfile.read_metadata(path))
+
+    def test_compact_metadata_falls_back_to_pickle(self):
+        path = self._xattr_file()
+        for metadata in ({'float': 1.5}, {'bool': True},
+                         {'nul': 'a\x00b'}, {u'unicode-key': 'x'}):
+            diskfile.write_metadata(path, metadata, compact=True)
+            metastr = xattr.getxattr(path, diskfile.METADATA_KEY)
+            self.assertEqual(metadata, pickle.loads(metastr))
+            self.assertEqual(metadata, diskfile.read_metadata(path))
+
+    def test_read_metadata_pickle(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'X-Object-Meta-Big': 'x' * 300}
+        diskfile.write_metadata(path, metadata, xattr_size=100)
+        self.assertEqual(metadata, diskfile.read_metadata(path))
+
+    def test_read_metadata_pickle_one_getxattr(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'X-Object-Meta-Dot': 'ends with .'}
+        diskfile.write_metadata(path, metadata)
+        calls = []
+        orig_getxattr = xattr.getxattr
+
+        def counting_getxattr(fd, key):
+            calls.append(key)
+            return orig_getxattr(fd, key)
+
+        with mock.patch('xattr.getxattr', counting_getxattr):
+            self.assertEqual(metadata, diskfile.read_metadata(path))
+        self.assertEqual([diskfile.METADATA_KEY], calls)
+
+        # a chunk that happens to end with a '.' is not mistaken for the
+        # whole pickle
+        metastr = pickle.dumps(metadata, diskfile.PICKLE_PROTOCOL)
+        split = metastr.index('.') + 1
+        xattr.setxattr(path, diskfile.METADATA_KEY, metastr[:split])
+        xattr.setxattr(path, diskfile.METADATA_KEY + '1', metastr[split:])
+        del calls[:]
+        with mock.patch('xattr.getxattr', counting_getxattr):
+            self.assertEqual(metadata, diskfile.read_metadata(path))
+        self.assertEqual([diskfile.METADATA_KEY, diskfile.METADATA_KEY + '1',
+                          diskfile.METADATA_KEY + '2'], calls)
+
+    def test_compact_metadata_chunks(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'X-Object-Meta-Big': 'x' * 300}
+        diskfile.write_metadata(path, metadata, xattr_size=100,
+                                compact=True)
+        chunks = []
+        key = 0
+        while True:
+            try:
+                chunks.append(xattr.getxattr(path, '%s%s' % (
+                    diskfile.METADATA_KEY, key or '')))
+            except IOError:
+                break
+            key += 1
+        self.assertEqual(4, len(chunks))
+        # chunks are evened out, rather than leaving a short last one
+        self.assertTrue(max(len(c) for c in chunks) -
+                        min(len(c) for c in chunks) < len(chunks))
+        self.assertTrue(all(len(c) <= 100 for c in chunks))
+
+        calls = []
+        orig_getxattr = xattr.getxattr
+
+        def counting_getxattr(fd, key):
+            calls.append(key)
+            return orig_getxattr(fd, key)
+
+        with mock.patch('xattr.getxattr', counting_getxattr):
+            self.assertEqual(metadata, diskfile.read_metadata(path))
+        # no trailing getxattr() for a key that does not exist
+        self.assertEqual(4, len(calls))
+
+    def test_compact_metadata_missing_chunk(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'X-Object-Meta-Big': 'x' * 300}
+        diskfile.write_metadata(path, metadata, xattr_size=100,
+                                compact=True)
+        inode = os.stat(path).st_ino
+        del unit.xattr_data[inode]['%s3' % diskfile.METADATA_KEY]
+        with self.assertRaises(ValueError) as cm:
+            diskfile.read_metadata(path)
+        self.assertIn('missing xattr', str(cm.exception))
+
+    def test_compact_metadata_corrupt(self):
+        path = self._xattr_file()
+        diskfile.write_metadata(path, {'name': '/a/c/o'}, compact=True)
+        metastr = xattr.getxattr(path, diskfile.METADATA_KEY)
+        xattr.setxattr(path, diskfile.METADATA_KEY, metastr[:-1])
+        self.assertRaises(ValueError, diskfile.read_metadata, path)
+        header_len = len(diskfile.COMPACT_METADATA_MAGIC)
+        bad_version = metastr[:header_len] + b'\x09' + \
+            metastr[header_len + 1:]
+        xattr.setxattr(path, diskfile.METADATA_KEY, bad_version)
+        self.assertRaises(ValueError, diskfile.read_metadata, path)
+
+    def test_write_metadata_retries_smaller_xattrs(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'X-Object-Meta-Big': 'x' * 3000}
+        orig_setxattr = xattr.setxattr
+        sizes = []
+
+        def limited_setxattr(fd, key, value):
+            sizes.append(len(value))
+            if len(value) > 2048:
+                raise IOError(errno.E2BIG, 'Argument list too long')
+            return orig_setxattr(fd, key, value)
+
+        with mock.patch('xattr.setxattr', limited_setxattr):
+            diskfile.write_metadata(path, metadata, xattr_size=8192,
+                                    compact=True)
+        self.assertEqual(metadata, diskfile.read_metadata(path))
+        self.assertTrue(all(size <= 2048 for size in sizes[-2:]))
+
+    def test_migrate_metadata(self):
+        path = self._xattr_file()
+        metadata = {'name': '/a/c/o', 'Content-Length': 3}
+        diskfile.write_metadata(path, metadata)
+        self.assertTrue(diskfile.migrate_metadata(path))
+        metastr = xattr.getxattr(path, diskfile.METADATA_KEY)
+        self.assertTrue(metastr.startswith(diskfile.COMPACT_METADATA_MAGIC))
+        self.assertEqual(metadata, diskfile.read_metadata(path))
+        # already compact
+        self.assertFalse(diskfile.migrate_metadata(path))
+
+        # pickles spread over several xattrs are left alone
+        big = {'name': '/a/c/o', 'X-Object-Meta-Big': 'x' * 300}
+        diskfile.write_metadata(path, big, xattr_size=100)
+        self.assertFalse(diskfile.migrate_metadata(path))
+        self.assertEqual(big, diskfile.read_metadata(path))
+
+        # as is metadata the compact format cannot represent
+        diskfile.write_metadata(path, {'float': 1.5})
+        self.assertFalse(diskfile.migrate_metadata(path))
+
+        os.unlink(path)
+        self.assertRaises(DiskFileNotExist, diskfile.migrate_metadata, path)
+
     def test_pickle_async_update_tmp_dir(self):
         for policy in POLICIES:
             if int(policy) == 0:
@@ -524,6 +692,129 @@ class TestObjectAuditLocationGenerator(unittest.TestCase):
             gen.next()
             gen.next()
 
+    def test_verified_before(self):
+        with temptree([]) as tmpdir:
+            datadir = os.path.join(tmpdir, "sdf", "objects")
+            hashes = dict((name, md5(name).hexdigest())
+                          for name in ('a', 'b', 'c', 'd', 'gone'))
+            ts = Timestamp(1000).internal
+
+            def make_object(partition, name):
+                path = os.path.join(datadir, partition, hashes[name][-3:],
+                                    hashes[name])
+                os.makedirs(path)
+                with open(os.path.join(path, ts + '.data'), 'w'):
+                    pass
+                return path
+
+            paths = dict((name, make_object(partition, name))
+                         for name, partition in (('a', '1'), ('b', '1'),
+                                                 ('c', '1'), ('d', '2')))
+            data_files = dict((name, os.path.join(path, ts + '.data'))
+                              for name, path in paths.items())
+            part1 = os.path.join(datadir, '1')
+            write_pickle({hashes['a']: (ts, 100), hashes['gone']: (ts, 500)},
+                         os.path.join(part1, diskfile.VERIFIED_FILE))
+            diskfile.record_verified(data_files['b'], 300)
+            diskfile.record_verified(data_files['d'], 50)
+            diskfile.consolidate_verified(os.path.join(datadir, '2'))
+            self.assertEqual(100, diskfile.get_oldest_verified(part1))
+            self.assertEqual(0, diskfile.get_oldest_verified(
+                os.path.join(datadir, '3')))
+
+            # the partition with the oldest verification goes first, and in
+            # each partition the least recently verified objects
+            locations = [
+                loc.path for loc in diskfile.object_audit_location_generator(
+                    tmpdir, False, verified_before=200)]
+            self.assertEqual([paths['d'], paths['c'], paths['a']],
+                             locations)
+            # the journal has been consolidated, without the gone object
+            with open(os.path.join(part1, diskfile.VERIFIED_FILE),
+                      'rb') as fp:
+                self.assertEqual({hashes['a']: (ts, 100),
+                                  hashes['b']: (ts, 300)},
+                                 pickle.load(fp))
+            with open(os.path.join(part1,
+                                   diskfile.VERIFIED_JOURNAL_FILE)) as fp:
+                self.assertEqual('', fp.read())
+            diskfile.clear_auditor_status(tmpdir)
+
+            # a later verification wins, and junk in the journal is skipped
+            diskfile.record_verified(data_files['c'], 400)
+            diskfile.record_verified(data_files['a'], 20)
+            with open(os.path.join(part1, diskfile.VERIFIED_JOURNAL_FILE),
+                      'a') as fp:
+                fp.write('junk\n')
+            self.assertEqual(
+                {hashes['a']: (ts, 100), hashes['b']: (ts, 300),
+                 hashes['c']: (ts, 400)},
+                diskfile.consolidate_verified(part1))
+            locations = [
+                loc.path for loc in diskfile.object_audit_location_generator(
+                    tmpdir, False, verified_before=1000)]
+            self.assertEqual([paths['d'], paths['a'], paths['b'],
+                              paths['c']], locations)
+            diskfile.clear_auditor_status(tmpdir)
+
+            # a verification does not carry over to a newer .data
+            with open(os.path.join(paths['b'],
+                                   Timestamp(2000).internal + '.data'),
+                      'w'):
+                pass
+            locations = [
+                loc.path for loc in diskfile.object_audit_location_generator(
+                    tmpdir, False, verified_before=200)]
+            self.assertEqual([paths['d'], paths['b'], paths['a']],
+                             locations)
+
+    def test_audit_location_generator_consolidates_verified(self):
+        with temptree([]) as tmpdir:
+            part_path = os.path.join(tmpdir, "sdf", "objects", "1")
+            hashes = [md5(name).hexdigest() for name in ('a', 'b')]
+            for hsh in hashes:
+                os.makedirs(os.path.join(part_path, hsh[-3:], hsh))
+            diskfile.record_verified(
+                os.path.join(part_path, hashes[0][-3:], hashes[0],
+                             Timestamp(1000).internal + '.data'), 100)
+            diskfile.record_verified(
+                os.path.join(part_path, 'gon', 'gone',
+                             Timestamp(1000).internal + '.data'), 200)
+            locations = list(
+                diskfile.object_audit_location_generator(tmpdir, False))
+            self.assertEqual(2, len(locations))
+            # auditing without verified_before still empties the journal
+            with open(os.path.join(part_path,
+                                   diskfile.VERIFIED_JOURNAL_FILE)) as fp:
+                self.assertEqual('', fp.read())
+            with open(os.path.join(part_path, diskfile.VERIFIED_FILE),
+                      'rb') as fp:
+                self.assertEqual({hashes[0]: (Timestamp(1000).internal, 100)},
+                                 pickle.load(fp))
+
+    def test_record_verified_journal_size_limit(self):
+        with temptree([]) as tmpdir:
+            part_path = os.path.join(tmpdir, "sdf", "objects", "1")
+            hsh = md5('a').hexdigest()
+            os.makedirs(os.path.join(part_path, hsh[-3:], hsh))
+            data_file = os.path.join(part_path, hsh[-3:], hsh,
+                                     Timestamp(1000).internal + '.data')
+            entry = '%s %s 100\n' % (hsh, Timestamp(1000).internal)
+            # reads of a hot object stop adding to the journal once it is full
+            with mock.patch('swift.obj.diskfile.MAX_VERIFIED_JOURNAL_SIZE',
+                            len(entry) + 1):
+                for _ in range(3):
+                    diskfile.record_verified(data_file, 100)
+            with open(os.path.join(part_path,
+                                   diskfile.VERIFIED_JOURNAL_FILE)) as fp:
+                self.assertEqual(entry * 2, fp.read())
+            self.assertEqual({hsh: (Timestamp(1000).internal, 100)},
+                             diskfile.consolidate_verified(part_path))
+            # and take new entries once consolidated
+            diskfile.record_verified(data_file, 200)
+            self.assertEqual({hsh: (Timestamp(1000).internal, 200)},
+                             diskfile.consolidate_verified(part_path))
+
     def test_update_auditor_status_throttle(self):
         # If there are a lot of nearly empty partitions, the
         # update_auditor_status will write the status file many times a second,
@@ -580,6 +871,37 @@ class TestDiskFileRouter(unittest.TestCase):
                 manager = router[POLICIES.default]
                 self.assertTrue(isinstance(manager, TestDiskFileManager))
 
+    @patch_policies([StoragePolicy(0, 'zero', True),
+                     ECStoragePolicy(1, 'one', ec_type=DEFAULT_TEST_EC_TYPE,
+                                     ec_ndata=2, ec_nparity=1)])
+    def test_policies_share_device_threadpools(self):
+        devices = mkdtemp()
+        self.addCleanup(rmtree, devices)
+        for device in ('sda1', 'sdb1'):
+            mkdirs(os.path.join(devices, device))
+        conf = {'devices': devices, 'mount_check': 'false',
+                'threads_per_disk': '2', 'max_queue_depth_per_disk': '5'}
+        router = diskfile.DiskFileRouter(conf, debug_logger('test'))
+        self.assertIs(router[POLICIES[0]].threadpools,
+                      router[POLICIES[1]].threadpools)
+        repl_df = router[POLICIES[0]].get_diskfile(
+            'sda1', '0', 'a', 'c', 'o', policy=POLICIES[0])
+        ec_df = router[POLICIES[1]].get_diskfile(
+            'sda1', '0', 'a', 'c', 'o', policy=POLICIES[1], frag_index=0)
+        other_df = router[POLICIES[0]].get_diskfile(
+            'sdb1', '0', 'a', 'c', 'o', policy=POLICIES[0])
+        pools = [repl_df._threadpool, other_df._threadpool]
+        try:
+            # one pool of threads_per_disk threads and one queue depth limit
+            # per device, whatever the policies of the objects on it
+            self.assertIs(repl_df._threadpool, ec_df._threadpool)
+            self.assertIsNot(repl_df._threadpool, other_df._threadpool)
+            self.assertEqual(2, repl_df._threadpool.nthreads)
+            self.assertEqual(5, repl_df._threadpool.max_queue_depth)
+        finally:
+            for pool in pools:
+                pool.terminate()
+
 
 class BaseDiskFileTestMixin(object):
     """
@@ -2181,6 +2503,25 @@ class TestECDiskFileManager(DiskFileManagerMixin, unittest.TestCase):
         self.assertEqual("Invalid Timestamp value in filename 'junk'",
                          str(cm.exception))
 
+    def test_parse_on_disk_filename_data_fast_path(self):
+        # well-formed .data names are matched by a regex; the rest take the
+        # general path, and both must agree
+        mgr = self.df_router[POLICIES.default]
+        ts = Timestamp('1234567890.00001', offset=17)
+        for suffix, frag_index, durable in (('#3', 3, False),
+                                            ('#03#d', 3, True),
+                                            ('#+3', 3, False),
+                                            ('#3#d#junk', 3, True)):
+            fname = '%s%s.data' % (ts.internal, suffix)
+            self.assertEqual({'timestamp': ts, 'frag_index': frag_index,
+                              'ext': '.data', 'ctype_timestamp': None,
+                              'durable': durable},
+                             mgr.parse_on_disk_filename(fname))
+        with self.assertRaises(DiskFileError) as cm:
+            mgr.parse_on_disk_filename('junk#1.data')
+        self.assertEqual("Invalid Timestamp value in filename 'junk#1.data'",
+                         str(cm.exception))
+
     def test_make_on_disk_filename(self):
         mgr = self.df_router[POLICIES.default]
         for ts in (Timestamp('1234567890.00001'),
@@ -2791,6 +3132,7 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         """Tear down for testing swift.obj.diskfile"""
         rmtree(self.tmpdir, ignore_errors=1)
         tpool.execute = self._orig_tpool_exc
+        unit.xattr_data = {}
 
     def _create_ondisk_file(self, df, data, timestamp, metadata=None,
                             ctype_timestamp=None,
@@ -2915,6 +3257,213 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         df = self._simple_get_diskfile()
         self.assertRaises(DiskFileNotExist, df.open)
 
+    def test_threads_per_disk(self):
+        self.conf['threads_per_disk'] = '2'
+        self.conf['max_queue_depth_per_disk'] = '5'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df, data = self._create_test_file('1234567890' * 10)
+        df2 = self._simple_get_diskfile(obj='o2')
+        self.assertIs(df._threadpool, df2._threadpool)
+        self.assertEqual(2, df._threadpool.nthreads)
+        self.assertEqual(5, df._threadpool.max_queue_depth)
+        calls = []
+        orig_run_in_worker = df._threadpool._run_in_worker
+
+        def tracking_run_in_worker(func, args, kwargs):
+            calls.append(func)
+            return orig_run_in_worker(func, args, kwargs)
+
+        try:
+            with mock.patch.object(df._threadpool, '_run_in_worker',
+                                   tracking_run_in_worker):
+                with df.open():
+                    self.assertEqual(data, ''.join(df.reader()))
+            self.assertIn(os.listdir, calls)
+            self.assertTrue(len(calls) > 1)
+        finally:
+            df._threadpool.terminate()
+
+    def test_device_busy(self):
+        df, data = self._create_test_file('1234567890')
+        df = self._simple_get_diskfile()
+        with mock.patch('swift.obj.diskfile.ThreadPool.full', True):
+            self.assertRaises(DiskFileDeviceBusy, df.open)
+            with self.assertRaises(DiskFileDeviceBusy):
+                with df.create():
+                    pass
+        self.assertEqual(
+            2, self.logger.get_increment_counts().get('device_busy'))
+        with df.open():
+            self.assertEqual(data, ''.join(df.reader()))
+
+    def test_not_found_cache(self):
+        self.conf['not_found_cache_time'] = '10'
+        self.conf['not_found_cache_size'] = '2'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._simple_get_diskfile()
+        mgr = df.manager
+        with mock.patch('swift.obj.diskfile.os.listdir',
+                        side_effect=os.listdir) as mock_listdir:
+            self.assertRaises(DiskFileNotExist, df.open)
+            self.assertRaises(DiskFileNotExist, df.open)
+            self.assertRaises(DiskFileNotExist,
+                              self._simple_get_diskfile().open)
+        self.assertEqual(1, mock_listdir.call_count)
+        self.assertTrue(mgr.cached_not_found(df._datadir))
+
+        # entries expire
+        with mock.patch('swift.obj.diskfile.time.time',
+                        return_value=time() + 11):
+            self.assertFalse(mgr.cached_not_found(df._datadir))
+        self.assertNotIn(df._datadir, mgr._not_found)
+
+        # and are bounded in number
+        for obj in ('o1', 'o2', 'o3'):
+            self.assertRaises(DiskFileNotExist,
+                              self._simple_get_diskfile(obj=obj).open)
+        self.assertEqual(
+            [self._simple_get_diskfile(obj=obj)._datadir
+             for obj in ('o2', 'o3')], list(mgr._not_found))
+
+        # writing the object forgets it was missing
+        self.assertRaises(DiskFileNotExist,
+                          self._simple_get_diskfile(obj='o3').open)
+        df, data = self._create_test_file('1234567890', obj='o3')
+        self.assertFalse(mgr.cached_not_found(df._datadir))
+        df = self._simple_get_diskfile(obj='o3')
+        with df.open():
+            self.assertEqual(data, ''.join(df.reader()))
+
+    def test_not_found_cache_write_during_listing(self):
+        self.conf['not_found_cache_time'] = '10'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._simple_get_diskfile()
+        mgr = df.manager
+        written = []
+
+        def list_datadir(real_list_datadir=df._list_datadir):
+            files = real_list_datadir()
+            # a PUT creates the object while the GET is listing its
+            # (still missing) directory
+            written.append(self._create_test_file('1234567890')[1])
+            return files
+
+        with mock.patch.object(df, '_list_datadir', list_datadir):
+            self.assertRaises(DiskFileNotExist, df.open)
+        self.assertFalse(mgr.cached_not_found(df._datadir))
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual(written[0], ''.join(df.reader()))
+
+    def test_not_found_cache_disabled(self):
+        df = self._simple_get_diskfile()
+        with mock.patch('swift.obj.diskfile.os.listdir',
+                        side_effect=os.listdir) as mock_listdir:
+            self.assertRaises(DiskFileNotExist, df.open)
+            self.assertRaises(DiskFileNotExist, df.open)
+        self.assertEqual(2, mock_listdir.call_count)
+        self.assertFalse(df.manager._not_found)
+
+    def test_metadata_cache(self):
+        self.conf['metadata_cache_size'] = '2'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df, data = self._create_test_file('1234567890',
+                                          timestamp=self.ts().internal)
+        mgr = df.manager
+        old = time() - 10
+        os.utime(df._datadir, (old, old))
+        df = self._simple_get_diskfile()
+        with df.open():
+            metadata = df.get_metadata()
+        # _create_test_file's own open() missed, but the hash dir was too
+        # new to be cached then
+        self.assertEqual({'hits': 0, 'misses': 2, 'hit_ratio': 0.0,
+                          'size': 1}, mgr.metadata_cache_stats())
+
+        # a hit stats the hash dir but neither lists it nor reads xattrs;
+        # the data file is still opened unless the body won't be read
+        with mock.patch('swift.obj.diskfile.os.listdir') as mock_listdir, \
+                mock.patch('swift.obj.diskfile.read_metadata') as mock_read:
+            df = self._simple_get_diskfile()
+            with df.open():
+                self.assertEqual(metadata, df.get_metadata())
+                self.assertIsNotNone(df._fp)
+                # the open file survives the data file being cleaned up
+                os.rename(df._data_file, df._data_file + '.gone')
+                self.assertEqual(data, ''.join(df.reader()))
+                os.rename(df._data_file + '.gone', df._data_file)
+            os.utime(df._datadir, (old, old))
+            df = self._simple_get_diskfile()
+            self.assertEqual(metadata, df.read_metadata())
+            self.assertIsNone(df._fp)
+        self.assertFalse(mock_listdir.called)
+        self.assertFalse(mock_read.called)
+        self.assertEqual({'hits': 2, 'misses': 2, 'hit_ratio': 0.5,
+                          'size': 1}, mgr.metadata_cache_stats())
+        self.assertEqual(2, self.logger.get_increment_counts()[
+            'metadata_cache.hits'])
+
+        # without the body the data file is stat'ed, and opened by reader()
+        df = self._simple_get_diskfile()
+        with df.open(read_body=False):
+            self.assertIsNone(df._fp)
+            self.assertEqual(data, ''.join(df.reader()))
+        df = self._simple_get_diskfile()
+        with df.open(read_body=False):
+            os.rename(df._data_file, df._data_file + '.gone')
+            self.assertRaises(DiskFileNotExist, df.reader)
+            os.rename(df._data_file + '.gone', df._data_file)
+        os.utime(df._datadir, (old, old))
+        os.rename(df._data_file, df._data_file + '.gone')
+        os.utime(df._datadir, (old, old))
+        self.assertRaises(DiskFileNotExist,
+                          self._simple_get_diskfile().read_metadata)
+        os.rename(df._data_file + '.gone', df._data_file)
+        os.utime(df._datadir, (old, old))
+
+        # changes to the hash dir invalidate the entry, and recently
+        # modified hash dirs are not cached
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-Color': 'blue'})
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual('blue', df.get_metadata()['X-Object-Meta-Color'])
+        self.assertEqual(0, mgr.metadata_cache_stats()['size'])
+        os.utime(df._datadir, (old, old))
+        for i in range(2):
+            df = self._simple_get_diskfile()
+            with df.open():
+                self.assertEqual('blue',
+                                 df.get_metadata()['X-Object-Meta-Color'])
+        self.assertEqual({'hits': 6, 'misses': 4, 'hit_ratio': 0.6,
+                          'size': 1}, mgr.metadata_cache_stats())
+
+        # entries are bounded in number
+        for obj in ('o1', 'o2'):
+            df, _ = self._create_test_file('1234567890', obj=obj)
+            os.utime(df._datadir, (old, old))
+            with self._simple_get_diskfile(obj=obj).open():
+                pass
+        self.assertEqual(
+            [self._simple_get_diskfile(obj=obj)._datadir
+             for obj in ('o1', 'o2')], list(mgr._metadata_cache))
+
+        # the size of the data file is still checked without the body
+        df = self._simple_get_diskfile(obj='o2')
+        df.read_metadata()
+        with open(df._data_file, 'ab') as fp:
+            fp.write('extra')
+        self.assertRaises(DiskFileQuarantined,
+                          self._simple_get_diskfile(obj='o2').read_metadata)
+
+    def test_metadata_cache_disabled(self):
+        df, _ = self._create_test_file('1234567890')
+        with df.open():
+            self.assertIsNotNone(df._fp)
+        self.assertFalse(df.manager._metadata_cache)
+        self.assertEqual({'hits': 0, 'misses': 0, 'hit_ratio': 0.0,
+                          'size': 0}, df.manager.metadata_cache_stats())
+
     def test_open_expired(self):
         self.assertRaises(DiskFileExpired,
                           self._create_test_file,
@@ -3114,6 +3663,53 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         self.assertEqual(quarantine_msgs, [])
         self.assertTrue(reader._fp is None)
 
+    def test_track_verified(self):
+        def journaled(df):
+            journal = os.path.join(os.path.dirname(os.path.dirname(
+                df._datadir)), diskfile.VERIFIED_JOURNAL_FILE)
+            try:
+                with open(journal) as fp:
+                    return [line.split()[0] for line in fp]
+            except IOError:
+                return []
+
+        # nothing is recorded by default
+        df, df_data = self._create_test_file('1234567890')
+        self.assertEqual(''.join(df.reader()), df_data)
+        self.assertEqual([], journaled(df))
+
+        self.conf['track_verified'] = 'true'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        # putting data counts as verifying it...
+        df, df_data = self._create_test_file('1234567890', obj='o2')
+        hsh = os.path.basename(df._datadir)
+        self.assertEqual([hsh], journaled(df))
+        # along with the timestamp of the data verified
+        journal = os.path.join(os.path.dirname(os.path.dirname(
+            df._datadir)), diskfile.VERIFIED_JOURNAL_FILE)
+        with open(journal) as fp:
+            self.assertEqual(df.data_timestamp.internal,
+                             fp.read().split()[1])
+        # ...as does a full read, but not a partial one
+        reader = df.reader()
+        self.assertEqual(''.join(reader.app_iter_range(0, 5)), df_data[:5])
+        self.assertEqual([hsh], journaled(df))
+        df = self._simple_get_diskfile(obj='o2')
+        with df.open():
+            reader = df.reader()
+        self.assertEqual(''.join(reader), df_data)
+        self.assertEqual([hsh, hsh], journaled(df))
+        # nor does a read that finds the data corrupt
+        df, df_data = self._create_test_file(
+            '1234567890', obj='o3', metadata={'ETag': 'bad'})
+        quarantine_msgs = []
+        reader = df.reader(_quarantine_hook=quarantine_msgs.append)
+        self.assertEqual(''.join(reader), df_data)
+        self.assertEqual(1, len(quarantine_msgs))
+        self.assertEqual([os.path.basename(df._datadir)],
+                         [line for line in journaled(df)
+                          if line == os.path.basename(df._datadir)])
+
     def test_disk_file_app_iter_ranges(self):
         df, df_data = self._create_test_file('012345678911234567892123456789')
         quarantine_msgs = []
@@ -3523,7 +4119,7 @@ class DiskFileMixin(BaseDiskFileTestMixin):
 
         def bad_fstat(fd):
             invocations[0] += 1
-            if invocations[0] == 4:
+            if invocations[0] == 3:
                 # FIXME - yes, this an icky way to get code coverage ... worth
                 # it?
                 raise OSError()
@@ -3639,6 +4235,41 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         exp_name = '%s.meta' % timestamp
         self.assertIn(exp_name, set(dl))
 
+    def test_compact_metadata(self):
+        self.conf['compact_metadata'] = 'true'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df, df_data = self._create_test_file('1234567890',
+                                             timestamp=self.ts())
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-Test': 'data'})
+        dl = os.listdir(df._datadir)
+        self.assertEqual(2, len(dl))
+        for filename in dl:
+            metastr = xattr.getxattr(os.path.join(df._datadir, filename),
+                                     diskfile.METADATA_KEY)
+            self.assertTrue(
+                metastr.startswith(diskfile.COMPACT_METADATA_MAGIC))
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual('data', df.get_metadata()['X-Object-Meta-Test'])
+            self.assertEqual(df_data, ''.join(df.reader()))
+            # nothing left to migrate
+            self.assertEqual(0, df.migrate_metadata())
+
+    def test_migrate_metadata(self):
+        df, df_data = self._create_test_file('1234567890',
+                                             timestamp=self.ts())
+        df.write_metadata({'X-Timestamp': self.ts().internal,
+                           'X-Object-Meta-Test': 'data'})
+        df = self._simple_get_diskfile()
+        with df.open():
+            metadata = df.get_metadata()
+        self.assertEqual(2, df.migrate_metadata())
+        self.assertEqual(0, df.migrate_metadata())
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual(metadata, df.get_metadata())
+
     def test_write_metadata_with_content_type(self):
         # if metadata has content-type then its time should be in file name
         df, df_data = self._create_test_file('1234567890')
@@ -4468,6 +5099,83 @@ class DiskFileMixin(BaseDiskFileTestMixin):
             log_lines = df_mgr.logger.get_lines_for_level('warning')
             self.assertIn('MD5 sockets', log_lines[-1])
 
+    def test_kernel_md5_turns_off_when_md5_sockets_not_supported(self):
+        self.conf['kernel_md5'] = 'on'
+        with mock.patch('swift.common.utils.get_md5_socket') as mock_md5sock:
+            mock_md5sock.side_effect = IOError(
+                errno.EAFNOSUPPORT, "MD5 socket busted")
+            df = self._get_open_disk_file(fsize=128)
+        self.assertFalse(df.manager.use_kernel_md5)
+        reader = df.reader()
+        self.assertFalse(reader.can_zero_copy_hash())
+        log_lines = df.manager.logger.get_lines_for_level('warning')
+        self.assertIn('MD5 sockets', log_lines[-1])
+
+    def test_kernel_md5_used_by_reader(self):
+        self.conf['kernel_md5'] = 'on'
+        with mock.patch('swift.obj.diskfile.kernel_md5_available',
+                        return_value=True):
+            df = self._get_open_disk_file(fsize=128)
+        self.assertTrue(df.manager.use_kernel_md5)
+        calls = []
+
+        def fake_md5_hasher(use_kernel=False):
+            calls.append(use_kernel)
+            return md5()
+
+        quarantine_msgs = []
+        reader = df.reader(_quarantine_hook=quarantine_msgs.append)
+        with mock.patch('swift.obj.diskfile.md5_hasher', fake_md5_hasher):
+            for _ in reader:
+                pass
+        self.assertEqual(calls, [True])
+        self.assertEqual(quarantine_msgs, [])
+
+    def test_zero_copy_write(self):
+        if not splice.available:
+            raise SkipTest("splice support is missing")
+        df = self._simple_get_diskfile()
+        df._use_splice = True
+        df._pipe_size = 4096
+        data = os.urandom(10000)
+        rsock, wsock = socket.socketpair()
+        wsock.sendall(data)
+        wsock.close()
+        hasher = FakeKernelMD5()
+        sizes = []
+        timestamp = Timestamp(time())
+        with mock.patch('swift.obj.diskfile.fdatasync') as mock_fdatasync, \
+                df.create() as writer:
+            writer._bytes_per_sync = 4096
+            self.assertTrue(writer.can_zero_copy_write())
+            size = writer.write(data[:100])
+            hasher.update(data[:100])
+            while True:
+                new_size = writer.zero_copy_write(
+                    rsock.fileno(), 10000, hasher)
+                if new_size == size:
+                    break  # EOF
+                sizes.append(new_size)
+                size = new_size
+            self.assertIsNotNone(writer._pipes)
+            writer.put({'ETag': hasher.hexdigest(),
+                        'X-Timestamp': timestamp.internal,
+                        'Content-Length': str(size)})
+            writer.commit(timestamp)
+        rsock.close()
+        self.assertIsNone(writer._pipes)
+        self.assertEqual(sizes[-1], 10100)
+        self.assertTrue(all(0 < b - a <= 4096
+                            for a, b in zip([100] + sizes, sizes)))
+        self.assertEqual(len(mock_fdatasync.mock_calls), 2)
+
+        df = self._simple_get_diskfile()
+        with df.open():
+            with open(df._data_file, 'rb') as fp:
+                self.assertEqual(fp.read(), data[:100] + data)
+            self.assertEqual(df.get_metadata()['ETag'],
+                             md5(data[:100] + data).hexdigest())
+
     def test_tee_to_md5_pipe_length_mismatch(self):
         if not self._system_can_zero_copy():
             raise SkipTest("zero-copy support is missing")
@@ -4718,12 +5426,52 @@ class TestDiskFile(DiskFileMixin, unittest.TestCase):
 
     mgr_cls = diskfile.DiskFileManager
 
+    def _zero_copy_hash(self, **kwargs):
+        if not splice.available:
+            raise SkipTest("splice support is missing")
+
+        self.conf['kernel_md5'] = 'on'
+        with mock.patch('swift.obj.diskfile.kernel_md5_available',
+                        return_value=True):
+            df = self._get_open_disk_file(fsize=16385, csize=4096, **kwargs)
+        data_size = os.path.getsize(df._data_file)
+        quarantine_msgs = []
+        reader = df.reader(_quarantine_hook=quarantine_msgs.append)
+        self.assertTrue(reader.can_zero_copy_hash())
+        progress = []
+        with mock.patch('swift.obj.diskfile.KernelMD5', FakeKernelMD5):
+            reader.zero_copy_hash(progress.append)
+        self.assertIsNone(reader._fp)
+        self.assertEqual(sum(progress), data_size)
+        self.assertTrue(all(0 < count <= 4096 for count in progress))
+        return quarantine_msgs
+
+    def test_zero_copy_hash(self):
+        self.assertEqual(self._zero_copy_hash(), [])
+
+    def test_zero_copy_hash_quarantines(self):
+        quarantine_msgs = self._zero_copy_hash(invalid_type='ETag')
+        self.assertEqual(len(quarantine_msgs), 1)
+        self.assertIn('do not match', quarantine_msgs[0])
+
 
 @patch_policies(with_ec_default=True)
 class TestECDiskFile(DiskFileMixin, unittest.TestCase):
 
     mgr_cls = diskfile.ECDiskFileManager
 
+    def test_no_zero_copy_hash(self):
+        self.conf['kernel_md5'] = 'on'
+        with mock.patch('swift.obj.diskfile.kernel_md5_available',
+                        return_value=True), \
+                mock.patch('swift.obj.diskfile.splice') as mock_splice:
+            mock_splice.available = True
+            df = self._get_open_disk_file(fsize=16385, csize=4096)
+            df._pipe_size = 4096
+            # fragments are checked as they are read, which needs the data
+            # in userspace
+            self.assertFalse(df.reader().can_zero_copy_hash())
+
     def _test_commit_raises_DiskFileError_for_rename_error(self, fake_err):
         df = self._simple_get_diskfile(account='a', container='c',
                                        obj='o_rename_err',
@@ -7281,6 +8029,146 @@ class TestSuffixHashes(unittest.TestCase):
                 mtime + 4,  # not modifed
             ])
 
+    # get_bucket_hashes tests
+
+    def _make_objects(self, df_mgr, policy, count=8):
+        # returns a dict of suffix -> list of diskfiles in that suffix, with
+        # count objects in each of two suffixes
+        names = defaultdict(list)
+        for i in itertools.count():
+            name = 'o%d' % i
+            suffix = hash_path('a', 'c', name)[-3:]
+            if len(names) < 2 or suffix in names:
+                names[suffix].append(name)
+            if all(len(n) >= count for n in names.values()):
+                break
+        diskfiles = defaultdict(list)
+        for name in itertools.chain(*names.values()):
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     name, policy=policy, frag_index=2)
+            timestamp = self.ts()
+            with df.create() as writer:
+                writer.write('x')
+                writer.put({'X-Timestamp': timestamp.internal,
+                            'Content-Length': '1',
+                            'ETag': md5('x').hexdigest()})
+                writer.commit(timestamp)
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            diskfiles[suffix].append(df)
+        return diskfiles
+
+    def test_get_bucket_hashes(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            diskfiles = self._make_objects(df_mgr, policy)
+            suffixes = sorted(diskfiles)
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            buckets = df_mgr.get_bucket_hashes(
+                self.existing_device, '0', suffixes + ['fff'], policy)
+            self.assertEqual({}, buckets.pop('fff'))
+            self.assertEqual(sorted(buckets), suffixes)
+            part_path = os.path.join(self.devices, self.existing_device,
+                                     diskfile.get_data_dir(policy), '0')
+            for suffix, suffix_buckets in buckets.items():
+                self.assertEqual(
+                    set(suffix_buckets),
+                    set(diskfile.get_hash_bucket(os.path.basename(df._datadir))
+                        for df in diskfiles[suffix]))
+                # computing the buckets does not change the suffix hash
+                suffix_hash, _junk = df_mgr._hash_suffix_buckets(
+                    os.path.join(part_path, suffix), df_mgr.reclaim_age)
+                self.assertEqual(hashes[suffix], suffix_hash)
+                if policy.policy_type == REPL_POLICY:
+                    # each bucket is hashed just as its suffix would be
+                    for bucket, bucket_hash in suffix_buckets.items():
+                        expected = md5()
+                        for hsh in sorted(os.listdir(
+                                os.path.join(part_path, suffix))):
+                            if diskfile.get_hash_bucket(hsh) == bucket:
+                                expected.update(os.listdir(os.path.join(
+                                    part_path, suffix, hsh))[0])
+                        self.assertEqual(expected.hexdigest(), bucket_hash)
+            self.assertTrue(os.path.exists(
+                os.path.join(part_path, diskfile.BUCKETS_FILE)))
+
+    def test_get_bucket_hashes_cached_until_suffix_changes(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            diskfiles = self._make_objects(df_mgr, policy)
+            suffixes = sorted(diskfiles)
+            buckets = df_mgr.get_bucket_hashes(
+                self.existing_device, '0', suffixes, policy)
+            with mock.patch.object(df_mgr, '_hash_suffix_buckets') as mocked:
+                self.assertEqual(buckets, df_mgr.get_bucket_hashes(
+                    self.existing_device, '0', suffixes, policy))
+            self.assertFalse(mocked.called)
+            # a newer tombstone changes one bucket of one suffix
+            suffix = suffixes[0]
+            df = diskfiles[suffix][0]
+            df.delete(self.ts())
+            calls = []
+            orig_hash_suffix_buckets = df_mgr._hash_suffix_buckets
+
+            def mock_hash_suffix_buckets(path, reclaim_age):
+                calls.append(os.path.basename(path))
+                return orig_hash_suffix_buckets(path, reclaim_age)
+
+            with mock.patch.object(df_mgr, '_hash_suffix_buckets',
+                                   mock_hash_suffix_buckets):
+                new_buckets = df_mgr.get_bucket_hashes(
+                    self.existing_device, '0', suffixes, policy)
+            self.assertEqual([suffix], calls)
+            bucket = diskfile.get_hash_bucket(os.path.basename(df._datadir))
+            for other in suffixes[1:]:
+                self.assertEqual(buckets[other], new_buckets[other])
+            self.assertNotEqual(buckets[suffix][bucket],
+                                new_buckets[suffix][bucket])
+            del buckets[suffix][bucket]
+            del new_buckets[suffix][bucket]
+            self.assertEqual(buckets[suffix], new_buckets[suffix])
+
+    def test_get_bucket_hashes_no_partition(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            self.assertEqual({'abc': {}}, df_mgr.get_bucket_hashes(
+                self.existing_device, '0', ['abc'], policy))
+            self.assertRaises(
+                DiskFileDeviceUnavailable, df_mgr.get_bucket_hashes,
+                'sdz1', '0', ['abc'], policy)
+
+    def test_yield_hashes_buckets(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            diskfiles = self._make_objects(df_mgr, policy)
+            suffix = max(diskfiles, key=lambda s: len(diskfiles[s]))
+            hashes = dict((os.path.basename(df._datadir), df)
+                          for df in diskfiles[suffix])
+            wanted = diskfile.get_hash_bucket(sorted(hashes)[0])
+            listed = []
+            orig_listdir = os.listdir
+
+            def mock_listdir(path):
+                listed.append(path)
+                return orig_listdir(path)
+
+            with mock.patch('os.listdir', mock_listdir):
+                found = [object_hash for _junk, object_hash, _junk in
+                         df_mgr.yield_hashes(
+                             self.existing_device, '0', policy, [suffix],
+                             buckets={suffix: set([wanted])},
+                             frag_index=2)]
+            expected = [object_hash for object_hash in hashes
+                        if diskfile.get_hash_bucket(object_hash) == wanted]
+            self.assertEqual(sorted(expected), sorted(found))
+            # object dirs in other buckets are not even listed
+            self.assertEqual(len(expected) + 1, len(listed))
+            # suffixes not in buckets are searched in full
+            found = [object_hash for _junk, object_hash, _junk in
+                     df_mgr.yield_hashes(
+                         self.existing_device, '0', policy, [suffix],
+                         buckets={}, frag_index=2)]
+            self.assertEqual(len(diskfiles[suffix]), len(found))
+
 
 if __name__ == '__main__':
     unittest.main()
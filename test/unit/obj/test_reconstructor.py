@@ -25,8 +25,9 @@ import shutil
 import re
 import random
 import struct
-from eventlet import Timeout, sleep
+from eventlet import GreenPool, Timeout, sleep
 
+from collections import defaultdict
 from contextlib import closing, contextmanager
 from gzip import GzipFile
 from shutil import rmtree
@@ -37,7 +38,7 @@ from swift.obj import diskfile, reconstructor as object_reconstructor
 from swift.common import ring
 from swift.common.storage_policy import (StoragePolicy, ECStoragePolicy,
                                          POLICIES, EC_POLICY)
-from swift.obj.reconstructor import REVERT
+from swift.obj.reconstructor import REVERT, SYNC
 
 from test.unit import (patch_policies, debug_logger, mocked_http_conn,
                        FabricatedRing, make_timestamp_iter,
@@ -1113,6 +1114,116 @@ class TestGlobalSetupObjectReconstructorLegacyDurable(
     legacy_durable = True
 
 
+class TestRebuildPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'plan.pkl')
+        self.logger = debug_logger()
+
+    def tearDown(self):
+        rmtree(self.tmpdir, ignore_errors=1)
+
+    def _job(self, partition, job_type=SYNC, device='sda'):
+        return {'policy': POLICIES.default, 'device': device,
+                'partition': partition, 'job_type': job_type}
+
+    def _planned(self, planner, jobs, **kwargs):
+        planner.plan(jobs, **kwargs)
+        return [(job['partition'], job['job_type']) for job in jobs]
+
+    def test_plan_order(self):
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        jobs = [self._job(0), self._job(1), self._job(2),
+                self._job(2, job_type=REVERT)]
+        self.assertEqual([(2, REVERT), (0, SYNC), (1, SYNC), (2, SYNC)],
+                         self._planned(planner, jobs))
+        self.assertEqual({'handoff': 1, 'degraded': 0, 'normal': 3},
+                         planner.pending)
+        # the worst degraded partitions follow the handoffs
+        planner.rebuilt(jobs[1])
+        planner.done(jobs[1], failed=1)
+        planner.rebuilt(jobs[2])
+        planner.rebuilt(jobs[2])
+        planner.done(jobs[2], failed=1)
+        planner.done(jobs[3], failed=2)
+        planner.done(jobs[0])
+        self.assertEqual({'handoff': 0, 'degraded': 0, 'normal': 0},
+                         planner.pending)
+        self.assertEqual(
+            {'%d/sda/0' % int(POLICIES.default): {'failed': 1, 'rebuilt': 1},
+             '%d/sda/1' % int(POLICIES.default): {'failed': 1, 'rebuilt': 2},
+             '%d/sda/2' % int(POLICIES.default): {'failed': 2, 'rebuilt': 0}},
+            planner.entries)
+        jobs = [self._job(0), self._job(1), self._job(2), self._job(3),
+                self._job(4, job_type=REVERT)]
+        self.assertEqual([(4, REVERT), (2, SYNC), (1, SYNC), (0, SYNC),
+                          (3, SYNC)], self._planned(planner, jobs))
+        self.assertEqual({'handoff': 1, 'degraded': 3, 'normal': 1},
+                         planner.pending)
+        # a partition is no longer degraded once its sync succeeds
+        planner.done(jobs[1])
+        self.assertEqual(
+            {'handoff': 1, 'degraded': 2, 'normal': 1},
+            planner.pending)
+        self.assertEqual([(4, REVERT), (1, SYNC), (0, SYNC), (2, SYNC),
+                          (3, SYNC)], self._planned(planner, jobs))
+
+    def test_prune(self):
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        jobs = [self._job(0), self._job(1)]
+        planner.plan(jobs)
+        for job in jobs:
+            planner.done(job, failed=1)
+        self.assertEqual(2, len(planner.entries))
+        # a partial pass keeps what it did not see
+        planner.plan([self._job(1)])
+        self.assertEqual(2, len(planner.entries))
+        planner.plan([self._job(1), self._job(0, job_type=REVERT)],
+                     prune=True)
+        self.assertEqual(['%d/sda/1' % int(POLICIES.default)],
+                         list(planner.entries))
+
+    def test_stats(self):
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        jobs = [self._job(0), self._job(1), self._job(2, job_type=REVERT)]
+        planner.plan(jobs)
+        planner.done(jobs[1], failed=1)
+        self.assertEqual({'handoff': 1, 'degraded': 0, 'normal': 1,
+                          'degraded_partitions': 1,
+                          'time_to_redundancy': None, 'updated': 100},
+                         planner.stats(None, 4, now=100))
+        planner.plan(jobs)
+        self.assertEqual({'handoff': 1, 'degraded': 1, 'normal': 1,
+                          'degraded_partitions': 1,
+                          'time_to_redundancy': 5.0, 'updated': 101},
+                         planner.stats(10.0, 4, now=101))
+
+    def test_save_and_load(self):
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        job = self._job(7)
+        planner.plan([job])
+        planner.rebuilt(job)
+        planner.done(job, failed=1)
+        planner.save()
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        self.assertEqual(
+            {'%d/sda/7' % int(POLICIES.default): {'failed': 1, 'rebuilt': 1}},
+            planner.entries)
+        # a corrupt file is logged and forgotten
+        with open(self.path, 'wb') as fp:
+            fp.write(b'garbage')
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        self.assertEqual({}, planner.entries)
+        self.assertTrue(self.logger.get_lines_for_level('error'))
+        # a missing file is not an error
+        self.logger.clear()
+        os.unlink(self.path)
+        planner = object_reconstructor.RebuildPlanner(self.path, self.logger)
+        self.assertEqual({}, planner.entries)
+        self.assertFalse(self.logger.get_lines_for_level('error'))
+
+
 @patch_policies(with_ec_default=True)
 class TestObjectReconstructor(unittest.TestCase):
 
@@ -2883,6 +2994,190 @@ class TestObjectReconstructor(unittest.TestCase):
             self.assertEqual(md5(fixed_body).hexdigest(),
                              md5(broken_body).hexdigest())
 
+    def _rebuild_broken_body(self, job):
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        metadata = {
+            'name': '/a/c/o',
+            'Content-Length': 0,
+            'ETag': 'etag',
+            'X-Timestamp': '1234567890.12345'
+        }
+        test_data = ('rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = make_ec_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies.pop(1)
+        responses = []
+        for body in ec_archive_bodies:
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+        codes, body_iter, headers = zip(*responses)
+        with mocked_http_conn(*codes, body_iter=body_iter, headers=headers):
+            df = self.reconstructor.reconstruct_fa(job, node, metadata)
+            fixed_body = ''.join(df.reader())
+        return broken_body, fixed_body
+
+    def test_reconstruct_fa_rebuild_threads(self):
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+        }
+        orig_reconstruct = self.reconstructor._reconstruct
+        for conf in ({'rebuild_threads': '2', 'rebuild_batch_size': '3'},
+                     {'rebuild_threads': '2', 'rebuild_batch_size': '3',
+                      'rebuild_prefetch': '1'},
+                     {'rebuild_batch_size': '100', 'rebuild_prefetch': '2'}):
+            self._configure_reconstructor(**conf)
+            with mock.patch.object(
+                    self.reconstructor._rebuild_pool, 'run_in_thread',
+                    wraps=self.reconstructor._rebuild_pool.run_in_thread), \
+                    mock.patch.object(self.reconstructor, '_reconstruct',
+                                      side_effect=orig_reconstruct):
+                broken_body, fixed_body = self._rebuild_broken_body(job)
+                run_in_thread = self.reconstructor._rebuild_pool.run_in_thread
+                self.assertEqual(md5(fixed_body).hexdigest(),
+                                 md5(broken_body).hexdigest())
+                self.assertEqual(self.reconstructor._reconstruct.call_count,
+                                 7)
+                # the 7 segments are decoded in batches
+                batch_size = int(conf['rebuild_batch_size'])
+                self.assertEqual(
+                    [len(c[0][1]) for c in run_in_thread.call_args_list],
+                    [batch_size] * (7 // batch_size) +
+                    ([7 % batch_size] if 7 % batch_size else []))
+            self.reconstructor._rebuild_pool.terminate()
+
+    def test_reconstruct_fa_rebuild_prefetch_error(self):
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+        }
+        self._configure_reconstructor(rebuild_prefetch='2')
+        with mock.patch.object(self.reconstructor, '_reconstruct',
+                               side_effect=Exception('kaboom')):
+            self.assertRaises(Exception, self._rebuild_broken_body, job)
+
+    def test_throttle_rebuild(self):
+        self._configure_reconstructor(rebuild_bytes_per_second='1000')
+        sleeps = []
+        with mock.patch('swift.obj.reconstructor.time.time',
+                        return_value=100.0), \
+                mock.patch('swift.obj.reconstructor.sleep',
+                           side_effect=sleeps.append):
+            self.reconstructor._throttle_rebuild('sda', 500)
+            self.reconstructor._throttle_rebuild('sda', 500)
+            self.reconstructor._throttle_rebuild('sdb', 500)
+            self.reconstructor._throttle_rebuild('sda', 2000)
+            self.reconstructor._throttle_rebuild(None, 2000)
+        self.assertEqual(sleeps, [0.5, 1.0])
+        self.assertEqual(self.reconstructor._rebuild_next_time,
+                         {'sda': 103.0, 'sdb': 100.5})
+        # not throttled by default
+        self._configure_reconstructor(rebuild_bytes_per_second='0')
+        with mock.patch('swift.obj.reconstructor.sleep') as mock_sleep:
+            self.reconstructor._throttle_rebuild('sda', 10 ** 9)
+        self.assertFalse(mock_sleep.called)
+
+    def test_reconstruct_fa_rebuild_throttled(self):
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+            'device': 'sda',
+        }
+        self._configure_reconstructor(rebuild_bytes_per_second='1000')
+        with mock.patch.object(self.reconstructor,
+                               '_throttle_rebuild') as mock_throttle:
+            broken_body, fixed_body = self._rebuild_broken_body(job)
+        self.assertEqual(fixed_body, broken_body)
+        self.assertEqual([c[0][0] for c in mock_throttle.call_args_list],
+                         ['sda'] * 7)
+        self.assertEqual(sum(c[0][1] for c in mock_throttle.call_args_list),
+                         len(broken_body))
+
+    def _planned_jobs(self):
+        jobs = []
+        for device in ('sda', 'sdb'):
+            for part in range(3):
+                jobs.append({'policy': self.policy, 'device': device,
+                             'partition': part, 'job_type': SYNC})
+        return jobs
+
+    def test_run_planned_jobs_per_device_limit(self):
+        self._configure_reconstructor(max_jobs_per_device='1')
+        self.reconstructor.run_pool = GreenPool(size=4)
+        started = []
+        running = defaultdict(int)
+        most_running = defaultdict(int)
+
+        def process_job(job):
+            started.append((job['device'], job['partition']))
+            running[job['device']] += 1
+            most_running[job['device']] = max(most_running[job['device']],
+                                              running[job['device']])
+            sleep(0.001)
+            running[job['device']] -= 1
+
+        self.reconstructor.process_job = process_job
+        self.assertTrue(
+            self.reconstructor.run_planned_jobs(self._planned_jobs()))
+        self.reconstructor.run_pool.waitall()
+        self.assertEqual({'sda': 1, 'sdb': 1}, most_running)
+        # the busy device's jobs are passed over, not reordered
+        self.assertEqual([('sda', 0), ('sdb', 0)], started[:2])
+        self.assertEqual([0, 1, 2],
+                         [part for dev, part in started if dev == 'sda'])
+        self.assertEqual(6, len(started))
+
+    def test_run_planned_jobs_ring_change(self):
+        self.reconstructor.run_pool = GreenPool(size=4)
+        self.reconstructor.process_job = mock.MagicMock()
+        with mock.patch.object(self.reconstructor, 'check_ring',
+                               side_effect=[True, False]):
+            self.assertFalse(
+                self.reconstructor.run_planned_jobs(self._planned_jobs()))
+        self.reconstructor.run_pool.waitall()
+        self.assertEqual(1, self.reconstructor.process_job.call_count)
+
+    def test_reconstruct_priority_queue(self):
+        self._configure_reconstructor(priority_queue='yes',
+                                      recon_cache_path=self.testdir)
+        planner = self.reconstructor.rebuild_planner
+        jobs = self._planned_jobs()
+        planner.entries[planner.key(jobs[2])] = {'failed': 1, 'rebuilt': 1}
+        revert = dict(jobs[4], job_type=REVERT)
+        processed = []
+
+        def process_job(job):
+            processed.append((job['device'], job['partition'],
+                              job['job_type']))
+            self.reconstructor.partition_times.append(2.0)
+            planner.done(job)
+
+        part_infos = [{'policy': self.policy, 'part_path': 'p%d' % i}
+                      for i in range(2)]
+        self.reconstructor.process_job = process_job
+        with mock.patch.object(self.reconstructor, 'collect_parts',
+                               return_value=part_infos), \
+                mock.patch.object(self.reconstructor,
+                                  'build_reconstruction_jobs',
+                                  side_effect=[jobs[:3], jobs[3:] + [revert]]):
+            self.reconstructor.reconstruct()
+        self.assertEqual([('sdb', 1, REVERT), ('sda', 2, SYNC),
+                          ('sda', 0, SYNC), ('sda', 1, SYNC),
+                          ('sdb', 0, SYNC), ('sdb', 1, SYNC),
+                          ('sdb', 2, SYNC)], processed)
+        self.assertEqual({}, planner.entries)
+        self.assertEqual(2.0, self.reconstructor._last_job_time)
+        with open(self.reconstructor.rcache) as f:
+            plan_stats = json.load(f)['object_reconstruction_plan']
+        self.assertEqual({'handoff': 0, 'degraded': 0, 'normal': 0,
+                          'degraded_partitions': 0,
+                          'time_to_redundancy': 0.0},
+                         dict((k, v) for k, v in plan_stats.items()
+                              if k != 'updated'))
+        self.assertTrue(os.path.exists(planner.path))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import unittest
 import os
 import mock
@@ -25,6 +26,7 @@ from contextlib import contextmanager, closing
 from collections import defaultdict
 from errno import ENOENT, ENOTEMPTY, ENOTDIR
 
+import eventlet
 from eventlet.green import subprocess
 from eventlet import Timeout, tpool
 
@@ -173,6 +175,159 @@ def _create_test_rings(path, devs=None):
     return
 
 
+@patch_policies([StoragePolicy(0, 'zero', False),
+                StoragePolicy(1, 'one', True)])
+class TestReplicationQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'queue.pkl')
+        self.logger = debug_logger()
+
+    def tearDown(self):
+        rmtree(self.tmpdir, ignore_errors=1)
+
+    def _job(self, partition, nodes=(1, 2), delete=False, policy=0):
+        return {'policy': POLICIES[policy], 'device': 'sda',
+                'partition': partition, 'delete': delete,
+                'nodes': [{'id': node_id} for node_id in nodes]}
+
+    def _sorted(self, queue, jobs, now, **kwargs):
+        queue.sort(jobs, now=now, **kwargs)
+        return [job['partition'] for job in jobs]
+
+    def test_priorities(self):
+        queue = object_replicator.ReplicationQueue(self.path, 0, self.logger)
+        jobs = [self._job(str(part)) for part in range(4)]
+        self.assertEqual(['0', '1', '2', '3'],
+                         self._sorted(queue, jobs, 100))
+        # handoff first, then failed, then moved primaries, then the rest
+        queue.done(jobs[3], failed=True, now=101)
+        jobs = [self._job('0'), self._job('1', nodes=(1, 3)),
+                self._job('2', nodes=(1, 2, 3), delete=True), self._job('3')]
+        self.assertEqual(['2', '3', '1', '0'],
+                         self._sorted(queue, jobs, 102))
+        self.assertEqual({'handoff': 1, 'failed': 1, 'moved': 1, 'normal': 1,
+                          'aged': 0, 'oldest': 2, 'updated': 102},
+                         queue.stats(now=102))
+        # success puts a partition back in line, a removed handoff is gone
+        for job in jobs:
+            queue.done(job, removed=job['delete'], now=103)
+        jobs = [job for job in jobs if not job['delete']]
+        self.assertEqual(['3', '1', '0'], self._sorted(queue, jobs, 104))
+        self.assertEqual({'handoff': 0, 'failed': 0, 'moved': 0, 'normal': 3,
+                          'aged': 0, 'oldest': 1, 'updated': 104},
+                         queue.stats(now=104))
+
+    def test_handoff_keeps_priority_until_removed(self):
+        queue = object_replicator.ReplicationQueue(self.path, 0, self.logger)
+        jobs = [self._job('0'), self._job('1', nodes=(1, 2, 3), delete=True)]
+        self.assertEqual(['1', '0'], self._sorted(queue, jobs, 100))
+        queue.done(jobs[1], now=101)
+        self.assertEqual(['1', '0'], self._sorted(queue, jobs, 102))
+        # a handoff that becomes a primary again has moved
+        jobs = [self._job('0'), self._job('1', nodes=(2, 3))]
+        queue.sort(jobs, now=103)
+        self.assertEqual(queue.MOVED, queue.entries['0/sda/1']['priority'])
+
+    def test_aging(self):
+        queue = object_replicator.ReplicationQueue(self.path, 10, self.logger)
+        job0, job1 = jobs = [self._job('0'), self._job('1')]
+        queue.sort(jobs, now=100)
+        queue.done(job1, failed=True, now=100)
+        queue.done(job0, now=100)
+        self.assertEqual(['1', '0'], self._sorted(queue, jobs, 105))
+        # partition 0 has waited long enough to overtake the failed one
+        queue.done(job1, now=125)
+        queue.done(job1, failed=True, now=126)
+        self.assertEqual(['0', '1'], self._sorted(queue, jobs, 130))
+        self.assertEqual(1, queue.stats(now=130)['aged'])
+
+    def test_prune(self):
+        queue = object_replicator.ReplicationQueue(self.path, 0, self.logger)
+        queue.sort([self._job('0'), self._job('1')], now=100)
+        queue.sort([self._job('0')], now=101)
+        self.assertEqual(['0/sda/0', '0/sda/1'], sorted(queue.entries))
+        queue.sort([self._job('0')], prune=True, now=102)
+        self.assertEqual(['0/sda/0'], sorted(queue.entries))
+
+    def test_save_and_load(self):
+        queue = object_replicator.ReplicationQueue(self.path, 0, self.logger)
+        self.assertEqual({}, queue.entries)
+        jobs = [self._job('0'), self._job('1', policy=1)]
+        queue.sort(jobs, now=100)
+        queue.done(jobs[1], failed=True)
+        queue.save()
+        queue = object_replicator.ReplicationQueue(self.path, 0, self.logger)
+        self.assertEqual(
+            {'0/sda/0': {'priority': queue.NORMAL, 'last': 100,
+                         'nodes': [1, 2]},
+             '1/sda/1': {'priority': queue.FAILED, 'last': 100,
+                         'nodes': [1, 2]}}, queue.entries)
+        self.assertEqual([], self.logger.get_lines_for_level('error'))
+
+    def test_load_bad_file(self):
+        with open(self.path, 'wb') as fp:
+            fp.write('not a pickle')
+        queue = object_replicator.ReplicationQueue(self.path, 0, self.logger)
+        self.assertEqual({}, queue.entries)
+        self.assertEqual(
+            ['Error loading replication queue %s: ' % self.path],
+            self.logger.get_lines_for_level('error'))
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    def _run_window(self, limiter, done, now):
+        limiter.acquire()
+        limiter.release(done, now=now)
+        return limiter.limit
+
+    def test_hill_climbing(self):
+        limiter = object_replicator.AdaptiveConcurrency(3, interval=10)
+        limiter.window_start = 0
+        # within an interval the limit is left alone
+        self.assertEqual(1, self._run_window(limiter, 5, 5))
+        # the limit goes up while the rate holds up...
+        self.assertEqual(2, self._run_window(limiter, 5, 10))
+        self.assertEqual(3, self._run_window(limiter, 20, 20))
+        # ... turns round at the maximum ...
+        self.assertEqual(2, self._run_window(limiter, 30, 30))
+        # ... and turns round again when the rate drops
+        self.assertEqual(3, self._run_window(limiter, 10, 40))
+        self.assertEqual(2, self._run_window(limiter, 20, 50))
+        self.assertEqual(1, self._run_window(limiter, 20, 60))
+        self.assertEqual(2, self._run_window(limiter, 20, 70))
+
+    def test_failure_halves_limit(self):
+        limiter = object_replicator.AdaptiveConcurrency(8, interval=10)
+        limiter.limit = 6
+        limiter.step = -1
+        limiter.acquire()
+        limiter.release(success=False, now=limiter.window_start)
+        self.assertEqual(3, limiter.limit)
+        self.assertEqual(1, limiter.step)
+        self.assertEqual(0, limiter.done)
+
+    def test_acquire_waits(self):
+        limiter = object_replicator.AdaptiveConcurrency(2)
+        limiter.acquire()
+        order = []
+
+        def waiter():
+            limiter.acquire()
+            order.append('acquired')
+
+        thread = eventlet.spawn(waiter)
+        eventlet.sleep(0)
+        self.assertEqual([], order)
+        order.append('released')
+        limiter.release()
+        thread.wait()
+        self.assertEqual(['released', 'acquired'], order)
+        self.assertEqual(1, limiter.active)
+
+
 @patch_policies([StoragePolicy(0, 'zero', False),
                 StoragePolicy(1, 'one', True)])
 class TestObjectReplicator(unittest.TestCase):
@@ -755,6 +910,56 @@ class TestObjectReplicator(unittest.TestCase):
         self.assertTrue(jobs[0]['delete'])
         self.assertEqual('1', jobs[0]['partition'])
 
+    def test_collect_jobs_priority_queue(self):
+        self.conf.update({'priority_queue': 'yes',
+                          'recon_cache_path': self.recon_cache})
+        self._create_replicator()
+        queue = self.replicator.replication_queue
+        self.assertIsInstance(queue, object_replicator.ReplicationQueue)
+        self.assertEqual(86400, queue.aging)
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual([True, True], [job['delete'] for job in jobs[:2]])
+        primary = [job for job in jobs if not job['delete']][0]
+        queue.done(primary, failed=True)
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual([True, True], [job['delete'] for job in jobs[:2]])
+        self.assertEqual(queue.key(primary), queue.key(jobs[2]))
+        # the queue is saved and reported to recon
+        queue = object_replicator.ReplicationQueue(
+            os.path.join(self.recon_cache,
+                         object_replicator.REPLICATION_QUEUE_FILE),
+            0, self.logger)
+        self.assertEqual(len(jobs), len(queue.entries))
+        with open(os.path.join(self.recon_cache, 'object.recon')) as fp:
+            recon = json.load(fp)
+        self.assertEqual(
+            {'handoff': 2, 'failed': 1, 'moved': 0, 'normal': len(jobs) - 3,
+             'aged': 0}, dict((k, v) for k, v in
+                              recon['object_replication_queue'].items()
+                              if k not in ('oldest', 'updated')))
+
+    def test_update_priority_queue(self):
+        self.replicator.replication_queue = queue = mock.MagicMock()
+        self.replicator.replication_count = 0
+        self.replicator.suffix_hash = 0
+        self.replicator.partition_times = []
+        self.replicator.handoffs_remaining = 0
+        jobs = self.replicator.collect_jobs()
+        primary = [job for job in jobs if not job['delete']][0]
+        handoff = [job for job in jobs if job['delete']][0]
+        with mock.patch('swift.obj.replicator.http_connect',
+                        mock_http_connect(500)):
+            self.replicator.update(primary)
+        queue.done.assert_called_once_with(primary, failed=True)
+        queue.reset_mock()
+        with mock.patch('swift.obj.replicator.http_connect',
+                        mock_http_connect(200)), \
+                mock.patch.object(self.replicator, 'sync',
+                                  return_value=(True, {})):
+            self.replicator.update_deleted(handoff)
+        queue.done.assert_called_once_with(handoff, failed=False,
+                                           removed=True)
+
     def test_handoffs_first_mode_will_process_all_jobs_after_handoffs(self):
         # make a object in the handoff & primary partition
         expected_suffix_paths = []
@@ -1885,6 +2090,96 @@ class TestObjectReplicator(unittest.TestCase):
                                   '/a83', headers=self.headers))
         mock_http.assert_has_calls(reqs, any_order=True)
 
+    def _diff_buckets(self, status, headers, body, local_buckets):
+        job = [j for j in self.replicator.collect_jobs()
+               if not j['delete']][0]
+        node = job['nodes'][0]
+        resp = mock.MagicMock(status=status)
+        resp.getheader.side_effect = headers.get
+        resp.read.return_value = body
+        conn = mock.MagicMock()
+        conn.getresponse.return_value = resp
+        with mock.patch('swift.obj.replicator.http_connect',
+                        return_value=conn) as mock_http, \
+                mock.patch('swift.obj.replicator.tpool_reraise',
+                           return_value=local_buckets):
+            buckets = self.replicator.diff_buckets(
+                node, job, ['abc', 'def'], {'Content-Length': '0'})
+        mock_http.assert_called_once_with(
+            node['replication_ip'], node['replication_port'],
+            node['device'], job['partition'], 'REPLICATE', '/abc-def',
+            headers={'Content-Length': '0', 'X-Backend-Hash-Buckets': 'yes'})
+        return buckets
+
+    def test_diff_buckets(self):
+        remote = {'abc': {'0': 'x', '1': 'y'}, 'def': {'f': 'z'}}
+        local = {'abc': {'0': 'x', '1': 'changed', '2': 'new'},
+                 'def': {'f': 'z'}}
+        buckets = self._diff_buckets(
+            200, {'X-Backend-Hash-Buckets': 'yes'}, pickle.dumps(remote),
+            local)
+        self.assertEqual({'abc': set(['1', '2']), 'def': set()}, buckets)
+
+    def test_diff_buckets_not_supported(self):
+        # an older remote ignores the header and returns suffix hashes
+        buckets = self._diff_buckets(
+            200, {}, pickle.dumps({'abc': 'hash', 'def': 'hash'}), {})
+        self.assertIsNone(buckets)
+        buckets = self._diff_buckets(
+            507, {'X-Backend-Hash-Buckets': 'yes'}, '', {})
+        self.assertIsNone(buckets)
+        self.assertEqual([], self.logger.get_lines_for_level('error'))
+
+    def test_diff_buckets_error(self):
+        buckets = self._diff_buckets(
+            200, {'X-Backend-Hash-Buckets': 'yes'}, 'not a pickle', {})
+        self.assertIsNone(buckets)
+        error_lines = self.logger.get_lines_for_level('error')
+        self.assertEqual(1, len(error_lines))
+        self.assertTrue(error_lines[0].startswith(
+            'Error getting bucket hashes from node:'))
+
+    @mock.patch('swift.obj.replicator.tpool_reraise')
+    @mock.patch('swift.obj.replicator.http_connect', autospec=True)
+    def test_update_ssync_hash_buckets(self, mock_http, mock_tpool_reraise):
+        self.assertFalse(self.replicator.ssync_hash_buckets)
+        self.replicator.ssync_hash_buckets = True
+        self.replicator.replication_count = 0
+        self.replicator.suffix_count = 0
+        self.replicator.suffix_sync = 0
+        self.replicator.suffix_hash = 0
+        self.replicator.partition_times = []
+        job = [j for j in self.replicator.collect_jobs()
+               if not j['delete'] and j['partition'] == '0' and
+               int(j['policy']) == 0][0]
+        mock_tpool_reraise.return_value = (1, {'a83': 'local'})
+        mock_http.return_value = answer = mock.MagicMock()
+        answer.getresponse.return_value = resp = mock.MagicMock()
+        resp.status = 200
+        resp.read.return_value = pickle.dumps({'a83': 'remote'})
+        fake_ssync = mock.MagicMock(return_value=(True, {}))
+        buckets = {'a83': set(['f'])}
+        with mock.patch.object(self.replicator, 'sync_method', fake_ssync), \
+                mock.patch.object(self.replicator, 'ssync', fake_ssync), \
+                mock.patch.object(self.replicator, 'diff_buckets',
+                                  return_value=buckets) as mock_diff:
+            self.replicator.update(job)
+        self.assertEqual(len(job['nodes']), mock_diff.call_count)
+        self.assertEqual(
+            [mock.call(node, job, ['a83'], buckets=buckets)
+             for node in job['nodes']], fake_ssync.call_args_list)
+
+        # no buckets from the remote: fall back to whole suffixes
+        fake_ssync.reset_mock()
+        with mock.patch.object(self.replicator, 'sync_method', fake_ssync), \
+                mock.patch.object(self.replicator, 'ssync', fake_ssync), \
+                mock.patch.object(self.replicator, 'diff_buckets',
+                                  return_value=None):
+            self.replicator.update(job)
+        self.assertEqual(
+            [mock.call(node, job, ['a83']) for node in job['nodes']],
+            fake_ssync.call_args_list)
+
     def test_rsync_compress_different_region(self):
         self.assertEqual(self.replicator.sync_method, self.replicator.rsync)
         jobs = self.replicator.collect_jobs()
@@ -1921,6 +2216,122 @@ class TestObjectReplicator(unittest.TestCase):
                             _m_os_path_exists.call_args_list[-2][0][0],
                             os.path.join(job['path']))
 
+    def _batch_jobs(self, policy=0):
+        # primary partitions of one policy that all sync to the same node
+        jobs = [job for job in self.replicator.collect_jobs()
+                if int(job['policy']) == policy and not job['delete']]
+        node_id = jobs[0]['nodes'][0]['id']
+        jobs = [job for job in jobs
+                if node_id in [node['id'] for node in job['nodes']]]
+        node = [n for n in jobs[0]['nodes'] if n['id'] == node_id][0]
+        for job in jobs:
+            mkdirs(os.path.join(job['path'], 'abc'))
+        return node, jobs
+
+    def _sync_all(self, node, jobs):
+        pool = eventlet.GreenPool()
+        results = [pool.spawn(self.replicator.sync, node, job, ['abc'])
+                   for job in jobs]
+        return [result.wait() for result in results]
+
+    def test_rsync_batched(self):
+        self.replicator.rsync_batch_size = 2
+        self.replicator.rsync_batch_wait = 10
+        node, jobs = self._batch_jobs()
+        self.assertEqual(2, len(jobs))
+        calls = []
+
+        def fake_rsync(args, **kwargs):
+            files_from = [arg for arg in args
+                          if arg.startswith('--files-from=')][0]
+            with open(files_from.split('=', 1)[1]) as fp:
+                calls.append((args, kwargs, fp.read()))
+            return 0
+
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            results = self._sync_all(node, jobs)
+        self.assertEqual([(True, {}), (True, {})], results)
+        self.assertEqual(1, len(calls))
+        args, kwargs, files_from = calls[0]
+        self.assertEqual(
+            sorted('%s/abc' % job['partition'] for job in jobs),
+            sorted(files_from.splitlines()))
+        dest = '%s::object/%s/objects/' % (
+            node['replication_ip'], node['device'])
+        self.assertEqual([jobs[0]['obj_path'] + '/', dest], args[-2:])
+        self.assertEqual({'timeout': 2 * self.replicator.rsync_timeout},
+                         kwargs)
+        # the files-from list is cleaned up
+        tmp_path = os.path.join(self.devices, 'sda', 'tmp')
+        self.assertEqual([], os.listdir(tmp_path))
+        self.assertEqual({}, self.replicator._rsync_batches)
+
+    def test_rsync_batch_wait(self):
+        self.replicator.rsync_batch_size = 10
+        self.replicator.rsync_batch_wait = 0.01
+        node, jobs = self._batch_jobs()
+        fake_rsync = mock.Mock(return_value=0)
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            results = self._sync_all(node, jobs)
+        self.assertEqual([(True, {})] * len(jobs), results)
+        self.assertEqual(1, fake_rsync.call_count)
+
+    def test_rsync_batch_failure(self):
+        self.replicator.rsync_batch_size = 2
+        self.replicator.rsync_batch_wait = 10
+        node, jobs = self._batch_jobs()
+        calls = []
+
+        def fake_rsync(args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                return 23
+            # each partition is retried on its own
+            self.assertFalse([arg for arg in args
+                              if arg.startswith('--files-from=')])
+            return 0 if args[-1].endswith('/' + jobs[0]['partition']) \
+                else 23
+
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            results = self._sync_all(node, jobs)
+        self.assertEqual([(True, {}), (False, {})], results)
+        self.assertEqual(3, len(calls))
+        self.assertEqual(
+            ['Batched rsync failed, retrying 2 partitions one at a time'],
+            self.logger.get_lines_for_level('info'))
+
+    def test_rsync_batch_error(self):
+        self.replicator.rsync_batch_size = 2
+        self.replicator.rsync_batch_wait = 10
+        node, jobs = self._batch_jobs()
+        with mock.patch.object(self.replicator, '_rsync',
+                               side_effect=Exception('boom')):
+            results = self._sync_all(node, jobs)
+        self.assertEqual([(False, {}), (False, {})], results)
+        error_lines = self.logger.get_lines_for_level('error')
+        self.assertEqual(1, len(error_lines))
+        self.assertIn('Error syncing rsync batch to', error_lines[0])
+
+    def test_rsync_max_concurrency(self):
+        self.replicator.rsync_max_concurrency = 4
+        node, jobs = self._batch_jobs()
+        active = []
+
+        def fake_rsync(args, **kwargs):
+            active.append(args)
+            eventlet.sleep(0.01)
+            self.assertEqual(1, len(active))
+            active.remove(args)
+            return 0
+
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            results = self._sync_all(node, jobs)
+        self.assertEqual([(True, {})] * len(jobs), results)
+        limiter = self.replicator._rsync_limiters[node['replication_ip']]
+        self.assertEqual(4, limiter.maximum)
+        self.assertEqual(len(jobs), limiter.done)
+        self.assertEqual(0, limiter.active)
+
     def test_do_listdir(self):
         # Test if do_listdir is enabled for every 10th partition to rehash
         # First number is the number of partitions in the job, list entries
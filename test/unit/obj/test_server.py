@@ -28,6 +28,8 @@ from six import StringIO
 import unittest
 import math
 import random
+import socket
+import ssl
 from shutil import rmtree
 from time import gmtime, strftime, time, struct_time
 from tempfile import mkdtemp
@@ -61,7 +63,8 @@ from swift.common.splice import splice
 from swift.common.storage_policy import (StoragePolicy, ECStoragePolicy,
                                          POLICIES, EC_POLICY)
 from swift.common.exceptions import DiskFileDeviceUnavailable, \
-    DiskFileNoSpace, DiskFileQuarantined
+    DiskFileNoSpace, DiskFileQuarantined, DiskFileNotExist
+from test.unit.obj.common import FakeKernelMD5
 
 
 def mock_time(*args, **kwargs):
@@ -170,6 +173,44 @@ class TestObjectController(unittest.TestCase):
         self.object_controller.get_diskfile = raise_disk_unavail
         self.check_all_api_methods(alt_res=507)
 
+    def test_device_busy(self):
+        with mock.patch('swift.obj.diskfile.ThreadPool.full', True):
+            self.check_all_api_methods(alt_res=503)
+        self.assertEqual({'device_busy': 5},
+                         self.object_controller.logger.get_increment_counts())
+
+    def test_HEAD_GET_metadata_cache(self):
+        conf = dict(self.conf, metadata_cache_size='10')
+        self.object_controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        req = Request.blank('/sda1/p/a/c/o', method='PUT',
+                            headers={'X-Timestamp': next(self.ts).internal,
+                                     'Content-Type': 'application/x-test'},
+                            body='VERIFY')
+        resp = req.get_response(self.object_controller)
+        self.assertEqual(resp.status_int, 201)
+        datadir = os.path.dirname(self.df_mgr.get_diskfile(
+            'sda1', 'p', 'a', 'c', 'o', policy=POLICIES.legacy)._datadir)
+        old = time() - 10
+        for hsh in os.listdir(datadir):
+            os.utime(os.path.join(datadir, hsh), (old, old))
+
+        etag = md5('VERIFY').hexdigest()
+        for method, headers, status, body in (
+                ('HEAD', {}, 200, ''),
+                ('HEAD', {}, 200, ''),
+                ('GET', {'If-None-Match': etag}, 304, ''),
+                ('GET', {}, 200, 'VERIFY')):
+            req = Request.blank('/sda1/p/a/c/o', method=method,
+                                headers=headers)
+            resp = req.get_response(self.object_controller)
+            self.assertEqual(resp.status_int, status)
+            self.assertEqual(resp.body, body)
+            self.assertEqual(resp.etag, etag)
+        mgr = self.object_controller._diskfile_router[POLICIES.legacy]
+        self.assertEqual({'hits': 3, 'misses': 1, 'hit_ratio': 0.75,
+                          'size': 1}, mgr.metadata_cache_stats())
+
     def test_allowed_headers(self):
         dah = ['content-disposition', 'content-encoding', 'x-delete-at',
                'x-object-manifest', 'x-static-large-object']
@@ -1215,6 +1256,39 @@ class TestObjectController(unittest.TestCase):
                           'X-Object-Meta-Test': 'one',
                           'Custom-Header': '*'})
 
+    def test_PUT_kernel_md5(self):
+        self.assertFalse(self.object_controller.use_kernel_md5)
+        conf = dict(self.conf, kernel_md5='on')
+        with mock.patch('swift.obj.diskfile.kernel_md5_available',
+                        return_value=True):
+            controller = object_server.ObjectController(
+                conf, logger=debug_logger())
+        self.assertTrue(controller.use_kernel_md5)
+        calls = []
+
+        def fake_md5_hasher(use_kernel=False):
+            calls.append(use_kernel)
+            return md5()
+
+        req = Request.blank(
+            '/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': normalize_timestamp(time()),
+                     'Content-Length': '6',
+                     'Content-Type': 'application/octet-stream'},
+            body='VERIFY')
+        with mock.patch('swift.obj.server.md5_hasher', fake_md5_hasher):
+            resp = req.get_response(controller)
+        self.assertEqual(resp.status_int, 201)
+        self.assertEqual(resp.etag, '0b4c12d7e0a73840c1c4f148fda3b037')
+        self.assertEqual(calls, [True])
+
+        # the probe failing turns it off
+        with mock.patch('swift.obj.diskfile.kernel_md5_available',
+                        return_value=False):
+            controller = object_server.ObjectController(
+                conf, logger=debug_logger())
+        self.assertFalse(controller.use_kernel_md5)
+
     def test_PUT_overwrite(self):
         req = Request.blank(
             '/sda1/p/a/c/o', environ={'REQUEST_METHOD': 'PUT'},
@@ -6066,6 +6140,32 @@ class TestObjectController(unittest.TestCase):
             tpool.execute = was_tpool_exe
             diskfile.DiskFileManager._get_hashes = was_get_hashes
 
+    def test_REPLICATE_hash_buckets(self):
+        def fake_get_bucket_hashes(self, partition_path, suffixes):
+            return dict((suffix, {'a': 'hash'}) for suffix in suffixes)
+
+        with mock.patch.object(diskfile.DiskFileManager,
+                               '_get_bucket_hashes', fake_get_bucket_hashes), \
+                mock.patch('swift.obj.diskfile.tpool_reraise',
+                           lambda func, *args, **kwargs: func(*args)), \
+                mock.patch('os.path.exists', return_value=True):
+            req = Request.blank('/sda1/p/abc-def',
+                                environ={'REQUEST_METHOD': 'REPLICATE'},
+                                headers={'X-Backend-Hash-Buckets': 'yes'})
+            resp = req.get_response(self.object_controller)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual('yes', resp.headers['X-Backend-Hash-Buckets'])
+        self.assertEqual({'abc': {'a': 'hash'}, 'def': {'a': 'hash'}},
+                         pickle.loads(resp.body))
+
+    def test_REPLICATE_hash_buckets_no_partition(self):
+        req = Request.blank('/sda1/p/abc',
+                            environ={'REQUEST_METHOD': 'REPLICATE'},
+                            headers={'X-Backend-Hash-Buckets': 'yes'})
+        resp = req.get_response(self.object_controller)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual({'abc': {}}, pickle.loads(resp.body))
+
     def test_REPLICATE_timeout(self):
 
         def fake_get_hashes(*args, **kwargs):
@@ -7478,5 +7578,164 @@ class TestZeroCopy(unittest.TestCase):
         self.assertEqual(contents, '')
 
 
+class TestZeroCopyPUT(unittest.TestCase):
+    """
+    Test the object server's zero-copy PUT path. MD5 sockets are faked out
+    so that this runs wherever splice() is available.
+    """
+
+    def setUp(self):
+        if not splice.available:
+            raise SkipTest("splice support is missing")
+
+        self.testdir = mkdtemp(suffix="obj_server_zero_copy_put")
+        mkdirs(os.path.join(self.testdir, 'sda1', 'tmp'))
+        self.conf = {'devices': self.testdir,
+                     'mount_check': 'false',
+                     'splice': 'yes',
+                     'disk_chunk_size': '4096'}
+        # the DiskFileManager only checks that it can get an MD5 socket
+        with mock.patch('swift.obj.diskfile.get_md5_socket',
+                        lambda: os.open(os.devnull, os.O_RDONLY)):
+            self.object_controller = object_server.ObjectController(
+                self.conf, logger=debug_logger())
+        self.df_mgr = diskfile.DiskFileManager(
+            self.conf, self.object_controller.logger)
+
+        self.zero_copy_writes = []
+        orig_zero_copy_write = diskfile.BaseDiskFileWriter.zero_copy_write
+
+        def zero_copy_write(writer, *args):
+            self.zero_copy_writes.append(args[1])
+            return orig_zero_copy_write(writer, *args)
+
+        for patcher in (
+                mock.patch('swift.obj.server.md5_hasher',
+                           lambda use_kernel=False: FakeKernelMD5()),
+                mock.patch.object(diskfile.BaseDiskFileWriter,
+                                  'zero_copy_write', zero_copy_write)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        listener = listen(('localhost', 0))
+        self.port = listener.getsockname()[1]
+        self.wsgi_greenlet = spawn(
+            wsgi.server, listener, self.object_controller, NullLogger())
+
+    def tearDown(self):
+        self.wsgi_greenlet.kill()
+        rmtree(self.testdir)
+
+    def _read_object(self):
+        df = self.df_mgr.get_diskfile('sda1', '2100', 'a', 'c', 'o',
+                                      policy=POLICIES.legacy)
+        with df.open():
+            return ''.join(df.reader()), df.get_metadata()
+
+    def test_PUT(self):
+        body = ''.join(chr(i % 256) for i in range(1024 * 1024))
+        http_conn = httplib.HTTPConnection('127.0.0.1', self.port)
+        http_conn.request('PUT', '/sda1/2100/a/c/o', body,
+                          {'X-Timestamp': next(make_timestamp_iter()).internal,
+                           'Content-Type': 'application/octet-stream'})
+        response = http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+        self.assertEqual(response.getheader('etag'),
+                         '"%s"' % md5(body).hexdigest())
+        # the start of the body came in with the headers; the rest was
+        # spliced from the socket a pipe's worth at a time
+        self.assertTrue(self.zero_copy_writes)
+        self.assertLess(self.zero_copy_writes[0], len(body))
+        contents, metadata = self._read_object()
+        self.assertEqual(contents, body)
+        self.assertEqual(metadata['ETag'], md5(body).hexdigest())
+
+        # the connection is still good for another request
+        http_conn.request('HEAD', '/sda1/2100/a/c/o')
+        response = http_conn.getresponse()
+        self.assertEqual(response.status, 200)
+
+    def test_PUT_expect_100_continue(self):
+        body = 'x' * 100000
+        sock = connect_tcp(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('PUT /sda1/2100/a/c/o HTTP/1.1\r\n'
+                 'Host: localhost\r\n'
+                 'X-Timestamp: %s\r\n'
+                 'Content-Type: application/octet-stream\r\n'
+                 'Content-Length: %d\r\n'
+                 'Expect: 100-continue\r\n'
+                 '\r\n' % (next(make_timestamp_iter()).internal, len(body)))
+        fd.flush()
+        headers = readuntil2crlfs(fd)
+        self.assertTrue(headers.startswith('HTTP/1.1 100 Continue'), headers)
+        fd.write(body)
+        fd.flush()
+        headers = readuntil2crlfs(fd)
+        self.assertTrue(headers.startswith('HTTP/1.1 201'), headers)
+        self.assertEqual(self.zero_copy_writes[0], len(body))
+        self.assertEqual(self._read_object()[0], body)
+
+    def test_PUT_client_disconnect(self):
+        sock = connect_tcp(('localhost', self.port))
+        fd = sock.makefile()
+        fd.write('PUT /sda1/2100/a/c/o HTTP/1.1\r\n'
+                 'Host: localhost\r\n'
+                 'X-Timestamp: %s\r\n'
+                 'Content-Type: application/octet-stream\r\n'
+                 'Content-Length: 100000\r\n'
+                 '\r\n' % next(make_timestamp_iter()).internal)
+        fd.write('x' * 20000)
+        fd.flush()
+        sock.shutdown(socket.SHUT_WR)
+        headers = readuntil2crlfs(fd)
+        self.assertTrue(headers.startswith('HTTP/1.1 499'), headers)
+        self.assertRaises(DiskFileNotExist, self._read_object)
+
+    def test_PUT_chunked_is_not_zero_copy(self):
+        body = 'x' * 100000
+        http_conn = httplib.HTTPConnection('127.0.0.1', self.port)
+        http_conn.putrequest('PUT', '/sda1/2100/a/c/o')
+        http_conn.putheader('X-Timestamp',
+                            next(make_timestamp_iter()).internal)
+        http_conn.putheader('Content-Type', 'application/octet-stream')
+        http_conn.putheader('Transfer-Encoding', 'chunked')
+        http_conn.endheaders()
+        http_conn.send('%x\r\n%s\r\n0\r\n\r\n' % (len(body), body))
+        response = http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        self.assertEqual(self.zero_copy_writes, [])
+        self.assertEqual(self._read_object()[0], body)
+
+    def _zero_copy_put_sockfd(self, controller, sock):
+        wsgi_input = wsgi.Input(mock.MagicMock(_rbuf=StringIO()), 10, sock)
+        req = Request.blank('/sda1/2100/a/c/o', method='PUT',
+                            environ={'wsgi.input': wsgi_input},
+                            headers={'Content-Length': '10'})
+        writer = mock.MagicMock(can_zero_copy_write=lambda: True)
+        return controller._zero_copy_put_sockfd(req, writer, POLICIES.legacy)
+
+    def test_PUT_over_tls_is_not_zero_copy(self):
+        tcp_sock = mock.MagicMock(spec=socket.socket)
+        tcp_sock.fileno.return_value = 7
+        self.assertEqual(7, self._zero_copy_put_sockfd(
+            self.object_controller, tcp_sock))
+
+        # splicing from a TLS socket would store the ciphertext
+        for ssl_sock in (mock.MagicMock(spec=ssl.SSLSocket),
+                         mock.MagicMock(fd=mock.MagicMock(
+                             spec=ssl.SSLSocket))):
+            ssl_sock.fileno.return_value = 7
+            self.assertIsNone(self._zero_copy_put_sockfd(
+                self.object_controller, ssl_sock))
+
+        # and with a cert_file the server wraps every client socket in TLS
+        controller = object_server.ObjectController(
+            dict(self.conf, cert_file='/etc/swift/object.crt'),
+            logger=debug_logger())
+        self.assertIsNone(self._zero_copy_put_sockfd(controller, tcp_sock))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -27,6 +27,7 @@ from swift.common.exceptions import DiskFileNotExist, DiskFileError, \
     DiskFileDeleted
 from swift.common import utils
 from swift.common.storage_policy import POLICIES, EC_POLICY
+from swift.common.swob import HTTPInternalServerError
 from swift.common.utils import Timestamp
 from swift.obj import ssync_sender, server
 from swift.obj.reconstructor import RebuildingECDiskFileStream, \
@@ -1587,5 +1588,102 @@ class TestSsyncReplication(TestBaseSsync):
             self.device, self.partition, suffixes, policy)
         self.assertEqual(tx_hashes, rx_hashes)
 
+
+class TestSsyncPipelined(TestBaseSsync):
+    def setUp(self):
+        super(TestSsyncPipelined, self).setUp()
+        self.daemon.ssync_pipeline = True
+        self.policy = POLICIES.default
+        self.tx_df_mgr = self.daemon._diskfile_router[self.policy]
+        self.rx_df_mgr = self.rx_controller._diskfile_router[self.policy]
+
+    def _get_object_data(self, path, **kwargs):
+        if path == '/a/c/big' and path not in self.obj_data:
+            # bigger than a network chunk so not buffered by the receiver
+            self.obj_data[path] = 'x' * 100000
+        return super(TestSsyncPipelined, self)._get_object_data(
+            path, **kwargs)
+
+    def _setup_objects(self):
+        tx_objs = {}
+        tx_tombstones = {}
+        suffixes = set()
+        for i in range(20):
+            name = 'o%d' % i
+            t = next(self.ts_iter)
+            tx_objs[name] = self._create_ondisk_files(
+                self.tx_df_mgr, name, self.policy, t)
+            if i % 4 == 0:
+                # in sync on rx
+                self._create_ondisk_files(self.rx_df_mgr, name, self.policy, t)
+            elif i % 4 == 1:
+                # a PUT then a POST to the same object
+                t_meta = next(self.ts_iter)
+                tx_objs[name][0].write_metadata({
+                    'X-Timestamp': t_meta.internal,
+                    'X-Object-Meta-Test': name})
+        t = next(self.ts_iter)
+        tx_objs['big'] = self._create_ondisk_files(
+            self.tx_df_mgr, 'big', self.policy, t)
+        t = next(self.ts_iter)
+        tx_tombstones['gone'] = self._create_ondisk_files(
+            self.tx_df_mgr, 'gone', self.policy, t)
+        tx_tombstones['gone'][0].delete(next(self.ts_iter))
+        for diskfiles in list(tx_objs.values()) + list(tx_tombstones.values()):
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+        return tx_objs, tx_tombstones, suffixes
+
+    def _sync(self, suffixes):
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': self.policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        return ssync_sender.Sender(self.daemon, node, job, suffixes)()
+
+    def test_sync(self):
+        tx_objs, tx_tombstones, suffixes = self._setup_objects()
+        with mock.patch.object(
+                self.rx_controller, 'ssync_receiver_concurrency', 2):
+            success, in_sync_objs = self._sync(suffixes)
+        self.assertTrue(success)
+        self.assertEqual(22, len(in_sync_objs))
+        self._verify_ondisk_files(tx_objs, self.policy)
+        self._verify_tombstones(tx_tombstones, self.policy)
+
+    def test_sync_streams(self):
+        self.daemon.ssync_streams = 3
+        tx_objs, tx_tombstones, suffixes = self._setup_objects()
+        self.assertGreater(len(suffixes), 3)
+        orig_connect = ssync_sender.Sender.connect
+        with mock.patch.object(ssync_sender.Sender, 'connect', autospec=True,
+                               side_effect=orig_connect) as mock_connect:
+            success, in_sync_objs = self._sync(suffixes)
+        self.assertTrue(success)
+        self.assertEqual(3, mock_connect.call_count)
+        self.assertEqual(22, len(in_sync_objs))
+        self._verify_ondisk_files(tx_objs, self.policy)
+        self._verify_tombstones(tx_tombstones, self.policy)
+
+    def test_sync_subrequest_failure(self):
+        tx_objs, tx_tombstones, suffixes = self._setup_objects()
+        orig_put = self.rx_controller.PUT
+
+        def fail_big(req):
+            if req.path.endswith('/a/c/big'):
+                return HTTPInternalServerError()
+            return orig_put(req)
+        fail_big.publicly_accessible = True
+
+        with mock.patch.object(self.rx_controller, 'PUT', fail_big):
+            success, in_sync_objs = self._sync(suffixes)
+        self.assertFalse(success)
+        self.assertEqual({}, in_sync_objs)
+        self.assertEqual(
+            ['ssync subrequest failed with 500: PUT /dev/9/a/c/big'],
+            self.rx_logger.get_lines_for_level('warning'))
+
+
 if __name__ == '__main__':
     unittest.main()
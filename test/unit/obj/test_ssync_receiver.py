@@ -665,6 +665,38 @@ class TestReceiver(unittest.TestCase):
         self.assertFalse(self.controller.logger.error.called)
         self.assertFalse(self.controller.logger.exception.called)
 
+    def test_MISSING_CHECK_device_busy(self):
+        object_dir = utils.storage_directory(
+            os.path.join(self.testdir, 'sda1',
+                         diskfile.get_data_dir(POLICIES[0])),
+            '1', self.hash1)
+        utils.mkdirs(object_dir)
+        fp = open(os.path.join(object_dir, self.ts1 + '.data'), 'w+')
+        fp.write('1')
+        fp.flush()
+        self.metadata1['Content-Length'] = '1'
+        diskfile.write_metadata(fp, self.metadata1)
+
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=':MISSING_CHECK: START\r\n' +
+                 self.hash1 + ' ' + self.ts1 + '\r\n'
+                 ':MISSING_CHECK: END\r\n'
+                 ':UPDATES: START\r\n:UPDATES: END\r\n')
+        # a busy device must not look like a missing object
+        with mock.patch('swift.obj.diskfile.ThreadPool.full', True):
+            resp = req.get_response(self.controller)
+            body_lines = self.body_lines(resp.body)
+        self.assertEqual(
+            body_lines,
+            [":ERROR: 503 '<html><h1>Service Unavailable</h1><p>The "
+             "server is currently unavailable. Please try again at a "
+             "later time.</p></html>'"])
+        self.assertEqual(resp.status_int, 200)
+        self.assertFalse(self.controller.logger.exception.called)
+
     @patch_policies(with_ec_default=True)
     def test_MISSING_CHECK_missing_durable(self):
         self.controller.logger = mock.MagicMock()
@@ -1926,6 +1958,163 @@ class TestReceiver(unittest.TestCase):
         self.assertEqual(req.read_body, '1')
         self.assertEqual(_requests, [])
 
+    def test_MISSING_CHECK_pipelined(self):
+        running = []
+        max_running = [0]
+
+        def _check_missing(line):
+            running.append(line)
+            max_running[0] = max(max_running[0], len(running))
+            eventlet.sleep(0)
+            running.remove(line)
+            return line.split()[0]
+
+        hashes = ['%032x' % i for i in range(10)]
+        self.controller.logger = mock.MagicMock()
+        self.controller.ssync_receiver_concurrency = 3
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            headers={'X-Backend-Ssync-Pipeline': '1'},
+            body=':MISSING_CHECK: START\r\n' +
+                 ''.join('%s %s\r\n' % (h, self.ts1) for h in hashes) +
+                 ':MISSING_CHECK: END\r\n'
+                 ':UPDATES: START\r\n:UPDATES: END\r\n')
+        with mock.patch.object(ssync_receiver.Receiver, '_check_missing',
+                               side_effect=_check_missing):
+            resp = req.get_response(self.controller)
+            body = resp.body
+        self.assertEqual(
+            self.body_lines(body),
+            [':MISSING_CHECK: START'] + hashes +
+            [':MISSING_CHECK: END', ':UPDATES: START', ':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(3, max_running[0])
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertFalse(self.controller.logger.exception.called)
+
+    def test_MISSING_CHECK_pipelined_exception(self):
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            headers={'X-Backend-Ssync-Pipeline': '1'},
+            body=':MISSING_CHECK: START\r\n' +
+                 self.hash1 + ' ' + self.ts1 + '\r\n'
+                 ':MISSING_CHECK: END\r\n')
+        with mock.patch.object(ssync_receiver.Receiver, '_check_missing',
+                               side_effect=Exception('kaboom')):
+            resp = req.get_response(self.controller)
+            body = resp.body
+        self.assertEqual(
+            self.body_lines(body),
+            [':MISSING_CHECK: START', ":ERROR: 0 'kaboom'"])
+        self.controller.logger.exception.assert_called_once_with(
+            'None/sda1/1 EXCEPTION in ssync.Receiver')
+
+    def test_UPDATES_pipelined(self):
+        _requests = []
+        running = []
+        max_running = [0]
+
+        def handler(status):
+            @server.public
+            def _handler(request):
+                running.append(request)
+                max_running[0] = max(max_running[0], len(running))
+                request.read_body = request.environ['wsgi.input'].read()
+                eventlet.sleep(0)
+                running.remove(request)
+                _requests.append(request)
+                return status()
+            return _handler
+
+        self.controller.network_chunk_size = 40
+        self.controller.ssync_receiver_concurrency = 2
+        with mock.patch.object(self.controller, 'PUT',
+                               handler(swob.HTTPCreated)), \
+                mock.patch.object(self.controller, 'POST',
+                                  handler(swob.HTTPAccepted)), \
+                mock.patch.object(self.controller, 'DELETE',
+                                  handler(swob.HTTPNoContent)):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Pipeline': '1'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'PUT /a/c/o1\r\n'
+                     'Content-Length: 1\r\n'
+                     'X-Timestamp: 1364456113.00001\r\n'
+                     '\r\n'
+                     '1'
+                     'POST /a/c/o1\r\n'
+                     'X-Timestamp: 1364456113.00002\r\n'
+                     '\r\n'
+                     'DELETE /a/c/o2\r\n'
+                     'X-Timestamp: 1364456113.00003\r\n'
+                     '\r\n'
+                     'PUT /a/c/o3\r\n'
+                     'Content-Length: 50\r\n'
+                     'X-Timestamp: 1364456113.00004\r\n'
+                     '\r\n' + '3' * 50 +
+                     'PUT /a/c/o4\r\n'
+                     'Content-Length: 2\r\n'
+                     'X-Timestamp: 1364456113.00005\r\n'
+                     '\r\n'
+                     '12'
+            )
+            resp = req.get_response(self.controller)
+            body = resp.body
+        self.assertEqual(
+            self.body_lines(body),
+            [':MISSING_CHECK: START', ':MISSING_CHECK: END',
+             ':UPDATES: START', ':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertFalse(self.controller.logger.exception.called)
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertEqual(2, max_running[0])
+        self.assertEqual(
+            sorted([('PUT', '/device/partition/a/c/o1', '1'),
+                    ('POST', '/device/partition/a/c/o1', ''),
+                    ('DELETE', '/device/partition/a/c/o2', ''),
+                    ('PUT', '/device/partition/a/c/o3', '3' * 50),
+                    ('PUT', '/device/partition/a/c/o4', '12')]),
+            sorted((r.method, r.path, r.read_body) for r in _requests))
+        # subrequests to the same object are run in order
+        o1_methods = [r.method for r in _requests
+                      if r.path.endswith('/o1')]
+        self.assertEqual(['PUT', 'POST'], o1_methods)
+
+    def test_UPDATES_pipelined_failures(self):
+        @server.public
+        def _PUT(request):
+            return swob.HTTPInternalServerError()
+
+        self.controller.replication_failure_threshold = 2
+        self.controller.replication_failure_ratio = 0
+        with mock.patch.object(self.controller, 'PUT', _PUT):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Pipeline': '1'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n' +
+                     ''.join('PUT /a/c/o%d\r\n'
+                             'Content-Length: 0\r\n'
+                             'X-Timestamp: 1364456113.00001\r\n'
+                             '\r\n' % i for i in range(3)) +
+                     ':UPDATES: END\r\n')
+            resp = req.get_response(self.controller)
+            body = resp.body
+        self.assertEqual(
+            self.body_lines(body),
+            [':MISSING_CHECK: START', ':MISSING_CHECK: END',
+             ":ERROR: 0 'Too many 2 failures to 0 successes'"])
+        self.assertEqual(resp.status_int, 200)
+
 
 @patch_policies(with_ec_default=True)
 class TestSsyncRxServer(unittest.TestCase):
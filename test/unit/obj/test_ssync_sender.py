@@ -187,6 +187,72 @@ class TestSender(BaseTest):
         self.sender.updates.assert_called_once_with()
         self.sender.disconnect.assert_called_once_with()
 
+    def test_call_pipelined_calls_others(self):
+        self.daemon.ssync_pipeline = True
+        self.sender = ssync_sender.Sender(self.daemon, None, None, ['abc'])
+        self.sender.connect = mock.MagicMock()
+        self.sender.missing_check = mock.MagicMock()
+        self.sender.updates = mock.MagicMock()
+        self.sender.pipelined_updates = mock.MagicMock()
+        self.sender.disconnect = mock.MagicMock()
+        success, candidates = self.sender()
+        self.assertTrue(success)
+        self.assertEqual(candidates, {})
+        self.sender.connect.assert_called_once_with()
+        self.sender.pipelined_updates.assert_called_once_with()
+        self.assertFalse(self.sender.missing_check.called)
+        self.assertFalse(self.sender.updates.called)
+        self.sender.disconnect.assert_called_once_with()
+
+    def test_pipeline_not_used_with_remote_check_objs(self):
+        self.daemon.ssync_pipeline = True
+        self.sender = ssync_sender.Sender(self.daemon, None, None, ['abc'])
+        self.assertTrue(self.sender.pipeline)
+        self.sender = ssync_sender.Sender(
+            self.daemon, None, None, ['abc'], remote_check_objs=['abc'])
+        self.assertFalse(self.sender.pipeline)
+
+    def _run_streams(self, suffixes, fail=()):
+        calls = []
+
+        def missing_check(sender):
+            calls.append(sender.suffixes)
+            for suffix in sender.suffixes:
+                sender.available_map[suffix + 'hash'] = {
+                    'ts_data': Timestamp(1)}
+            if set(sender.suffixes) & set(fail):
+                sender.failures = 1
+
+        self.daemon.ssync_streams = 2
+        sender = ssync_sender.Sender(self.daemon, None, None, suffixes)
+        with mock.patch.multiple(
+                ssync_sender.Sender, connect=mock.DEFAULT,
+                updates=mock.DEFAULT, disconnect=mock.DEFAULT), \
+                mock.patch.object(ssync_sender.Sender, 'missing_check',
+                                  missing_check):
+            return calls, sender()
+
+    def test_call_streams(self):
+        calls, (success, candidates) = self._run_streams(
+            ['abc', 'def', 'ghi'])
+        self.assertEqual([['abc', 'ghi'], ['def']], calls)
+        self.assertTrue(success)
+        self.assertEqual(['abchash', 'defhash', 'ghihash'],
+                         sorted(candidates))
+
+    def test_call_streams_failure(self):
+        calls, (success, candidates) = self._run_streams(
+            ['abc', 'def', 'ghi'], fail=['def'])
+        self.assertEqual([['abc', 'ghi'], ['def']], calls)
+        self.assertFalse(success)
+        self.assertEqual({}, candidates)
+
+    def test_call_streams_one_suffix(self):
+        calls, (success, candidates) = self._run_streams(['abc'])
+        self.assertEqual([['abc']], calls)
+        self.assertTrue(success)
+        self.assertEqual(['abchash'], list(candidates))
+
     def test_connect(self):
         node = dict(replication_ip='1.2.3.4', replication_port=5678,
                     device='sda1', index=0)
@@ -752,6 +818,31 @@ class TestSender(BaseTest):
         self.assertEqual(self.sender.send_map, {})
         self.assertEqual(self.sender.available_map, {})
 
+    def test_missing_check_buckets(self):
+        calls = []
+
+        def yield_hashes(device, partition, policy, suffixes=None, **kwargs):
+            calls.append((suffixes, kwargs))
+            return iter([])
+
+        self.sender.connection = FakeConnection()
+        self.sender.job = {
+            'device': 'dev',
+            'partition': '9',
+            'policy': POLICIES.legacy,
+        }
+        self.sender.suffixes = ['abc', 'def']
+        self.sender.buckets = {'abc': set(['9']), 'def': set()}
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':MISSING_CHECK: START\r\n'
+                ':MISSING_CHECK: END\r\n'))
+        self.sender.daemon._diskfile_mgr.yield_hashes = yield_hashes
+        self.sender.missing_check()
+        self.assertEqual(
+            [(['abc', 'def'],
+              {'frag_index': None, 'buckets': self.sender.buckets})], calls)
+
     def test_missing_check_has_suffixes(self):
         def yield_hashes(device, partition, policy, suffixes=None, **kwargs):
             if (device == 'dev' and partition == '9' and
@@ -1009,6 +1100,92 @@ class TestSender(BaseTest):
                          dict([('9d41d8cd98f00b204e9800998ecf0abc',
                                 {'ts_data': Timestamp(1380144470.00000)})]))
 
+    def test_missing_check_pipelined(self):
+        def yield_hashes(device, partition, policy, suffixes=None, **kwargs):
+            for suffix in suffixes:
+                yield ('/srv/node/dev/objects/9/%s/hash' % suffix,
+                       '9d41d8cd98f00b204e9800998ecf0' + suffix,
+                       {'ts_data': Timestamp(1380144470.00000)})
+
+        self.daemon.ssync_pipeline = True
+        self.daemon.network_chunk_size = 100
+        self.sender = ssync_sender.Sender(
+            self.daemon, None, {'device': 'dev', 'partition': '9',
+                                'policy': POLICIES.legacy},
+            ['abc', 'def', 'ghi'])
+        self.sender.connection = FakeConnection()
+        self.sender.daemon._diskfile_mgr.yield_hashes = yield_hashes
+        self.sender.send_missing_check()
+        # missing_check lines are batched up to network_chunk_size
+        self.assertEqual(
+            ''.join(self.sender.connection.sent),
+            '17\r\n:MISSING_CHECK: START\r\n\r\n'
+            '66\r\n9d41d8cd98f00b204e9800998ecf0abc 1380144470.00000\r\n'
+            '9d41d8cd98f00b204e9800998ecf0def 1380144470.00000\r\n\r\n'
+            '33\r\n9d41d8cd98f00b204e9800998ecf0ghi 1380144470.00000\r\n\r\n'
+            '15\r\n:MISSING_CHECK: END\r\n\r\n')
+
+    def test_pipelined_updates(self):
+        self.daemon.ssync_pipeline = True
+        self.sender = ssync_sender.Sender(self.daemon, None, None, ['abc'])
+        self.sender.connection = FakeConnection()
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':MISSING_CHECK: START\r\n'
+                '9d41d8cd98f00b204e9800998ecf0abc d\r\n'
+                '9d41d8cd98f00b204e9800998ecf0def m\r\n'
+                ':MISSING_CHECK: END\r\n'
+                ':UPDATES: START\r\n'
+                ':UPDATES: END\r\n'))
+        self.sender.send_missing_check = mock.MagicMock()
+        sent = []
+
+        def send_update(object_hash, want):
+            sent.append((object_hash, want, len(self.sender.connection.sent)))
+
+        self.sender.send_update = send_update
+        self.sender.pipelined_updates()
+        self.sender.send_missing_check.assert_called_once_with()
+        # updates were sent after :UPDATES: START
+        self.assertEqual(
+            [('9d41d8cd98f00b204e9800998ecf0abc', {'data': True}, 1),
+             ('9d41d8cd98f00b204e9800998ecf0def', {'meta': True}, 1)], sent)
+        self.assertEqual(
+            ''.join(self.sender.connection.sent),
+            '11\r\n:UPDATES: START\r\n\r\n'
+            'f\r\n:UPDATES: END\r\n\r\n')
+        self.assertEqual(
+            {'9d41d8cd98f00b204e9800998ecf0abc': {'data': True},
+             '9d41d8cd98f00b204e9800998ecf0def': {'meta': True}},
+            self.sender.send_map)
+
+    def test_pipelined_updates_unexpected_response(self):
+        self.daemon.ssync_pipeline = True
+        self.sender = ssync_sender.Sender(self.daemon, None, None, ['abc'])
+        self.sender.connection = FakeConnection()
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':MISSING_CHECK: START\r\n'
+                ':ERROR: 0 \'oops\'\r\n'))
+        self.sender.send_missing_check = mock.MagicMock()
+        self.sender.send_update = mock.MagicMock()
+        with self.assertRaises(exceptions.ReplicationException) as cm:
+            self.sender.pipelined_updates()
+        self.assertEqual('Unexpected response: ":ERROR: 0 \'oops\'"',
+                         str(cm.exception))
+        self.assertFalse(self.sender.send_update.called)
+
+    def test_pipelined_updates_timeout(self):
+        self.daemon.ssync_pipeline = True
+        self.daemon.http_timeout = 0.01
+        self.sender = ssync_sender.Sender(self.daemon, None, None, ['abc'])
+        self.sender.connection = FakeConnection()
+        self.sender.send_missing_check = mock.MagicMock()
+        self.sender.read_missing_check = lambda *args: eventlet.sleep(1)
+        with self.assertRaises(exceptions.MessageTimeout) as cm:
+            self.sender.pipelined_updates()
+        self.assertIn('missing_check line wait', str(cm.exception))
+
     def test_updates_timeout(self):
         self.sender.connection = FakeConnection()
         self.sender.connection.send = lambda d: eventlet.sleep(1)
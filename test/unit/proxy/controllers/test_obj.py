@@ -1666,6 +1666,31 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
         self.assertEqual(len(real_body), len(resp.body))
         self.assertEqual(real_body, resp.body)
 
+    def test_GET_with_body_stage_timing(self):
+        self.app.stage_timing = True
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        segment_size = self.policy.ec_segment_size
+        real_body = ('asdf' * segment_size)[:-10]
+        chunks = [real_body[x:x + segment_size]
+                  for x in range(0, len(real_body), segment_size)]
+        fragment_payloads = [self.policy.pyeclib_driver.encode(chunk)
+                             for chunk in chunks]
+        node_fragments = list(zip(*fragment_payloads))
+        headers = {'X-Object-Sysmeta-Ec-Content-Length': str(len(real_body))}
+        responses = [(200, ''.join(node_fragments[i]), headers)
+                     for i in range(POLICIES.default.ec_ndata)]
+        status_codes, body_iter, headers = zip(*responses)
+        with set_http_connect(*status_codes, body_iter=body_iter,
+                              headers=headers):
+            resp = req.get_response(self.app)
+            self.assertEqual(real_body, resp.body)
+        stage_timings = req.environ['swift.proxy_stage_timings']
+        for stage in ('connect', 'first_byte', 'ec_decode', 'fragment_send'):
+            self.assertIn(stage, stage_timings)
+        self.assertEqual(1, self.app.stage_histograms['ec_decode'].count)
+        self.assertEqual(self.policy.ec_ndata,
+                         self.app.stage_histograms['connect'].count)
+
     def test_PUT_simple(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o', method='PUT',
                                               body='')
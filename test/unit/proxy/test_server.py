@@ -723,6 +723,69 @@ class TestProxyServer(unittest.TestCase):
         finally:
             rmtree(swift_dir, ignore_errors=True)
 
+    def test_stage_timing(self):
+        baseapp = proxy_server.Application({},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertFalse(baseapp.stage_timing)
+        env = {}
+        baseapp.record_stage_timing('connect', 0.01, env)
+        baseapp.record_handoff(1)
+        self.assertEqual({}, baseapp.stage_histograms)
+        self.assertEqual({}, env)
+
+        logger = debug_logger()
+        baseapp = proxy_server.Application({'stage_timing': 'yes',
+                                            'stage_timing_statsd': 'yes'},
+                                           FakeMemcache(), logger=logger,
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertTrue(baseapp.stage_timing)
+        baseapp.record_stage_timing('connect', 0.002, env)
+        baseapp.record_stage_timing('connect', 0.004, env)
+        baseapp.record_stage_timing('first_byte', 0.1)
+        baseapp.record_handoff(1)
+        baseapp.record_handoff(2)
+        self.assertEqual({'connect': 0.006},
+                         {k: round(v, 6) for k, v in
+                          env['swift.proxy_stage_timings'].items()})
+        timings = baseapp.get_stage_timings()
+        self.assertEqual(['connect', 'first_byte', 'handoff_depth'],
+                         sorted(timings))
+        self.assertEqual(2, timings['connect']['count'])
+        self.assertAlmostEqual(2.0, timings['connect']['min'], places=1)
+        self.assertAlmostEqual(4.0, timings['connect']['max'], places=1)
+        self.assertAlmostEqual(100.0, timings['first_byte']['p50'],
+                               places=0)
+        self.assertEqual(2, timings['handoff_depth']['max'])
+        self.assertEqual(
+            ['stage.connect.timing', 'stage.connect.timing',
+             'stage.first_byte.timing'],
+            [call[0][0] for call in logger.log_dict['timing']])
+        self.assertEqual({'stage.handoff': 2}, logger.get_increment_counts())
+
+        # exposed in the admin section of /info
+        req = Request.blank('/info')
+        controller, path_parts = baseapp.get_controller(req)
+        self.assertEqual(baseapp.get_stage_timings,
+                         path_parts['stage_timings'])
+
+    def test_stage_timing_backend_request(self):
+        baseapp = proxy_server.Application({'stage_timing': 'yes'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        req = Request.blank('/v1/a', environ={'REQUEST_METHOD': 'HEAD'})
+        with save_globals():
+            set_http_connect(200, 200)
+            resp = baseapp.handle_request(req)
+        self.assertEqual(resp.status_int, 200)
+        self.assertIn('connect', req.environ['swift.proxy_stage_timings'])
+        self.assertIn('first_byte', req.environ['swift.proxy_stage_timings'])
+        self.assertEqual(1, baseapp.stage_histograms['connect'].count)
+        self.assertEqual(1, baseapp.stage_histograms['first_byte'].count)
+
     def test_node_timing(self):
         baseapp = proxy_server.Application({'sorting_method': 'timing'},
                                            FakeMemcache(),